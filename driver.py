@@ -5,8 +5,15 @@
 """
 
 # Imports
-import inventory_management_frontend as imf     # Allows for use of the frontend of the Inventory Management System.
+import time                                     # Allows for timing the startup.
+startup_start = time.perf_counter()             # Records when the program started (before the other imports).
+import argparse                                 # Allows for reading the command line arguments.
+import inventory_management_backend as imb      # Allows for use of the backend of the Inventory Management System.
+import inventory_management_metrics as imm      # Allows for serving the startup times with the other metrics.
+import inventory_management_storage as ims      # Allows for listing the local storage engines.
 import pymongo                                  # Allows for use of MongoDB functionality.
+#   The frontend (and the WSGI server) is imported by start() (importing it loads Dash and builds the app, which only
+#       the dashboard needs).
 
 # Declare Global Variables
 #   The username and password are initially used to create a user for the database. This allows testing
@@ -17,32 +24,86 @@ host = "localhost"                                      # The host to use in acc
 port = 27017                                            # The port to use in accessing the database.
 target_db = "inventory_management_db"                   # The database to be used.
 target_collection = "inventory_management_collection"   # The collection to be used.
+startup_times = {}                                      # How long each phase of the startup took, in seconds.
 
+# Serves the startup times with every other metric (e.g. "ims_startup_total_seconds").
+imm.register_collector(lambda: {f"ims_startup_{phase}_seconds": seconds for phase, seconds in startup_times.items()})
 
-def start():
+
+def start(fast_start : bool =False, workers : int =None, threads : int =None, port : int =8050):
     """
         Populates the database with data if needed before starting the frontend service.
+
+        :param fast_start:      Whether to skip preparing the database (the user check, seeding and indexes). Use it
+                                when the database was already prepared, e.g. when a container restarts.
+        :param workers:         The number of worker processes serving the dashboard with gunicorn (the single process
+                                development server is used if None).
+        :param threads:         The number of threads serving requests in every worker (gunicorn only).
+        :param port:            The port the dashboard is served on.
     """
-    # The below code accesses the admin account of the MongoClient.
-    client = pymongo.MongoClient(f"mongodb://{host}:{port}/")  # Connects to the MongoDB client as an admin.
-    database = client['admin']  # Accesses the 'admin' database within the MongoDB client.
-    collection = database['system.users']  # Accesses the collection for the users in the database.
 
-    # If the user is not yet registered in the admin database,
-    if len(list(collection.find({'user': username}))) == 0:
-        database.command("createUser", username, pwd=password,
-                         roles=[{"role": "readWrite", "db": target_db}])  # Adds the user to the database.
+    startup_times["imports"] = time.perf_counter() - startup_start  # Records how long the imports took.
+    phase_start = time.perf_counter()  # Records when the database started being prepared.
+
+    # If the database should be prepared,
+    if not fast_start:
+        bootstrap()  # Prepares the database.
+
+    # Otherwise, if the inventory is stored by a local storage engine,
+    elif imb.storage_engine != "mongo":
+        imb.storage_users[username] = password  # Registers the user (the only bootstrap step kept in memory).
+
+    startup_times["bootstrap"] = time.perf_counter() - phase_start  # Records how long preparing the database took.
+    phase_start = time.perf_counter()  # Records when the frontend started being imported.
+
+    import inventory_management_frontend as imf  # Imports the frontend (loads Dash and builds the app).
+
+    # If the dashboard is served by several workers,
+    if workers is not None:
+        import inventory_management_wsgi as imw  # Imports the production server.
+
+    startup_times["frontend"] = time.perf_counter() - phase_start  # Records how long importing the frontend took.
+    startup_times["total"] = time.perf_counter() - startup_start  # Records how long the whole startup took.
+
+    # Outputs the startup times.
+    print(f"Started in {startup_times['total']:.3f}s (imports {startup_times['imports']:.3f}s, "
+          f"bootstrap {startup_times['bootstrap']:.3f}s, frontend {startup_times['frontend']:.3f}s)")
+
+    # If the dashboard is served by several workers,
+    if workers is not None:
+        imw.serve(workers, threads or imw.default_threads, port=port)  # Starts the production server.
+
+    # Otherwise,
+    else:
+        imf.start(port=port)  # Starts the frontend of the Inventory Management System (creates the dashboard).
 
-    client.close()  # Closes the client (prevents admin-level access for future operations).
 
-    # The below code logs into the target database as the generated user.
-    client = pymongo.MongoClient(
-        f"mongodb://{username}:{password}@{host}:{port}/")  # Logs in to the MongoDB client as the user.
+def bootstrap():
+    """
+        Creates the user, populates the collection if it does not exist yet and creates the indexes, all with a
+            single client.
+    """
+
+    # If the inventory is stored by MongoDB,
+    if imb.storage_engine == "mongo":
+        # The below code accesses the admin account of the MongoClient (it is used for every step).
+        client = pymongo.MongoClient(f"mongodb://{host}:{port}/")  # Connects to the MongoDB client as an admin.
+        database = client['admin']  # Accesses the 'admin' database within the MongoDB client.
+
+        # If the user is not yet registered in the admin database (usersInfo looks up only this user),
+        if not database.command("usersInfo", username)["users"]:
+            database.command("createUser", username, pwd=password,
+                             roles=[{"role": "readWrite", "db": target_db}])  # Adds the user to the database.
+
+    # Otherwise (the inventory is stored by a local storage engine),
+    else:
+        client = connect()  # Registers the user and gets the shared client.
+
     database = client[target_db]  # Forges a reference to the targeted database.
     collection = database[target_collection]  # Forges a reference to the collection within the targeted database.
 
-    # If the targeted collection does not yet exist,
-    if target_collection not in database.list_collection_names():
+    # If the targeted collection does not yet exist (only its name is looked up),
+    if not database.list_collection_names(filter={"name": target_collection}):
         to_insert = []   # Holds the entries to be inserted into the database.
 
         # For 100 entries,
@@ -54,12 +115,90 @@ def start():
 
         collection.insert_many(to_insert)  # Inserts every entry in the list to the database.
 
-    client.close()  # Closes the connection to the MongoDB client.
-    imf.start()  # Starts the frontend of the Inventory Management System (creates the dashboard).
+    imb.ensure_indexes(collection)  # Creates the indexes used by the backend (does nothing if they already exist).
+    imb.seed_product_id_counter(collection)  # Starts the product ID counter after the highest product ID in use.
+
+    disconnect(client)  # Closes the connection to the MongoDB client.
+
+
+def connect():
+    """
+        Logs in to the storage engine chosen in the backend as the generated user.
+
+        :return object:     The MongoClient, or the client of the local storage engine.
+    """
+
+    # If the inventory is stored by MongoDB,
+    if imb.storage_engine == "mongo":
+        return pymongo.MongoClient(f"mongodb://{username}:{password}@{host}:{port}/")  # Logs in as the user.
+
+    imb.storage_users[username] = password  # Registers the user with the local storage engine.
+    return imb.get_client(username, password)  # Gets the shared client (the dashboard logs in with it later).
+
+
+def disconnect(client):
+    """
+        Closes a client opened by connect() (the shared client of a local storage engine is kept open).
+
+        :param client:      The client to close.
+    """
+
+    # If the inventory is stored by MongoDB,
+    if imb.storage_engine == "mongo":
+        client.close()  # Closes the connection to the MongoDB client.
+
+
+def rebuild_summary():
+    """
+        Recalculates the summary document from every product and reports whether the stored summary matched.
+    """
+
+    client = connect()  # Logs in to the storage engine as the user.
+    result = imb.rebuild_summary(client[target_db][target_collection])  # Recalculates the summary.
+    disconnect(client)  # Closes the connection to the MongoDB client.
+
+    print(f"Stored summary:  {result['stored']}")  # Outputs the summary before the rebuild.
+    print(f"Rebuilt summary: {result['summary']}")  # Outputs the recalculated summary.
+    print("The stored summary was consistent." if result["consistent"] else "The stored summary was NOT consistent.")
 
 
 # The below code runs as soon as the program starts.
 if __name__ == "__main__":
-    start()  # Starts the frontend service.
+    parser = argparse.ArgumentParser(description="Starts the Inventory Management System.")  # Reads the arguments.
+    parser.add_argument("--rebuild-summary", action="store_true",
+                        help="Recalculate the inventory summary from every product and exit.")
+    parser.add_argument("--storage", choices=["mongo", *ims.engines], default="mongo",
+                        help="Where the inventory is stored (a MongoDB server, memory or a SQLite file).")
+    parser.add_argument("--sqlite-path", default=imb.storage_path,
+                        help="The SQLite file used by the sqlite storage engine.")
+    parser.add_argument("--fast-start", action="store_true",
+                        help="Skip the user check, seeding and index creation (the database is already prepared).")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Serve the dashboard with this many gunicorn worker processes (production mode).")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="The number of threads serving requests in every worker (production mode).")
+    parser.add_argument("--port", type=int, default=8050, help="The port the dashboard is served on.")
+    parser.add_argument("--journal-directory", default=None,
+                        help="The directory of the change journal (IMS_JOURNAL_DIRECTORY if not given).")
+    arguments = parser.parse_args()
+
+    # If the in-memory inventory would be split between several workers,
+    if arguments.storage == "memory" and (arguments.workers or 1) > 1:
+        parser.error("The memory storage engine cannot be shared by several workers.")  # Outputs an error and exits.
+
+    imb.storage_engine = arguments.storage  # Chooses the storage engine.
+    imb.storage_path = arguments.sqlite_path  # Chooses the SQLite file.
+
+    # If a directory was chosen for the change journal,
+    if arguments.journal_directory is not None:
+        imb.journal.set_directory(arguments.journal_directory)  # Moves the journal there (before anything is written).
+
+    # If the summary should be rebuilt,
+    if arguments.rebuild_summary:
+        rebuild_summary()  # Rebuilds the summary (without starting the dashboard).
+
+    # Otherwise,
+    else:
+        start(arguments.fast_start, arguments.workers, arguments.threads, arguments.port)  # Starts the frontend service.
 
 
@@ -0,0 +1,1038 @@
+"""
+    :author:        Jacob Whetham
+    :version:       1.0.0, 04 JAN 2024
+    :desc:          This file handles the asynchronous backend of the Inventory Management System (MongoDB with asyncio).
+                    It has the same functions as the synchronous backend, but every function that talks to the
+                    database is a coroutine, so one process can serve many requests while they wait on MongoDB.
+"""
+
+# Imports
+import asyncio          # Allows for running database calls at the same time.
+import collections      # Allows for keeping the sessions in the order they were last used.
+import contextvars      # Allows for tracking the session of the task being served.
+import threading        # Allows for locking shared state.
+import time             # Allows for timing operations (throughput counters).
+import pymongo          # Allows for the use of MongoDB (AsyncMongoClient requires PyMongo 4.9 or newer).
+import inventory_management_backend as imb  # Allows for sharing the query translation, cache and settings.
+import inventory_management_cache as imc    # Allows for finding the fields an update changes.
+import inventory_management_metrics as imm  # Allows for timing and counting operations.
+
+# Declare global variables.
+client_pool = {}                                # The shared AsyncMongoClients, keyed by their credentials.
+client_pool_lock = threading.Lock()             # Prevents two threads from changing the client pool at once.
+sessions = collections.OrderedDict()            # The session of every browser tab, keyed by its token.
+sessions_lock = threading.Lock()                # Prevents two threads from changing the sessions at once.
+reserved_product_ids = iter(())                 # The product IDs reserved by this process but not yet used.
+product_id_lock = threading.Lock()              # Prevents two tasks from using the same reserved product ID.
+default_session = imb.Session()                 # The session used when a task has not chosen one.
+current_session = contextvars.ContextVar("current_async_session", default=default_session)  # The session of the task.
+
+
+def get_session() -> imb.Session:
+    """
+        Gets the session of the task being served.
+
+        :return Session:    The session chosen with use_session(), or the default session.
+    """
+
+    return current_session.get()  # Returns the session of the task.
+
+
+def use_session(token : str) -> imb.Session:
+    """
+        Chooses the session used by every function of this backend for the rest of the task.
+
+        :param token:       The token of the session. An unknown token gets a logged out session that is only kept
+                            once it logs in (see login()).
+        :return Session:    The chosen session.
+    """
+
+    # If no token was given,
+    if token is None:
+        current_session.set(default_session)  # Uses the default session.
+        return default_session  # Returns the default session.
+
+    # Only one thread may change the sessions at a time.
+    with sessions_lock:
+        session = sessions.get(token)  # Gets the session of the token.
+
+        # If the token has a session,
+        if session is not None:
+            imb.keep_session(sessions, session)  # Marks it as used (and forgets the sessions idle for too long).
+
+        # Otherwise,
+        else:
+            session = imb.Session(token)  # Creates a session for the task.
+
+    current_session.set(session)  # Uses the session for the rest of the task.
+    return session  # Returns the session.
+
+
+def is_logged_in() -> bool:
+    """
+        Gets whether the session of the task is logged in.
+
+        :return bool:       Whether the session holds a connection to the AsyncMongoClient.
+    """
+
+    return get_session().logged_in  # Returns the login status of the session.
+
+
+async def get_client(username : str, password : str) -> pymongo.AsyncMongoClient:
+    """
+        Gets the shared AsyncMongoClient for a set of credentials, forging it the first time they are used.
+
+        :param username:                The username to use in forging the connection.
+        :param password:                The password to use in forging the connection.
+        :return AsyncMongoClient:       The shared AsyncMongoClient (an error is raised if the credentials are invalid).
+    """
+
+    key = imb.get_client_key(username, password)  # Identifies the credentials.
+
+    # Only one thread may change the client pool at a time.
+    with client_pool_lock:
+        client = client_pool.get(key)  # Gets the AsyncMongoClient of the credentials.
+
+    # If the credentials have already been used,
+    if client is not None:
+        return client  # Returns the shared AsyncMongoClient.
+
+    # Forges the connection to the AsyncMongoClient with the same pool settings as the synchronous backend.
+    client = pymongo.AsyncMongoClient(host=imb.host, port=imb.port, username=username, password=password,
+                                      serverSelectionTimeoutMS=imb.server_selection_timeout_ms,
+                                      maxPoolSize=imb.max_pool_size, minPoolSize=imb.min_pool_size,
+                                      maxIdleTimeMS=imb.max_idle_time_ms)
+
+    # Makes an attempt,
+    try:
+        await client.server_info()  # Gets info from the server (throws an error if the connection could not be forged).
+
+    # If an error occurred,
+    except Exception:
+        await client.close()  # Closes the connection to the AsyncMongoClient (it is not shared).
+        raise  # Passes the error on (the login failed).
+
+    # Only one thread may change the client pool at a time.
+    with client_pool_lock:
+        shared = client_pool.setdefault(key, client)  # Shares the AsyncMongoClient (unless another task already did).
+
+    # If another task forged an AsyncMongoClient for the same credentials in the meantime,
+    if shared is not client:
+        await client.close()  # Closes the extra connection.
+
+    return shared  # Returns the shared AsyncMongoClient.
+
+
+async def close_client_pool():
+    """
+        Closes every shared AsyncMongoClient (e.g. when the server shuts down).
+    """
+
+    # Only one thread may change the client pool at a time.
+    with client_pool_lock:
+        clients = list(client_pool.values())  # Gets every shared AsyncMongoClient.
+        client_pool.clear()  # Empties the pool.
+
+    # For every shared AsyncMongoClient,
+    for client in clients:
+        await client.close()  # Closes the connection to the AsyncMongoClient.
+
+
+@imm.instrument("login", "async_backend", is_failure=lambda result: not get_session().logged_in)
+async def login(username, password):
+    """
+        Forges the connection to the AsyncMongoClient for the session of the task.
+
+        :param username:        The username to use in forging the connection.
+        :param password:        The password to use in forging the connection.
+    """
+
+    session = get_session()  # Gets the session of the task.
+
+    # Makes an attempt,
+    try:
+        session.client = await get_client(username, password)  # Gets the shared connection to the AsyncMongoClient.
+        session.database = session.client[imb.target_db]  # Gets a reference to the target database.
+        session.collection = session.database[imb.target_collection]  # Gets a reference to the target collection.
+        session.username = username  # Remembers who is logged in.
+        session.logged_in = True  # Updates the login status (login succeeded).
+
+    # If an error occurred,
+    except Exception:
+        session.logged_in = False  # Updates the login status (login failed).
+        return  # Exits the function.
+
+    # If the session has a token,
+    if session.token is not None:
+        # Only one thread may change the sessions at a time.
+        with sessions_lock:
+            imb.keep_session(sessions, session)  # Keeps the session.
+
+
+async def logout():
+    """
+        Releases the connection to the AsyncMongoClient held by the session of the task.
+    """
+
+    session = get_session()  # Gets the session of the task.
+
+    # If the session has a token,
+    if session.token is not None:
+        # Only one thread may change the sessions at a time.
+        with sessions_lock:
+            sessions.pop(session.token, None)  # Forgets the session.
+
+    session.client = None  # Releases the shared AsyncMongoClient.
+    session.database = None  # Releases the database.
+    session.collection = None  # Releases the collection.
+    session.logged_in = False  # Updates the login status (logout succeeded).
+
+
+async def seed_product_id_counter() -> int:
+    """
+        Moves the product ID counter past the highest product ID in the collection (never moves it backwards).
+
+        :return int:        The next product ID the counter will hand out.
+    """
+
+    session = get_session()  # Gets the session of the task.
+
+    # Finds the product with the highest product ID (uses the product ID index).
+    highest = await session.collection.find_one({}, {"_id": 0, "product_id": 1},
+                                                sort=[("product_id", pymongo.DESCENDING)])
+    next_id = 0 if highest is None else int(highest["product_id"]) + 1  # Gets the product ID after the highest.
+
+    # Raises the counter to the next product ID.
+    counter = await session.database[imb.target_counter_collection].find_one_and_update(
+        {"_id": "product_id"}, {"$max": {"next": next_id}}, upsert=True, return_document=pymongo.ReturnDocument.AFTER)
+
+    return counter["next"]  # Returns the next product ID.
+
+
+async def adjust_summary(previous : dict, document : dict):
+    """
+        Adjusts the summary document by the change of a single product (one atomic $inc).
+
+        :param previous:    The product before the change (None if it was created).
+        :param document:    The product after the change (None if it was deleted).
+    """
+
+    delta = imb.get_summary_delta(previous, document)  # Gets how much the summary changes.
+
+    # If the summary does not change,
+    if not delta:
+        return  # Exits the function (there is nothing to write).
+
+    # Makes an attempt,
+    try:
+        # Adjusts the summary (a missing summary is left missing and rebuilt when it is next read).
+        await get_session().database[imb.target_counter_collection].update_one({"_id": imb.summary_id},
+                                                                               imb.get_summary_update(delta))
+
+    # If an error occurred,
+    except Exception:
+        print("The summary could not be adjusted!")  # Outputs an error.
+
+
+async def rebuild_summary() -> dict:
+    """
+        Recalculates the summary document from every product and stores it if no write adjusted it meanwhile, and
+            requests another rebuild if the stored summary did not match (see imb.rebuild_summary()).
+
+        :return dict:       The stored summary before the rebuild ("stored", None if there was none), the
+                            recalculated summary ("summary"), whether they matched ("consistent") and whether the
+                            summary was stored ("written").
+    """
+
+    session = get_session()  # Gets the session of the task.
+    counters = session.database[imb.target_counter_collection]  # Gets the collection holding the summary.
+    first = None  # Holds the summary read by the first attempt.
+    imb.summary_rebuild_due = False  # The writes made so far are included in the rebuild.
+    imb.summary_rebuilt = time.monotonic()  # Remembers when the summary was rebuilt.
+
+    # For every attempt,
+    for attempt in range(imb.summary_rebuild_attempts):
+        stored = await counters.find_one({"_id": imb.summary_id}, {"_id": 0})  # Gets the summary before the rebuild.
+        first = stored if attempt == 0 else first  # Remembers the summary the rebuild started from.
+        cursor = await session.collection.aggregate(imb.get_summary_pipeline())  # Calculates the summary on the server.
+        results = await cursor.to_list()  # Gets the summary.
+        summary = results[0] if results else imb.get_summary_values(None)  # Gets the summary (empty without products).
+        summary["reorder_point"] = imb.reorder_point  # Stores the reorder point the summary was calculated with.
+        version = {"version": (stored or {}).get("version", 0) + 1}  # Gives the summary a new version.
+
+        # If there is no summary yet,
+        if stored is None:
+            # Makes an attempt,
+            try:
+                await counters.insert_one({"_id": imb.summary_id, **summary, **version})  # Stores the summary.
+                written = True
+
+            # If another process stored a summary at the same time,
+            except pymongo.errors.DuplicateKeyError:
+                written = False
+
+        # Otherwise (the summary is replaced if no write adjusted it since it was read),
+        else:
+            replaced = await counters.replace_one(imb.get_summary_version_query(stored), {**summary, **version})
+            written = replaced.matched_count == 1
+
+        # If the summary was stored,
+        if written:
+            break  # Stops trying.
+
+    # If the stored summary was replaced with a different one (a write may have been counted twice),
+    if written and not imb.check_summary(stored, summary):
+        imb.request_summary_rebuild()  # Checks the summary again when it is next read.
+
+    # Returns the result of the rebuild.
+    return {"stored": first, "summary": summary, "consistent": imb.check_summary(first, summary), "written": written}
+
+
+async def get_summary() -> dict:
+    """
+        Gets the summary of the inventory (a single document read, no matter how many products there are).
+
+        :return dict:       The summary (see inventory_management_backend.get_summary()), or None if it could not
+                            be read.
+    """
+
+    session = get_session()  # Gets the session of the task.
+
+    # If the user is not logged in,
+    if not session.logged_in:
+        print("Login first!")  # Outputs an error.
+        return None  # Returns nothing (the user should not be able to read data unless they are logged in).
+
+    # The below code only runs if the user is logged in.
+
+    # Makes an attempt,
+    try:
+        summary = await session.database[imb.target_counter_collection].find_one({"_id": imb.summary_id},
+                                                                                 {"_id": 0, "version": 0})
+
+        # If the summary does not exist yet, was calculated with another reorder point or is due a deferred rebuild,
+        if summary is None or summary.get("reorder_point") != imb.reorder_point or imb.is_summary_rebuild_due():
+            summary = (await rebuild_summary())["summary"]  # Calculates the summary.
+
+    # If an error occurred,
+    except Exception:
+        print("The summary could not be read!")  # Outputs an error.
+        return None  # Returns nothing (the summary could not be read).
+
+    return summary  # Returns the summary.
+
+
+async def allocate_product_ids(count : int =1) -> range:
+    """
+        Reserves a block of consecutive product IDs with one atomic update of the counter document.
+
+        :param count:       The number of product IDs to reserve.
+        :return range:      The reserved product IDs.
+    """
+
+    counters = get_session().database[imb.target_counter_collection]  # Gets the collection holding the counter.
+
+    # If the counter does not exist yet,
+    if await counters.find_one({"_id": "product_id"}) is None:
+        await seed_product_id_counter()  # Starts the counter after the highest product ID in use.
+
+    # Moves the counter forward by the number of product IDs and gets its value after the move.
+    counter = await counters.find_one_and_update({"_id": "product_id"}, {"$inc": {"next": count}}, upsert=True,
+                                                 return_document=pymongo.ReturnDocument.AFTER)
+
+    return range(counter["next"] - count, counter["next"])  # Returns the reserved product IDs.
+
+
+async def next_product_id() -> int:
+    """
+        Gets an unused product ID, reserving a new block of imb.product_id_block_size IDs when this process runs out.
+
+        :return int:        The product ID.
+    """
+
+    # Declare which variables use the global scope.
+    global reserved_product_ids
+
+    # Only one task may take from the reserved product IDs at a time.
+    with product_id_lock:
+        product_id = next(reserved_product_ids, None)  # Takes the next reserved product ID.
+
+    # If there are no reserved product IDs left,
+    if product_id is None:
+        block = await allocate_product_ids(imb.product_id_block_size)  # Reserves a new block.
+        product_id = block[0]  # Takes the first product ID of the block.
+
+        # Only one task may change the reserved product IDs at a time.
+        with product_id_lock:
+            reserved_product_ids = iter(block[1:])  # Keeps the rest of the block (a replaced block is skipped, never reused).
+
+    return product_id  # Returns the product ID.
+
+
+def record_change(change_type : str, document : dict, fields : set =None, product_ids : list =None,
+                  documents : list =None):
+    """
+        Tells the dashboards about a written product and records it in the change journal.
+
+        :param change_type:     The type of the change ("insert", "update" or "delete").
+        :param document:        The product (after the write, or before it if it was deleted).
+        :param fields:          The fields an update changed (None if unknown).
+        :param product_ids:     The product IDs the write selected (None records the document as it is).
+        :param documents:       The products as they are after the write (see imb.journal_products()).
+    """
+
+    imb.change_feed.record_local(change_type, document, fields)  # Tells the dashboards about the change.
+
+    # If the products the write selected were given,
+    if product_ids is not None:
+        imb.journal_products(product_ids, documents)  # Records them (a product that is gone is a deletion).
+
+    # Otherwise,
+    else:
+        imb.journal.record_products([document])  # Records the product.
+
+
+async def record_write(change_type : str, document : dict, fields : set =None, product_ids : list =None,
+                       documents : list =None):
+    """
+        Runs record_change() in a worker thread. The change feed may write the counter shared between workers and
+            the journal may write a segment to disk, so neither is called on the event loop.
+
+        :param change_type:     The type of the change ("insert", "update" or "delete").
+        :param document:        The product (after the write, or before it if it was deleted).
+        :param fields:          The fields an update changed (None if unknown).
+        :param product_ids:     The product IDs the write selected (None records the document as it is).
+        :param documents:       The products as they are after the write (see imb.journal_products()).
+    """
+
+    await asyncio.to_thread(record_change, change_type, document, fields, product_ids, documents)  # Records it.
+
+
+def record_batch(product_ids : list, documents : list):
+    """
+        Records the products changed by a batch of bulk write operations in the change journal (called in a worker
+            thread, see record_write()).
+
+        :param product_ids:     The product IDs the batch selected.
+        :param documents:       The products as they are after the batch (a product that is gone was deleted).
+    """
+
+    imb.journal_products(product_ids, documents)  # Records the products.
+
+
+@imm.instrument("create", "async_backend", is_failure=lambda document: document is None)
+async def create(data : dict ={}) -> dict:
+    """
+        Creates a new entry in the database.
+
+        :param data:    The data to be used in creating the new entry. If it has no "product_id", one is allocated.
+        :return dict:   The document that was created (without the "_id" field), or None if the insertion failed.
+    """
+
+    # Declare which variables use the global scope.
+    global reserved_product_ids
+
+    session = get_session()  # Gets the session of the task.
+
+    # If the user is not logged in,
+    if not session.logged_in:
+        print("Login first!")  # Output an error
+        return None  # Exit the function (the user should not be able to create entries if they aren't logged in).
+
+    # The below code only runs if the user is logged in.
+
+    document = dict(data)  # Copies the data (inserting adds an "_id" field to the dictionary it is given).
+    allocate_id = "product_id" not in document  # Whether the product ID should be allocated by the server.
+
+    # Makes an attempt,
+    try:
+        # If no product ID was given,
+        if allocate_id:
+            document["product_id"] = await next_product_id()  # Allocates a product ID no other request can receive.
+
+        await session.collection.insert_one(document)  # Creates a new document in the collection.
+
+    # If the product ID is already in use,
+    except pymongo.errors.DuplicateKeyError:
+        # If the product ID was not allocated by the server,
+        if not allocate_id:
+            print("The product ID is already in use.")  # Outputs an error.
+            return None  # Returns nothing (no document was created).
+
+        # The counter fell behind the collection (e.g. products were imported with their own IDs).
+
+        # Makes an attempt,
+        try:
+            await seed_product_id_counter()  # Moves the counter past the highest product ID in use.
+
+            # Only one task may change the reserved product IDs at a time.
+            with product_id_lock:
+                reserved_product_ids = iter(())  # Forgets the product IDs reserved before the counter was moved.
+
+            document.pop("_id", None)  # Removes the "_id" field from the failed insertion.
+            document["product_id"] = await next_product_id()  # Allocates a new product ID.
+            await session.collection.insert_one(document)  # Creates a new document in the collection.
+
+        # If an error occurred,
+        except Exception:
+            print("The insertion failed.")  # Outputs an error.
+            return None  # Returns nothing (no document was created).
+
+    # If an error occurred,
+    except Exception:
+        print("The insertion failed.")  # Outputs an error.
+        return None  # Returns nothing (no document was created).
+
+    document.pop("_id", None)  # Removes the "_id" field (the table does not show it).
+    imb.query_cache.invalidate(document, inserted_or_deleted=True)  # Removes the cached pages the new document belongs on.
+    await record_write("insert", document)  # Tells the dashboards and records the new document in the change journal.
+    await adjust_summary(None, document)  # Adds the new document to the summary.
+    return document  # Returns the document that was created.
+
+
+def read(query : dict ={}, projection : dict =None, batch_size : int =0) -> pymongo.CursorType:
+    """
+        Reads data from the collection (iterate the cursor with "async for" or call "await cursor.to_list()").
+
+        :param query:               The dictionary to be used to find the matching documents.
+        :param projection:          The fields to return (e.g. imb.table_projection). If None, every field is returned.
+        :param batch_size:          The number of documents fetched in each round-trip (0 uses the server default).
+        :return CursorType:         The cursor (AsyncCursor) of the search.
+    """
+
+    session = get_session()  # Gets the session of the task.
+
+    # If the user is not logged in,
+    if not session.logged_in:
+        print("Login first!")  # Outputs an error.
+        return None  # Returns nothing (the user should not be able to retrieve data unless they are logged in).
+
+    # The below code only runs if the user is logged in.
+
+    return session.collection.find(query, projection, batch_size=batch_size)  # Returns the results of the search.
+
+
+async def stream_batches(query : dict ={}, projection : dict =None, batch_size : int =None,
+                         resume_token : str =None):
+    """
+        Reads the documents matching a query in batches, walking the collection in product ID order (iterate it
+            with "async for", see imb.stream_batches()).
+
+        :param query:               The dictionary used to find the matching documents.
+        :param projection:          The fields to return. If None, every field except "_id" is returned.
+        :param batch_size:          The number of products read in each batch (imb.stream_batch_size if None).
+        :param resume_token:        The token of a previous read to resume, or None to start from the beginning.
+        :return async generator:    An asynchronous generator of (products, resume token) pairs.
+    """
+
+    session = get_session()  # Gets the session of the task.
+
+    # If the user is not logged in,
+    if not session.logged_in:
+        print("Login first!")  # Outputs an error.
+        return  # Returns nothing (the user should not be able to retrieve data unless they are logged in).
+
+    # The below code only runs if the user is logged in.
+
+    batch_size = batch_size or imb.stream_batch_size  # Uses the default batch size if none was given.
+    after = imb.parse_resume_token(query, resume_token)  # Gets the product the read starts after.
+    projection, remove_key = imb.get_keyset_projection(projection)  # Gets the projection returning the product ID.
+
+    # Until every product was read,
+    while True:
+        # Reads the next batch with a short query of its own (no cursor is kept open between batches).
+        cursor = session.collection.find(imb.get_keyset_query(query, after), projection, batch_size=batch_size)
+        documents = await cursor.sort([("product_id", pymongo.ASCENDING)]).limit(batch_size).to_list(None)
+
+        # If there are no more products,
+        if not documents:
+            return  # Exits the function.
+
+        after = documents[-1]["product_id"]  # Remembers the last product read.
+        token = imb.create_resume_token(query, after)  # Creates the token resuming after the batch.
+
+        # If the caller did not ask for the product ID,
+        if remove_key:
+            # For every product,
+            for document in documents:
+                del document["product_id"]  # Removes the product ID.
+
+        yield documents, token  # Returns the batch and its token.
+
+        # If the batch was not full,
+        if len(documents) < batch_size:
+            return  # Exits the function (there are no more products).
+
+
+async def stream_documents(query : dict ={}, projection : dict =None, batch_size : int =None,
+                           resume_token : str =None):
+    """
+        Reads the documents matching a query one at a time in product ID order (iterate it with "async for").
+
+        :param query:               The dictionary used to find the matching documents.
+        :param projection:          The fields to return. If None, every field except "_id" is returned.
+        :param batch_size:          The number of products read in each batch (imb.stream_batch_size if None).
+        :param resume_token:        The token of a previous read to resume, or None to start from the beginning.
+        :return async generator:    An asynchronous generator of the matching documents.
+    """
+
+    # For every batch,
+    async for documents, token in stream_batches(query, projection, batch_size, resume_token):
+        # For every document,
+        for document in documents:
+            yield document  # Returns the document.
+
+
+@imm.instrument("read_page", "async_backend", count_documents=lambda page: len(page[0]))
+async def read_page(page_current : int =0, page_size : int =25, sort_by : list =None,
+                    filter_query : str ="") -> (list, int):
+    """
+        Reads a single page of data from the collection, filtered and sorted on the server.
+
+        :param page_current:        The index of the page to read.
+        :param page_size:           The number of documents on each page.
+        :param sort_by:             The sort_by property of the DataTable.
+        :param filter_query:        The filter_query property of the DataTable.
+        :return (list, int):        The documents on the page (without the "_id" field).
+                                    The total number of documents matching the filter.
+    """
+
+    session = get_session()  # Gets the session of the task.
+
+    # If the user is not logged in,
+    if not session.logged_in:
+        print("Login first!")  # Outputs an error.
+        return [], 0  # Returns nothing (the user should not be able to retrieve data unless they are logged in).
+
+    # The below code only runs if the user is logged in.
+
+    query = imb.translate_filter_query(filter_query)  # Translates the filter into a MongoDB query.
+    sort = imb.translate_sort_by(sort_by)  # Translates the sorting into a MongoDB sort specification.
+
+    # Creates the key of the page from the normalized query, sort and page (shared with the synchronous backend).
+    key = imb.query_cache.make_key(imb.target_db, imb.target_collection, query, sort, page_current, page_size)
+    cached = imb.query_cache.get(key)  # Gets the page from the cache.
+
+    # If the page is in the cache,
+    if cached is not None:
+        return cached  # Returns the page without reading the database.
+
+    generation = imb.query_cache.get_generation()  # Remembers the generation of the cache before reading.
+
+    # Makes an attempt,
+    try:
+        # Reads only the documents on the requested page.
+        cursor = session.collection.find(query, imb.table_projection, batch_size=page_size).sort(sort) \
+            .skip(page_current * page_size).limit(page_size)
+
+        # Counts the matching documents and reads the page at the same time.
+        total, records = await asyncio.gather(session.collection.count_documents(query), cursor.to_list(length=None))
+
+    # If an error occurred,
+    except Exception:
+        print("The page could not be read!")  # Outputs an error.
+        imm.increment("ims_operation_errors_total", layer="async_backend", operation="read_page")  # Counts the error.
+        return [], 0  # Returns nothing (the page could not be read).
+
+    imb.query_cache.put(key, (records, total), query, sort, records, generation)  # Stores the page in the cache.
+    return records, total  # Returns the page and the total number of matching documents.
+
+
+@imm.instrument("update", "async_backend")
+async def update(query : dict ={}, data : dict ={}) -> dict:
+    """
+        Updates one entry with new data.
+
+        :param query:       A dictionary containing an identifier of the entry to update.
+        :param data:        A dictionary of the new data to apply to the found entry.
+        :return dict:       The updated document (without the "_id" field), or None if nothing was updated.
+    """
+
+    session = get_session()  # Gets the session of the task.
+
+    # If the user is not logged in,
+    if not session.logged_in:
+        print("Login first!")  # Outputs an error.
+        return None  # Exits the function (the user should not be able to update the entries unless they are logged in).
+
+    # The below code only runs if the user is logged in.
+
+    # Makes an attempt,
+    try:
+        # Updates the entry with new data and gets the document as it was before the update (needed for the summary).
+        previous = await session.collection.find_one_and_update(query, data, projection=imb.table_projection,
+                                                                return_document=pymongo.ReturnDocument.BEFORE)
+
+        # If no document was updated,
+        if previous is None:
+            return None  # Returns nothing (no document matched the query).
+
+        # Makes an attempt,
+        try:
+            document = imc.apply_update(previous, data)  # Applies the same update to the document in memory.
+            document = {field: document[field] for field in imb.product_field_types if field in document}
+
+        # If the update cannot be applied in memory,
+        except ValueError:
+            document = await session.collection.find_one({"product_id": previous.get("product_id")},
+                                                          imb.table_projection)
+
+    # If an error occurred,
+    except Exception:
+        print("The document could not be updated!")  # Outputs an error.
+        return None  # Returns nothing (no document was updated).
+
+    imb.query_cache.invalidate(document or previous, imc.get_update_fields(data))  # Removes the cached pages it could change.
+    # Tells the dashboards about the updated document and records it in the change journal.
+    await record_write("update", document or previous, imc.get_update_fields(data), [previous.get("product_id")],
+                       [document] if document else [])
+    await adjust_summary(previous, document)  # Moves the summary from the old document to the new one.
+    return document  # Returns the updated document.
+
+
+@imm.instrument("adjust_quantity", "async_backend", is_failure=lambda document: document is None)
+async def adjust_quantity(product_id : int, delta : int, allow_negative : bool =False) -> dict:
+    """
+        Atomically adds a change to the quantity of a product (see inventory_management_backend.adjust_quantity()).
+
+        :param product_id:      The product ID of the product.
+        :param delta:           The change of its quantity (negative values remove stock).
+        :param allow_negative:  Whether the quantity may go below zero. If False, a decrease larger than the stock is
+                                refused (nothing is changed).
+        :return dict:           The product after the change, or None if the product does not exist, does not have
+                                enough stock or the change is not valid.
+    """
+
+    session = get_session()  # Gets the session of the task.
+
+    # If the user is not logged in,
+    if not session.logged_in:
+        print("Login first!")  # Outputs an error.
+        return None  # Exits the function (the user should not be able to update the entries unless they are logged in).
+
+    # The below code only runs if the user is logged in.
+
+    # Makes an attempt,
+    try:
+        delta = imb.get_quantity_change(delta)  # Checks the change.
+
+        # Adds the change to the quantity (only if the product has enough stock, unless negative stock is allowed).
+        document = await session.collection.find_one_and_update(imb.get_quantity_query(product_id, delta, allow_negative),
+                                                                {"$inc": {"product_quantity": delta}},
+                                                                projection=imb.table_projection,
+                                                                return_document=pymongo.ReturnDocument.AFTER)
+
+    # If an error occurred,
+    except Exception:
+        print("The quantity could not be adjusted!")  # Outputs an error.
+        return None  # Returns nothing (no document was updated).
+
+    # If no product was changed,
+    if document is None:
+        print("The product does not exist or does not have enough stock!")  # Outputs an error.
+        return None  # Returns nothing (no document was updated).
+
+    previous = dict(document, product_quantity=document["product_quantity"] - delta)  # Gets the product before.
+    imb.query_cache.invalidate(document, {"product_quantity"})  # Removes the cached pages it could change.
+    await record_write("update", document, {"product_quantity"})  # Tells the dashboards and records it in the journal.
+    await adjust_summary(previous, document)  # Moves the summary from the old quantity to the new one.
+    return document  # Returns the changed product.
+
+
+@imm.instrument("delete", "async_backend")
+async def delete(query : dict) -> dict:
+    """
+        Deletes an entry from the database.
+
+        :param query:   A dictionary containing an identifier for the document to be deleted.
+        :return dict:   The deleted document (without the "_id" field), or None if nothing was deleted.
+    """
+
+    session = get_session()  # Gets the session of the task.
+
+    # If the user is not logged in,
+    if not session.logged_in:
+        print("Login first!")  # Outputs an error.
+        return None  # Exits the function (the user should not be able to delete documents unless they are logged in).
+
+    # The below code only executes if the user is logged in.
+
+    # If the query is empty,
+    if (query == None or query == {}):
+        print("Specify something to delete!")  # Output an error.
+        return None  # Exits the function (specifying nothing would delete the first entry in the database).
+
+    # The below code only executes if the query is not empty.
+
+    # Makes an attempt,
+    try:
+        # Deletes the entry found with the query.
+        document = await session.collection.find_one_and_delete(query, projection=imb.table_projection)
+
+    # If an error is occurred,
+    except Exception:
+        print("The document could not be deleted!")  # Outputs an error.
+        return None  # Returns nothing (no document was deleted).
+
+    # If a document was deleted,
+    if document is not None:
+        imb.query_cache.invalidate(document, inserted_or_deleted=True)  # Removes the cached pages it belonged on.
+        await record_write("delete", document, None, [document.get("product_id")], [])  # Tells the dashboards.
+        await adjust_summary(document, None)  # Removes the deleted document from the summary.
+
+    return document  # Returns the deleted document (None if no document matched the query).
+
+
+async def write_batch(batch : list, ordered : bool, positions : list) -> dict:
+    """
+        Writes a single batch of operations to the collection with one bulk_write call.
+
+        :param batch:       The pymongo operations to write.
+        :param ordered:     Whether the operations must be applied in order (stopping at the first error).
+        :param positions:   The position of each operation of the batch within the whole stream.
+        :return dict:       The counts, errors and duration of the batch.
+    """
+
+    written = None  # Holds the result of the call.
+    error = None  # Holds the error raised by the call.
+    start = time.perf_counter()  # Records when the batch started.
+
+    # Makes an attempt,
+    try:
+        written = await get_session().collection.bulk_write(batch, ordered=ordered)  # Writes every operation in one round-trip.
+
+    # If an error occurred,
+    except Exception as caught:
+        error = caught  # Stores the error.
+
+    seconds = time.perf_counter() - start  # Records how long the batch took.
+    return imb.get_batch_result(positions, written, error, seconds)  # Returns the result of the batch.
+
+
+async def read_batch_products(product_ids : list) -> dict:
+    """
+        Reads the products a batch of bulk write operations selects (see imb.read_batch_products()).
+
+        :param product_ids: The product IDs (see imb.get_journal_product_ids()).
+        :return dict:       The products, keyed by product ID, or None if they could not be read.
+    """
+
+    # If no products are selected,
+    if not product_ids:
+        return {}  # Returns no products.
+
+    # Makes an attempt,
+    try:
+        # Reads the products.
+        cursor = get_session().collection.find({"product_id": {"$in": product_ids}}, imb.table_projection)
+        return {document.get("product_id"): document for document in await cursor.to_list(None)}
+
+    # If an error occurred,
+    except Exception:
+        return None  # Returns nothing (the products are not known).
+
+
+async def write_summarized_batch(batch : list, ordered : bool, positions : list) -> (dict, bool):
+    """
+        Writes a single batch of operations, records it in the change journal and adjusts the summary by the products
+            it changed (see imb.write_summarized_batch()).
+
+        :param batch:       The pymongo operations to write.
+        :param ordered:     Whether the operations must be applied in order (stopping at the first error).
+        :param positions:   The position of each operation of the batch within the whole stream.
+        :return (dict,
+                 bool):     The counts, errors and duration of the batch.
+                            Whether the summary was adjusted (otherwise it must be rebuilt).
+    """
+
+    product_ids, unknown = imb.get_journal_product_ids(batch)  # Gets the products the batch can change.
+    before = None if unknown else await read_batch_products(product_ids)  # Reads them before the batch.
+    selected = await read_journal_selection(unknown)  # Reads the products the other operations select.
+    batch_result = await write_batch(batch, ordered, positions)  # Writes the batch.
+    after = await read_batch_products(product_ids)  # Reads the products after the batch.
+
+    # If the products after the batch are known and every operation selects products by product ID,
+    if after is not None and not unknown:
+        await asyncio.to_thread(record_batch, product_ids, list(after.values()))  # Records them.
+
+    # Otherwise,
+    else:
+        await journal_batch(batch, selected)  # Reads and records every product the batch can have changed.
+
+    changes = imb.get_summary_changes(product_ids, before, after, batch_result)  # Gets the changes the batch made.
+
+    # If the changes are not known,
+    if changes is None:
+        return batch_result, False  # Returns that the summary must be rebuilt.
+
+    delta = imb.get_summary_delta_many(changes)  # Gets how much the summary changes.
+
+    # If the summary changes,
+    if delta:
+        # Makes an attempt,
+        try:
+            # Adjusts the summary (a missing summary is left missing and rebuilt when it is next read).
+            await get_session().database[imb.target_counter_collection].update_one({"_id": imb.summary_id},
+                                                                                   imb.get_summary_update(delta))
+
+        # If an error occurred,
+        except Exception:
+            print("The summary could not be adjusted!")  # Outputs an error.
+
+    return batch_result, True  # Returns that the summary was adjusted.
+
+
+async def read_journal_selection(unknown : list) -> list:
+    """
+        Reads the product IDs the operations not selecting products by product ID select before they are written (see
+            imb.read_journal_selection()).
+
+        :param unknown:     The operations that do not select products by product ID.
+        :return list:       The product IDs (empty if writes are not recorded or the products could not be read).
+    """
+
+    query = imb.get_journal_query([], unknown)  # Gets the query of the operations.
+
+    # If writes are not recorded or the operations select no products,
+    if not imb.journal.enabled or query is None:
+        return []  # Returns nothing (nothing has to be read).
+
+    # Makes an attempt,
+    try:
+        # Returns the product IDs.
+        cursor = get_session().collection.find(query, {"_id": 0, "product_id": 1})
+        return [document["product_id"] for document in await cursor.to_list(None) if "product_id" in document]
+
+    # If an error occurred,
+    except Exception:
+        print("The products selected by the bulk write could not be read for the change journal!")  # Outputs an error.
+        imm.increment("ims_operation_errors_total", layer="async_backend", operation="journal_batch")  # Counts it.
+        return []  # Returns nothing (products deleted by the operations are not recorded).
+
+
+async def journal_batch(batch : list, selected : list =()):
+    """
+        Records the products changed by a batch of bulk write operations in the change journal (see
+            imb.journal_batch()).
+
+        :param batch:       The pymongo operations that were written.
+        :param selected:    The product IDs the other operations selected before the batch (see
+                            read_journal_selection()).
+    """
+
+    # If writes are not recorded,
+    if not imb.journal.enabled:
+        return  # Exits the function (the products are not read back).
+
+    product_ids, unknown = imb.get_journal_product_ids(batch)  # Gets the products the batch can change.
+    product_ids = list(dict.fromkeys([*product_ids, *selected]))  # Adds the products the other operations selected.
+    query = imb.get_journal_query(product_ids, unknown)  # Gets the query finding every product the batch can change.
+
+    # Makes an attempt,
+    try:
+        documents = []  # Holds the products as they are after the batch.
+
+        # If the batch can have changed products,
+        if query is not None:
+            documents = await get_session().collection.find(query, imb.table_projection).to_list(None)  # Reads them.
+
+    # If an error occurred,
+    except Exception:
+        print("The written products could not be recorded in the change journal!")  # Outputs an error.
+        imm.increment("ims_operation_errors_total", layer="async_backend", operation="journal_batch")  # Counts it.
+        return  # Exits the function.
+
+    # Records the products (a document without a product ID cannot be replayed, so it is not recorded).
+    await asyncio.to_thread(record_batch, product_ids, [document for document in documents if "product_id" in document])
+
+
+@imm.instrument("bulk_write", "async_backend", count_documents=lambda results: results["operations"],
+                is_failure=lambda results: len(results["errors"]) > 0)
+async def bulk_write(operations, batch_size : int =1000, ordered : bool =False) -> dict:
+    """
+        Applies a stream of insert/update/replace/delete operations in batched bulk_write calls.
+
+        :param operations:      An iterable or asynchronous iterable of operations (see imb.build_bulk_operation()).
+        :param batch_size:      The maximum number of operations sent in each bulk_write call.
+        :param ordered:         Whether the operations must be applied in order (stopping at the first error).
+        :return dict:           The result of every batch, the totals, every error and the throughput.
+    """
+
+    session = get_session()  # Gets the session of the task.
+
+    # If the user is not logged in,
+    if not session.logged_in:
+        print("Login first!")  # Outputs an error.
+        return None  # Exits the function (the user should not be able to write data unless they are logged in).
+
+    # The below code only runs if the user is logged in.
+
+    # If the operations are a normal iterable,
+    if not hasattr(operations, "__aiter__"):
+        operations = iterate_async(operations)  # Reads them through an asynchronous iterable.
+
+    results = imb.create_bulk_results()  # Holds the whole result.
+    batch = []  # Holds the operations of the current batch.
+    positions = []  # Holds the position of each operation of the current batch within the stream.
+    index = 0  # Holds the position of the current operation within the stream.
+    summarized = True  # Whether the summary was adjusted by every batch.
+    start = time.perf_counter()  # Records when the writes started.
+
+    # For every operation in the stream,
+    async for operation in operations:
+        # Makes an attempt,
+        try:
+            batch.append(imb.build_bulk_operation(operation))  # Adds the operation to the current batch.
+            positions.append(index)  # Remembers where the operation is within the stream.
+
+        # If the operation is not valid,
+        except (AttributeError, KeyError, TypeError, ValueError) as error:
+            results["errors"].append({"index": index, "code": None, "message": str(error)})  # Stores the error.
+
+            # If the writes are ordered,
+            if ordered:
+                break  # Stops at the invalid operation (after writing the operations before it).
+
+            index += 1  # Moves to the next position.
+            continue  # Skips the operation (unordered writes continue past errors).
+
+        index += 1  # Moves to the next position.
+
+        # If the batch is full,
+        if len(batch) >= batch_size:
+            batch_result, adjusted = await write_summarized_batch(batch, ordered, positions)  # Writes the batch.
+            results["batches"].append(batch_result)  # Stores the result of the batch.
+            summarized = summarized and adjusted  # Remembers whether the summary must be rebuilt.
+            batch = []  # Starts a new batch.
+            positions = []  # Starts the positions of the new batch.
+
+            # If the writes are ordered and the batch failed,
+            if ordered and batch_result["errors"]:
+                break  # Stops writing (ordered writes stop at the first error).
+
+    # If there are operations left in the last batch,
+    if batch:
+        batch_result, adjusted = await write_summarized_batch(batch, ordered, positions)  # Writes the last batch.
+        results["batches"].append(batch_result)  # Stores the result of the batch.
+        summarized = summarized and adjusted  # Remembers whether the summary must be rebuilt.
+
+    results = await asyncio.to_thread(imb.finish_bulk_results, results, start)  # Adds up the totals of every batch.
+
+    # If a batch changed products that are not known exactly,
+    if not summarized:
+        await rebuild_summary()  # Recalculates the summary.
+
+    return results  # Returns the whole result with its totals.
+
+
+async def iterate_async(iterable):
+    """
+        Reads a normal iterable through an asynchronous iterable.
+
+        :param iterable:        The iterable to read.
+        :return generator:      An asynchronous generator of the items.
+    """
+
+    # For every item in the iterable,
+    for item in iterable:
+        yield item  # Yields the item.
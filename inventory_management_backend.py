@@ -5,163 +5,3239 @@
 """
 
 # Imports
-import pandas       # Allows for Pandas functionality e.g. creating DataFrames.
+import atexit       # Allows for writing the change journal when the process exits.
+import base64       # Allows for storing the position of a streaming read as text (resume tokens).
+import collections  # Allows for keeping the sessions in the order they were last used.
+import contextvars  # Allows for tracking the session of the request being served.
+import csv          # Allows for reading and writing CSV files.
+import hashlib      # Allows for hashing passwords (connection pool keys).
+import json         # Allows for reading and writing JSON Lines files.
+import math         # Allows for math functionality e.g. rounding up the page count.
+import re           # Allows for regular expressions (filter translation).
+import secrets      # Allows for creating session tokens.
+import threading    # Allows for locking shared state between the threads serving requests.
+import time         # Allows for timing operations (throughput counters).
+import typing       # Allows for naming Pandas types without importing Pandas (see get_pandas()).
+import numpy        # Allows for typed column arrays.
 import pymongo      # Allows for the use of MongoDB.
+import inventory_management_buffer as imbf # Allows for adding up stock movements before writing them.
+import inventory_management_cache as imc    # Allows for caching query results.
+import inventory_management_changes as imch # Allows for telling dashboards about recent changes.
+import inventory_management_journal as imj  # Allows for keeping an append-only history of every write.
+import inventory_management_metrics as imm  # Allows for timing and counting operations.
+import inventory_management_search as imsr   # Allows for searching product names with an in-process index.
+import inventory_management_sessions as imse # Allows for sharing the login state of every session between workers.
+import inventory_management_snapshot as imsn # Allows for serving pages from an in-process columnar snapshot.
+import inventory_management_storage as ims  # Allows for storing the inventory without a MongoDB server.
+
+# If the types are being checked (Pandas is only imported the first time a DataFrame is needed),
+if typing.TYPE_CHECKING:
+    import pandas   # Allows for annotating DataFrames.
 
 # Declare global variables.
-client : pymongo.MongoClient = None                         # The reference to the MongoClient connection.
-database = None                                             # The database to be used.
-collection = None                                           # The collection to be used in the database.
-logged_in = False                                           # Whether a connection is held to the MongoClient.
+host = "localhost"                                          # The host of the MongoDB server.
+port = 27017                                                # The port of the MongoDB server.
+storage_engine = "mongo"                                    # Where the inventory is stored ("mongo", "memory" or "sqlite").
+storage_path = "inventory_management.sqlite3"               # The SQLite file (or the name of the in-memory store).
+storage_users = {}                                          # The password of every user of a local storage engine.
+max_pool_size = 100                                         # The most connections each pooled MongoClient may open.
+min_pool_size = 0                                           # The connections each pooled MongoClient keeps open when idle.
+max_idle_time_ms = 300000                                   # How long an unused pooled connection is kept open.
+server_selection_timeout_ms = 1                             # How long to wait for the server when forging a connection.
+client_pool = {}                                            # The shared MongoClients, keyed by their credentials.
+client_pool_lock = threading.Lock()                         # Prevents two threads from changing the client pool at once.
+sessions = collections.OrderedDict()                        # The connections of every browser tab in this process.
+sessions_lock = threading.Lock()                            # Prevents two threads from changing the sessions at once.
+session_idle_seconds = 1800.0                               # How long an unused session is kept in this process.
+max_sessions = 10000                                        # The most sessions kept in this process.
+session_store = imse.SessionStore()                         # The login state of every browser tab (see use_session()).
+session_secret = secrets.token_bytes(32)                    # The key sealing the passwords in the session store.
+shared_storage = False                                      # Whether other processes (workers) write to the collection.
+query_cache = imc.QueryCache()                              # The results of recent page reads (shared by every session).
+change_feed = imch.ChangeFeed()                             # The recent changes to the collection (shared by every session).
+snapshot = imsn.InventorySnapshot()                         # Every product held as typed columns (shared by every session).
+snapshot_enabled = True                                     # Whether pages of the table are served from the snapshot.
+search_index = imsr.SearchIndex()                           # The words of every product name (shared by every session).
+search_enabled = True                                       # Whether searches are served from the search index.
+quantity_buffer = imbf.QuantityBuffer(lambda key, deltas: flush_quantity_buffer(key, deltas))  # The unwritten movements.
+quantity_buffer_sessions = {}                               # The session writing the movements of each login.
+journal = imj.ChangeJournal(imj.get_default_directory(),
+                            snapshot_function=lambda: read_journal_snapshot())  # The history of every write.
+journal_target = None                                       # The collection the journal snapshots are read from.
+change_watcher = None                                       # The thread watching the change stream of the collection.
+change_watcher_stop = threading.Event()                     # Tells the change watcher to stop.
+change_watcher_lock = threading.Lock()                      # Prevents two threads from starting a change watcher at once.
+change_watcher_wait_ms = 1000                               # How long the change watcher waits on the server for changes.
+change_watcher_retry_seconds = 1.0                          # How long to wait before reopening a lost change stream.
+change_watcher_max_retry_seconds = 60.0                     # The longest wait before reopening a lost change stream.
+change_stream_unsupported_codes = (40573, None)             # The errors of servers without change streams.
+change_stream_lost_codes = (280, 286)                       # The errors of streams that cannot resume.
 target_db = "inventory_management_db"                       # The database to use.
 target_collection = "inventory_management_collection"       # The collection to use.
+target_counter_collection = "inventory_management_counters" # The collection holding the product ID counter.
+product_id_block_size = 1                                   # The number of product IDs reserved from the counter at once.
+reserved_product_ids = iter(())                             # The product IDs reserved by this process but not yet used.
+product_id_lock = threading.Lock()                          # Prevents two threads from using the same reserved product ID.
+summary_id = "inventory_summary"                            # The "_id" of the summary document in the counter collection.
+summary_rebuild_attempts = 5                                # How many times a rebuild is stored before giving up.
+summary_rebuild_interval_seconds = 60.0                     # The shortest time between two deferred summary rebuilds.
+summary_rebuild_due = False                                 # Whether a write may have left the summary inexact.
+summary_rebuilt = None                                      # When the summary was last rebuilt (None if never).
+reorder_point = 10                                          # A product below this quantity is counted as low on stock.
+stream_batch_size = 1000                                    # The number of products read in each batch of a streaming read.
+
+# The fields of every product and the DataTable column type used to display them.
+product_field_types = {"product_id": "numeric",
+                       "product_name": "text",
+                       "product_price": "numeric",
+                       "product_quantity": "numeric"}
+
+# The typed array dtype of every product field (used when reading documents into columns).
+product_field_dtypes = {"product_id": "int64",
+                        "product_name": "object",
+                        "product_price": "float64",
+                        "product_quantity": "int64"}
+
+# The projection of the fields shown in the table (other fields, including "_id", are never sent over the wire).
+table_projection = {"_id": 0, **{field: 1 for field in product_field_types}}
+
+# The product fields the reports may be grouped by (product_id and product_name would make a group of every product).
+report_group_fields = ["product_price", "product_quantity"]
+
+# The fields given a secondary index by ensure_indexes() (each is paired with the product ID for stable sorting).
+secondary_index_fields = ["product_name", "product_price", "product_quantity"]
+
+# The value of a single product (its price times its quantity, treating missing fields as 0) in aggregation pipelines.
+product_value_expression = {"$multiply": [{"$ifNull": ["$product_price", 0]}, {"$ifNull": ["$product_quantity", 0]}]}
+
+# The operators of the DataTable filter query syntax mapped to their MongoDB equivalents.
+#   The order matters: longer operators (e.g. ">=") must be checked before the shorter operators they start with (e.g. ">").
+filter_operators = [(["ge ", ">="], "$gte"),
+                    (["le ", "<="], "$lte"),
+                    (["lt ", "<"], "$lt"),
+                    (["gt ", ">"], "$gt"),
+                    (["ne ", "!="], "$ne"),
+                    (["eq ", "="], "$eq"),
+                    (["contains "], "contains"),
+                    (["datestartswith "], "datestartswith")]
+
+
+class Session:
+    """
+        Holds the connection state of a single user of the backend (e.g. one browser tab of the dashboard).
+    """
+
+    def __init__(self, token : str =None):
+        """
+            Creates a session that is not logged in.
+
+            :param token:       The token of the session (None if its login is not kept in the session store).
+        """
+
+        self.token = token                          # The token of the session.
+        self.client : pymongo.MongoClient = None    # The reference to the (shared) MongoClient connection.
+        self.database = None                        # The database to be used.
+        self.collection = None                      # The collection to be used in the database.
+        self.logged_in = False                      # Whether the session holds a connection to the MongoClient.
+        self.username = None                        # The username the session logged in with.
+        self.client_key = None                      # The key of the credentials in the client pool.
+        self.last_used = time.monotonic()           # When the session was last chosen by a request.
+
+
+default_session = Session()  # The session used when a request has not chosen one (e.g. scripts and the driver).
+current_session = contextvars.ContextVar("current_session", default=default_session)  # The session of the request.
+
+
+def get_session() -> Session:
+    """
+        Gets the session of the request being served.
+
+        :return Session:    The session chosen with use_session(), or the default session.
+    """
+
+    return current_session.get()  # Returns the session of the request.
+
+
+def use_session(token : str) -> Session:
+    """
+        Chooses the session used by every backend function for the rest of the request (or thread).
+            The login state comes from the session store, so a browser tab logged in (or out) through another worker
+            process is logged in (or out) here too.
+
+        :param token:       The token of the session. An unknown token gets a logged out session that is only kept
+                            once it logs in (see login()).
+        :return Session:    The chosen session.
+    """
+
+    # If no token was given,
+    if token is None:
+        current_session.set(default_session)  # Uses the default session.
+        return default_session  # Returns the default session.
+
+    record = session_store.get(token)  # Gets the login state of the session.
+
+    # Only one thread may change the sessions at a time.
+    with sessions_lock:
+        session = sessions.get(token)  # Gets the session of the token.
+
+        # If the token does not have a session in this process yet,
+        if session is None:
+            session = Session(token)  # Creates a session for the request.
+
+        # If the session is (or was) logged in,
+        if record is not None or session.logged_in:
+            keep_session(sessions, session)  # Keeps the session (a logged out token is not kept).
+
+    current_session.set(session)  # Uses the session for the rest of the request.
+
+    # If the session was logged out (e.g. through another worker or because its login expired),
+    if record is None:
+        # If the session is still logged in here,
+        if session.logged_in:
+            release_session(session)  # Logs the session out.
+
+            # Only one thread may change the sessions at a time.
+            with sessions_lock:
+                sessions.pop(token, None)  # Forgets the session.
+
+    # Otherwise if the session was logged in through another worker (or as another user),
+    elif not session.logged_in or session.username != record.get("username"):
+        password = imse.unseal(session_secret, record.get("credential", ""))  # Gets the password of the login.
+
+        # Makes an attempt,
+        try:
+            # If the password was not sealed by this server,
+            if password is None:
+                raise ValueError("The session was not created by this server.")  # Refuses the login.
+
+            open_session(session, record["username"], password)  # Logs the session in.
+
+        # If an error occurred,
+        except Exception:
+            release_session(session)  # Leaves the session logged out.
+            end_session(token)  # Forgets the session and its login (it can no longer be used).
+
+    return session  # Returns the session.
+
+
+def keep_session(table : collections.OrderedDict, session : Session):
+    """
+        Stores a session under its token as the most recently used one, and forgets the sessions that were not used
+            for session_idle_seconds (or the least recently used ones beyond max_sessions). Hold the lock of the
+            table while calling it.
+
+        :param table:       The sessions of this process, keyed by their tokens (least recently used first).
+        :param session:     The session being used.
+    """
+
+    session.last_used = time.monotonic()  # Remembers when the session was used.
+    table[session.token] = session  # Stores the session.
+    table.move_to_end(session.token)  # Marks it as the most recently used.
+
+    # While there are sessions,
+    while table:
+        oldest = next(iter(table.values()))  # Gets the least recently used session.
+
+        # If it was used recently and there is room for it,
+        if len(table) <= max_sessions and session.last_used - oldest.last_used <= session_idle_seconds:
+            break  # Stops (every other session was used after it).
+
+        table.popitem(last=False)  # Forgets it (a session whose login is still stored is logged in again when used).
+
+
+def create_session_token() -> str:
+    """
+        Creates a token that identifies a new session.
+
+        :return str:        The token.
+    """
+
+    return secrets.token_urlsafe(16)  # Returns a random token that cannot be guessed.
+
+
+def end_session(token : str):
+    """
+        Logs a session out and forgets it.
+
+        :param token:       The token of the session.
+    """
+
+    # Only one thread may change the sessions at a time.
+    with sessions_lock:
+        session = sessions.pop(token, None)  # Removes the session.
+
+    session_store.delete(token)  # Forgets the login of the session (in every worker).
+
+    # If the session existed,
+    if session is not None:
+        session.logged_in = False  # Updates the login status (the session can no longer be used).
+
+
+def is_logged_in() -> bool:
+    """
+        Gets whether the session of the request is logged in.
+
+        :return bool:       Whether the session holds a connection to the MongoClient.
+    """
+
+    return get_session().logged_in  # Returns the login status of the session.
+
+
+def get_client_key(username : str, password : str) -> tuple:
+    """
+        Gets the key of a set of credentials in the client pool.
+
+        :param username:        The username of the credentials.
+        :param password:        The password of the credentials.
+        :return tuple:          The key (the password is hashed so it is not kept as a key).
+    """
+
+    # Gets where the credentials connect to.
+    location = (host, port) if storage_engine == "mongo" else (storage_engine, storage_path)
+    return *location, username, hashlib.sha256(password.encode("utf-8")).hexdigest()  # Returns the key.
+
+
+def register_client(username : str, password : str, client : pymongo.MongoClient):
+    """
+        Shares an existing MongoClient (or a compatible client e.g. mongomock) for a set of credentials, so logging in
+        with them uses the client instead of forging a new connection (e.g. for benchmarks).
+
+        :param username:        The username of the credentials.
+        :param password:        The password of the credentials.
+        :param client:          The client to share.
+    """
+
+    # Only one thread may change the client pool at a time.
+    with client_pool_lock:
+        client_pool[get_client_key(username, password)] = client  # Shares the client.
+
+
+def get_client(username : str, password : str) -> pymongo.MongoClient:
+    """
+        Gets the shared MongoClient for a set of credentials, forging it the first time the credentials are used.
+        Every MongoClient keeps its own pool of warm connections, so later logins do not repeat the handshake.
+        If a local storage engine is chosen (see storage_engine), its client is returned instead.
+
+        :param username:                The username to use in forging the connection.
+        :param password:                The password to use in forging the connection.
+        :return MongoClient:            The shared MongoClient (an error is raised if the credentials are invalid).
+    """
+
+    key = get_client_key(username, password)  # Identifies the credentials.
+
+    # Only one thread may change the client pool at a time.
+    with client_pool_lock:
+        client = client_pool.get(key)  # Gets the MongoClient of the credentials.
+
+    # If the credentials have already been used,
+    if client is not None:
+        return client  # Returns the shared MongoClient.
+
+    # If the inventory is stored by a local storage engine,
+    if storage_engine != "mongo":
+        client = ims.create_client(storage_engine, storage_path, username, password, storage_users)
+
+    # Otherwise (the inventory is stored by MongoDB),
+    else:
+        # Forges the connection to the MongoClient with the pool settings.
+        client = pymongo.MongoClient(host=host, port=port, username=username, password=password,
+                                     serverSelectionTimeoutMS=server_selection_timeout_ms, maxPoolSize=max_pool_size,
+                                     minPoolSize=min_pool_size, maxIdleTimeMS=max_idle_time_ms)
+
+    # Makes an attempt,
+    try:
+        # The below line is used to throw an error if the connection could not be forged.
+        #   This ensures the credentials are valid before the MongoClient is shared.
+        client.server_info()  # Gets info from the server.
+
+    # If an error occurred,
+    except Exception:
+        client.close()  # Closes the connection to the MongoClient (it is not shared).
+        raise  # Passes the error on (the login failed).
+
+    # Only one thread may change the client pool at a time.
+    with client_pool_lock:
+        # If another thread forged a MongoClient for the same credentials in the meantime,
+        if key in client_pool:
+            client.close()  # Closes the extra connection.
+            client = client_pool[key]  # Uses the MongoClient of the other thread.
+
+        # Otherwise (this is the only MongoClient for the credentials),
+        else:
+            client_pool[key] = client  # Shares the MongoClient.
+
+    return client  # Returns the shared MongoClient.
+
+
+def close_client_pool():
+    """
+        Closes every shared MongoClient (e.g. when the server shuts down or the database is deleted).
+    """
+
+    # Only one thread may change the client pool at a time.
+    with client_pool_lock:
+        clients = list(client_pool.values())  # Gets every shared MongoClient.
+        client_pool.clear()  # Empties the pool.
+
+    # For every shared MongoClient,
+    for client in clients:
+        client.close()  # Closes the connection to the MongoClient.
+
+
+@imm.instrument("login", is_failure=lambda result: not get_session().logged_in)
+def login(username, password):
+    """
+        Forges the connection to the MongoClient for the session of the request.
+
+        :param username:        The username to use in forging the connection.
+        :param password:        The password to use in forging the connection.
+    """
+
+    session = get_session()  # Gets the session of the request.
+
+    # Makes an attempt,
+    try:
+        open_session(session, username, password)  # Forges the connection.
+
+    # If an error occurred,
+    except Exception:
+        session.logged_in = False  # Updates the login status (login failed).
+        return  # Exits the function.
+
+    # If the session has a token,
+    if session.token is not None:
+        # Keeps the login in the session store (the password is sealed) so every worker can serve the session.
+        session_store.set(session.token, {"username": username, "credential": imse.seal(session_secret, password)})
+
+        # Only one thread may change the sessions at a time.
+        with sessions_lock:
+            keep_session(sessions, session)  # Keeps the session in this process.
+
+
+def open_session(session : Session, username : str, password : str):
+    """
+        Connects a session to the MongoClient (an error is raised if the credentials are invalid).
+
+        :param session:         The session to connect.
+        :param username:        The username to use in forging the connection.
+        :param password:        The password to use in forging the connection.
+    """
+
+    # Declare which variables use the global scope.
+    global journal_target
+
+    session.client = get_client(username, password)  # Gets the shared connection to the MongoClient.
+    session.database = session.client[target_db]  # Gets a reference to the target database.
+    session.collection = session.database[target_collection]  # Gets a reference to the target collection.
+    session.username = username  # Remembers who is logged in.
+    session.client_key = get_client_key(username, password)  # Remembers the credentials (without the password).
+    session.logged_in = True  # Updates the login status (login succeeded).
+    start_change_watcher(session.collection)  # Starts watching for changes made by other processes (if not already).
+    journal_target = session.collection  # Reads the journal snapshots from the collection.
+
+
+def logout():
+    """
+        Releases the connection to the MongoClient held by the session of the request (in every worker).
+            The connection itself stays open in the shared pool for the next login with the same credentials.
+    """
+
+    session = get_session()  # Gets the session of the request.
+
+    # If the session has a token,
+    if session.token is not None:
+        session_store.delete(session.token)  # Forgets the login in the session store.
+
+        # Only one thread may change the sessions at a time.
+        with sessions_lock:
+            sessions.pop(session.token, None)  # Forgets the session in this process.
+
+    release_session(session)  # Releases the connection.
+
+
+def release_session(session : Session):
+    """
+        Releases the connection to the MongoClient held by a session in this process.
+
+        :param session:         The session to release.
+    """
+
+    session.client = None  # Releases the shared MongoClient.
+    session.database = None  # Releases the database.
+    session.collection = None  # Releases the collection.
+    session.client_key = None  # Forgets the credentials.
+    session.logged_in = False  # Updates the login status (logout succeeded).
+
+
+@imm.instrument("create", is_failure=lambda document: document is None)
+def create(data : dict ={}) -> dict:
+    """
+        Creates a new entry in the database.
+
+        :param data:    The data to be used in creating the new entry. If it has no "product_id", one is allocated.
+        :return dict:   The document that was created (without the "_id" field), or None if the insertion failed.
+    """
+
+    session = get_session()  # Gets the session of the request.
+
+    # If the user is not logged in,
+    if not session.logged_in:
+        print("Login first!")  # Output an error
+        return None  # Exit the function (the user should not be able to create entries if they aren't logged in).
+
+    # The below code only runs if the user is logged in.
+
+    document = dict(data)  # Copies the data (inserting adds an "_id" field to the dictionary it is given).
+    allocate_id = "product_id" not in document  # Whether the product ID should be allocated by the server.
+
+    # Makes an attempt,
+    try:
+        # If no product ID was given,
+        if allocate_id:
+            document["product_id"] = next_product_id()  # Allocates a product ID that no other request can receive.
+
+        session.collection.insert_one(document)  # Creates a new document in the collection.
+
+    # If the product ID is already in use,
+    except pymongo.errors.DuplicateKeyError:
+        # If the product ID was not allocated by the server,
+        if not allocate_id:
+            print("The product ID is already in use.")  # Outputs an error.
+            return None  # Returns nothing (no document was created).
+
+        # The counter fell behind the collection (e.g. products were imported with their own IDs).
+
+        # Makes an attempt,
+        try:
+            seed_product_id_counter()  # Moves the counter past the highest product ID in use.
+            release_product_ids()  # Forgets the product IDs reserved before the counter was moved.
+            document.pop("_id", None)  # Removes the "_id" field from the failed insertion.
+            document["product_id"] = next_product_id()  # Allocates a new product ID.
+            session.collection.insert_one(document)  # Creates a new document in the collection.
+
+        # If an error occurred,
+        except Exception:
+            print("The insertion failed.")  # Outputs an error.
+            return None  # Returns nothing (no document was created).
+
+    # If an error occurred,
+    except Exception:
+        print("The insertion failed.")  # Outputs an error.
+        return None  # Returns nothing (no document was created).
+
+    document.pop("_id", None)  # Removes the "_id" field (the table does not show it).
+    query_cache.invalidate(document, inserted_or_deleted=True)  # Removes the cached pages the new document belongs on.
+    change_feed.record_local("insert", document)  # Tells the dashboards about the new document.
+    journal.record_products([document])  # Records the new document in the change journal.
+    adjust_summary(None, document)  # Adds the new document to the summary.
+    return document  # Returns the document that was created.
+
+
+def seed_product_id_counter(target : pymongo.collection.Collection =None) -> int:
+    """
+        Moves the product ID counter past the highest product ID in the collection (never moves it backwards).
+
+        :param target:      The collection whose product IDs are counted. If None, the logged in collection is used.
+        :return int:        The next product ID the counter will hand out.
+    """
+
+    target = get_session().collection if target is None else target  # Uses the logged in collection if none was specified.
+
+    # Finds the product with the highest product ID (uses the product ID index).
+    highest = target.find_one({}, {"_id": 0, "product_id": 1}, sort=[("product_id", pymongo.DESCENDING)])
+    next_id = 0 if highest is None else int(highest["product_id"]) + 1  # Gets the product ID after the highest.
+
+    # Raises the counter to the next product ID ($max makes this safe when several processes seed at once).
+    counter = target.database[target_counter_collection].find_one_and_update(
+        {"_id": "product_id"}, {"$max": {"next": next_id}}, upsert=True, return_document=pymongo.ReturnDocument.AFTER)
+
+    return counter["next"]  # Returns the next product ID.
+
+
+def allocate_product_ids(count : int =1) -> range:
+    """
+        Reserves a block of consecutive product IDs with one atomic update of the counter document.
+
+        :param count:       The number of product IDs to reserve.
+        :return range:      The reserved product IDs (no other request or process can receive them).
+    """
+
+    counters = get_session().database[target_counter_collection]  # Gets the collection holding the counter.
+
+    # If the counter does not exist yet,
+    if counters.find_one({"_id": "product_id"}) is None:
+        seed_product_id_counter()  # Starts the counter after the highest product ID in use.
+
+    # Moves the counter forward by the number of product IDs and gets its value after the move.
+    counter = counters.find_one_and_update({"_id": "product_id"}, {"$inc": {"next": count}}, upsert=True,
+                                           return_document=pymongo.ReturnDocument.AFTER)
+
+    return range(counter["next"] - count, counter["next"])  # Returns the reserved product IDs.
+
+
+def next_product_id() -> int:
+    """
+        Gets an unused product ID, reserving a new block of product_id_block_size IDs when this process runs out.
+
+        :return int:        The product ID.
+    """
+
+    # Declare which variables use the global scope.
+    global reserved_product_ids
+
+    # Only one thread may take from the reserved product IDs at a time.
+    with product_id_lock:
+        product_id = next(reserved_product_ids, None)  # Takes the next reserved product ID.
+
+        # If there are no reserved product IDs left,
+        if product_id is None:
+            reserved_product_ids = iter(allocate_product_ids(product_id_block_size))  # Reserves a new block.
+            product_id = next(reserved_product_ids)  # Takes the first product ID of the block.
+
+    return product_id  # Returns the product ID.
+
+
+def get_summary_values(document : dict) -> dict:
+    """
+        Gets what a single product adds to the summary.
+
+        :param document:    The product (None adds nothing).
+        :return dict:       The units, value, product count and low stock count the product adds.
+    """
+
+    # If there is no product,
+    if document is None:
+        return {"total_units": 0, "total_value": 0, "products": 0, "below_reorder_point": 0}  # Adds nothing.
+
+    # Gets the quantity and price (like the aggregation, a missing or non-numeric field counts as 0).
+    quantity = document.get("product_quantity")
+    quantity = quantity if isinstance(quantity, (int, float)) and not isinstance(quantity, bool) else 0
+    price = document.get("product_price")
+    price = price if isinstance(price, (int, float)) and not isinstance(price, bool) else 0
+
+    # Returns what the product adds.
+    return {"total_units": quantity,
+            "total_value": price * quantity,
+            "products": 1,
+            "below_reorder_point": 1 if quantity < reorder_point else 0}
+
+
+def get_summary_delta(previous : dict, document : dict) -> dict:
+    """
+        Gets how much the summary changes when a product changes.
+
+        :param previous:    The product before the change (None if it was created).
+        :param document:    The product after the change (None if it was deleted).
+        :return dict:       The change of every summary field that changed (used with $inc).
+    """
+
+    before = get_summary_values(previous)  # Gets what the product added before the change.
+    after = get_summary_values(document)  # Gets what the product adds after the change.
+
+    # Returns every field that changed.
+    return {field: after[field] - before[field] for field in after if after[field] != before[field]}
+
+
+def get_summary_pipeline() -> list:
+    """
+        Gets the aggregation pipeline that calculates the summary from every product.
+
+        :return list:       The stages of the pipeline.
+    """
+
+    quantity = {"$cond": [{"$isNumber": "$product_quantity"}, "$product_quantity", 0]}  # Non-numeric counts as 0.
+
+    # Returns the pipeline (the same rules as get_summary_values(), calculated by the server).
+    return [{"$group": {"_id": None,
+                        "total_units": {"$sum": quantity},
+                        "total_value": {"$sum": product_value_expression},
+                        "products": {"$sum": 1},
+                        "below_reorder_point": {"$sum": {"$cond": [{"$lt": [quantity, reorder_point]}, 1, 0]}}}},
+            {"$project": {"_id": 0}}]
+
+
+def get_summary_update(delta : dict) -> dict:
+    """
+        Creates the update adjusting the summary document by a change (its version is increased with it, so a rebuild
+            running at the same time does not overwrite the change, see rebuild_summary()).
+
+        :param delta:       The change of every summary field (see get_summary_delta()).
+        :return dict:       The $inc update.
+    """
+
+    return {"$inc": {**delta, "version": 1}}  # Returns the update.
+
+
+def get_summary_changes(product_ids : list, before : dict, after : dict, batch_result : dict) -> list:
+    """
+        Pairs the products a batch of bulk write operations selected before and after the batch, if the changes seen
+            are exactly the changes the server reported (otherwise another write changed the products at the same time,
+            or one operation changed several products, and the summary must be rebuilt).
+
+        :param product_ids:     The product IDs the operations select (see get_journal_product_ids()).
+        :param before:          The products before the batch, keyed by product ID (None if they were not read).
+        :param after:           The products after the batch, keyed by product ID (None if they were not read).
+        :param batch_result:    The result of the batch (see get_batch_result()).
+        :return list:           The (previous, document) pair of every changed product, or None if the changes
+                                are not known exactly.
+    """
+
+    # If the products before or after the batch are not known,
+    if before is None or after is None:
+        return None  # Returns that the changes are not known.
+
+    # Gets the (previous, document) pair of every product that changed.
+    changes = [(before.get(product_id), after.get(product_id)) for product_id in product_ids
+               if before.get(product_id) != after.get(product_id)]
+
+    # Gets the number of products the server reported changing.
+    reported = batch_result["inserted"] + batch_result["upserted"] + batch_result["modified"] + batch_result["deleted"]
+    return changes if len(changes) == reported else None  # Returns the changes (if they are the ones reported).
+
+
+def adjust_summary(previous : dict, document : dict):
+    """
+        Adjusts the summary document by the change of a single product (one atomic $inc).
+
+        :param previous:    The product before the change (None if it was created).
+        :param document:    The product after the change (None if it was deleted).
+    """
+
+    adjust_summary_many([(previous, document)])  # Adjusts the summary by the change.
+
+
+def get_summary_delta_many(changes : list) -> dict:
+    """
+        Gets how much the summary changes when many products change.
+
+        :param changes:     The (previous, document) pair of every changed product (see adjust_summary()).
+        :return dict:       The change of every summary field that changed (used with $inc).
+    """
+
+    delta = {}  # Holds the change of every summary field.
+
+    # For every changed product,
+    for previous, document in changes:
+        # For every summary field the product changes,
+        for field, change in get_summary_delta(previous, document).items():
+            delta[field] = delta.get(field, 0) + change  # Adds up the change.
+
+    return {field: change for field, change in delta.items() if change}  # Returns the changes that did not cancel out.
+
+
+def adjust_summary_many(changes : list):
+    """
+        Adjusts the summary document by the changes of many products at once (one atomic $inc).
+
+        :param changes:     The (previous, document) pair of every changed product (see adjust_summary()).
+    """
+
+    delta = get_summary_delta_many(changes)  # Gets how much the summary changes.
+
+    # If the summary does not change,
+    if not delta:
+        return  # Exits the function (there is nothing to write).
+
+    # Makes an attempt,
+    try:
+        # Adjusts the summary (a missing summary is left missing and rebuilt when it is next read).
+        get_session().database[target_counter_collection].update_one({"_id": summary_id}, get_summary_update(delta))
+
+    # If an error occurred,
+    except Exception:
+        print("The summary could not be adjusted!")  # Outputs an error.
+
+
+def get_summary_version_query(stored : dict) -> dict:
+    """
+        Creates the query matching the summary document only while it is still the version that was read.
+
+        :param stored:      The summary that was read (not None).
+        :return dict:       The query.
+    """
+
+    # Returns the query (a summary stored before versions were added matches while it has none).
+    return {"_id": summary_id, "version": stored["version"] if "version" in stored else {"$exists": False}}
+
+
+def check_summary(stored : dict, summary : dict) -> bool:
+    """
+        Checks whether a stored summary matches a recalculated one.
+
+        :param stored:      The stored summary (None if there was none).
+        :param summary:     The recalculated summary.
+        :return bool:       Whether they match (the value is a float, so it is compared with a tolerance).
+    """
+
+    # Returns whether every field matches.
+    return stored is not None and all(math.isclose(stored.get(field, 0), summary[field], rel_tol=1e-9, abs_tol=1e-6)
+                                      for field in summary)
+
+
+def rebuild_summary(target : pymongo.collection.Collection =None) -> dict:
+    """
+        Recalculates the summary document from every product and stores it (use to verify the summary). The summary
+            is only replaced if no write adjusted it during the calculation (its version is unchanged), otherwise it
+            is calculated again. The version does not cover a write whose product is changed before the calculation
+            but whose $inc reaches the summary after it is replaced: that change is then counted twice. Such a write
+            always leaves the stored summary different from the calculated one, so whenever a rebuild stores a summary
+            that did not match, another rebuild is requested (see request_summary_rebuild()) to check it again once
+            the writes have settled, repairing the double count.
+
+        :param target:      The collection to summarize. If None, the logged in collection is used.
+        :return dict:       The stored summary before the rebuild ("stored", None if there was none), the
+                            recalculated summary ("summary"), whether they matched ("consistent") and whether the
+                            summary was stored ("written", False if writes kept adjusting it).
+    """
+
+    # Declare which variables use the global scope.
+    global summary_rebuild_due, summary_rebuilt
+
+    target = get_session().collection if target is None else target  # Uses the logged in collection if none was specified.
+    counters = target.database[target_counter_collection]  # Gets the collection holding the summary.
+    first = None  # Holds the summary read by the first attempt.
+    summary_rebuild_due = False  # The writes made so far are included in the rebuild.
+    summary_rebuilt = time.monotonic()  # Remembers when the summary was rebuilt.
+
+    # For every attempt,
+    for attempt in range(summary_rebuild_attempts):
+        stored = counters.find_one({"_id": summary_id}, {"_id": 0})  # Gets the summary before the rebuild.
+        first = stored if attempt == 0 else first  # Remembers the summary the rebuild started from.
+        results = list(target.aggregate(get_summary_pipeline()))  # Calculates the summary on the server.
+        summary = results[0] if results else get_summary_values(None)  # Gets the summary (empty without products).
+        summary["reorder_point"] = reorder_point  # Stores the reorder point the summary was calculated with.
+        version = {"version": (stored or {}).get("version", 0) + 1}  # Gives the summary a new version.
+
+        # If there is no summary yet,
+        if stored is None:
+            # Makes an attempt,
+            try:
+                counters.insert_one({"_id": summary_id, **summary, **version})  # Stores the summary.
+                written = True
+
+            # If another process stored a summary at the same time,
+            except pymongo.errors.DuplicateKeyError:
+                written = False
+
+        # Otherwise (the summary is replaced if no write adjusted it since it was read),
+        else:
+            written = counters.replace_one(get_summary_version_query(stored), {**summary, **version}).matched_count == 1
+
+        # If the summary was stored,
+        if written:
+            break  # Stops trying.
+
+    # If the stored summary was replaced with a different one (a write may have been counted twice, see above),
+    if written and not check_summary(stored, summary):
+        request_summary_rebuild()  # Checks the summary again when it is next read.
+
+    # Returns the result of the rebuild.
+    return {"stored": first, "summary": summary, "consistent": check_summary(first, summary), "written": written}
+
+
+def get_summary() -> dict:
+    """
+        Gets the summary of the inventory (a single document read, no matter how many products there are).
+
+        :return dict:       The total units, total value, number of products, number of products below the reorder
+                            point and the reorder point, or None if the summary could not be read.
+    """
+
+    session = get_session()  # Gets the session of the request.
+
+    # If the user is not logged in,
+    if not session.logged_in:
+        print("Login first!")  # Outputs an error.
+        return None  # Returns nothing (the user should not be able to read data unless they are logged in).
+
+    # The below code only runs if the user is logged in.
+
+    # Makes an attempt,
+    try:
+        # Reads the summary.
+        summary = session.database[target_counter_collection].find_one({"_id": summary_id}, {"_id": 0, "version": 0})
+
+        # If the summary does not exist yet, was calculated with another reorder point or is due a deferred rebuild,
+        if summary is None or summary.get("reorder_point") != reorder_point or is_summary_rebuild_due():
+            summary = rebuild_summary()["summary"]  # Calculates the summary.
+
+    # If an error occurred,
+    except Exception:
+        print("The summary could not be read!")  # Outputs an error.
+        return None  # Returns nothing (the summary could not be read).
+
+    return summary  # Returns the summary.
+
+
+def request_summary_rebuild():
+    """
+        Marks the summary as possibly inexact (e.g. after writes whose outcome is not known exactly). Instead of
+            rebuilding it on the write path, it is rebuilt the next time it is read, at most once every
+            summary_rebuild_interval_seconds.
+    """
+
+    # Declare which variables use the global scope.
+    global summary_rebuild_due
+
+    summary_rebuild_due = True  # Rebuilds the summary when it is next read.
+
+
+def is_summary_rebuild_due() -> bool:
+    """
+        Gets whether a deferred rebuild of the summary should run now.
+
+        :return bool:       Whether a rebuild was requested and the last rebuild is old enough.
+    """
+
+    # Returns whether the summary should be rebuilt.
+    return summary_rebuild_due and (summary_rebuilt is None or
+                                    time.monotonic() - summary_rebuilt >= summary_rebuild_interval_seconds)
+
+
+def release_product_ids():
+    """
+        Forgets the product IDs reserved by this process (the unused IDs are skipped, never handed out twice).
+    """
+
+    # Declare which variables use the global scope.
+    global reserved_product_ids
+
+    # Only one thread may change the reserved product IDs at a time.
+    with product_id_lock:
+        reserved_product_ids = iter(())  # Empties the reserved product IDs.
+
+
+@imm.instrument("read", is_failure=lambda results: results is None)
+def read(query : dict ={}, projection : dict =None, batch_size : int =0) -> pymongo.CursorType:
+    """
+        Reads data from the collection.
+
+        :param query:               The dictionary to be used to find the matching documents.
+        :param projection:          The fields to return (e.g. table_projection). If None, every field is returned.
+        :param batch_size:          The number of documents fetched in each round-trip (0 uses the server default).
+        :return CursorType:         The cursor (result) of the search.
+    """
+
+    session = get_session()  # Gets the session of the request.
+
+    # If the user is not logged in,
+    if not session.logged_in:
+        print("Login first!")  # Outputs an error.
+        return None  # Returns nothing (the user should not be able to retrieve data unless they are logged in).
+
+    # The below code only runs if the user is logged in.
+
+    results = session.collection.find(query, projection, batch_size=batch_size)  # Stores the results of the search.
+    return results  # Returns the results of the search.
+
+
+def get_query_fingerprint(query : dict) -> str:
+    """
+        Gets a short fingerprint of a query (a resume token only resumes the query it was created for).
+
+        :param query:               The dictionary used to find the matching documents.
+        :return str:                The fingerprint.
+    """
+
+    # Returns the start of the hash of the query (the keys are sorted so equal queries give equal fingerprints).
+    return hashlib.sha256(json.dumps(query or {}, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def create_resume_token(query : dict, after) -> str:
+    """
+        Creates the token resuming a streaming read after a product.
+
+        :param query:               The dictionary used to find the matching documents.
+        :param after:               The product ID of the last product read.
+        :return str:                The resume token.
+    """
+
+    data = json.dumps({"after": after, "query": get_query_fingerprint(query)}, separators=(",", ":"))  # Encodes it.
+    return base64.urlsafe_b64encode(data.encode("utf-8")).decode("ascii")  # Returns the token.
+
+
+def parse_resume_token(query : dict, token : str):
+    """
+        Gets the product a streaming read resumes after.
+
+        :param query:               The dictionary used to find the matching documents.
+        :param token:               The resume token (see create_resume_token()), or None to start from the beginning.
+        :return object:             The product ID of the last product read (minus infinity to start from the beginning).
+    """
+
+    # If the read starts from the beginning,
+    if token is None:
+        return float("-inf")  # Returns a key before every product ID.
+
+    # Makes an attempt,
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))  # Decodes the token.
+        after, fingerprint = data["after"], data["query"]  # Gets the product ID and the fingerprint of the query.
+
+    # If the token is not valid,
+    except (ValueError, TypeError, KeyError, AttributeError):
+        raise ValueError("Invalid resume token.")  # Refuses the token.
+
+    # If the token was created for another query,
+    if fingerprint != get_query_fingerprint(query):
+        raise ValueError("The resume token belongs to another query.")  # Refuses the token.
+
+    return after  # Returns the product ID.
+
+
+def get_keyset_projection(projection : dict) -> (dict, bool):
+    """
+        Gets the projection of a streaming read, which must return the product ID (the key the read walks).
+
+        :param projection:          The fields to return. If None, every field except "_id" is returned.
+        :return (dict, bool):       The projection to read with.
+                                    Whether the product ID must be removed from the documents before they are returned.
+    """
+
+    projection = dict(projection or {"_id": 0})  # Copies the projection (the caller's projection is not changed).
+
+    # If the projection leaves the product ID out,
+    if "product_id" in projection and not projection["product_id"]:
+        del projection["product_id"]  # Returns the product ID (every other field is still left out).
+        return projection, True  # Returns the projection (the product ID is removed afterwards).
+
+    # If the projection only returns some fields and the product ID is not one of them,
+    if any(value for field, value in projection.items() if field != "_id") and "product_id" not in projection:
+        projection["product_id"] = 1  # Returns the product ID too.
+        return projection, True  # Returns the projection (the product ID is removed afterwards).
+
+    return projection, False  # Returns the projection as it is.
+
+
+def get_keyset_query(query : dict, after) -> dict:
+    """
+        Gets the query reading the products after a product ID.
+
+        :param query:               The dictionary used to find the matching documents.
+        :param after:               The product ID of the last product read.
+        :return dict:               The query.
+    """
+
+    key = {"product_id": {"$gt": after}}  # Selects the products after the last product read.
+    return {"$and": [query, key]} if query else key  # Returns the query.
+
+
+@imm.instrument("read_keyset_batch", count_documents=len)
+def read_keyset_batch(target : pymongo.collection.Collection, query : dict, projection : dict, after,
+                      batch_size : int) -> list:
+    """
+        Reads the next batch of a streaming read with a short query of its own (no cursor is kept open between
+            batches, so a slow consumer never hits a cursor timeout).
+
+        :param target:              The collection to read.
+        :param query:               The dictionary used to find the matching documents.
+        :param projection:          The fields to return (they must include the product ID).
+        :param after:               The product ID of the last product read.
+        :param batch_size:          The most products read.
+        :return list:               The products, in product ID order.
+    """
+
+    # Reads the batch (the unique product ID index serves both the range and the order).
+    return list(target.find(get_keyset_query(query, after), projection, batch_size=batch_size)
+                .sort([("product_id", pymongo.ASCENDING)]).limit(batch_size))
+
+
+def iterate_keyset(target : pymongo.collection.Collection, query : dict ={}, projection : dict =None,
+                   batch_size : int =None, resume_token : str =None):
+    """
+        Walks a collection in product ID order, one batch at a time (see stream_batches()).
+
+        :param target:              The collection to read.
+        :param query:               The dictionary used to find the matching documents.
+        :param projection:          The fields to return. If None, every field except "_id" is returned.
+        :param batch_size:          The number of products read in each batch (stream_batch_size if None).
+        :param resume_token:        The token of a previous read to resume, or None to start from the beginning.
+        :return generator:          A generator of (products, resume token) pairs.
+    """
+
+    batch_size = batch_size or stream_batch_size  # Uses the default batch size if none was given.
+    after = parse_resume_token(query, resume_token)  # Gets the product the read starts after.
+    projection, remove_key = get_keyset_projection(projection)  # Gets the projection returning the product ID.
+
+    # Until every product was read,
+    while True:
+        documents = read_keyset_batch(target, query, projection, after, batch_size)  # Reads the next batch.
+
+        # If there are no more products,
+        if not documents:
+            return  # Exits the function.
+
+        after = documents[-1]["product_id"]  # Remembers the last product read.
+        token = create_resume_token(query, after)  # Creates the token resuming after the batch.
+
+        # If the caller did not ask for the product ID,
+        if remove_key:
+            # For every product,
+            for document in documents:
+                del document["product_id"]  # Removes the product ID.
+
+        yield documents, token  # Returns the batch and its token.
+
+        # If the batch was not full,
+        if len(documents) < batch_size:
+            return  # Exits the function (there are no more products).
+
+
+def stream_batches(query : dict ={}, projection : dict =None, batch_size : int =None, resume_token : str =None):
+    """
+        Reads the documents matching a query in batches, walking the collection in product ID order (keyset
+            pagination). Only one batch is held in memory at a time and each batch is read with a short query of its
+            own, so reads over millions of documents neither grow in memory nor hit cursor timeouts. Every batch comes
+            with a resume token: passing it back resumes the read after that batch (e.g. after a failure). Documents
+            without a numeric product ID are not read.
+
+        :param query:               The dictionary used to find the matching documents.
+        :param projection:          The fields to return. If None, every field except "_id" is returned.
+        :param batch_size:          The number of products read in each batch (stream_batch_size if None).
+        :param resume_token:        The token of a previous read to resume, or None to start from the beginning.
+        :return generator:          A generator of (products, resume token) pairs.
+    """
+
+    session = get_session()  # Gets the session of the request.
+
+    # If the user is not logged in,
+    if not session.logged_in:
+        print("Login first!")  # Outputs an error.
+        return  # Returns nothing (the user should not be able to retrieve data unless they are logged in).
+
+    # The below code only runs if the user is logged in.
+
+    yield from iterate_keyset(session.collection, query, projection, batch_size, resume_token)  # Reads the batches.
+
+
+def stream_documents(query : dict ={}, projection : dict =None, batch_size : int =None, resume_token : str =None):
+    """
+        Reads the documents matching a query one at a time in product ID order (see stream_batches()).
+
+        :param query:               The dictionary used to find the matching documents.
+        :param projection:          The fields to return. If None, every field except "_id" is returned.
+        :param batch_size:          The number of products read in each batch (stream_batch_size if None).
+        :param resume_token:        The token of a previous read to resume, or None to start from the beginning.
+        :return generator:          A generator of the matching documents.
+    """
+
+    # For every batch,
+    for documents, token in stream_batches(query, projection, batch_size, resume_token):
+        yield from documents  # Returns its documents.
+
+
+def split_filter_part(filter_part : str) -> (str, str, object):
+    """
+        Splits a single part of a DataTable filter query into its column, operator and value.
+
+        :param filter_part:             A single part of the filter query e.g. "{product_price} >= 5".
+        :return (str, str, object):     The name of the column (None if it is not a product field).
+                                        The MongoDB operator (or "contains"/"datestartswith").
+                                        The value to compare against (a number only for a numeric column).
+    """
+
+    filter_part = filter_part.strip()  # Removes the surrounding whitespace from the part.
+    end = filter_part.find("}")  # Finds the end of the column name.
+
+    # If the part does not start with a column name between braces,
+    if not filter_part.startswith("{") or end == -1:
+        return None, None, None  # Returns nothing (the part cannot be understood).
+
+    name = filter_part[1:end]  # Gets the column name between the braces.
+
+    # If the column is not a product field (e.g. "$where", which MongoDB would read as an operator),
+    if name not in product_field_types:
+        return None, None, None  # Returns nothing (the part is refused).
+
+    operator_part = filter_part[end + 1:].lstrip()  # Gets the operator and the value after the column name.
+
+    # For every supported operator,
+    for operator_names, mongo_operator in filter_operators:
+        # For every way the operator can be written,
+        for operator_name in operator_names:
+            # If the operator follows the column name (so a value containing an operator, e.g. "orange juice", is not
+            #   mistaken for it),
+            if operator_part.startswith(operator_name):
+                value_part = operator_part[len(operator_name):].strip()  # Gets the value after the operator.
+
+                # If the value is quoted,
+                if len(value_part) > 1 and value_part[0] == value_part[-1] and value_part[0] in ("'", '"', "`"):
+                    value = value_part[1:-1].replace("\\" + value_part[0], value_part[0])  # Removes the quotes.
+
+                # Otherwise if the column holds text (e.g. "item 3" is found by "contains 3"),
+                elif product_field_types[name] == "text":
+                    value = value_part  # Keeps the value as text.
+
+                # Otherwise (the value is not quoted and the column holds numbers),
+                else:
+                    # Makes an attempt,
+                    try:
+                        value = float(value_part)  # Converts the value to a number.
+
+                    # If the value is not a number,
+                    except ValueError:
+                        value = value_part  # Keeps the value as text.
+
+                return name, mongo_operator, value  # Returns the parts of the filter.
+
+    return None, None, None  # Returns nothing (the operator is not supported).
+
+
+def translate_filter_query(filter_query : str ="") -> dict:
+    """
+        Translates a DataTable filter query into a MongoDB query.
+
+        :param filter_query:    The filter query of the DataTable e.g. "{product_name} contains a && {product_price} > 5".
+        :return dict:           The MongoDB query matching the same documents.
+    """
+
+    conditions = []  # Holds the condition created from each part of the filter query.
+
+    # For every part of the filter query,
+    for filter_part in (filter_query or "").split(" && "):
+        name, operator, value = split_filter_part(filter_part)  # Splits the part into its column, operator and value.
+
+        # If the part could not be understood,
+        if name is None or name == "":
+            continue  # Skips the part.
+
+        # If the operator is "contains",
+        if operator == "contains":
+            # If the column holds numbers,
+            if product_field_types[name] == "numeric":
+                conditions.append({name: value})  # Numbers can only contain themselves.
+
+            # Otherwise (the column holds text),
+            else:
+                conditions.append({name: {"$regex": re.escape(str(value)), "$options": "i"}})  # Matches the text anywhere.
+
+        # Otherwise if the operator is "datestartswith",
+        elif operator == "datestartswith":
+            conditions.append({name: {"$regex": "^" + re.escape(str(value))}})  # Matches the text at the start.
+
+        # Otherwise (the operator is a comparison),
+        else:
+            conditions.append({name: {operator: value}})  # Compares the column to the value.
+
+    # If there are no conditions,
+    if len(conditions) == 0:
+        return {}  # Returns an empty query (matches every document).
+
+    # Otherwise if there is only one condition,
+    elif len(conditions) == 1:
+        return conditions[0]  # Returns the condition on its own.
+
+    return {"$and": conditions}  # Returns the conditions joined together.
+
+
+def translate_sort_by(sort_by : list =None) -> list:
+    """
+        Translates the DataTable sort_by property into a MongoDB sort specification.
+
+        :param sort_by:     The sort_by property of the DataTable e.g. [{"column_id": "product_price", "direction": "asc"}].
+        :return list:       A list of (field, direction) pairs for MongoDB to sort by.
+    """
+
+    sort = []  # Holds the (field, direction) pairs.
+
+    # For every column being sorted,
+    for column in (sort_by or []):
+        # Adds the column and its direction to the sort specification.
+        sort.append((column["column_id"],
+                     pymongo.ASCENDING if column["direction"] == "asc" else pymongo.DESCENDING))
+
+    # If the product ID is not already being sorted,
+    if "product_id" not in [field for field, direction in sort]:
+        # Sorts by the product ID last so each page is stable. It follows the direction of the last sorted column so
+        #   the (field, product_id) indexes created by ensure_indexes() can be walked forwards or backwards.
+        sort.append(("product_id", sort[-1][1] if sort else pymongo.ASCENDING))
+
+    return sort  # Returns the sort specification.
+
+
+@imm.instrument("read_page", count_documents=lambda page: len(page[0]))
+def read_page(page_current : int =0, page_size : int =25, sort_by : list =None, filter_query : str ="") -> (list, int):
+    """
+        Reads a single page of data from the collection, filtered and sorted on the server.
+            The page is served from the snapshot when it can be (see read_snapshot_page()).
+
+        :param page_current:        The index of the page to read.
+        :param page_size:           The number of documents on each page.
+        :param sort_by:             The sort_by property of the DataTable.
+        :param filter_query:        The filter_query property of the DataTable.
+        :return (list, int):        The documents on the page (without the "_id" field).
+                                    The total number of documents matching the filter.
+    """
+
+    session = get_session()  # Gets the session of the request.
+
+    # If the user is not logged in,
+    if not session.logged_in:
+        print("Login first!")  # Outputs an error.
+        return [], 0  # Returns nothing (the user should not be able to retrieve data unless they are logged in).
+
+    # The below code only runs if the user is logged in.
+
+    query = translate_filter_query(filter_query)  # Translates the filter into a MongoDB query.
+    sort = translate_sort_by(sort_by)  # Translates the sorting into a MongoDB sort specification.
+
+    page = read_snapshot_page(session.collection, query, sort, page_current, page_size)  # Reads the snapshot.
+
+    # If the snapshot served the page,
+    if page is not None:
+        return page  # Returns the page without reading the database.
+
+    reuse = can_reuse_pages()  # Whether the page may be served from (and stored in) the cache.
+
+    # Creates the key of the page from the normalized query, sort and page.
+    key = query_cache.make_key(target_db, target_collection, query, sort, page_current, page_size)
+    cached = query_cache.get(key) if reuse else None  # Gets the page from the cache.
+
+    # If the page is in the cache,
+    if cached is not None:
+        return cached  # Returns the page without reading the database.
+
+    generation = query_cache.get_generation()  # Remembers the generation of the cache before reading.
+
+    # Makes an attempt,
+    try:
+        total = session.collection.count_documents(query)  # Counts every document matching the query.
+
+        # Reads only the documents on the requested page.
+        cursor = session.collection.find(query, table_projection, batch_size=page_size).sort(sort) \
+            .skip(page_current * page_size).limit(page_size)
+        records = list(cursor)  # Stores the documents on the page.
+
+    # If an error occurred,
+    except Exception:
+        print("The page could not be read!")  # Outputs an error.
+        imm.increment("ims_operation_errors_total", layer="backend", operation="read_page")  # Counts the error.
+        return [], 0  # Returns nothing (the page could not be read).
+
+    # If the page may be cached,
+    if reuse:
+        query_cache.put(key, (records, total), query, sort, records, generation)  # Stores the page in the cache.
+
+    return records, total  # Returns the page and the total number of matching documents.
+
+
+def can_reuse_pages() -> bool:
+    """
+        Gets whether pages may be served from the snapshot and the cache. When other processes (e.g. the other
+            workers) write to the collection, their writes are seen through a change stream or, in local mode,
+            counted in the version store of the change feed (any write of another worker then empties the cache, and
+            the snapshot and search index are read again). Without either, pages are read from the database.
+
+        :return bool:       Whether pages may be reused.
+    """
+
+    # If only this process writes to the collection, or a change stream reports every write,
+    if not shared_storage or change_feed.mode == "stream":
+        return True  # Returns that pages may be reused.
+
+    # If the writes of the other workers are not counted,
+    if not change_feed.is_shared():
+        return False  # Returns that pages must be read from the database.
+
+    # If another worker wrote since the writes were last counted,
+    if change_feed.synchronize():
+        query_cache.clear()  # Removes every cached page (the feed tells the snapshot and index to read again).
+
+    return True  # Returns that pages may be reused.
+
+
+def load_snapshot(target : pymongo.collection.Collection):
+    """
+        Reads every product for the snapshot, one batch at a time (only the typed columns of the snapshot are kept).
+
+        :param target:      The collection to read.
+        :return generator:  A generator of every product (only the fields shown in the table).
+    """
+
+    # For every batch,
+    for documents, token in iterate_keyset(target, {}, table_projection, 10000):
+        yield from documents  # Returns its products.
+
+
+def read_snapshot_page(target : pymongo.collection.Collection, query : dict, sort : list, page_current : int,
+                       page_size : int) -> (list, int):
+    """
+        Reads a page of the table from the snapshot, first applying the changes made since it was last used.
+
+        :param target:          The collection the snapshot holds (read again if a change cannot be applied).
+        :param query:           The MongoDB query of the page (see translate_filter_query()).
+        :param sort:            The (field, direction) pairs to sort by (see translate_sort_by()).
+        :param page_current:    The index of the page to read.
+        :param page_size:       The number of documents on each page.
+        :return (list, int):    The documents on the page and the total number of matching documents, or None if the
+                                snapshot is disabled or cannot serve the page (the page is then read from the database).
+    """
+
+    # If the snapshot is disabled (or could miss the writes of other processes),
+    if not snapshot_enabled or not can_reuse_pages():
+        return None  # Returns nothing (the page is read from the database).
+
+    # Makes an attempt,
+    try:
+        # If the snapshot cannot be brought up to date (a product does not fit its columns),
+        if not snapshot.refresh(change_feed, lambda: load_snapshot(target)):
+            return None  # Returns nothing (the page is read from the database).
+
+        return snapshot.read_page(query, sort, page_current * page_size, page_size)  # Returns the page.
+
+    # If the query or sort cannot be served, or the products could not be read,
+    except Exception:
+        return None  # Returns nothing (the page is read from the database).
+
+
+def get_snapshot_metrics() -> dict:
+    """
+        Gets the size and usage counters of the snapshot.
+
+        :return dict:       The metrics of the snapshot (see InventorySnapshot.get_metrics()).
+    """
+
+    return snapshot.get_metrics()  # Returns the metrics of the snapshot.
+
+
+# Serves the metrics of the snapshot with every other metric (e.g. "ims_snapshot_rows").
+imm.register_collector(lambda: {f"ims_snapshot_{name}": value for name, value in get_snapshot_metrics().items()})
+
+
+def load_search_index(target : pymongo.collection.Collection):
+    """
+        Reads the product ID and name of every product for the search index, one batch at a time.
+
+        :param target:      The collection to read.
+        :return generator:  A generator of every product (only the product ID and name).
+    """
+
+    # For every batch,
+    for documents, token in iterate_keyset(target, {}, {"_id": 0, "product_id": 1, "product_name": 1}, 10000):
+        yield from documents  # Returns its products.
+
+
+def read_search_index(target : pymongo.collection.Collection, text : str, limit : int, prefix : bool) -> list:
+    """
+        Finds the products matching a search with the search index, first applying the changes made since it was last
+            used.
+
+        :param target:          The collection the index holds (read again if a change cannot be applied).
+        :param text:            The search.
+        :param limit:           The most product IDs returned.
+        :param prefix:          Whether the last word is matched as a prefix.
+        :return list:           The product IDs of the matching products, or None if the index is disabled or could
+                                not be read (the search is then run in the database).
+    """
+
+    # If the index is disabled (or could miss the writes of other processes),
+    if not search_enabled or not can_reuse_pages():
+        return None  # Returns nothing (the search is run in the database).
+
+    # Makes an attempt,
+    try:
+        search_index.refresh(change_feed, lambda: load_search_index(target))  # Brings the index up to date.
+        return search_index.search(text, limit, prefix)  # Returns the matching products.
+
+    # If the products could not be read,
+    except Exception:
+        return None  # Returns nothing (the search is run in the database).
+
+
+def get_search_query(text : str, prefix : bool =True) -> dict:
+    """
+        Gets the query finding the products whose names contain every word of a search (used when the search index
+            cannot serve the search; no index can serve it, so every product is scanned).
+
+        :param text:            The search.
+        :param prefix:          Whether the last word is matched as a prefix.
+        :return dict:           The query.
+    """
+
+    terms = imsr.get_terms(text)  # Gets the words of the search.
+    conditions = []  # Holds the condition of every word.
+
+    # For every word,
+    for index, term in enumerate(terms):
+        ending = "" if prefix and index == len(terms) - 1 else r"\b"  # Only the last word of a prefix search may go on.
+        conditions.append({"product_name": {"$regex": r"\b" + re.escape(term) + ending, "$options": "i"}})
+
+    return {"$and": conditions} if len(conditions) > 1 else conditions[0]  # Returns the query.
+
+
+@imm.instrument("search_products", count_documents=len, is_failure=lambda results: results is None)
+def search_products(text : str, limit : int =20, prefix : bool =True) -> list:
+    """
+        Finds the products whose names contain every word of a search (see SearchIndex.search()). The search index
+            answers type-ahead lookups over hundreds of thousands of products in milliseconds; when it cannot be
+            used, the names are matched in the database instead (ordered by product ID).
+
+        :param text:            The search (e.g. "blue wid").
+        :param limit:           The most products returned.
+        :param prefix:          Whether the last word is matched as a prefix (e.g. while typing).
+        :return list:           The matching products (only the fields shown in the table), or None if the search
+                                failed.
+    """
+
+    session = get_session()  # Gets the session of the request.
+
+    # If the user is not logged in,
+    if not session.logged_in:
+        print("Login first!")  # Outputs an error.
+        return None  # Returns nothing (the user should not be able to retrieve data unless they are logged in).
+
+    # The below code only runs if the user is logged in.
+
+    # If the search has no words,
+    if not imsr.get_terms(text):
+        return []  # Returns no products.
+
+    product_ids = read_search_index(session.collection, text, limit, prefix)  # Finds the products with the index.
+
+    # Makes an attempt,
+    try:
+        # If the index could not be used,
+        if product_ids is None:
+            # Returns the products found by matching the names in the database.
+            return list(session.collection.find(get_search_query(text, prefix), table_projection)
+                        .sort([("product_id", pymongo.ASCENDING)]).limit(limit))
+
+        # Reads the products found (one query using the product ID index).
+        documents = {document["product_id"]: document
+                     for document in session.collection.find({"product_id": {"$in": product_ids}}, table_projection)}
+
+    # If an error occurred,
+    except Exception:
+        print("The products could not be searched!")  # Outputs an error.
+        return None  # Returns nothing.
+
+    return [documents[product_id] for product_id in product_ids if product_id in documents]  # Returns them in order.
+
+
+def get_search_metrics() -> dict:
+    """
+        Gets the size and usage counters of the search index.
+
+        :return dict:       The metrics of the search index (see SearchIndex.get_metrics()).
+    """
+
+    return search_index.get_metrics()  # Returns the metrics of the search index.
+
+
+# Serves the metrics of the search index with every other metric (e.g. "ims_search_terms").
+imm.register_collector(lambda: {f"ims_search_{name}": value for name, value in get_search_metrics().items()})
+
+
+def get_cache_metrics() -> dict:
+    """
+        Gets the hit/miss counters and the size of the page cache.
+
+        :return dict:       The metrics of the cache (see QueryCache.get_metrics()).
+    """
+
+    return query_cache.get_metrics()  # Returns the metrics of the cache.
+
+
+# Serves the metrics of the cache with every other metric (e.g. "ims_cache_hits").
+imm.register_collector(lambda: {f"ims_cache_{name}": value for name, value in get_cache_metrics().items()})
+
+
+def get_page_count(total : int, page_size : int) -> int:
+    """
+        Gets the number of pages needed to show every matching document.
+
+        :param total:       The total number of matching documents.
+        :param page_size:   The number of documents on each page.
+        :return int:        The number of pages (at least 1).
+    """
+
+    return max(1, math.ceil(total / page_size))  # Returns the number of pages.
+
+
+def start_change_watcher(target : pymongo.collection.Collection):
+    """
+        Starts watching the change stream of the collection in a background thread (one thread per process).
+            Every change, including changes made by other processes, is added to the change feed and removes the
+            cached pages it could change. If the server does not support change streams (e.g. it is not a replica set),
+            the change feed keeps being filled by the writes of this process instead.
+
+        :param target:      The collection to watch.
+    """
+
+    # Declare which variables use the global scope.
+    global change_watcher
+
+    # Only one thread may start the watcher.
+    with change_watcher_lock:
+        # If the watcher is already running,
+        if change_watcher is not None and change_watcher.is_alive():
+            return  # Exits the function (every session shares the watcher).
+
+        change_watcher_stop.clear()  # Allows the new watcher to run.
+        change_watcher = threading.Thread(target=watch_changes, args=(target,), name="change_watcher", daemon=True)
+        change_watcher.start()  # Starts the watcher.
+
+
+def stop_change_watcher():
+    """
+        Stops the thread watching the change stream of the collection (if it is running).
+    """
+
+    change_watcher_stop.set()  # Tells the watcher to stop.
+
+    # If the watcher is running (and is not the thread calling this function),
+    if change_watcher is not None and change_watcher is not threading.current_thread():
+        change_watcher.join(change_watcher_wait_ms / 1000 * 2)  # Waits for the watcher to stop.
+
+
+def watch_changes(target : pymongo.collection.Collection):
+    """
+        Adds every change reported by the change stream of the collection to the change feed until it is told to stop.
+            If the stream is lost (e.g. the connection dropped), it is opened again after a growing delay and resumes
+            after the last change reported, and the writes of this process are added in the meantime. If the stream
+            cannot be opened at all (e.g. the server is not a replica set, or the client is a stand-in such as mongomock
+            without a watch() method), the watcher stops and the change feed keeps adding the writes of this process
+            and polling the change counter of the workers (see ChangeFeed.synchronize()).
+
+        :param target:      The collection to watch.
+    """
+
+    resume_token = None  # Holds the position of the stream after the last change reported (None to start from now).
+    delay = change_watcher_retry_seconds  # Holds how long to wait before opening the stream again.
+
+    # While the watcher has not been told to stop,
+    while not change_watcher_stop.is_set():
+        opened = False  # Holds whether the stream was opened.
+
+        # Makes an attempt,
+        try:
+            # Opens the change stream (the updated document is looked up so it can be shown in the table).
+            with target.watch(full_document="updateLookup", max_await_time_ms=change_watcher_wait_ms,
+                              resume_after=resume_token) as stream:
+                opened = True  # Marks the stream as opened.
+                change_feed.set_mode("stream")  # Stops adding the writes of this process (the stream reports them).
+                delay = change_watcher_retry_seconds  # Waits the shortest time again the next time the stream is lost.
+
+                # While the watcher has not been told to stop,
+                while not change_watcher_stop.is_set():
+                    event = stream.try_next()  # Waits (briefly) for the next change.
+
+                    # If a change was reported,
+                    if event is not None:
+                        record_change_event(event)  # Adds the change to the change feed.
+
+                    resume_token = stream.resume_token  # Remembers where the stream is.
+
+        # If the stream was lost,
+        except pymongo.errors.PyMongoError as error:
+            code = getattr(error, "code", None)  # Gets the code of the error (None if the server did not send one).
+
+            # If the server does not support change streams (e.g. it is not a replica set),
+            if isinstance(error, pymongo.errors.OperationFailure) and code in change_stream_unsupported_codes:
+                break  # Falls back to the writes of this process for good.
+
+            change_feed.set_mode("local")  # Adds the writes of this process until the stream is open again.
+            imm.increment("ims_change_watcher_retries_total")  # Counts the lost stream.
+
+            # If the stream cannot resume after the last change (e.g. it is no longer in the oplog),
+            if isinstance(error, pymongo.errors.OperationFailure) and code in change_stream_lost_codes:
+                resume_token = None  # Opens the stream from now on.
+                query_cache.clear()  # Removes every cached page (the changes made meanwhile are not known).
+                change_feed.record("reset")  # Tells the dashboards that any document may have changed.
+
+            change_watcher_stop.wait(delay)  # Waits before opening the stream again (unless told to stop).
+            delay = min(delay * 2, change_watcher_max_retry_seconds)  # Waits longer if it is lost again.
+
+        # If any other error occurred (e.g. the client has no change streams, or a change could not be added),
+        except Exception as error:
+            change_feed.set_mode("local")  # Adds the writes of this process (and polls the change counter) instead.
+
+            # If the stream could not be opened,
+            if not opened:
+                print(f"Change streams are not available ({type(error).__name__}: {error}).")  # Outputs an error.
+                break  # Falls back to the writes of this process for good.
+
+            print(f"The change stream failed ({type(error).__name__}: {error})!")  # Outputs an error.
+            imm.increment("ims_change_watcher_retries_total")  # Counts the lost stream.
+            resume_token = None  # Opens the stream from now on (resuming could report the same change again).
+            query_cache.clear()  # Removes every cached page (the changes made meanwhile are not known).
+            change_feed.record("reset")  # Tells the dashboards that any document may have changed.
+            change_watcher_stop.wait(delay)  # Waits before opening the stream again (unless told to stop).
+            delay = min(delay * 2, change_watcher_max_retry_seconds)  # Waits longer if it is lost again.
+
+    change_feed.set_mode("local")  # Adds the writes of this process again.
+
+
+def record_change_event(event : dict):
+    """
+        Adds a single change stream event to the change feed and removes the cached pages it could change.
+
+        :param event:       The change stream event.
+    """
+
+    operation = event.get("operationType")  # Gets the type of the change.
+    document = event.get("fullDocument")  # Gets the document after the change (if it still exists).
+
+    # If the document is known,
+    if document is not None:
+        document = {field: document[field] for field in product_field_types if field in document}  # Keeps the table fields.
+
+    # If a document was inserted (or replaced),
+    if operation in ("insert", "replace") and document is not None:
+        query_cache.invalidate(document, inserted_or_deleted=True)  # Removes the cached pages it belongs on.
+        change_feed.record("insert", document)  # Adds the change.
+
+    # Otherwise if a document was updated,
+    elif operation == "update" and document is not None:
+        description = event.get("updateDescription", {})  # Gets which fields were changed.
+        fields = {field.split(".")[0] for field in description.get("updatedFields", {})} | \
+                 {field.split(".")[0] for field in description.get("removedFields", [])}
+        query_cache.invalidate(document, fields)  # Removes the cached pages it could change.
+        change_feed.record("update", document, fields)  # Adds the change.
+
+    # Otherwise (a document was deleted, or the collection was dropped or renamed),
+    else:
+        query_cache.clear()  # Removes every cached page (only the "_id" of a deleted document is reported).
+        change_feed.record("reset")  # Tells the dashboards that any document may have changed.
+
+
+def get_page_patches(changes : list, records : list, sort_by : list =None, filter_query : str ="") -> dict:
+    """
+        Works out how a page of the table is affected by a list of changes (see ChangeFeed.changes_since()).
+
+        :param changes:         The changes, with only the newest change of every product.
+        :param records:         The documents shown on the page.
+        :param sort_by:         The sort_by property of the DataTable.
+        :param filter_query:    The filter_query property of the DataTable.
+        :return dict:           The new document of every changed row, keyed by its index on the page (empty if the
+                                page is not affected), or None if the page must be read again.
+    """
+
+    query = translate_filter_query(filter_query)  # Translates the filter into a MongoDB query.
+    order_fields = imc.get_query_fields(query) | {field for field, direction in translate_sort_by(sort_by)}
+    rows = {record.get("product_id"): index for index, record in enumerate(records)}  # Maps every product to its row.
+    patches = {}  # Holds the new document of every changed row.
+
+    # For every change,
+    for change in changes:
+        # If any document may have changed,
+        if change["type"] == "reset":
+            return None  # Returns that the page must be read again.
+
+        # If the product is shown on the page,
+        if change["product_id"] in rows:
+            # If the change could move the product (or remove it from the page),
+            if change["type"] != "update" or change["fields"] is None or change["fields"] & order_fields:
+                return None  # Returns that the page must be read again.
+
+            patches[rows[change["product_id"]]] = change["document"]  # Updates the row in place.
+
+        # Otherwise if the change could add a product to the page or move the products shown on it,
+        elif change["type"] != "update" or change["fields"] is None or change["fields"] & order_fields:
+            # Makes an attempt,
+            try:
+                # If the product does not match the filter (before or after the change), it cannot affect the page.
+                if change["type"] == "update" and change["fields"] is not None and \
+                        change["fields"] & imc.get_query_fields(query) == set() and \
+                        not imc.document_matches(query, change["document"]):
+                    continue
+
+                # If the inserted or deleted product does not match the filter, it cannot affect the page.
+                if change["type"] != "update" and not imc.document_matches(query, change["document"]):
+                    continue
+
+            # If the filter cannot be checked in memory,
+            except ValueError:
+                pass  # Assumes the page is affected.
+
+            return None  # Returns that the page must be read again.
+
+    return patches  # Returns the new document of every changed row.
+
+
+@imm.instrument("update")
+def update(query : dict ={}, data : dict ={}) -> dict:
+    """
+        Updates one entry with new data.
+
+        :param query:       A dictionary containing an identifier of the entry to update.
+        :param data:        A dictionary of the new data to apply to the found entry.
+        :return dict:       The updated document (without the "_id" field), or None if nothing was updated.
+    """
+
+    session = get_session()  # Gets the session of the request.
+
+    # If the user is not logged in,
+    if not session.logged_in:
+        print("Login first!")  # Outputs an error.
+        return None  # Exits the function (the user should not be able to update the entries unless they are logged in).
+
+    # The below code only runs if the user is logged in.
+
+    # Makes an attempt,
+    try:
+        # Updates the entry with new data and gets the document as it was before the update (needed for the summary).
+        previous = session.collection.find_one_and_update(query, data, projection=table_projection,
+                                                  return_document=pymongo.ReturnDocument.BEFORE)
+
+        # If no document was updated,
+        if previous is None:
+            return None  # Returns nothing (no document matched the query).
+
+        # Makes an attempt,
+        try:
+            document = imc.apply_update(previous, data)  # Applies the same update to the document in memory.
+            document = {field: document[field] for field in product_field_types if field in document}
+
+        # If the update cannot be applied in memory,
+        except ValueError:
+            document = session.collection.find_one({"product_id": previous.get("product_id")}, table_projection)
+
+    # If an error occurred,
+    except Exception:
+        print("The document could not be updated!")  # Outputs an error.
+        return None  # Returns nothing (no document was updated).
+
+    query_cache.invalidate(document or previous, imc.get_update_fields(data))  # Removes the cached pages it could change.
+    change_feed.record_local("update", document or previous, imc.get_update_fields(data))  # Tells the dashboards about it.
+    journal_products([previous.get("product_id")], [document] if document else [])  # Records it in the journal.
+    adjust_summary(previous, document)  # Moves the summary from the old document to the new one.
+    return document  # Returns the updated document.
+
+
+@imm.instrument("delete")
+def delete(query : dict) -> dict:
+    """
+        Deletes an entry from the database.
+
+        :param query:   A dictionary containing an identifier for the document to be deleted.
+        :return dict:   The deleted document (without the "_id" field), or None if nothing was deleted.
+    """
+
+    session = get_session()  # Gets the session of the request.
+
+    # If the user is not logged in,
+    if not session.logged_in:
+        print("Login first!")  # Outputs an error.
+        return None  # Exits the function (the user should not be able to delete documents unless they are logged in).
+
+    # The below code only executes if the user is logged in.
+
+    # If the query is empty,
+    if (query == None or query == {}):
+        print("Specify something to delete!")  # Output an error.
+        return None  # Exits the function (specifying nothing would delete the first entry in the database).
+
+    # The below code only executes if the query is not empty.
+
+    # Makes an attempt,
+    try:
+        document = session.collection.find_one_and_delete(query, projection=table_projection)  # Deletes the entry found with the query.
+
+    # If an error is occurred,
+    except Exception:
+        print("The document could not be deleted!")  # Outputs an error.
+        return None  # Returns nothing (no document was deleted).
+
+    # If a document was deleted,
+    if document is not None:
+        query_cache.invalidate(document, inserted_or_deleted=True)  # Removes the cached pages it belonged on.
+        change_feed.record_local("delete", document)  # Tells the dashboards about the deleted document.
+        journal.record_deletions([document.get("product_id")])  # Records the deletion in the change journal.
+        adjust_summary(document, None)  # Removes the deleted document from the summary.
+
+    return document  # Returns the deleted document (None if no document matched the query).
+
+
+def build_bulk_operation(operation) -> object:
+    """
+        Converts a single operation into the matching pymongo bulk write operation.
+
+        :param operation:   A dictionary describing the operation e.g. {"op": "insert", "document": {...}},
+                            {"op": "update", "query": {...}, "data": {...}, "upsert": False},
+                            {"op": "replace", "query": {...}, "document": {...}, "upsert": False} or
+                            {"op": "delete", "query": {...}}. A pymongo InsertOne, UpdateOne, ReplaceOne or
+                            DeleteOne is used as it is (other pymongo operations, e.g. UpdateMany, are refused).
+                            {"op": "invalid", "error": "..."} marks an operation that could not be read.
+        :return object:     The pymongo operation (InsertOne, UpdateOne, ReplaceOne or DeleteOne).
+    """
+
+    # If the operation is already a pymongo operation,
+    if isinstance(operation, (pymongo.InsertOne, pymongo.UpdateOne, pymongo.ReplaceOne, pymongo.DeleteOne)):
+        return operation  # Returns the operation as it is.
+
+    # If the operation is not a dictionary (e.g. UpdateMany or DeleteMany, whose changes cannot be journaled or
+    #   summarized by product),
+    if not isinstance(operation, dict):
+        raise ValueError(f"Unsupported bulk operation: {type(operation).__name__}")  # Refuses the operation.
+
+    kind = operation.get("op")  # Gets the kind of operation.
+
+    # If the operation is an insertion,
+    if kind == "insert":
+        return pymongo.InsertOne(dict(operation["document"]))  # Copies the document (inserting adds an "_id" field).
+
+    # Otherwise if the operation is an update,
+    elif kind == "update":
+        return pymongo.UpdateOne(operation["query"], operation["data"], upsert=operation.get("upsert", False))
+
+    # Otherwise if the operation is a replacement,
+    elif kind == "replace":
+        return pymongo.ReplaceOne(operation["query"], operation["document"], upsert=operation.get("upsert", False))
+
+    # Otherwise if the operation is a deletion,
+    elif kind == "delete":
+        # If the query is empty,
+        if not operation["query"]:
+            raise ValueError("Specify something to delete!")  # Refuses the operation (it would delete the first entry).
+
+        return pymongo.DeleteOne(operation["query"])
+
+    # Refuses the operation (the kind is not supported, or the operation could not be built from its source).
+    raise ValueError(operation.get("error", f"Unknown operation: {kind}"))
+
+
+def get_batch_result(positions : list, written, error : Exception, seconds : float) -> dict:
+    """
+        Gets the counts and errors of a single bulk_write call.
+
+        :param positions:   The position of each operation of the batch within the whole stream.
+        :param written:     The BulkWriteResult of the call (None if the call raised an error).
+        :param error:       The error raised by the call (None if it succeeded).
+        :param seconds:     How long the call took.
+        :return dict:       The counts, errors and duration of the batch.
+    """
+
+    result = {"operations": len(positions), "inserted": 0, "matched": 0, "modified": 0, "deleted": 0, "upserted": 0,
+              "errors": [], "seconds": seconds}  # Holds the result of the batch.
+
+    # If every operation succeeded,
+    if error is None:
+        # Stores the counts of the batch.
+        result["inserted"] = written.inserted_count
+        result["matched"] = written.matched_count
+        result["modified"] = written.modified_count
+        result["deleted"] = written.deleted_count
+        result["upserted"] = written.upserted_count
+
+    # Otherwise if some of the operations failed,
+    elif isinstance(error, pymongo.errors.BulkWriteError):
+        details = error.details  # Gets the details of what was and was not written.
+
+        # Stores the counts of the operations that succeeded.
+        result["inserted"] = details.get("nInserted", 0)
+        result["matched"] = details.get("nMatched", 0)
+        result["modified"] = details.get("nModified", 0)
+        result["deleted"] = details.get("nRemoved", 0)
+        result["upserted"] = details.get("nUpserted", 0)
+
+        # Stores every error with its position within the whole stream.
+        result["errors"] = [{"index": positions[write_error["index"]], "code": write_error.get("code"),
+                             "message": write_error.get("errmsg")} for write_error in details.get("writeErrors", [])]
+
+    # Otherwise (the whole batch failed e.g. the connection was lost),
+    else:
+        result["errors"] = [{"index": positions[0], "code": None, "message": str(error)}]  # Stores the error.
+
+    return result  # Returns the result of the batch.
+
+
+def write_batch(batch : list, ordered : bool, positions : list, record : bool =True) -> dict:
+    """
+        Writes a single batch of operations to the collection with one bulk_write call.
+
+        :param batch:       The pymongo operations to write.
+        :param ordered:     Whether the operations must be applied in order (stopping at the first error).
+        :param positions:   The position of each operation of the batch within the whole stream.
+        :param record:      Whether to record the changed products in the change journal (the caller records them
+                            itself if False).
+        :return dict:       The counts, errors and duration of the batch.
+    """
+
+    written = None  # Holds the result of the call.
+    error = None  # Holds the error raised by the call.
+    start = time.perf_counter()  # Records when the batch started.
+
+    # Makes an attempt,
+    try:
+        written = get_session().collection.bulk_write(batch, ordered=ordered)  # Writes every operation in one round-trip.
+
+    # If an error occurred,
+    except Exception as caught:
+        error = caught  # Stores the error.
+
+    seconds = time.perf_counter() - start  # Records how long the batch took (recording it in the journal is not timed).
+
+    # If the changed products should be recorded,
+    if record:
+        journal_batch(batch, get_session().collection)  # Records the products as they are after the batch.
+
+    return get_batch_result(positions, written, error, seconds)  # Returns the result of the batch.
+
+
+def read_batch_products(target : pymongo.collection.Collection, product_ids : list) -> dict:
+    """
+        Reads the products a batch of bulk write operations selects.
+
+        :param target:      The collection holding the products.
+        :param product_ids: The product IDs (see get_journal_product_ids()).
+        :return dict:       The products (only the fields shown in the table), keyed by product ID, or None if they
+                            could not be read.
+    """
+
+    # Makes an attempt,
+    try:
+        # Returns the products.
+        return {document.get("product_id"): document for document in
+                target.find({"product_id": {"$in": product_ids}}, table_projection)} if product_ids else {}
+
+    # If an error occurred,
+    except Exception:
+        return None  # Returns nothing (the products are not known).
+
+
+def write_summarized_batch(batch : list, ordered : bool, positions : list) -> (dict, bool):
+    """
+        Writes a single batch of operations (see write_batch()), records it in the change journal and adjusts the
+            summary by the products it changed. The products are read before and after the batch, so the summary is
+            only rebuilt when the changes cannot be known (e.g. an operation not selecting products by product ID).
+
+        :param batch:       The pymongo operations to write.
+        :param ordered:     Whether the operations must be applied in order (stopping at the first error).
+        :param positions:   The position of each operation of the batch within the whole stream.
+        :return (dict,
+                 bool):     The counts, errors and duration of the batch.
+                            Whether the summary was adjusted (otherwise it must be rebuilt).
+    """
+
+    target = get_session().collection  # Gets the collection of the session.
+    product_ids, unknown = get_journal_product_ids(batch)  # Gets the products the batch can change.
+    before = None if unknown else read_batch_products(target, product_ids)  # Reads them before the batch.
+    selected = read_journal_selection(target, unknown)  # Reads the products the other operations select.
+    batch_result = write_batch(batch, ordered, positions, record=False)  # Writes the batch.
+    after = read_batch_products(target, product_ids)  # Reads the products after the batch.
+
+    # If the products after the batch are known and every operation selects products by product ID,
+    if after is not None and not unknown:
+        journal_products(product_ids, list(after.values()))  # Records them in the change journal.
+
+    # Otherwise,
+    else:
+        journal_batch(batch, target, selected)  # Reads and records every product the batch can have changed.
+
+    changes = get_summary_changes(product_ids, before, after, batch_result)  # Gets the changes the batch made.
+
+    # If the changes are not known,
+    if changes is None:
+        return batch_result, False  # Returns that the summary must be rebuilt.
+
+    adjust_summary_many(changes)  # Adjusts the summary by every change at once.
+    return batch_result, True  # Returns that the summary was adjusted.
+
+
+def get_journal_product_ids(batch : list) -> (list, list):
+    """
+        Gets the products a batch of bulk write operations can change.
+
+        :param batch:       The pymongo operations.
+        :return (list,
+                 list):     The product IDs of the products the operations select by product ID.
+                            The operations that do not select products by product ID.
+    """
+
+    product_ids = []  # Holds the product IDs.
+    unknown = []  # Holds the operations that do not select products by product ID.
+
+    # For every operation,
+    for operation in batch:
+        selected = imj.get_operation_product_ids(operation)  # Gets the products it can change.
+
+        # If the products cannot be known,
+        if selected is None:
+            unknown.append(operation)
+
+        # Otherwise (the products are known),
+        else:
+            product_ids.extend(selected)
+
+    return list(dict.fromkeys(product_ids)), unknown  # Returns the product IDs (without duplicates).
+
+
+def get_journal_query(product_ids : list, unknown : list) -> dict:
+    """
+        Gets the query finding every product a batch of bulk write operations can have changed: the products selected
+            by product ID and the products matching the query of every other operation (an inserted document is found
+            by the "_id" it was given when it was written).
+
+        :param product_ids: The product IDs the operations select (see get_journal_product_ids()).
+        :param unknown:     The operations that do not select products by product ID.
+        :return dict:       The query, or None if the operations cannot change any product.
+    """
+
+    queries = [{"product_id": {"$in": product_ids}}] if product_ids else []  # Holds the query of every selection.
+
+    # For every operation not selecting products by product ID,
+    for operation in unknown:
+        kind, query, data, upsert = ims.get_bulk_request(operation)  # Reads the operation.
+
+        # If the operation is an insertion,
+        if kind == "insert":
+            # If the document was given an "_id" (it always is once it was written),
+            if "_id" in data:
+                queries.append({"_id": data["_id"]})  # Finds the inserted document.
+
+        # Otherwise,
+        else:
+            queries.append(query)  # Finds the documents the operation selects.
+
+    return {"$or": queries} if queries else None  # Returns the query.
+
+
+def read_journal_selection(target : pymongo.collection.Collection, unknown : list) -> list:
+    """
+        Reads the product IDs the operations not selecting products by product ID select before they are written, so
+            the products they change (or delete) can be recorded in the change journal after the write.
+
+        :param target:      The collection holding the products.
+        :param unknown:     The operations that do not select products by product ID.
+        :return list:       The product IDs (empty if writes are not recorded or the products could not be read).
+    """
+
+    query = get_journal_query([], unknown)  # Gets the query of the operations.
+
+    # If writes are not recorded or the operations select no products,
+    if not journal.enabled or query is None:
+        return []  # Returns nothing (nothing has to be read).
+
+    # Makes an attempt,
+    try:
+        # Returns the product IDs.
+        return [document["product_id"] for document in target.find(query, {"_id": 0, "product_id": 1})
+                if "product_id" in document]
+
+    # If an error occurred,
+    except Exception:
+        print("The products selected by the bulk write could not be read for the change journal!")  # Outputs an error.
+        imm.increment("ims_operation_errors_total", layer="backend", operation="journal_batch")  # Counts the error.
+        return []  # Returns nothing (products deleted by the operations are not recorded).
+
+
+def journal_products(product_ids : list, documents : list):
+    """
+        Records products in the change journal as they are now (a product that was not found was deleted).
+
+        :param product_ids: The product IDs of the products that were written.
+        :param documents:   The products that still exist (only the fields shown in the table).
+    """
+
+    found = {document.get("product_id") for document in documents}  # Gets the products that still exist.
+    journal.record_products(documents)  # Records the products.
+    journal.record_deletions([product_id for product_id in product_ids if product_id not in found])
+
+
+def journal_batch(batch : list, target : pymongo.collection.Collection, selected : list =()):
+    """
+        Records the products changed by a batch of bulk write operations in the change journal. The products are read
+            back after the batch, so only the writes that were made are recorded (and replaying them is idempotent).
+            The products of operations that do not select products by product ID are found with their queries, and
+            with the products they selected before the batch (a selected product that is gone was deleted).
+
+        :param batch:       The pymongo operations that were written.
+        :param target:      The collection they were written to.
+        :param selected:    The product IDs the other operations selected before the batch (see
+                            read_journal_selection()).
+    """
+
+    # If writes are not recorded,
+    if not journal.enabled:
+        return  # Exits the function (the products are not read back).
+
+    product_ids, unknown = get_journal_product_ids(batch)  # Gets the products the batch can change.
+    product_ids = list(dict.fromkeys([*product_ids, *selected]))  # Adds the products the other operations selected.
+    query = get_journal_query(product_ids, unknown)  # Gets the query finding every product the batch can change.
+
+    # Makes an attempt,
+    try:
+        documents = list(target.find(query, table_projection)) if query else []  # Reads the products after the batch.
+
+    # If an error occurred,
+    except Exception:
+        print("The written products could not be recorded in the change journal!")  # Outputs an error.
+        imm.increment("ims_operation_errors_total", layer="backend", operation="journal_batch")  # Counts the error.
+        return  # Exits the function.
+
+    # Records the products (a document without a product ID cannot be replayed, so it is not recorded).
+    journal_products(product_ids, [document for document in documents if "product_id" in document])
+
+
+def read_journal_snapshot() -> list:
+    """
+        Reads every product for a snapshot of the change journal (from the collection of the last login).
+
+        :return list:       Every product (only the fields shown in the table).
+    """
+
+    # If no session has logged in yet,
+    if journal_target is None:
+        raise RuntimeError("No collection to take a journal snapshot from.")  # Refuses the snapshot.
+
+    return list(journal_target.find({}, table_projection, batch_size=10000))  # Returns every product.
+
+
+def get_journal_metrics() -> dict:
+    """
+        Gets the size and counters of the change journal.
+
+        :return dict:       The metrics of the journal (see ChangeJournal.get_metrics()).
+    """
+
+    return journal.get_metrics()  # Returns the metrics of the journal.
+
+
+# Serves the metrics of the journal with every other metric (e.g. "ims_journal_written").
+imm.register_collector(lambda: {f"ims_journal_{name}": value for name, value in get_journal_metrics().items()})
+atexit.register(journal.stop)  # Writes the records left in the buffer when the process exits.
+
+
+def create_bulk_results() -> dict:
+    """
+        Creates the empty result of a bulk write.
+
+        :return dict:       The result with no batches, no errors and every count at zero.
+    """
+
+    # Returns the empty result.
+    return {"batches": [], "operations": 0, "inserted": 0, "matched": 0, "modified": 0, "deleted": 0, "upserted": 0,
+            "errors": [], "seconds": 0.0, "operations_per_second": 0.0}
+
+
+def finish_bulk_results(results : dict, start : float) -> dict:
+    """
+        Adds up the counts of every batch of a bulk write and calculates its throughput.
+
+        :param results:     The result holding every batch (see create_bulk_results()).
+        :param start:       When the bulk write started (from time.perf_counter()).
+        :return dict:       The result with its totals, every error in stream order and the throughput.
+    """
+
+    # Adds up the counts of every batch.
+    for batch_result in results["batches"]:
+        for key in ("operations", "inserted", "matched", "modified", "deleted", "upserted"):
+            results[key] += batch_result[key]
+
+        results["errors"].extend(batch_result["errors"])  # Stores the errors of the batch.
+
+    results["errors"].sort(key=lambda error: error["index"])  # Orders the errors by their position in the stream.
+
+    # If anything was written,
+    if results["batches"]:
+        query_cache.clear()  # Removes every cached page (a bulk write can change any of them).
+        change_feed.record_local("reset")  # Tells the dashboards that any document may have changed.
+
+    results["seconds"] = time.perf_counter() - start  # Records how long the writes took.
+
+    # If any time passed,
+    if results["seconds"] > 0:
+        results["operations_per_second"] = results["operations"] / results["seconds"]  # Calculates the throughput.
+
+    return results  # Returns the whole result.
+
+
+@imm.instrument("bulk_write", count_documents=lambda results: results["operations"],
+                is_failure=lambda results: len(results["errors"]) > 0)
+def bulk_write(operations, batch_size : int =1000, ordered : bool =False) -> dict:
+    """
+        Applies a stream of insert/update/replace/delete operations in batched bulk_write calls.
+
+        :param operations:      An iterable of operations (see build_bulk_operation()). It is read one batch at a time.
+        :param batch_size:      The maximum number of operations sent in each bulk_write call.
+        :param ordered:         Whether the operations must be applied in order. Ordered writes stop at the first error,
+                                unordered writes continue past errors and let the server apply each batch in parallel.
+        :return dict:           The result of every batch, the totals, every error and the throughput.
+    """
+
+    session = get_session()  # Gets the session of the request.
+
+    # If the user is not logged in,
+    if not session.logged_in:
+        print("Login first!")  # Outputs an error.
+        return None  # Exits the function (the user should not be able to write data unless they are logged in).
+
+    # The below code only runs if the user is logged in.
+
+    results = create_bulk_results()  # Holds the whole result.
+
+    batch = []  # Holds the operations of the current batch.
+    positions = []  # Holds the position of each operation of the current batch within the stream.
+    summarized = True  # Whether the summary was adjusted by every batch.
+    start = time.perf_counter()  # Records when the writes started.
+
+    # For every operation in the stream,
+    for index, operation in enumerate(operations):
+        # Makes an attempt,
+        try:
+            batch.append(build_bulk_operation(operation))  # Adds the operation to the current batch.
+            positions.append(index)  # Remembers where the operation is within the stream.
+
+        # If the operation is not valid,
+        except (AttributeError, KeyError, TypeError, ValueError) as error:
+            results["errors"].append({"index": index, "code": None, "message": str(error)})  # Stores the error.
+
+            # If the writes are ordered,
+            if ordered:
+                break  # Stops at the invalid operation (after writing the operations before it).
+
+            continue  # Skips the operation (unordered writes continue past errors).
+
+        # If the batch is full,
+        if len(batch) >= batch_size:
+            batch_result, adjusted = write_summarized_batch(batch, ordered, positions)  # Writes the batch.
+            results["batches"].append(batch_result)  # Stores the result of the batch.
+            summarized = summarized and adjusted  # Remembers whether the summary must be rebuilt.
+            batch = []  # Starts a new batch.
+            positions = []  # Starts the positions of the new batch.
+
+            # If the writes are ordered and the batch failed,
+            if ordered and batch_result["errors"]:
+                break  # Stops writing (ordered writes stop at the first error).
+
+    # If there are operations left in the last batch,
+    if batch:
+        batch_result, adjusted = write_summarized_batch(batch, ordered, positions)  # Writes the last batch.
+        results["batches"].append(batch_result)  # Stores the result of the batch.
+        summarized = summarized and adjusted  # Remembers whether the summary must be rebuilt.
+
+    results = finish_bulk_results(results, start)  # Adds up the totals of every batch.
+
+    # If a batch changed products that are not known exactly,
+    if not summarized:
+        rebuild_summary()  # Recalculates the summary.
+
+    return results  # Returns the whole result with its totals.
+
+
+@imm.instrument("batch_edit", count_documents=lambda results: results["operations"],
+                is_failure=lambda results: results is None)
+def batch_edit(product_ids : list, action : str, value : float =None) -> dict:
+    """
+        Applies the same edit to many products in a single bulk write (e.g. the rows selected in the dashboard).
+
+        :param product_ids:     The product IDs of the products to edit.
+        :param action:          The edit to apply: "set_price" (sets the price to the value), "adjust_quantity" (adds
+                                the value to the quantity, negative values remove stock) or "delete".
+        :param value:           The price or quantity change (not used when deleting).
+        :return dict:           The result of the bulk write (see bulk_write()), or None if the edit is not valid.
+    """
+
+    # Makes an attempt,
+    try:
+        # If the action sets the price,
+        if action == "set_price":
+            data = {"$set": {"product_price": float(value)}}  # Sets the price of every product.
+
+        # Otherwise if the action adjusts the quantity (by a whole number of units),
+        elif action == "adjust_quantity" and float(value) == int(value):
+            # Adds the change to the quantity of every product (refusing products without enough stock).
+            return adjust_quantities({product_id: int(value) for product_id in product_ids})
+
+        # Otherwise if the action deletes the products,
+        elif action == "delete":
+            data = None  # Deleting does not need any data.
+
+        # Otherwise (the action is not supported),
+        else:
+            raise ValueError(f"Unknown batch action: {action}")
+
+    # If the value could not be converted or the action is not supported,
+    except (TypeError, ValueError):
+        print("Cannot convert!")  # Outputs an error.
+        return None  # Exits the function (nothing is written).
+
+    # Creates one operation for every product (duplicates are removed so no product is edited twice).
+    operations = [{"op": "delete", "query": {"product_id": product_id}} if data is None else
+                  {"op": "update", "query": {"product_id": product_id}, "data": data}
+                  for product_id in dict.fromkeys(product_ids)]
+
+    # Writes every operation at once (each batch holds every operation, so a single bulk_write call is made).
+    return bulk_write(operations, batch_size=max(1, len(operations)))
+
+
+def get_quantity_change(delta) -> int:
+    """
+        Checks a quantity change.
+
+        :param delta:       The change (a whole number, e.g. 3 or -2.0).
+        :return int:        The change as a whole number (a ValueError is raised if it is not a whole number).
+    """
+
+    # If the change is not a whole number,
+    if isinstance(delta, bool) or not isinstance(delta, (int, float)) or delta != int(delta):
+        raise ValueError(f"The quantity change must be a whole number: {delta!r}")  # Refuses the change.
+
+    return int(delta)  # Returns the change.
+
+
+def get_quantity_query(product_id : int, delta : int, allow_negative : bool) -> dict:
+    """
+        Gets the query of an atomic quantity change. A guarded decrease only matches the product if it has enough stock,
+        so the check and the change are made together by the server and cannot be interleaved with other changes.
+
+        :param product_id:      The product ID of the product.
+        :param delta:           The change of its quantity.
+        :param allow_negative:  Whether the quantity may go below zero.
+        :return dict:           The query.
+    """
+
+    # If the change removes stock and the quantity may not go below zero,
+    if delta < 0 and not allow_negative:
+        return {"product_id": product_id, "product_quantity": {"$gte": -delta}}  # Only matches enough stock.
+
+    return {"product_id": product_id}  # Matches the product.
+
+
+@imm.instrument("adjust_quantity", is_failure=lambda document: document is None)
+def adjust_quantity(product_id : int, delta : int, allow_negative : bool =False) -> dict:
+    """
+        Atomically adds a change to the quantity of a product ($inc, so concurrent changes are never lost and no prior
+        read is needed).
+
+        :param product_id:      The product ID of the product.
+        :param delta:           The change of its quantity (negative values remove stock).
+        :param allow_negative:  Whether the quantity may go below zero. If False, a decrease larger than the stock is
+                                refused (nothing is changed).
+        :return dict:           The product after the change, or None if the product does not exist, does not have
+                                enough stock or the change is not valid.
+    """
+
+    session = get_session()  # Gets the session of the request.
+
+    # If the user is not logged in,
+    if not session.logged_in:
+        print("Login first!")  # Outputs an error.
+        return None  # Exits the function (the user should not be able to update the entries unless they are logged in).
+
+    # The below code only runs if the user is logged in.
+
+    # Makes an attempt,
+    try:
+        delta = get_quantity_change(delta)  # Checks the change.
+
+        # Adds the change to the quantity (only if the product has enough stock, unless negative stock is allowed).
+        document = session.collection.find_one_and_update(get_quantity_query(product_id, delta, allow_negative),
+                                                          {"$inc": {"product_quantity": delta}},
+                                                          projection=table_projection,
+                                                          return_document=pymongo.ReturnDocument.AFTER)
+
+    # If an error occurred,
+    except Exception:
+        print("The quantity could not be adjusted!")  # Outputs an error.
+        return None  # Returns nothing (no document was updated).
+
+    # If no product was changed,
+    if document is None:
+        print("The product does not exist or does not have enough stock!")  # Outputs an error.
+        return None  # Returns nothing (no document was updated).
+
+    previous = dict(document, product_quantity=document["product_quantity"] - delta)  # Gets the product before.
+    query_cache.invalidate(document, {"product_quantity"})  # Removes the cached pages it could change.
+    change_feed.record_local("update", document, {"product_quantity"})  # Tells the dashboards about it.
+    journal.record_products([document])  # Records the changed product in the change journal.
+    adjust_summary(previous, document)  # Moves the summary from the old quantity to the new one.
+
+    return document  # Returns the changed product.
+
+
+@imm.instrument("adjust_quantities", count_documents=lambda results: results["operations"],
+                is_failure=lambda results: results is None)
+def adjust_quantities(deltas : dict, allow_negative : bool =False) -> dict:
+    """
+        Atomically adds a change to the quantity of many products in a single bulk write (one $inc per product).
+
+        :param deltas:          The change of the quantity of every product, keyed by its product ID.
+        :param allow_negative:  Whether a quantity may go below zero. If False, each decrease larger than the stock of
+                                its product is refused (the other changes are still made).
+        :return dict:           The result of the bulk write (see bulk_write()) with the product IDs of the changes
+                                that were made ("applied"), refused for a lack of stock ("rejected"), of the
+                                products that do not exist ("missing") and of the changes that cannot be told apart
+                                from other writes made at the same time ("unknown"), or None if nothing could be
+                                written.
+    """
+
+    session = get_session()  # Gets the session of the request.
+
+    # If the user is not logged in,
+    if not session.logged_in:
+        print("Login first!")  # Outputs an error.
+        return None  # Exits the function (the user should not be able to write data unless they are logged in).
+
+    # The below code only runs if the user is logged in.
+
+    results = dict(create_bulk_results(), applied=[], rejected=[], missing=[], unknown=[])  # Holds the whole result.
+    start = time.perf_counter()  # Records when the writes started.
+
+    # Makes an attempt,
+    try:
+        deltas = {product_id: get_quantity_change(delta) for product_id, delta in deltas.items()}  # Checks every change.
+        deltas = {product_id: delta for product_id, delta in deltas.items() if delta}  # Skips the empty changes.
+
+        # Reads the products before the changes (to tell which changes the server made and which it refused).
+        before = {document.get("product_id"): document for document in
+                  session.collection.find({"product_id": {"$in": list(deltas)}}, table_projection)} if deltas else {}
+
+    # If an error occurred,
+    except Exception:
+        print("The quantities could not be adjusted!")  # Outputs an error.
+        return None  # Returns nothing (nothing was written).
+
+    # If there are no changes,
+    if not deltas:
+        return finish_quantity_results(results, start)  # Returns the empty result.
+
+    # Creates one guarded $inc for every product.
+    batch = [pymongo.UpdateOne(get_quantity_query(product_id, delta, allow_negative),
+                               {"$inc": {"product_quantity": delta}}) for product_id, delta in deltas.items()]
+    # Writes every change at once (the changed products are read below, so they are recorded from there).
+    results["batches"].append(write_batch(batch, False, list(range(len(batch))), record=False))
+
+    # Makes an attempt,
+    try:
+        # Reads the products after the changes.
+        after = {document.get("product_id"): document for document in
+                 session.collection.find({"product_id": {"$in": list(deltas)}}, table_projection)}
+
+    # If an error occurred,
+    except Exception:
+        after = None  # The changes that were made are unknown.
+
+    # If the products after the changes are known,
+    if after is not None:
+        journal_products(list(deltas), list(after.values()))  # Records them in the change journal.
+
+    # Otherwise,
+    else:
+        journal_batch(batch, session.collection)  # Tries to read and record them again.
+
+    changes = []  # Holds the (previous, document) pair of every change that was made.
+    unknown = []  # Holds the product IDs of the changes not known to have been made or refused.
+
+    # For every change,
+    for product_id, delta in deltas.items():
+        previous = before.get(product_id)  # Gets the product before the change.
+
+        # If the product does not exist,
+        if previous is None:
+            results["missing"].append(product_id)
+            continue
+
+        old = previous.get("product_quantity", 0)  # Gets the old quantity ($inc treats a missing quantity as 0).
+        new = (after or {}).get(product_id, {}).get("product_quantity")  # Gets the new quantity.
+
+        # If the quantity changed by exactly the change (the server made it),
+        if isinstance(old, (int, float)) and not isinstance(old, bool) and new == old + delta:
+            results["applied"].append(product_id)
+            changes.append((previous, after[product_id]))
 
+        # Otherwise if the quantity did not change (the server refused it),
+        elif product_id in (after or {}) and new == previous.get("product_quantity"):
+            results["rejected"].append(product_id)
 
-def login(username, password):
+        # Otherwise (another write changed the product at the same time),
+        else:
+            unknown.append(product_id)
+
+    # If the products after the changes are not known,
+    if after is None:
+        query_cache.clear()  # Removes every cached page.
+        change_feed.record_local("reset")  # Tells the dashboards that any document may have changed.
+        request_summary_rebuild()  # Rebuilds the summary when it is next read (not on the write path).
+        return finish_quantity_results(results, start)  # Returns the whole result.
+
+    # Every guarded $inc the server matched was made, so the matches not seen are among the unknown changes.
+    unseen = results["batches"][0]["matched"] - len(results["applied"])  # Gets how many unknown changes were made.
+
+    # For every change not known exactly,
+    for product_id in unknown:
+        document = after.get(product_id)  # Gets the product after the changes (None if it was deleted meanwhile).
+
+        # If every unknown change was made and the product still exists,
+        if unseen == len(unknown) and document is not None:
+            results["applied"].append(product_id)
+            # Adjusts the summary as if the change was made last (the units and value are exact; the other write
+            #   adjusted the summary by its own change).
+            changes.append((dict(document, product_quantity=document["product_quantity"] - deltas[product_id]),
+                            document))
+
+        # Otherwise if no unknown change was made,
+        elif unseen == 0:
+            results["rejected"].append(product_id)
+
+        # Otherwise (the changes made cannot be told apart),
+        else:
+            results["unknown"].append(product_id)
+
+    # For every change that was made,
+    for previous, document in changes:
+        query_cache.invalidate(document, {"product_quantity"})  # Removes the cached pages it could change.
+        change_feed.record_local("update", document, {"product_quantity"})  # Tells the dashboards about it.
+
+    # For every product whose change is not known,
+    for product_id in results["unknown"]:
+        document = after.get(product_id) or before[product_id]  # Gets the product (as it was if it was deleted).
+
+        # If the product still exists,
+        if product_id in after:
+            query_cache.invalidate(document, {"product_quantity"})  # Removes the cached pages it could change.
+            change_feed.record_local("update", document, {"product_quantity"})  # Tells the dashboards about it.
+
+        # Otherwise (it was deleted meanwhile),
+        else:
+            query_cache.invalidate(document, inserted_or_deleted=True)  # Removes the cached pages it belonged on.
+            change_feed.record_local("delete", document)  # Tells the dashboards about it.
+
+    adjust_summary_many(changes)  # Adjusts the summary by every change at once.
+
+    # If a change was not known exactly (the count of products below the reorder point may be off),
+    if unknown and unseen != 0:
+        request_summary_rebuild()  # Rebuilds the summary when it is next read (not on the write path).
+
+    return finish_quantity_results(results, start)  # Returns the whole result.
+
+
+def finish_quantity_results(results : dict, start : float) -> dict:
     """
-        Forges the connection to the MongoClient.
+        Adds up the counts of the batch of a quantity change and calculates its throughput.
 
-        :param username:        The username to use in forging the connection.
-        :param password:        The password to use in forging the connection.
+        :param results:     The result holding the batch (see adjust_quantities()).
+        :param start:       When the changes started (from time.perf_counter()).
+        :return dict:       The result with its totals and throughput.
     """
 
-    # Declare which variables use the global scope.
-    global client, collection, database, logged_in
+    # For every batch (there is at most one),
+    for batch_result in results["batches"]:
+        # Adds up the counts of the batch.
+        for key in ("operations", "inserted", "matched", "modified", "deleted", "upserted"):
+            results[key] += batch_result[key]
 
-    # Makes an attempt,
-    try:
-        # Forges the connection to the MongoClient
-        client = pymongo.MongoClient(host="localhost", port=27017, username=username, password=password,
-                                     serverSelectionTimeoutMS=1)
+        results["errors"].extend(batch_result["errors"])  # Stores the errors of the batch.
 
-        # The below line is used to throw an error if the connection could not be forged.
-        #   This ensures the connection is valid before accessing the database.
-        client.server_info()  # Gets info from the server.
+    results["seconds"] = time.perf_counter() - start  # Records how long the changes took.
 
-        database = client[target_db]  # Gets a reference to the target database.
-        collection = database[target_collection]  # Gets a reference to the target collection.
-        logged_in = True  # Updates the login status (login succeeded).
+    # If any time passed,
+    if results["seconds"] > 0:
+        results["operations_per_second"] = results["operations"] / results["seconds"]  # Calculates the throughput.
 
-    # If an error occurred,
-    except Exception:
-        logged_in = False  # Updates the login status (login failed).
+    return results  # Returns the whole result.
 
 
-def logout():
+def buffer_quantity_change(product_id : int, delta : int):
     """
-        Closes the connection to the MongoClient.
+        Adds a quantity change to the buffer instead of writing it (e.g. for every sale of a point-of-sale burst).
+            Changes to the same product are added up and written together by flush_quantity_changes(), or in the
+            background once start_quantity_buffer() has been called. Only changes made with the same credentials are
+            added up and written together. A decrease is refused when it is written if the net change would take the
+            product below zero (the refusal is reported then, see flush_quantity_buffer()).
+
+        :param product_id:      The product ID of the product.
+        :param delta:           The change of its quantity (negative values remove stock).
     """
 
-    # Declare which variables use the global scope.
-    global client, collection, database, logged_in
+    session = get_session()  # Gets the session of the request.
+
+    # If the user is not logged in,
+    if not session.logged_in:
+        print("Login first!")  # Outputs an error.
+        return  # Exits the function (the user should not be able to write data unless they are logged in).
+
+    # The below code only runs if the user is logged in.
+
+    delta = get_quantity_change(delta)  # Checks the change.
+
+    # Only one thread may change the sessions at a time.
+    with sessions_lock:
+        # If the credentials have no writer yet (the background flusher has no session of its own),
+        if session.client_key not in quantity_buffer_sessions:
+            writer = Session()  # Creates a session that stays logged in when the session of the request logs out.
+            writer.client, writer.database, writer.collection = session.client, session.database, session.collection
+            writer.username, writer.client_key, writer.logged_in = session.username, session.client_key, True
+            quantity_buffer_sessions[session.client_key] = writer  # Writes the group of the credentials with it.
+
+    quantity_buffer.add(product_id, delta, session.client_key)  # Adds the change to the group of the credentials.
+
+
+def flush_quantity_buffer(key, deltas : dict) -> dict:
+    """
+        Writes the changes of one group taken out of the quantity buffer (called by the buffer, from any thread).
+            Changes refused for a lack of stock, or for a product that does not exist, are reported here, as the
+            request that buffered them has already been answered.
+
+        :param key:         The credentials the changes were made with (see get_client_key()).
+        :param deltas:      The net change of every product, keyed by its product ID.
+        :return dict:       The result of the changes (see adjust_quantities()), or None if nothing was written.
+    """
+
+    # Uses a session logged in with the credentials that added the changes (the flush may run in the background).
+    token = current_session.set(quantity_buffer_sessions.get(key) or get_session())
 
     # Makes an attempt,
     try:
-        client.close()  # Closes the connection to the MongoClient.
-        logged_in = False  # Updates the login status (logout succeeded).
+        results = adjust_quantities(deltas)  # Writes every change in a single bulk write.
 
-    # If an error occurred,
-    except Exception:
-        print("The connection could not be closed!")  # Outputs an error.
+    # Whether or not an error occurred,
+    finally:
+        current_session.reset(token)  # Goes back to the session of the thread.
+
+    # For every kind of refused change,
+    for reason in ("rejected", "missing"):
+        refused = {product_id: deltas[product_id] for product_id in (results or {}).get(reason, [])}
+
+        # If changes were refused,
+        if refused:
+            print(f"Buffered quantity changes were refused ({reason}): {refused}")  # Outputs an error.
+            imm.increment("ims_quantity_buffer_refused_total", len(refused), reason=reason)  # Counts them.
+
+    return results  # Returns the result of the changes.
 
 
-def create(data : dict ={}):
+def flush_quantity_changes() -> dict:
     """
-        Creates a new entry in the database.
+        Writes every quantity change the session of the request has waiting in the buffer now.
 
-        :param data:    The data to be used in creating the new entry.
+        :return dict:       The result of the changes (see adjust_quantities()), or None if nothing was waiting.
     """
 
-    # If the user is not logged in,
-    if not logged_in:
-        print("Login first!")  # Output an error
-        return  # Exit the function (the user should not be able to create entries if they aren't logged in).
+    return quantity_buffer.flush(get_session().client_key)  # Writes the group of the credentials.
 
-    # The below code only runs if the user is logged in.
+
+def start_quantity_buffer(max_delay_seconds : float =None):
+    """
+        Starts writing the quantity buffer in the background, so no change waits longer than the delay.
+
+        :param max_delay_seconds:   The longest a change waits before it is written. If None, the delay is unchanged.
+    """
+
+    # If a delay was given,
+    if max_delay_seconds is not None:
+        quantity_buffer.max_delay_seconds = max_delay_seconds  # Updates the delay.
+
+    quantity_buffer.start()  # Starts the background flusher.
+
+
+# Serves the metrics of the quantity buffer with every other metric (e.g. "ims_quantity_buffer_pending").
+imm.register_collector(lambda: {f"ims_quantity_buffer_{name}": value
+                                for name, value in quantity_buffer.get_metrics().items()})
+atexit.register(quantity_buffer.stop)  # Writes the stock movements left in the buffer when the process exits.
+
+
+def get_file_format(path : str, file_format : str =None) -> str:
+    """
+        Gets the format of an import/export file.
+
+        :param path:            The path of the file.
+        :param file_format:     The format to use ("csv" or "jsonl"). If None, the format is taken from the extension.
+        :return str:            The format of the file ("csv" or "jsonl").
+    """
+
+    # If no format was specified,
+    if file_format is None:
+        file_format = "csv" if path.lower().endswith(".csv") else "jsonl"  # Uses the extension of the file.
+
+    # If the format is not supported,
+    if file_format not in ("csv", "jsonl"):
+        raise ValueError(f"Unsupported file format: {file_format}")  # Refuses the file.
+
+    return file_format  # Returns the format of the file.
+
+
+def convert_product_fields(record : dict) -> dict:
+    """
+        Converts the fields of an imported record to the types stored in the database.
+
+        :param record:      The record read from the file (CSV values are always text).
+        :return dict:       The record with a whole product ID and quantity and a decimal price.
+    """
+
+    document = dict(record)  # Copies the record.
+    document["product_id"] = int(document["product_id"])  # Every product must have a whole product ID.
+
+    # For every field that was left empty (e.g. a blank CSV cell),
+    for field in [field for field, value in document.items() if value == ""]:
+        del document[field]  # Removes the field (an import should not overwrite stored values with blanks).
+
+    # If the record has a price,
+    if document.get("product_price") is not None:
+        document["product_price"] = float(document["product_price"])  # Converts the price to a float value.
+
+    # If the record has a quantity,
+    if document.get("product_quantity") is not None:
+        document["product_quantity"] = int(document["product_quantity"])  # Converts the quantity to an integer value.
+
+    return document  # Returns the converted record.
+
+
+def read_import_file(path : str, file_format : str =None):
+    """
+        Reads the records of a CSV or JSON Lines file one at a time. A record that cannot be read (e.g. a line that
+            is not valid JSON) is reported with an error instead of stopping the read, so the rest of the file is
+            still imported.
+
+        :param path:            The path of the file to read.
+        :param file_format:     The format of the file ("csv" or "jsonl"). If None, the format is taken from the extension.
+        :return generator:      A generator of (line number, raw record, error) for every record in the file (the
+                                record is None and the error is a message if the record could not be read).
+    """
+
+    file_format = get_file_format(path, file_format)  # Gets the format of the file.
+
+    # Opens the file (only one line is held in memory at a time).
+    with open(path, "r", newline="", encoding="utf-8") as file:
+        # If the file is a CSV file,
+        if file_format == "csv":
+            reader = csv.DictReader(file)  # Reads every row as a dictionary.
+
+            # Until the end of the file,
+            while True:
+                # Makes an attempt,
+                try:
+                    record = next(reader)  # Reads the next row.
+
+                # If there are no more rows,
+                except StopIteration:
+                    return  # Exits the function.
+
+                # If the row is not valid CSV (the reader continues with the next row),
+                except csv.Error as error:
+                    yield reader.line_num, None, f"Line {reader.line_num} is not valid CSV: {error}"  # Reports the row.
+                    continue
+
+                yield reader.line_num, record, None  # Yields the row.
+
+        # Otherwise (the file is a JSON Lines file),
+        else:
+            # For every line in the file,
+            for number, line in enumerate(file, start=1):
+                # If the line is blank,
+                if not line.strip():
+                    continue  # Skips the line.
+
+                # Makes an attempt,
+                try:
+                    record = json.loads(line)  # Reads the record on the line.
+
+                # If the line is not valid JSON,
+                except ValueError as error:
+                    yield number, None, f"Line {number} is not valid JSON: {error}"  # Reports the line.
+                    continue
+
+                # If the line does not hold an object (e.g. a list or a number),
+                if not isinstance(record, dict):
+                    yield number, None, f"Line {number} is not a JSON object."  # Reports the line.
+                    continue
+
+                yield number, record, None  # Yields the record on the line.
+
+
+@imm.instrument("import_file", count_documents=lambda results: results["operations"],
+                is_failure=lambda results: len(results["errors"]) > 0)
+def import_file(path : str, file_format : str =None, batch_size : int =1000, upsert : bool =True,
+                ordered : bool =False) -> dict:
+    """
+        Streams a CSV or JSON Lines file into the collection using batched bulk writes.
+
+        :param path:            The path of the file to import.
+        :param file_format:     The format of the file ("csv" or "jsonl"). If None, the format is taken from the extension.
+        :param batch_size:      The number of records written in each bulk_write call.
+        :param upsert:          Whether records update the product with the same product ID (True) or are inserted (False).
+        :param ordered:         Whether the records must be written in order (stopping at the first error).
+        :return dict:           The result of the bulk write (see bulk_write()).
+    """
+
+    def operations():
+        """
+            Converts every record in the file into a bulk write operation.
+
+            :return generator:      A generator of the operations.
+        """
+
+        # For every record in the file,
+        for number, record, error in read_import_file(path, file_format):
+            # If the record could not be read,
+            if error is not None:
+                yield {"op": "invalid", "error": error}  # Reports the record.
+                continue
+
+            # Makes an attempt,
+            try:
+                document = convert_product_fields(record)  # Converts the record to the stored types.
+
+            # If the record could not be converted,
+            except (KeyError, TypeError, ValueError) as error:
+                # Reports the record.
+                yield {"op": "invalid", "error": f"The record on line {number} could not be converted: {error!r}"}
+                continue
+
+            # If the record should update the existing product,
+            if upsert:
+                yield {"op": "update", "query": {"product_id": document["product_id"]}, "data": {"$set": document},
+                       "upsert": True}
+
+            # Otherwise (the record should be inserted),
+            else:
+                yield {"op": "insert", "document": document}
+
+    return bulk_write(operations(), batch_size, ordered)  # Writes the records in batches.
+
+
+def iterate_documents(query : dict ={}, projection : dict =None, batch_size : int =1000):
+    """
+        Iterates over the documents matching a query without holding them all in memory (in product ID order, see
+            stream_batches()).
+
+        :param query:           The dictionary to be used to find the matching documents.
+        :param projection:      The fields to return. If None, every field except "_id" is returned.
+        :param batch_size:      The number of documents read in each batch.
+        :return generator:      A generator of the matching documents.
+    """
+
+    yield from stream_documents(query, projection, batch_size)  # Yields every document, one batch at a time.
+
+
+@imm.instrument("export_file", count_documents=lambda count: count)
+def export_file(path : str, file_format : str =None, query : dict ={}, batch_size : int =1000,
+                resume_token : str =None) -> int:
+    """
+        Streams the documents matching a query into a CSV or JSON Lines file. If the export stops (e.g. the server
+            is lost), the resume token of the last batch written is printed; passing it back appends the remaining
+            documents to the same file.
+
+        :param path:            The path of the file to write.
+        :param file_format:     The format of the file ("csv" or "jsonl"). If None, the format is taken from the extension.
+        :param query:           The dictionary to be used to find the documents to export.
+        :param batch_size:      The number of documents read in each batch.
+        :param resume_token:    The token printed by an export that stopped, or None to start a new file.
+        :return int:            The number of documents written.
+    """
+
+    file_format = get_file_format(path, file_format)  # Gets the format of the file.
+    count = 0  # Holds the number of documents written.
+
+    # Opens the file (only one batch is held in memory at a time), appending to it if the export is resumed.
+    with open(path, "w" if resume_token is None else "a", newline="", encoding="utf-8") as file:
+        # If the file is a CSV file,
+        if file_format == "csv":
+            # Creates a writer with a column for every product field (other fields are left out).
+            writer = csv.DictWriter(file, fieldnames=list(product_field_types), extrasaction="ignore")
+
+            # If the export is not resumed,
+            if resume_token is None:
+                writer.writeheader()  # Writes the column names.
+
+        token = resume_token  # Holds the token of the last batch written.
+
+        # Makes an attempt,
+        try:
+            # For every batch of matching documents,
+            for documents, token in stream_batches(query, None, batch_size, resume_token):
+                # If the file is a CSV file,
+                if file_format == "csv":
+                    writer.writerows(documents)  # Writes the documents as rows.
+
+                # Otherwise (the file is a JSON Lines file),
+                else:
+                    # Writes every document as a line.
+                    file.writelines(json.dumps(document, default=str) + "\n" for document in documents)
+
+                count += len(documents)  # Counts the documents.
+
+        # If an error occurred,
+        except Exception:
+            print(f"The export stopped after {count} documents!")  # Outputs an error.
+
+            # If a batch was written,
+            if token is not None:
+                print(f"Resume it with resume_token=\"{token}\".")  # Outputs how to resume the export.
+
+            raise  # Passes the error on.
+
+    return count  # Returns the number of documents written.
+
+
+def ensure_indexes(target : pymongo.collection.Collection =None, secondary_fields : list =None) -> list:
+    """
+        Creates the indexes used by the backend queries (creating an index that already exists does nothing).
+
+        :param target:              The collection to create the indexes on. If None, the logged in collection is used.
+        :param secondary_fields:    The fields to give a secondary index. If None, secondary_index_fields is used.
+        :return list:               The names of the indexes that exist after the call.
+    """
+
+    # If no collection was specified,
+    if target is None:
+        # If the user is not logged in,
+        if not get_session().logged_in:
+            print("Login first!")  # Outputs an error.
+            return []  # Returns nothing (the user should not be able to change the database unless they are logged in).
+
+        target = get_session().collection  # Uses the logged in collection.
+
+    names = []  # Holds the names of the indexes.
 
     # Makes an attempt,
     try:
-        collection.insert_one(data)  # Creates a new document in the collection.
+        # Creates a unique index on the product ID (every update and delete is keyed on it).
+        names.append(target.create_index([("product_id", pymongo.ASCENDING)], unique=True, name="product_id_unique"))
 
-    # If an error occurred,
-    except Exception:
-        print("The insertion failed.")  # Outputs an error.
+    # If the index could not be created (e.g. two products already share a product ID),
+    except pymongo.errors.PyMongoError as error:
+        print(f"The product ID index could not be created! {error}")  # Outputs an error.
 
+    # For every field to give a secondary index,
+    for field in (secondary_index_fields if secondary_fields is None else secondary_fields):
+        # Makes an attempt,
+        try:
+            # Creates an index on the field followed by the product ID (matches the sort used by read_page()).
+            names.append(target.create_index([(field, pymongo.ASCENDING), ("product_id", pymongo.ASCENDING)]))
 
-def read(query : dict ={}) -> pymongo.CursorType:
+        # If the index could not be created,
+        except pymongo.errors.PyMongoError as error:
+            print(f"The index on {field} could not be created! {error}")  # Outputs an error.
+
+    return names  # Returns the names of the indexes.
+
+
+def get_plan_stages(plan : dict) -> list:
     """
-        Reads data from the collection.
+        Gets every stage of a query plan, from the outermost stage to the innermost.
 
-        :param query:               The dictionary to be used to find the matching documents.
-        :return CursorType:         The cursor (result) of the search.
+        :param plan:        The (winning) plan from the output of an explain command.
+        :return list:       The stages of the plan (each is a dictionary with a "stage" key).
+    """
+
+    stages = []  # Holds the stages of the plan.
+    to_visit = [plan.get("queryPlan", plan)]  # Holds the stages left to visit (newer servers nest the plan).
+
+    # While there are stages left to visit,
+    while to_visit:
+        stage = to_visit.pop(0)  # Gets the next stage.
+        stages.append(stage)  # Stores the stage.
+
+        # If the stage has a single input,
+        if "inputStage" in stage:
+            to_visit.append(stage["inputStage"])  # Visits the input next.
+
+        to_visit.extend(stage.get("inputStages", []))  # Visits every other input next.
+
+    return stages  # Returns the stages of the plan.
+
+
+def explain(query : dict ={}, sort : list =None, projection : dict =None) -> dict:
+    """
+        Reports how the server runs a query and whether an index supports it.
+
+        :param query:           The dictionary to be used to find the matching documents.
+        :param sort:            The (field, direction) pairs to sort by, if any.
+        :param projection:      The fields to return, if any.
+        :return dict:           A summary of the plan: the stages, the indexes used, whether the query was answered
+                                from an index alone ("covered"), whether it had to scan the collection or sort in
+                                memory, and how many keys and documents were examined.
     """
 
+    session = get_session()  # Gets the session of the request.
+
     # If the user is not logged in,
-    if not logged_in:
+    if not session.logged_in:
         print("Login first!")  # Outputs an error.
-        return None  # Returns nothing (the user should not be able to retrieve data unless they are logged in).
+        return None  # Returns nothing (the user should not be able to query the database unless they are logged in).
 
     # The below code only runs if the user is logged in.
 
-    results = collection.find(query)  # Stores the results of the search.
-    return results  # Returns the results of the search.
+    cursor = session.collection.find(query, projection)  # Creates the cursor for the query.
+
+    # If the query is sorted,
+    if sort:
+        cursor = cursor.sort(sort)  # Sorts the cursor.
 
+    plan = cursor.explain()  # Gets the plan and the execution statistics of the query.
+    stages = get_plan_stages(plan["queryPlanner"]["winningPlan"])  # Gets every stage of the winning plan.
+    stage_names = [stage["stage"] for stage in stages]  # Gets the name of every stage.
+    statistics = plan.get("executionStats", {})  # Gets the execution statistics (if the server returned them).
+    uses_index = any(name in ("IXSCAN", "IDHACK", "EXPRESS_IXSCAN") for name in stage_names)  # Whether an index was used.
 
-def update(query : dict ={}, data : dict ={}):
+    # Returns the summary of the plan.
+    return {"stages": stage_names,
+            "indexes": [stage["indexName"] for stage in stages if "indexName" in stage],
+            "uses_index": uses_index,
+            "covered": uses_index and "FETCH" not in stage_names and "COLLSCAN" not in stage_names,
+            "collection_scan": "COLLSCAN" in stage_names,
+            "in_memory_sort": "SORT" in stage_names,
+            "keys_examined": statistics.get("totalKeysExamined"),
+            "documents_examined": statistics.get("totalDocsExamined"),
+            "documents_returned": statistics.get("nReturned")}
+
+
+def explain_page(sort_by : list =None, filter_query : str ="") -> dict:
     """
-        Updates one entry with new data.
+        Reports how the server runs the query behind a page of the table (see read_page()).
 
-        :param query:       A dictionary containing an identifier of the entry to update.
-        :param data:        A dictionary of the new data to apply to the found entry.
+        :param sort_by:         The sort_by property of the DataTable.
+        :param filter_query:    The filter_query property of the DataTable.
+        :return dict:           A summary of the plan (see explain()).
+    """
+
+    # Explains the same query, sort and projection that read_page() uses.
+    return explain(translate_filter_query(filter_query), translate_sort_by(sort_by), table_projection)
+
+
+@imm.instrument("aggregate", count_documents=lambda results: len(results or []),
+                is_failure=lambda results: results is None)
+def aggregate(pipeline : list) -> list:
+    """
+        Runs an aggregation pipeline on the collection (the work is done by the server and only the results are sent).
+
+        :param pipeline:        The stages of the aggregation pipeline.
+        :return list:           The results of the pipeline, or None if it could not be run.
     """
 
+    session = get_session()  # Gets the session of the request.
+
     # If the user is not logged in,
-    if not logged_in:
+    if not session.logged_in:
         print("Login first!")  # Outputs an error.
-        return  # Exits the function (the user should not be able to update the entries unless they are logged in).
+        return None  # Returns nothing (the user should not be able to query the database unless they are logged in).
 
     # The below code only runs if the user is logged in.
 
     # Makes an attempt,
     try:
-        collection.update_one(query, data)  # Updates the entry with new data.
+        return list(session.collection.aggregate(pipeline))  # Runs the pipeline and returns its results.
 
     # If an error occurred,
     except Exception:
-        print("The document could not be updated!")  # Outputs an error.
+        print("The aggregation failed!")  # Outputs an error.
+        return None  # Returns nothing (the pipeline could not be run).
 
 
-def delete(query : dict):
+def get_group_stage(group_by : str, fields : dict) -> dict:
     """
-        Deletes an entry from the database.
+        Creates the $group stage of a report.
 
-        :param query:   A dictionary containing an identifier for the document to be deleted.
+        :param group_by:        The product field to group by (e.g. "product_price"). If None, every product is one group.
+        :param fields:          The accumulators of the group e.g. {"total_value": {"$sum": ...}}.
+        :return dict:           The $group stage (an error is raised if the field is not in report_group_fields).
     """
 
-    # If the user is not logged in,
-    if not logged_in:
-        print("Login first!")  # Outputs an error.
-        return  # Exits the function (the user should not be able to delete documents unless they are logged in).
+    # If the field to group by is not a field the reports may be grouped by,
+    if group_by is not None and group_by not in report_group_fields:
+        raise ValueError(f"Cannot group by: {group_by}")  # Refuses the field (it could be any expression otherwise).
 
-    # The below code only executes if the user is logged in.
+    return {"$group": {"_id": None if group_by is None else f"${group_by}", **fields}}  # Returns the stage.
 
-    # If the query is empty,
-    if (query == None or query == {}):
-        print("Specify something to delete!")  # Output an error.
-        return  # Exits the function (specifying nothing would delete the first entry in the database).
 
-    # The below code only executes if the query is not empty.
+def get_inventory_value(group_by : str =None, limit : int =100, filter_query : str ="") -> list:
+    """
+        Gets the total value (price times quantity) and the total units of the inventory.
 
-    # Makes an attempt,
-    try:
-        collection.delete_one(query)  # Deletes the entry found with the query.
+        :param group_by:        The product field to group the totals by. If None, the whole inventory is one group.
+        :param limit:           The most groups returned (the most valuable).
+        :param filter_query:    The filter_query property of the DataTable (only matching products are counted).
+        :return list:           The totals of every group ({"group", "total_value", "total_quantity", "products"}),
+                                from the most to the least valuable, or None if they could not be calculated.
+    """
 
-    # If an error is occurred,
-    except Exception:
-        print("The document could not be deleted!")  # Outputs an error.
+    # Adds up every matching product on the server.
+    return aggregate([{"$match": translate_filter_query(filter_query)},
+                      get_group_stage(group_by, {"total_value": {"$sum": product_value_expression},
+                                                 "total_quantity": {"$sum": {"$ifNull": ["$product_quantity", 0]}},
+                                                 "products": {"$sum": 1}}),
+                      {"$sort": {"total_value": -1, "_id": 1}},
+                      {"$limit": limit},
+                      {"$project": {"_id": 0, "group": "$_id", "total_value": 1, "total_quantity": 1, "products": 1}}])
+
+
+def get_low_stock(threshold : int =10, group_by : str =None, limit : int =100, filter_query : str ="") -> list:
+    """
+        Gets the products whose quantity is below a threshold, from the lowest quantity up.
 
+        :param threshold:       The quantity a product must be below to be listed.
+        :param group_by:        The product field to count the low stock products by. If None, the products are listed.
+        :param limit:           The most products (or groups) returned.
+        :param filter_query:    The filter_query property of the DataTable (only matching products are listed).
+        :return list:           The products (with the table fields), or the number of low stock products and units
+                                of every group ({"group", "products", "total_quantity"}), or None if they could
+                                not be read.
+    """
+
+    # Matches the low stock products (answered from the product_quantity index).
+    pipeline = [{"$match": {"$and": [translate_filter_query(filter_query), {"product_quantity": {"$lt": threshold}}]}}]
+
+    # If the products should be listed,
+    if group_by is None:
+        pipeline += [{"$sort": {"product_quantity": 1, "product_id": 1}}, {"$limit": limit}, {"$project": table_projection}]
+
+    # Otherwise (the products should be counted by group),
+    else:
+        pipeline += [get_group_stage(group_by, {"products": {"$sum": 1},
+                                                "total_quantity": {"$sum": "$product_quantity"}}),
+                     {"$sort": {"products": -1, "_id": 1}},
+                     {"$limit": limit},
+                     {"$project": {"_id": 0, "group": "$_id", "products": 1, "total_quantity": 1}}]
+
+    return aggregate(pipeline)  # Returns the low stock products (or groups).
+
+
+def get_top_products(count : int =10, by : str ="value", group_by : str =None, filter_query : str ="") -> list:
+    """
+        Gets the products (or groups) with the highest value or quantity.
+
+        :param count:           The number of products (or groups) returned.
+        :param by:              What the products are ranked by ("value" or "quantity").
+        :param group_by:        The product field to add up before ranking. If None, single products are ranked.
+        :param filter_query:    The filter_query property of the DataTable (only matching products are ranked).
+        :return list:           The products (with the table fields and "product_value") or the groups
+                                ({"group", "total_value", "total_quantity", "products"}), from the highest down,
+                                or None if they could not be read.
+    """
+
+    # If the ranking is not supported,
+    if by not in ("value", "quantity"):
+        raise ValueError(f"Cannot rank by: {by}")  # Refuses the ranking.
+
+    pipeline = [{"$match": translate_filter_query(filter_query)}]  # Matches the products to rank.
+
+    # If single products should be ranked,
+    if group_by is None:
+        # Ranks the products by quantity using its index, or by their value (calculated on the server).
+        rank_field = "product_quantity" if by == "quantity" else "product_value"
+        pipeline += [{"$addFields": {"product_value": product_value_expression}},
+                     {"$sort": {rank_field: -1, "product_id": 1}},
+                     {"$limit": count},
+                     {"$project": {"_id": 0, **{field: 1 for field in product_field_types}, "product_value": 1}}]
+
+    # Otherwise (groups should be ranked),
+    else:
+        rank_field = "total_quantity" if by == "quantity" else "total_value"
+        pipeline += [get_group_stage(group_by, {"total_value": {"$sum": product_value_expression},
+                                                "total_quantity": {"$sum": {"$ifNull": ["$product_quantity", 0]}},
+                                                "products": {"$sum": 1}}),
+                     {"$sort": {rank_field: -1, "_id": 1}},
+                     {"$limit": count},
+                     {"$project": {"_id": 0, "group": "$_id", "total_value": 1, "total_quantity": 1, "products": 1}}]
 
-def get_data_frame(cursor : pymongo.CursorType) -> pandas.DataFrame:
+    return aggregate(pipeline)  # Returns the top products (or groups).
+
+
+def get_pandas():
+    """
+        Imports Pandas the first time it is needed (importing it is slow and most requests never use a DataFrame).
+
+        :return module:     The Pandas module.
+    """
+
+    import pandas  # Imports Pandas (later imports reuse the loaded module).
+    return pandas  # Returns the module.
+
+
+@imm.instrument("get_data_frame", "conversion", count_documents=len)
+def get_data_frame(cursor : pymongo.CursorType) -> "pandas.DataFrame":
     """
         Gets a DataFrame from a cursor (search result).
 
@@ -169,11 +3245,104 @@ def get_data_frame(cursor : pymongo.CursorType) -> pandas.DataFrame:
         :return DataFrame:          The DataFrame created.
     """
 
-    df = pandas.DataFrame.from_records(cursor)  # Creates a DataFrame from the cursor.
+    df = get_pandas().DataFrame.from_records(cursor)  # Creates a DataFrame from the cursor.
     return df  # Returns the DataFrame.
 
 
-def convert_dataframe_to_dict(df : pandas.DataFrame) -> dict:
+@imm.instrument("cursor_to_records", "conversion", count_documents=len)
+def cursor_to_records(cursor : pymongo.CursorType) -> list:
+    """
+        Converts a cursor (search result) straight into table records, without building a DataFrame.
+
+        :param cursor:              The cursor (result) of a database search.
+        :return list:               A dictionary for every document (without the "_id" field).
+    """
+
+    records = []  # Holds the records.
+
+    # For every document in the cursor,
+    for document in cursor:
+        document.pop("_id", None)  # Removes the "_id" field (the table does not show it).
+        records.append(document)  # Stores the document as a record.
+
+    return records  # Returns the records.
+
+
+@imm.instrument("cursor_to_columns", "conversion", count_documents=lambda columns: len(next(iter(columns.values()), [])))
+def cursor_to_columns(cursor : pymongo.CursorType, fields : list =None) -> dict:
+    """
+        Converts a cursor (search result) straight into one typed array per field, without building a DataFrame.
+
+        :param cursor:              The cursor (result) of a database search.
+        :param fields:              The fields to keep. If None, every product field is kept.
+        :return dict:               A NumPy array for every field, typed with product_field_dtypes.
+    """
+
+    fields = list(product_field_types) if fields is None else fields  # Uses the product fields if none were given.
+    values = {field: [] for field in fields}  # Holds the values of every field.
+
+    # For every document in the cursor,
+    for document in cursor:
+        # For every field to keep,
+        for field in fields:
+            values[field].append(document.get(field))  # Stores the value (None if the document does not have it).
+
+    columns = {}  # Holds the typed arrays.
+
+    # For every field to keep,
+    for field in fields:
+        # Makes an attempt,
+        try:
+            columns[field] = numpy.array(values[field], dtype=product_field_dtypes.get(field, "object"))  # Types the array.
+
+        # If a value does not fit the type (e.g. a missing whole number),
+        except (TypeError, ValueError):
+            # Makes an attempt,
+            try:
+                columns[field] = numpy.array(values[field], dtype="float64")  # Stores the numbers as decimals (NaN if missing).
+
+            # If the values are not numbers,
+            except (TypeError, ValueError):
+                columns[field] = numpy.array(values[field], dtype="object")  # Stores the values as they are.
+
+    return columns  # Returns the typed arrays.
+
+
+@imm.instrument("get_lean_data_frame", "conversion", count_documents=len)
+def get_lean_data_frame(cursor : pymongo.CursorType, fields : list =None) -> "pandas.DataFrame":
+    """
+        Gets a DataFrame with typed columns from a cursor (read it with table_projection to skip unused fields).
+
+        :param cursor:              The cursor (result) of a database search.
+        :param fields:              The fields to keep. If None, every product field is kept.
+        :return DataFrame:          The DataFrame created (without the "_id" column).
+    """
+
+    return get_pandas().DataFrame(cursor_to_columns(cursor, fields), copy=False)  # Wraps the typed arrays without copying them.
+
+
+def stream_data_frames(query : dict ={}, fields : list =None, batch_size : int =None, resume_token : str =None):
+    """
+        Reads the documents matching a query as a series of DataFrames with typed columns, one per batch, so reports
+            over millions of documents can be computed a batch at a time (see stream_batches()).
+
+        :param query:               The dictionary used to find the matching documents.
+        :param fields:              The fields to keep. If None, every product field is kept.
+        :param batch_size:          The number of products in each DataFrame (stream_batch_size if None).
+        :param resume_token:        The token of a previous read to resume, or None to start from the beginning.
+        :return generator:          A generator of (DataFrame, resume token) pairs.
+    """
+
+    fields = list(product_field_types) if fields is None else fields  # Uses the product fields if none were given.
+    projection = {"_id": 0, **{field: 1 for field in fields}}  # Only reads the fields to keep.
+
+    # For every batch,
+    for documents, token in stream_batches(query, projection, batch_size, resume_token):
+        yield get_lean_data_frame(documents, fields), token  # Returns its DataFrame and its token.
+
+
+@imm.instrument("convert_dataframe_to_dict", "conversion", count_documents=len)
+def convert_dataframe_to_dict(df : "pandas.DataFrame") -> dict:
     """
         Converts the specified DataFrame to a dictionary.
 
@@ -196,21 +3365,35 @@ def deleteDatabase():
     """
         Deletes the database and generated user. This cleans up everything that was created by the program.
     """
-    # Declare the global scope variables.
-    global client, collection, database, logged_in
+    session = get_session()  # Gets the session of the request.
 
     # If the user is not logged in,
-    if not logged_in:
+    if not session.logged_in:
         print("Please login first!")  # Outputs an error.
         return  # Exits the function (the user should only be able to drop the database if they are logged in).
 
     username_to_delete = "user"  # Defines the username to delete.
 
-    client.drop_database(target_db)  # Drops the target database.
-    client.close()  # Closes the connection to the MongoClient.
+    stop_change_watcher()  # Stops watching the collection (it is about to be dropped).
+    session.client.drop_database(target_db)  # Drops the target database.
+    journal.record_drop()  # Records that every product was deleted.
+    journal.flush()  # Writes the journal (the process is usually closed next).
+    query_cache.clear()  # Removes every cached page.
+    change_feed.record("reset")  # Tells the dashboards that every document is gone.
+    release_product_ids()  # Forgets the product IDs reserved from the dropped counter.
+
+    # For every session (including the session of the request),
+    for other_session in list(sessions.values()) + [default_session]:
+        other_session.logged_in = False  # Logs the session out (its database and user no longer exist).
+
+    close_client_pool()  # Closes every shared connection to the MongoClient.
+
+    # If the inventory is stored by a local storage engine,
+    if storage_engine != "mongo":
+        storage_users.pop(username_to_delete, None)  # Drops the specified user.
+        return  # Exits the function (there is no MongoDB admin to connect to).
 
-    client = pymongo.MongoClient("mongodb://localhost:27017")  # Forges a new connection as the admin to the MongoClient.
+    client = pymongo.MongoClient(f"mongodb://{host}:{port}")  # Forges a new connection as the admin to the MongoClient.
     database = client["admin"]  # Uses the admin database.
-    collection = database["system.users"]  # Uses the system.users collection.
     database.command("dropUser", username_to_delete)  # Drops the specified user.
     client.close()  # Closes the connection to the MongoClient.
@@ -0,0 +1,332 @@
+"""
+    :author:        Jacob Whetham
+    :version:       1.0.0, 04 JAN 2024
+    :desc:          This file benchmarks the Inventory Management System (backend functions and dashboard callbacks).
+                    It seeds a separate benchmark database, times every operation and writes the throughput,
+                    latency percentiles and peak memory to a JSON file that can be compared between releases.
+
+                    Example:    python inventory_management_benchmark.py --sizes 10000 100000 --output results.json
+"""
+
+# Imports
+import argparse     # Allows for reading the command line arguments.
+import datetime     # Allows for recording when the benchmark ran.
+import json         # Allows for writing the results.
+import platform     # Allows for recording the machine the benchmark ran on.
+import random       # Allows for generating products and choosing which products to use.
+import time         # Allows for timing operations.
+import tracemalloc  # Allows for measuring the peak memory of operations.
+import pymongo      # Allows for the use of MongoDB.
+import inventory_management_backend as imb  # Allows use of the Inventory Management backend service.
+
+# Makes an attempt,
+try:
+    import mongomock  # Allows for benchmarking without a MongoDB server (optional).
+
+# If mongomock is not installed,
+except ImportError:
+    mongomock = None  # Only the MongoDB server can be benchmarked.
+
+# Declare global variables.
+benchmark_db = "inventory_management_benchmark_db"      # The database seeded by the benchmark (never the real one).
+benchmark_username = "benchmark"                        # The username the benchmark session logs in with.
+benchmark_password = "benchmark"                        # The password the benchmark session logs in with.
+benchmark_token = "benchmark"                           # The token of the benchmark session.
+seed_batch_size = 10000                                 # The number of products inserted in each seeding round-trip.
+
+
+def generate_products(count : int, seed : int =0):
+    """
+        Generates products like driver.start() does, but with names, prices and quantities to sort and filter on.
+
+        :param count:           The number of products to generate.
+        :param seed:            The seed of the random values (the same seed always generates the same products).
+        :return generator:      A generator of the products.
+    """
+
+    generator = random.Random(seed)  # Creates the random generator.
+
+    # For every product to generate,
+    for i in range(count):
+        # Yields the product.
+        yield {"product_id": i,
+               "product_name": f"Product {generator.randrange(count):08d}",
+               "product_price": round(generator.uniform(0.5, 500.0), 2),
+               "product_quantity": generator.randrange(0, 1000)}
+
+
+def seed_collection(collection, size : int, seed : int =0):
+    """
+        Replaces the contents of a collection with generated products and creates the backend indexes.
+
+        :param collection:      The collection to seed.
+        :param size:            The number of products to insert.
+        :param seed:            The seed of the random values.
+    """
+
+    collection.drop()  # Removes the products of a previous run.
+    batch = []  # Holds the products of the current round-trip.
+
+    # For every generated product,
+    for product in generate_products(size, seed):
+        batch.append(product)  # Adds the product to the round-trip.
+
+        # If the round-trip is full,
+        if len(batch) >= seed_batch_size:
+            collection.insert_many(batch, ordered=False)  # Inserts the products.
+            batch = []  # Starts a new round-trip.
+
+    # If there are products left,
+    if batch:
+        collection.insert_many(batch, ordered=False)  # Inserts the products.
+
+    imb.ensure_indexes(collection)  # Creates the indexes used by the backend.
+    collection.database[imb.target_counter_collection].drop()  # Removes the product ID counter of a previous run.
+    imb.seed_product_id_counter(collection)  # Starts the product ID counter after the seeded products.
+
+
+def percentile(samples : list, fraction : float) -> float:
+    """
+        Gets a percentile of a list of samples (nearest rank).
+
+        :param samples:     The samples, sorted from lowest to highest.
+        :param fraction:    The percentile as a fraction e.g. 0.99.
+        :return float:      The sample at the percentile.
+    """
+
+    # Returns the sample at the percentile.
+    return samples[min(len(samples) - 1, max(0, round(fraction * len(samples) + 0.5) - 1))]
+
+
+def get_quantity(product_id : int) -> int:
+    """
+        Reads the quantity of a product from the database (bypassing the page cache and snapshot).
+
+        :param product_id:      The product ID of the product.
+        :return int:            The quantity of the product.
+    """
+
+    document = imb.get_session().collection.find_one({"product_id": product_id}, {"_id": 0, "product_quantity": 1})
+    return document["product_quantity"]  # Returns the quantity.
+
+
+def measure(function, repeat : int, setup=None, memory_repeat : int =3) -> dict:
+    """
+        Times an operation and measures its peak memory.
+
+        :param function:        The operation. It is called with the value returned by setup (or the repetition number).
+        :param repeat:          The number of times the operation is timed.
+        :param setup:           Called (untimed) with the repetition number before every call, if given.
+        :param memory_repeat:   The number of extra calls made while tracing memory (tracing slows the calls down, so
+                                they are not timed).
+        :return dict:           The calls, total seconds, throughput, latency percentiles (milliseconds) and peak memory.
+    """
+
+    samples = []  # Holds how long every call took.
+
+    # For every repetition,
+    for i in range(repeat):
+        argument = setup(i) if setup else i  # Prepares the call (untimed).
+        start = time.perf_counter()  # Records when the call started.
+        function(argument)  # Calls the operation.
+        samples.append(time.perf_counter() - start)  # Records how long the call took.
+
+    peak = 0  # Holds the highest memory use of a single call.
+    tracemalloc.start()  # Starts tracing memory.
+
+    # For every extra call,
+    for i in range(repeat, repeat + memory_repeat):
+        argument = setup(i) if setup else i  # Prepares the call.
+        tracemalloc.reset_peak()  # Forgets the peak of the previous call.
+        function(argument)  # Calls the operation.
+        peak = max(peak, tracemalloc.get_traced_memory()[1])  # Records the peak of the call.
+
+    tracemalloc.stop()  # Stops tracing memory.
+
+    samples.sort()  # Orders the samples from fastest to slowest.
+    total = sum(samples)  # Adds up how long every call took.
+
+    # Returns the measurements.
+    return {"calls": repeat,
+            "seconds": total,
+            "operations_per_second": repeat / total if total > 0 else None,
+            "p50_ms": percentile(samples, 0.50) * 1000,
+            "p99_ms": percentile(samples, 0.99) * 1000,
+            "max_ms": samples[-1] * 1000,
+            "peak_memory_bytes": peak}
+
+
+def benchmark_size(client, size : int, repeat : int, full_repeat : int, full_scan_limit : int, seed : int) -> dict:
+    """
+        Seeds the benchmark database with a number of products and measures every operation against it.
+
+        :param client:              The client connected to the benchmark server (MongoClient or mongomock).
+        :param size:                The number of products to seed.
+        :param repeat:              The number of times single-document operations and callbacks are timed.
+        :param full_repeat:         The number of times whole-collection operations are timed.
+        :param full_scan_limit:     The largest size whole-collection operations are run at.
+        :param seed:                The seed of the random values.
+        :return dict:               The measurements of every operation, and the operations that were skipped.
+    """
+
+    seeding_start = time.perf_counter()  # Records when seeding started.
+    seed_collection(client[benchmark_db][imb.target_collection], size, seed)  # Seeds the products.
+    seeding_seconds = time.perf_counter() - seeding_start  # Records how long seeding took.
+
+    imb.release_product_ids()  # Forgets the product IDs reserved from the counter of a previous size.
+    imb.register_client(benchmark_username, benchmark_password, client)  # Lets the backend log in with the client.
+    imb.use_session(benchmark_token)  # Uses the benchmark session.
+    imb.login(benchmark_username, benchmark_password)  # Logs the session in.
+    imb.query_cache.clear()  # Removes pages cached from a previous size.
+    imb.journal.enabled = False  # Stops recording the writes (the benchmark products are not worth keeping).
+
+    generator = random.Random(seed)  # Creates the random generator used to choose products.
+    operations = {}  # Holds the measurements of every operation.
+    skipped = {}  # Holds why operations were skipped.
+    first_created = imb.seed_product_id_counter()  # Gets the product ID the first created product will receive.
+
+    # The single-document backend operations.
+    operations["create"] = measure(lambda i: imb.create({"product_name": f"Benchmark {i}", "product_price": 1.0,
+                                                         "product_quantity": 1}), repeat)
+    operations["read"] = measure(lambda i: list(imb.read({"product_id": generator.randrange(size)},
+                                                         imb.table_projection)), repeat)
+    operations["update"] = measure(lambda i: imb.update({"product_id": generator.randrange(size)},
+                                                        {"$set": {"product_quantity": i}}), repeat)
+    operations["delete"] = measure(lambda i: imb.delete({"product_id": first_created + i}), repeat)
+
+    # The page reads, first without the cache (every call reads the database) and then from the cache.
+    sort_by = [{"column_id": "product_price", "direction": "desc"}]  # Sorts the pages by price.
+    imb.query_cache.enabled = False  # Disables the cache.
+    operations["read_page"] = measure(lambda i: imb.read_page(generator.randrange(100), 25, sort_by, ""), repeat)
+    operations["read_page_filtered"] = measure(lambda i: imb.read_page(0, 25, sort_by, "{product_price} < 100"), repeat)
+    imb.query_cache.enabled = True  # Enables the cache.
+    operations["read_page_cached"] = measure(lambda i: imb.read_page(0, 25, sort_by, ""), repeat)
+    # Type-ahead lookups of the first digits of a product name (served by the search index).
+    operations["search_products"] = measure(lambda i: imb.search_products(f"{generator.randrange(size):08d}"[:4]), repeat)
+
+    # If the collection is small enough to read whole,
+    if size <= full_scan_limit:
+        operations["get_data_frame"] = measure(lambda i: imb.get_data_frame(imb.read()), full_repeat, memory_repeat=1)
+        frame = imb.get_data_frame(imb.read())  # Reads the whole collection once for the conversion.
+        operations["convert_dataframe_to_dict"] = measure(imb.convert_dataframe_to_dict, full_repeat,
+                                                          setup=lambda i: frame.copy(), memory_repeat=1)
+        operations["cursor_to_records"] = measure(lambda i: imb.cursor_to_records(imb.read({}, imb.table_projection)),
+                                                  full_repeat, memory_repeat=1)
+
+    # Otherwise (the collection is too large to read whole),
+    else:
+        # Records why the whole-collection operations were skipped.
+        for name in ("get_data_frame", "convert_dataframe_to_dict", "cursor_to_records"):
+            skipped[name] = f"The size is above the full scan limit ({full_scan_limit})."
+
+    # Makes an attempt,
+    try:
+        import inventory_management_frontend as imf  # Allows calling the dashboard callbacks directly.
+
+    # If Dash is not installed,
+    except ImportError as error:
+        # Records why the callbacks were skipped.
+        for name in ("login_pressed", "table_query_changed", "button_pressed"):
+            skipped[name] = f"The frontend could not be imported: {error}"
+
+        return {"size": size, "seeding_seconds": seeding_seconds, "operations": operations, "skipped": skipped}
+
+    # The dashboard callbacks, called the same way Dash calls them.
+    operations["login_pressed"] = measure(lambda i: imf.login_pressed(1, benchmark_username, benchmark_password, 25,
+                                                                      [], "", benchmark_token),
+                                          repeat, setup=lambda i: imb.logout())  # Logs out (untimed) before each login.
+    operations["table_query_changed"] = measure(lambda i: imf.table_query_changed(generator.randrange(100), 25, sort_by,
+                                                                                  "", benchmark_token), repeat)
+    rows = imf.get_table_rows(imb.read_page(0, 25, [], "")[0])  # Reads the rows the update button acts on.
+    selected_ids = [rows[0]["product_id"]]  # Selects the first row (rows are selected by product ID).
+    operations["button_pressed"] = measure(lambda i: imf.button_pressed(1, 0, 0, "Benchmark", "1.5", str(i), rows,
+                                                                        selected_ids, benchmark_token), repeat)
+
+    # Presses the update button once more with a new quantity (so a callback doing nothing is not timed unnoticed).
+    expected = get_quantity(selected_ids[0]) + 1  # Gets a quantity the product does not have.
+    imf.button_pressed(1, 0, 0, "Benchmark", "1.5", str(expected), rows, selected_ids, benchmark_token)
+
+    # If the product was not changed,
+    if get_quantity(selected_ids[0]) != expected:
+        raise AssertionError("The update button did not change the selected product.")  # Stops the benchmark.
+
+    return {"size": size, "seeding_seconds": seeding_seconds, "operations": operations, "skipped": skipped}
+
+
+def main(arguments : list =None):
+    """
+        Runs the benchmark from the command line.
+
+        :param arguments:       The command line arguments. If None, the arguments of the program are used.
+    """
+
+    parser = argparse.ArgumentParser(description="Benchmarks the Inventory Management System.")  # Creates the parser.
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000], help="The collection sizes to benchmark.")
+    parser.add_argument("--repeat", type=int, default=200, help="How many times single-document operations run.")
+    parser.add_argument("--full-repeat", type=int, default=3, help="How many times whole-collection operations run.")
+    parser.add_argument("--full-scan-limit", type=int, default=1000000,
+                        help="The largest size whole-collection operations are run at.")
+    parser.add_argument("--backend", choices=["mongo", "mongomock"], default="mongo",
+                        help="Whether to use a MongoDB server or mongomock (in-process).")
+    parser.add_argument("--uri", default="mongodb://localhost:27017", help="The MongoDB server to use.")
+    parser.add_argument("--seed", type=int, default=0, help="The seed of the random values.")
+    parser.add_argument("--output", default="benchmark_results.json", help="The file to write the results to.")
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark database afterwards.")
+    options = parser.parse_args(arguments)  # Reads the arguments.
+
+    # If mongomock was chosen,
+    if options.backend == "mongomock":
+        # If mongomock is not installed,
+        if mongomock is None:
+            parser.error("mongomock is not installed.")  # Outputs an error and exits.
+
+        client = mongomock.MongoClient()  # Creates the in-process client.
+
+    # Otherwise (a MongoDB server was chosen),
+    else:
+        client = pymongo.MongoClient(options.uri)  # Connects to the server.
+
+    imb.target_db = benchmark_db  # Points the backend at the benchmark database.
+    results = []  # Holds the results of every size.
+
+    # Makes an attempt,
+    try:
+        # For every size,
+        for size in options.sizes:
+            print(f"Benchmarking {size} products...")  # Outputs the progress.
+            result = benchmark_size(client, size, options.repeat, options.full_repeat, options.full_scan_limit,
+                                    options.seed)  # Measures every operation.
+            results.append(result)  # Stores the result.
+
+            # For every operation,
+            for name, measurement in result["operations"].items():
+                # Outputs the measurement.
+                print(f"  {name:<28}{measurement['operations_per_second'] or 0:>12.1f} ops/s"
+                      f"{measurement['p50_ms']:>10.3f} ms p50{measurement['p99_ms']:>10.3f} ms p99"
+                      f"{measurement['peak_memory_bytes'] / 1024:>12.1f} KiB peak")
+
+    # Once the benchmark has finished (or failed),
+    finally:
+        imb.logout()  # Logs the benchmark session out.
+
+        # If the benchmark database should not be kept,
+        if not options.keep:
+            client.drop_database(benchmark_db)  # Drops the benchmark database.
+
+        client.close()  # Closes the connection.
+
+    # Writes the results.
+    with open(options.output, "w", encoding="utf-8") as file:
+        json.dump({"created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                   "backend": options.backend,
+                   "python": platform.python_version(),
+                   "pymongo": pymongo.version,
+                   "machine": platform.platform(),
+                   "results": results}, file, indent=2, sort_keys=True)
+
+    print(f"The results were written to {options.output}.")  # Outputs where the results are.
+
+
+# The below code runs as soon as the program starts.
+if __name__ == "__main__":
+    main()  # Runs the benchmark.
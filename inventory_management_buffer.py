@@ -0,0 +1,195 @@
+"""
+    :author:        Jacob Whetham
+    :version:       1.0.0, 04 JAN 2024
+    :desc:          This file handles the quantity buffer of the Inventory Management System (stock movements added
+                    up per product and written together, so bursts of sales cost one bulk write instead of one write
+                    per sale).
+"""
+
+# Imports
+import threading    # Allows for locking the buffer and flushing it in the background.
+import time         # Allows for timing how long movements wait in the buffer.
+
+
+class QuantityBuffer:
+    """
+        Adds up quantity changes per product until they are flushed. The changes are kept in groups (e.g. one for each
+        set of credentials), and a flush hands the net change of every product of a group to the flush function in one
+        call (e.g. a single bulk write). A group is flushed when it holds too many products, when the oldest change in
+        the buffer has waited too long (if the background flusher is started), or on demand.
+    """
+
+    def __init__(self, flush_function, max_pending : int =1000, max_delay_seconds : float =0.5):
+        """
+            Creates an empty buffer.
+
+            :param flush_function:      The function writing the changes. It is given the key of the group and
+                                        {product_id: net change}, and returns its result, or None if nothing was
+                                        written (the changes are then kept in the buffer for the next flush).
+            :param max_pending:         The most products a group holds before it is flushed.
+            :param max_delay_seconds:   The longest a change waits before the background flusher writes it.
+        """
+
+        self.flush_function = flush_function        # The function writing the changes.
+        self.max_pending = max_pending              # The most products a group holds before it is flushed.
+        self.max_delay_seconds = max_delay_seconds  # The longest a change waits in the buffer.
+        self.pending = {}                           # The net change of every product, keyed by group then product ID.
+        self.oldest = None                          # When the oldest change in the buffer was added.
+        self.lock = threading.Lock()                # Prevents two threads from changing the buffer at once.
+        self.flush_lock = threading.Lock()          # Prevents two flushes from writing at once (keeps them in order).
+        self.flusher = None                         # The thread flushing the buffer in the background.
+        self.stop_event = threading.Event()         # Tells the background flusher to stop.
+        self.added = 0                              # How many changes were added.
+        self.flushed = 0                            # How many products were written.
+        self.flushes = 0                            # How many times the buffer was flushed.
+
+    def add(self, product_id : int, delta : int, key =None):
+        """
+            Adds a quantity change to the buffer (flushing its group if it holds too many products).
+
+            :param product_id:      The product ID of the product.
+            :param delta:           The change of its quantity (negative values remove stock).
+            :param key:             The group of the change (changes are only added up and written with their group).
+        """
+
+        # Only one thread may change the buffer at a time.
+        with self.lock:
+            group = self.pending.setdefault(key, {})  # Gets the changes of the group.
+            group[product_id] = group.get(product_id, 0) + delta  # Adds the change to the net change.
+            self.added += 1  # Counts the change.
+
+            # If the buffer was empty,
+            if self.oldest is None:
+                self.oldest = time.monotonic()  # Remembers when the oldest change was added.
+
+            full = len(group) >= self.max_pending  # Whether the group holds too many products.
+
+        # If the group holds too many products,
+        if full:
+            self.flush(key)  # Writes the changes of the group.
+
+    def flush(self, key =None):
+        """
+            Writes the net change of every product in a group with one call to the flush function.
+
+            :param key:             The group to write.
+            :return object:         The result of the flush function (None if the group was empty).
+        """
+
+        # Only one flush may write at a time (a later flush must not overtake an earlier one).
+        with self.flush_lock:
+            # Only one thread may change the buffer at a time.
+            with self.lock:
+                # Takes the changes of the group out of the buffer (changes cancelling out to zero are not written).
+                deltas = {product_id: delta for product_id, delta in self.pending.pop(key, {}).items() if delta}
+
+                # If the buffer is now empty,
+                if not self.pending:
+                    self.oldest = None  # Forgets when the oldest change was added.
+
+            # If there are no changes,
+            if not deltas:
+                return None  # Exits the function (there is nothing to write).
+
+            result = self.flush_function(key, deltas)  # Writes the changes.
+
+            # Only one thread may change the buffer at a time.
+            with self.lock:
+                # If nothing was written,
+                if result is None:
+                    group = self.pending.setdefault(key, {})  # Gets the changes added to the group meanwhile.
+
+                    # For every change taken out of the buffer,
+                    for product_id, delta in deltas.items():
+                        group[product_id] = group.get(product_id, 0) + delta  # Puts the change back.
+
+                    self.oldest = self.oldest or time.monotonic()  # Waits again before the next background flush.
+
+                # Otherwise (the changes were written),
+                else:
+                    self.flushed += len(deltas)  # Counts the products written.
+                    self.flushes += 1  # Counts the flush.
+
+            return result  # Returns the result of the flush function.
+
+    def flush_all(self) -> dict:
+        """
+            Writes every group in the buffer (one call to the flush function for each group).
+
+            :return dict:           The result of the flush function for every group written, keyed by the group.
+        """
+
+        # Only one thread may read the buffer at a time.
+        with self.lock:
+            keys = list(self.pending)  # Gets every group.
+
+        results = {}  # Holds the result of every group.
+
+        # For every group,
+        for key in keys:
+            # Makes an attempt,
+            try:
+                results[key] = self.flush(key)  # Writes the group.
+
+            # If an error occurred,
+            except Exception:
+                print("The quantity buffer could not be flushed!")  # Outputs an error (the other groups are written).
+
+        return results  # Returns the results.
+
+    def run(self):
+        """
+            Flushes the buffer whenever its oldest change has waited too long (runs in the background thread).
+        """
+
+        # Until the flusher is stopped,
+        while not self.stop_event.wait(self.max_delay_seconds / 2):
+            # Only one thread may read the buffer at a time.
+            with self.lock:
+                due = self.oldest is not None and time.monotonic() - self.oldest >= self.max_delay_seconds
+
+            # If the oldest change has waited too long,
+            if due:
+                self.flush_all()  # Writes every group.
+
+    def start(self):
+        """
+            Starts flushing the buffer in the background (does nothing if it is already started).
+        """
+
+        # Only one thread may start the flusher.
+        with self.lock:
+            # If the flusher is already running,
+            if self.flusher is not None and self.flusher.is_alive():
+                return  # Exits the function.
+
+            self.stop_event.clear()  # Allows the flusher to run.
+            self.flusher = threading.Thread(target=self.run, name="quantity-buffer", daemon=True)  # Creates the flusher.
+            self.flusher.start()  # Starts the flusher.
+
+    def stop(self):
+        """
+            Stops the background flusher and writes every change left in the buffer.
+        """
+
+        self.stop_event.set()  # Tells the flusher to stop.
+
+        # If the flusher is running,
+        if self.flusher is not None:
+            self.flusher.join()  # Waits for it to stop.
+            self.flusher = None
+
+        self.flush_all()  # Writes every change left in the buffer.
+
+    def get_metrics(self) -> dict:
+        """
+            Gets the size and counters of the buffer.
+
+            :return dict:           The products waiting, the changes added, the products written and the flushes.
+        """
+
+        # Only one thread may read the buffer at a time.
+        with self.lock:
+            # Returns the metrics.
+            pending = sum(len(group) for group in self.pending.values())  # Counts the products waiting in every group.
+            return {"pending": pending, "added": self.added, "flushed": self.flushed, "flushes": self.flushes}
@@ -0,0 +1,417 @@
+"""
+    :author:        Jacob Whetham
+    :version:       1.0.0, 04 JAN 2024
+    :desc:          This file handles the cache of the Inventory Management System (query results held in memory).
+"""
+
+# Imports
+import collections  # Allows for ordered dictionaries (least recently used ordering).
+import json         # Allows for turning queries into keys.
+import re           # Allows for regular expressions (matching $regex conditions).
+import threading    # Allows for locking the cache between the threads serving requests.
+import time         # Allows for timing how long entries live.
+
+
+def get_query_fields(query : dict) -> set:
+    """
+        Gets every field a MongoDB query refers to.
+
+        :param query:       The MongoDB query.
+        :return set:        The names of the fields.
+    """
+
+    fields = set()  # Holds the names of the fields.
+
+    # For every key in the query,
+    for key, value in query.items():
+        # If the key joins other queries (e.g. $and or $or),
+        if key in ("$and", "$or", "$nor"):
+            # For every query being joined,
+            for part in value:
+                fields |= get_query_fields(part)  # Adds the fields of the query.
+
+        # Otherwise if the key is a field,
+        elif not key.startswith("$"):
+            fields.add(key)  # Adds the field.
+
+    return fields  # Returns the names of the fields.
+
+
+def compare(value, operator : str, target) -> bool:
+    """
+        Compares a stored value against a condition the way MongoDB does for the supported operators.
+
+        :param value:       The value stored in the document (None if the field is missing).
+        :param operator:    The MongoDB operator e.g. "$gte".
+        :param target:      The value the operator compares against.
+        :return bool:       Whether the value satisfies the condition.
+    """
+
+    # Makes an attempt,
+    try:
+        # If the operator is an equality,
+        if operator == "$eq":
+            return value == target
+
+        # Otherwise if the operator is an inequality,
+        elif operator == "$ne":
+            return value != target
+
+        # Otherwise if the operator is a membership test,
+        elif operator == "$in":
+            return value in target
+
+        # Otherwise if the operator is a non-membership test,
+        elif operator == "$nin":
+            return value not in target
+
+        # Otherwise if the operator checks for the field,
+        elif operator == "$exists":
+            return (value is not None) == bool(target)
+
+        # The comparisons below never match a missing field (like MongoDB).
+        elif value is None:
+            return False
+
+        elif operator == "$gt":
+            return value > target
+
+        elif operator == "$gte":
+            return value >= target
+
+        elif operator == "$lt":
+            return value < target
+
+        elif operator == "$lte":
+            return value <= target
+
+    # If the values cannot be compared (e.g. text against a number),
+    except TypeError:
+        return False  # MongoDB does not match values of different types.
+
+    raise ValueError(f"Unsupported operator: {operator}")  # Refuses the operator.
+
+
+def document_matches(query : dict, document : dict) -> bool:
+    """
+        Checks whether a document matches a MongoDB query. Supports the query operators used by the backend
+        (equality, $eq, $ne, $gt, $gte, $lt, $lte, $in, $nin, $exists, $regex, $and, $or and $nor).
+
+        :param query:       The MongoDB query.
+        :param document:    The document to check.
+        :return bool:       Whether the document matches (an error is raised for unsupported operators).
+    """
+
+    # For every key in the query,
+    for key, condition in query.items():
+        # If the key requires every query to match,
+        if key == "$and":
+            matched = all(document_matches(part, document) for part in condition)
+
+        # Otherwise if the key requires any query to match,
+        elif key == "$or":
+            matched = any(document_matches(part, document) for part in condition)
+
+        # Otherwise if the key requires no query to match,
+        elif key == "$nor":
+            matched = not any(document_matches(part, document) for part in condition)
+
+        # Otherwise if the key is an unsupported top-level operator,
+        elif key.startswith("$"):
+            raise ValueError(f"Unsupported operator: {key}")  # Refuses the operator.
+
+        # Otherwise if the condition is a set of operators,
+        elif isinstance(condition, dict) and condition and all(name.startswith("$") for name in condition):
+            value = document.get(key)  # Gets the stored value.
+            matched = True  # Holds whether every operator matched.
+
+            # For every operator in the condition,
+            for operator, target in condition.items():
+                # If the operator is a regular expression,
+                if operator == "$regex":
+                    flags = re.IGNORECASE if "i" in condition.get("$options", "") else 0  # Gets the options.
+                    matched = isinstance(value, str) and re.search(target, value, flags) is not None
+
+                # Otherwise if the operator is the options of a regular expression,
+                elif operator == "$options":
+                    continue  # Skips the options (they are read with the regular expression).
+
+                # Otherwise (the operator is a comparison),
+                else:
+                    matched = compare(value, operator, target)
+
+                # If the operator did not match,
+                if not matched:
+                    break  # Stops checking (every operator must match).
+
+        # Otherwise (the condition is a plain value),
+        else:
+            matched = document.get(key) == condition  # Checks for equality.
+
+        # If the key did not match,
+        if not matched:
+            return False  # Returns that the document does not match.
+
+    return True  # Returns that the document matches.
+
+
+def get_update_fields(data : dict) -> set:
+    """
+        Gets every field an update (or replacement document) can change.
+
+        :param data:        The update e.g. {"$set": {...}, "$inc": {...}} or a replacement document.
+        :return set:        The names of the fields, or None if every field may have changed (a replacement).
+    """
+
+    # If the update is a replacement document,
+    if not any(key.startswith("$") for key in data):
+        return None  # Every field may have changed.
+
+    fields = set()  # Holds the names of the fields.
+
+    # For every update operator,
+    for operator, changes in data.items():
+        fields |= {field.split(".")[0] for field in changes}  # Adds the top-level fields it changes.
+
+    return fields  # Returns the names of the fields.
+
+
+def apply_update(document : dict, data : dict) -> dict:
+    """
+        Applies an update (or replacement document) to a copy of a document the way MongoDB does. Supports the
+        update operators used by the backend ($set, $unset, $inc, $mul, $min and $max on top-level fields).
+
+        :param document:    The document before the update.
+        :param data:        The update e.g. {"$set": {...}, "$inc": {...}} or a replacement document.
+        :return dict:       The document after the update (an error is raised for unsupported updates).
+    """
+
+    # If the update is a replacement document,
+    if get_update_fields(data) is None:
+        return dict(data)  # Returns the replacement document.
+
+    updated = dict(document)  # Copies the document.
+
+    # For every update operator,
+    for operator, changes in data.items():
+        # For every field the operator changes,
+        for field, value in changes.items():
+            # If the field is nested (or the operator is not supported),
+            if "." in field or operator not in ("$set", "$unset", "$inc", "$mul", "$min", "$max"):
+                raise ValueError(f"Unsupported update: {operator} {field}")  # Refuses the update.
+
+            current = updated.get(field)  # Gets the value before the update.
+
+            # If the operator sets the field,
+            if operator == "$set":
+                updated[field] = value
+
+            # Otherwise if the operator removes the field,
+            elif operator == "$unset":
+                updated.pop(field, None)
+
+            # Otherwise if the operator adds to the field (a missing field counts as 0),
+            elif operator == "$inc":
+                updated[field] = (0 if current is None else current) + value
+
+            # Otherwise if the operator multiplies the field (a missing field becomes 0),
+            elif operator == "$mul":
+                updated[field] = (0 if current is None else current) * value
+
+            # Otherwise if the operator lowers the field,
+            elif operator == "$min":
+                updated[field] = value if current is None or value < current else current
+
+            # Otherwise (the operator raises the field),
+            else:
+                updated[field] = value if current is None or value > current else current
+
+    return updated  # Returns the document after the update.
+
+
+class QueryCache:
+    """
+        Holds the results of recent queries in memory, evicting the least recently used entries when full and
+        entries that have lived longer than their time to live.
+    """
+
+    def __init__(self, max_entries : int =1024, max_documents : int =100000, ttl_seconds : float =30.0):
+        """
+            Creates an empty cache.
+
+            :param max_entries:         The most results held at once.
+            :param max_documents:       The most documents held across every result.
+            :param ttl_seconds:         How long a result is served before it is read again.
+        """
+
+        self.max_entries = max_entries              # The most results held at once.
+        self.max_documents = max_documents          # The most documents held across every result.
+        self.ttl_seconds = ttl_seconds              # How long a result is served before it is read again.
+        self.enabled = True                         # Whether results are stored and served.
+        self.entries = collections.OrderedDict()    # The results, from least to most recently used.
+        self.documents = 0                          # The number of documents held across every result.
+        self.generation = 0                         # Changes every time results are invalidated.
+        self.lock = threading.Lock()                # Prevents two threads from changing the cache at once.
+        self.metrics = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """
+            Creates a key from the parts of a query (equal queries always create the same key).
+
+            :param parts:       The parts of the query e.g. the MongoDB query, the sort, the page and its size.
+            :return str:        The key.
+        """
+
+        return json.dumps(parts, sort_keys=True, default=str)  # Returns the parts as normalized text.
+
+    def get(self, key : str):
+        """
+            Gets a result from the cache.
+
+            :param key:         The key of the query (see make_key()).
+            :return object:     The result, or None if it is not held (or has expired).
+        """
+
+        # Only one thread may change the cache at a time.
+        with self.lock:
+            entry = self.entries.get(key)  # Gets the entry of the key.
+
+            # If the result is not held,
+            if entry is None or not self.enabled:
+                self.metrics["misses"] += 1  # Counts the miss.
+                return None  # Returns nothing.
+
+            # If the result has lived longer than its time to live,
+            if time.monotonic() - entry["stored"] > self.ttl_seconds:
+                self.remove(key)  # Removes the result.
+                self.metrics["expirations"] += 1  # Counts the expiration.
+                self.metrics["misses"] += 1  # Counts the miss.
+                return None  # Returns nothing.
+
+            self.entries.move_to_end(key)  # Marks the result as the most recently used.
+            self.metrics["hits"] += 1  # Counts the hit.
+            return entry["value"]  # Returns the result.
+
+    def get_generation(self) -> int:
+        """
+            Gets the current generation of the cache. A result read from the database is only stored if no
+            invalidation happened while it was being read (see put()).
+
+            :return int:        The generation.
+        """
+
+        return self.generation  # Returns the generation.
+
+    def put(self, key : str, value, query : dict, sort : list, documents : list, generation : int):
+        """
+            Stores a result in the cache.
+
+            :param key:             The key of the query (see make_key()).
+            :param value:           The result to store.
+            :param query:           The MongoDB query of the result (used to invalidate it precisely).
+            :param sort:            The (field, direction) pairs the result is sorted by.
+            :param documents:       The documents in the result.
+            :param generation:      The generation of the cache from before the result was read.
+        """
+
+        # Only one thread may change the cache at a time.
+        with self.lock:
+            # If caching is disabled, a write happened while the result was read or the result is too large,
+            if not self.enabled or generation != self.generation or len(documents) > self.max_documents:
+                return  # Does not store the result (it may already be stale).
+
+            # If the key is already held,
+            if key in self.entries:
+                self.remove(key)  # Removes the older result.
+
+            # Stores the result with what is needed to invalidate it.
+            self.entries[key] = {"value": value,
+                                 "query": query,
+                                 "fields": get_query_fields(query) | {field for field, direction in sort},
+                                 "product_ids": {document.get("product_id") for document in documents},
+                                 "size": len(documents),
+                                 "stored": time.monotonic()}
+            self.documents += len(documents)  # Counts the documents.
+
+            # While the cache holds too many results or documents,
+            while len(self.entries) > self.max_entries or self.documents > self.max_documents:
+                self.remove(next(iter(self.entries)))  # Removes the least recently used result.
+                self.metrics["evictions"] += 1  # Counts the eviction.
+
+    def remove(self, key : str):
+        """
+            Removes a result from the cache (the lock must already be held).
+
+            :param key:         The key of the result.
+        """
+
+        entry = self.entries.pop(key)  # Removes the result.
+        self.documents -= entry["size"]  # Stops counting its documents.
+
+    def invalidate(self, document : dict, changed_fields : set =None, inserted_or_deleted : bool =False):
+        """
+            Removes every result that a write to a single document could have changed.
+
+            :param document:                The document that was written (after an update, or the inserted or
+                                            deleted document).
+            :param changed_fields:          The fields an update changed (None if every field may have changed).
+            :param inserted_or_deleted:     Whether the document was inserted or deleted (instead of updated).
+        """
+
+        # Only one thread may change the cache at a time.
+        with self.lock:
+            self.generation += 1  # Stops results being read right now from being stored.
+
+            # For every result,
+            for key, entry in list(self.entries.items()):
+                # If the document was inserted or deleted,
+                if inserted_or_deleted:
+                    # Makes an attempt,
+                    try:
+                        stale = document_matches(entry["query"], document)  # The result changes if the document matches.
+
+                    # If the query cannot be checked in memory,
+                    except ValueError:
+                        stale = True  # Assumes the result changed.
+
+                # Otherwise (the document was updated),
+                else:
+                    # The result changes if it shows the document, or if the update changed a field that decides
+                    #   which documents match the query or the order they are in.
+                    stale = (document.get("product_id") in entry["product_ids"] or changed_fields is None or
+                             len(changed_fields & entry["fields"]) > 0)
+
+                # If the result may have changed,
+                if stale:
+                    self.remove(key)  # Removes the result.
+                    self.metrics["invalidations"] += 1  # Counts the invalidation.
+
+    def clear(self):
+        """
+            Removes every result (e.g. after a bulk write).
+        """
+
+        # Only one thread may change the cache at a time.
+        with self.lock:
+            self.generation += 1  # Stops results being read right now from being stored.
+            self.metrics["invalidations"] += len(self.entries)  # Counts the invalidations.
+            self.entries.clear()  # Removes every result.
+            self.documents = 0  # Stops counting the documents.
+
+    def get_metrics(self) -> dict:
+        """
+            Gets the hit/miss counters and the size of the cache.
+
+            :return dict:       The counters, the hit ratio and the number of results and documents held.
+        """
+
+        # Only one thread may read the counters at a time.
+        with self.lock:
+            metrics = dict(self.metrics)  # Copies the counters.
+            lookups = metrics["hits"] + metrics["misses"]  # Gets the number of lookups.
+            metrics["hit_ratio"] = metrics["hits"] / lookups if lookups else 0.0  # Calculates the hit ratio.
+            metrics["entries"] = len(self.entries)  # Gets the number of results held.
+            metrics["documents"] = self.documents  # Gets the number of documents held.
+
+        return metrics  # Returns the metrics.
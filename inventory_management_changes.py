@@ -0,0 +1,305 @@
+"""
+    :author:        Jacob Whetham
+    :version:       1.0.0, 04 JAN 2024
+    :desc:          This file handles the change feed of the Inventory Management System (recent writes to the
+                    collection, numbered so every dashboard can ask for only the changes it has not seen yet).
+"""
+
+# Imports
+import collections  # Allows for holding a limited number of recent changes.
+import os           # Allows for noticing that the process was forked (e.g. into a worker).
+import secrets      # Allows for naming the feed of every process.
+import threading    # Allows for locking the feed between the threads serving requests.
+
+# Declare global variables.
+version_counter = "changes"     # The counter of the writes of every worker in the version store.
+
+
+class ChangeFeed:
+    """
+        Holds the most recent changes to the collection, each numbered with a sequence number. The changes come from
+        a MongoDB change stream when the server supports one ("stream" mode), or from the writes made by this
+        process otherwise ("local" mode). Sequence numbers are only meaningful to the process that numbered them, so
+        positions (see get_position()) also name the feed they came from. When several workers write in "local" mode,
+        a version store (see set_version_store()) counts the writes of every worker, so a worker notices the writes
+        of the others and positions from any worker can tell that nothing has changed.
+    """
+
+    def __init__(self, max_changes : int =10000):
+        """
+            Creates an empty feed.
+
+            :param max_changes:     The most changes held at once (older changes are forgotten).
+        """
+
+        self.max_changes = max_changes                          # The most changes held at once.
+        self.changes = collections.deque(maxlen=max_changes)    # The changes, from oldest to newest.
+        self.sequence = 0                                       # The sequence number of the newest change.
+        self.mode = "local"                                     # Where the changes come from ("local" or "stream").
+        self.lock = threading.Lock()                            # Prevents two threads from changing the feed at once.
+        self.origin = secrets.token_hex(8)                      # The name of the feed (new in every forked process).
+        self.version_store = None                               # Counts the writes of every worker (None if unused).
+        self.version = 0                                        # The number of writes of every worker accounted for.
+        os.register_at_fork(after_in_child=self.rename)  # Renames the feed in every forked process.
+
+    def rename(self):
+        """
+            Gives the feed a new name (a forked process numbers its changes separately from its parent).
+        """
+
+        self.origin = secrets.token_hex(8)  # Names the feed.
+
+    def record(self, change_type : str, document : dict =None, fields : set =None):
+        """
+            Adds a change to the feed.
+
+            :param change_type:     The type of the change ("insert", "update", "delete" or "reset").
+                                    "reset" means any document may have changed (e.g. after a bulk write).
+            :param document:        The document after the change (or the deleted document), if known.
+            :param fields:          The fields an update changed (None if every field may have changed).
+        """
+
+        # Only one thread may change the feed at a time.
+        with self.lock:
+            self.append(change_type, document, fields)  # Adds the change.
+
+    def append(self, change_type : str, document : dict =None, fields : set =None):
+        """
+            Numbers and stores a change (the caller must hold the lock).
+
+            :param change_type:     The type of the change (see record()).
+            :param document:        The document after the change (or the deleted document), if known.
+            :param fields:          The fields an update changed (None if every field may have changed).
+        """
+
+        self.sequence += 1  # Numbers the change.
+
+        # Stores the change.
+        self.changes.append({"sequence": self.sequence,
+                             "type": change_type,
+                             "product_id": None if document is None else document.get("product_id"),
+                             "document": document,
+                             "fields": None if fields is None else set(fields)})
+
+    def record_local(self, change_type : str, document : dict =None, fields : set =None):
+        """
+            Adds a change made by this process to the feed, unless a change stream is already reporting every change.
+
+            :param change_type:     The type of the change (see record()).
+            :param document:        The document after the change (or the deleted document), if known.
+            :param fields:          The fields an update changed (None if every field may have changed).
+        """
+
+        # If a change stream is reporting every change,
+        if self.mode == "stream":
+            return  # Exits the function (the stream adds the change).
+
+        # Only one thread may change the feed at a time.
+        with self.lock:
+            # If the writes of every worker are counted,
+            if self.version_store is not None:
+                version = self.version_store.increment_counter(version_counter)  # Counts the write.
+
+                # If another worker wrote since the feed last counted the writes,
+                if version != self.version + 1:
+                    self.append("reset")  # Adds that any document may have changed.
+
+                self.version = version  # Remembers the writes accounted for.
+
+            self.append(change_type, document, fields)  # Adds the change.
+
+    def set_mode(self, mode : str):
+        """
+            Sets where the changes come from.
+
+            :param mode:            "stream" if a change stream reports every change, otherwise "local".
+        """
+
+        self.mode = mode  # Updates where the changes come from.
+
+    def set_version_store(self, store):
+        """
+            Sets the store counting the writes of every worker (used when several workers write without a change
+                stream).
+
+            :param store:           The store (see SessionStore.increment_counter()), or None if only this process
+                                    writes.
+        """
+
+        # Only one thread may change the feed at a time.
+        with self.lock:
+            self.version_store = store  # Remembers the store.
+            self.version = 0 if store is None else store.get_counter(version_counter)  # Accounts for earlier writes.
+
+    def is_shared(self) -> bool:
+        """
+            Gets whether the writes of other workers are noticed through the version store.
+
+            :return bool:           Whether the version store is used (False in "stream" mode, which needs none).
+        """
+
+        return self.version_store is not None and self.mode != "stream"  # Returns whether the store is used.
+
+    def synchronize(self) -> bool:
+        """
+            Notices the writes other workers made since the feed last counted the writes (adding a "reset" change,
+                since the documents they changed are not known).
+
+            :return bool:           Whether another worker wrote (False if the version store is not used).
+        """
+
+        # If the version store is not used,
+        if not self.is_shared():
+            return False  # Returns that no other writes are known.
+
+        # Only one thread may change the feed at a time.
+        with self.lock:
+            version = self.version_store.get_counter(version_counter)  # Gets the writes of every worker.
+
+            # If no worker wrote since the writes were last counted,
+            if version == self.version:
+                return False  # Returns that nothing changed.
+
+            self.append("reset")  # Adds that any document may have changed.
+            self.version = version  # Remembers the writes accounted for.
+            return True  # Returns that another worker wrote.
+
+    def get_sequence(self) -> int:
+        """
+            Gets the sequence number of the newest change.
+
+            :return int:            The sequence number (0 if nothing has changed).
+        """
+
+        return self.sequence  # Returns the sequence number.
+
+    def changes_since(self, sequence : int) -> (int, list, bool):
+        """
+            Gets the changes made after a sequence number, keeping only the newest change of every product.
+
+            :param sequence:        The sequence number of the newest change already seen.
+            :return (int, list,
+                     bool):         The sequence number of the newest change.
+                                    The changes (a "reset" change if any document may have changed).
+                                    Whether every change since the sequence number was still held.
+        """
+
+        # Only one thread may read the feed at a time.
+        with self.lock:
+            latest, newer, complete = self.get_newer(sequence)  # Gets the unseen changes.
+
+        return latest, self.coalesce(newer), complete  # Returns the newest change of every product.
+
+    def get_newer(self, sequence : int) -> (int, list, bool):
+        """
+            Gets every change made after a sequence number (the caller must hold the lock).
+
+            :param sequence:        The sequence number of the newest change already seen.
+            :return (int, list,
+                     bool):         The sequence number of the newest change.
+                                    The changes, from oldest to newest (empty if some were forgotten).
+                                    Whether every change since the sequence number was still held.
+        """
+
+        # If the oldest change held is newer than the first change not yet seen,
+        if self.changes and self.changes[0]["sequence"] > sequence + 1:
+            return self.sequence, [], False  # Returns that some changes were forgotten.
+
+        # Returns the unseen changes.
+        return self.sequence, [change for change in self.changes if change["sequence"] > sequence], True
+
+    @staticmethod
+    def coalesce(newer : list) -> list:
+        """
+            Keeps only the newest change of every product.
+
+            :param newer:           The changes, from oldest to newest.
+            :return list:           The changes (a "reset" change if any document may have changed).
+        """
+
+        coalesced = {}  # Holds the newest change of every product.
+
+        # For every unseen change (from oldest to newest),
+        for change in newer:
+            # If any document may have changed or the product of the change is unknown,
+            if change["type"] == "reset" or change["product_id"] is None:
+                return [dict(change, type="reset")]  # Returns that any document may have changed.
+
+            previous = coalesced.get(change["product_id"])  # Gets the earlier change of the product.
+
+            # If the product was already changed,
+            if previous is not None:
+                # If either change inserted or deleted the product,
+                if previous["type"] != "update" or change["type"] != "update":
+                    change = dict(change, type="delete" if change["type"] == "delete" else "insert")
+
+                # Otherwise if both changes updated the product,
+                else:
+                    # Joins the fields both updates changed.
+                    fields = None if previous["fields"] is None or change["fields"] is None \
+                        else previous["fields"] | change["fields"]
+                    change = dict(change, fields=fields)
+
+            coalesced[change["product_id"]] = change  # Keeps the newest change of the product.
+
+        return list(coalesced.values())  # Returns the newest change of every product.
+
+    def format_position(self, sequence : int) -> str:
+        """
+            Gets the text of a position (the caller must hold the lock).
+
+            :param sequence:        The sequence number of the newest change seen.
+            :return str:            The position e.g. "3f2a...:42", followed by the writes of every worker accounted
+                                    for if the version store is used (e.g. "3f2a...:42:17").
+        """
+
+        # Returns the position.
+        return f"{self.origin}:{sequence}:{self.version}" if self.is_shared() else f"{self.origin}:{sequence}"
+
+    def get_position(self) -> str:
+        """
+            Gets the position of the newest change, naming this feed (e.g. "3f2a...:42").
+
+            :return str:            The position.
+        """
+
+        self.synchronize()  # Notices the writes of other workers (the position must include them).
+
+        # Only one thread may read the feed at a time.
+        with self.lock:
+            return self.format_position(self.sequence)  # Returns the position.
+
+    def changes_since_position(self, position : str) -> (str, list, bool):
+        """
+            Gets the changes made after a position (see changes_since()). A position from another feed (e.g. another
+            worker process) cannot be compared, so it is reported as incomplete, unless the version store shows that
+            no worker has written since it was taken.
+
+            :param position:        The position of the newest change already seen.
+            :return (str, list,
+                     bool):         The position of the newest change.
+                                    The changes (a "reset" change if any document may have changed).
+                                    Whether every change since the position was still held.
+        """
+
+        origin, _, rest = str(position).partition(":")  # Splits the position.
+        sequence, _, version = rest.partition(":")
+        self.synchronize()  # Notices the writes of other workers.
+
+        # Only one thread may read the feed at a time (the position returned must match the changes).
+        with self.lock:
+            current = self.format_position(self.sequence)  # Gets the position of the newest change.
+
+            # If no worker wrote since the position was taken (by this feed or another),
+            if self.is_shared() and version == str(self.version) and \
+                    (origin != self.origin or sequence == str(self.sequence)):
+                return current, [], True  # Returns that nothing changed.
+
+            # If the position came from another feed (or is not a position),
+            if origin != self.origin or not sequence.isdigit():
+                return current, [], False  # Returns that the changes are unknown.
+
+            latest, newer, complete = self.get_newer(int(sequence))  # Gets the unseen changes.
+            current = self.format_position(latest)  # Gets the position of the newest of them.
+
+        return current, self.coalesce(newer), complete  # Returns the changes.
@@ -5,25 +5,41 @@
 """
 
 # Imports
-import pandas                                               # Allows for use of Pandas (Data Frames).
-from dash import Dash, dash_table, dcc, html                # Allows use of Dash functionality.
-from dash.dependencies import Input, Output, State          # Allows use of Dash dependencies for callbacks.
-import inventory_management_backend as imb                  # Allows use of the Inventory Management backend service.
+from dash import Dash, Patch, dash_table, dcc, html, no_update  # Allows use of Dash functionality.
+from dash.dependencies import Input, Output, State              # Allows use of Dash dependencies for callbacks.
+import inventory_management_backend as imb                      # Allows use of the Inventory Management backend service.
+import inventory_management_metrics as imm                      # Allows for timing callbacks and serving the metrics.
 
 app = Dash(name="Inventory Management System", prevent_initial_callbacks="initial_duplicate")  # Creates a Dash app.
+imm.register_routes(app.server)  # Serves the metrics at "/metrics" (see inventory_management_metrics.py).
+live_update_interval_ms = 2000  # How often every dashboard checks for changes made by other users.
+search_debounce_seconds = 0.3   # How long typing must pause before the search box searches.
+search_limit = 20               # The most products shown by the search box.
 
 
-def start():
+def create_layout():
     """
-        Creates the formatting of the Dash app before starting the app.
+        Creates the formatting of the Dash app (before it is served by start() or a WSGI server).
     """
 
     # Sets the layout for the app.
     app.layout = app.layout = html.Div([
+        # Holds the token of the backend session of the browser tab (each tab logs in separately).
+        dcc.Store(id="session_token", storage_type="session"),
+
+        # Holds the position of the newest change shown in the table (see live_update()).
+        dcc.Store(id="change_sequence", data=None),
+
+        # Checks for changes made by other users every few seconds.
+        dcc.Interval(id="live_update_interval", interval=live_update_interval_ms),
+
         # Creates the header.
         html.Div(id="header", children=[
             # The title.
-            html.Center(html.B(html.H1("Sample Inventory Management Dashboard")))
+            html.Center(html.B(html.H1("Sample Inventory Management Dashboard"))),
+
+            # The live totals of the inventory (see totals_changed()).
+            html.Center(html.H3(id="header_totals", children=""))
         ], style={"display": "flex", "justifyContent": "center", "flexDirection": "column"}),
 
         # Creates the login section.
@@ -49,19 +65,31 @@ def start():
            html.H2(id="h2_login_error", children="")
         ]),
 
+        # A container to hold the product search (see search_changed()).
+        html.Div(id="search_container", style={"display": "none"}, children=[
+            dcc.Input(id="input_search", type="search", placeholder="Search products",
+                      debounce=search_debounce_seconds),
+            html.Div(id="search_results")
+        ]),
+
         # Creates the table section (shows database data).
         html.Div(id="table_container", children=[
             # The table to hold the data.
             dash_table.DataTable(
                 id="table",
-                columns=[] if imb.logged_in else [],
+                columns=[] if imb.is_logged_in() else [],
                 data=None,
-                row_selectable = "single",
-                selected_rows = [0],
+                row_selectable = "multi",
+                selected_rows = [],
+                page_current = 0,
                 page_size = 25,
-                sort_action = "native",
+                page_count = 1,
+                page_action = "custom",
+                sort_action = "custom",
                 sort_mode = "multi",
-                filter_action = "native",
+                sort_by = [],
+                filter_action = "custom",
+                filter_query = "",
                 style_table = {"overflowX": "auto"}
             ),
 
@@ -79,16 +107,126 @@ def start():
             html.Button(id="button_update", children="Update Values", n_clicks=0, style={"display": "none"}),
             html.Button(id="button_delete", children="Delete Entry", n_clicks=0, style={"display": "none"}),
             html.Button(id="button_add", children="Add Entry", n_clicks=0, style={"display": "none"})
+        ]),
+
+        # A container to hold the section to edit every selected row at once (see batch_pressed()).
+        html.Div(id="batch_form_container", style={"display": "none"}, children=[
+            dcc.Input(id="input_batch_price", type="number", min=0, placeholder="New Price"),
+            html.Button(id="button_batch_set_price", children="Set Price of Selected", n_clicks=0),
+            dcc.Input(id="input_batch_quantity_delta", type="number", step=1, placeholder="Quantity Change"),
+            html.Button(id="button_batch_adjust_quantity", children="Adjust Quantity of Selected", n_clicks=0),
+            html.Button(id="button_batch_delete", children="Delete Selected", n_clicks=0),
+            html.Span(id="batch_status", children="")
+        ]),
+
+        # A container to hold the reports (calculated by the database, see reports_changed()).
+        html.Div(id="reports_container", style={"display": "none"}, children=[
+            # The options of the reports.
+            html.Div(children=[
+                html.Label("Group by"),
+                dcc.Dropdown(id="report_group_by", placeholder="No grouping", clearable=True,
+                             options=[{"label": field, "value": field} for field in imb.report_group_fields]),
+                html.Label("Low stock below"),
+                dcc.Input(id="report_low_stock_threshold", type="number", min=0, value=10, debounce=True),
+                html.Label("Top"),
+                dcc.Input(id="report_top_count", type="number", min=1, max=100, value=10, debounce=True),
+                dcc.Dropdown(id="report_top_by", clearable=False, value="value",
+                             options=[{"label": "by value", "value": "value"},
+                                      {"label": "by quantity", "value": "quantity"}])
+            ], style={"display": "flex", "gap": "8px", "alignItems": "center"}),
+
+            # The panels of the reports.
+            html.Div(id="report_inventory_value"),
+            html.Div(id="report_low_stock"),
+            html.Div(id="report_top_products")
         ])
 ], style={"background": "#348AA7"})
 
-    app.run_server(host="0.0.0.0", port="8050")  # Starts the app.
+
+def start(host : str ="0.0.0.0", port : int =8050):
+    """
+        Creates the formatting of the Dash app before starting the app with the (single process) development server.
+            See inventory_management_wsgi.py for serving it with several worker processes.
+
+        :param host:        The address to listen on.
+        :param port:        The port to listen on.
+    """
+
+    create_layout()  # Creates the formatting of the app.
+    app.run_server(host=host, port=str(port))  # Starts the app.
+
+
+def get_columns() -> list:
+    """
+        Gets the column definitions of the table.
+
+        :return list:       The definition of every column in the table.
+    """
+
+    # Returns the definition of every product field.
+    return [{"id": i, "name": i, "deletable": False, "selectable": True, "type": column_type}
+            for i, column_type in imb.product_field_types.items()]
+
+
+def get_table_rows(records : list) -> list:
+    """
+        Gives every row of the table an "id" equal to its product ID, so a selection follows its products (see
+            selected_row_ids) instead of row positions, which change whenever the page is read again.
+
+        :param records:     The documents to show in the table (None if nothing is shown).
+        :return list:       The rows of the table.
+    """
+
+    # If nothing is shown,
+    if records is None:
+        return None  # Returns nothing.
+
+    # Returns the rows (copies, so the cached pages are not changed).
+    return [dict(record, id=record.get("product_id")) for record in records]
+
+
+def get_row_selection(rows : list, selected_ids : list) -> (list, list):
+    """
+        Gets the selection of a page that was read again: only the selected products still shown are kept.
+
+        :param rows:            The rows of the page (see get_table_rows()).
+        :param selected_ids:    The product IDs of the selected rows.
+        :return (list, list):   The indexes of the selected rows.
+                                The product IDs of the selected rows.
+    """
+
+    selected = set(selected_ids or [])  # Gets the selected products.
+    indexes = [index for index, row in enumerate(rows or []) if row["id"] in selected]  # Finds their rows.
+    return indexes, [rows[index]["id"] for index in indexes]  # Returns the selection.
+
+
+def get_report_panel(title : str, records : list) -> list:
+    """
+        Creates a panel showing the results of a report.
+
+        :param title:       The title of the panel.
+        :param records:     The results of the report (None if it could not be calculated).
+        :return list:       The elements of the panel.
+    """
+
+    # If the report could not be calculated,
+    if records is None:
+        return [html.H3(title), html.P("The report could not be calculated.")]  # Returns the error.
+
+    # Gets the columns of the results (every result of a report has the same fields).
+    columns = [{"id": field, "name": field, "type": "numeric" if field != "group" else "any"}
+               for field in (records[0] if records else {})]
+
+    # Returns the title and the results in a table.
+    return [html.H3(title), dash_table.DataTable(data=records, columns=columns, page_size=10,
+                                                 style_table={"overflowX": "auto"})]
 
 
 @app.callback(
     # The elements that will be updated by the returned values.
     [Output("table", "data", allow_duplicate=True),
-     Output("table", "columns", allow_duplicate=True),
+     Output("table", "selected_rows", allow_duplicate=True),
+     Output("table", "selected_row_ids", allow_duplicate=True),
      Output("button_update", "n_clicks"),
      Output("button_delete", "n_clicks"),
      Output("button_add", "n_clicks")],
@@ -103,12 +241,15 @@ def start():
      State("input_product_price", "value"),
      State("input_product_quantity", "value"),
      State("table", "derived_virtual_data"),
-     State("table", "derived_virtual_selected_rows")],
+     State("table", "selected_row_ids"),
+     State("session_token", "data")],
 
     prevent_initial_call=True  # Prevents this function from running when the Dash app starts.
 )
+@imm.instrument("button_pressed", "callback", profile=True)
 def button_pressed(update_clicks : int, delete_clicks : int, add_clicks : int, product_name : str, product_price : str,
-                   product_quantity : str, all_rows, selected_row) -> (dict, list, int, int, int):
+                   product_quantity : str, all_rows, selected_ids, session_token : str) -> (Patch, list, list, int, int,
+                                                                                          int):
     """
         Performs the necessary modification depending on the button that was pressed.
 
@@ -119,40 +260,60 @@ def button_pressed(update_clicks : int, delete_clicks : int, add_clicks : int, p
         :param product_price:                   The price specified in the product price input field.
         :param product_quantity:                The quantity specified in the product quantity input field.
         :param all_rows:                        All the rows within the table.
-        :param selected_row:                    The currently selected row.
-        :return (dict, list, int, int, int):    The dictionary of the data to populate the table.
-                                                The composition of the columns.
+        :param selected_ids:                    The product IDs of the selected rows (the first is updated or deleted).
+        :param session_token:                   The token of the backend session of the browser tab.
+        :return (Patch, list, list,
+                 int, int, int):                The patch to apply to the data of the table (only the affected row).
+                                                The selected rows (cleared when the selected row is deleted).
+                                                The product IDs of the selected rows (cleared with the selected rows).
                                                 Reset the update button click count.
                                                 Reset the delete button click count.
                                                 Reset the add button click count.
     """
+    imb.use_session(session_token)  # Uses the backend session of the browser tab.
+
     # If the user is not logged in,
-    if not imb.logged_in:
-        return None, [], 0, 0, 0  # Returns default (empty) data to prevent unauthorized access.
+    if not imb.is_logged_in():
+        return None, [], [], 0, 0, 0  # Returns default (empty) data to prevent unauthorized access.
 
     # The below code only runs if the user is logged in.
 
-    frame = pandas.DataFrame(all_rows).iloc[selected_row]  # Builds a DataFrame from locating the selected row within all the rows.
-    id = frame["product_id"].tolist()  # Gets the product ID from the frame.
+    table_patch = no_update  # Holds the changes to apply to the table (nothing changes unless a modification succeeds).
+    selection = no_update  # Holds the new selection (the selection only changes when the selected row is deleted).
+    product_id = selected_ids[0] if selected_ids else None  # Gets the product ID of the selected row.
+
+    # Gets the index of the selected row within the table (None if the selected product is not shown anymore).
+    row_index = next((index for index, row in enumerate(all_rows or []) if row.get("id") == product_id), None)
 
-    # If the update button was pressed,
-    if update_clicks == 1:
+    # If the update button was pressed and a row is selected,
+    if update_clicks == 1 and row_index is not None:
         # Makes an attempt,
         try:
             product_price = float(product_price)  # Converts the price to a float value.
             product_quantity = int(product_quantity)  # Converts the quantity to an integer value.
 
             # Updates the selected entry with the data from the input fields.
-            imb.update({"product_id" : id[0]},
-                       {"$set": {"product_name": product_name, "product_price": product_price, "product_quantity": product_quantity}})
+            document = imb.update({"product_id" : product_id},
+                                  {"$set": {"product_name": product_name, "product_price": product_price, "product_quantity": product_quantity}})
+
+            # If the entry was updated,
+            if document is not None:
+                table_patch = Patch()  # Creates a patch for the table data.
+                table_patch[row_index] = get_table_rows([document])[0]  # Replaces only the updated row.
 
         # If something failed,
         except Exception:
             print("Cannot convert!")  # Output an error.
 
-    # Otherwise if the delete button was pressed,
-    elif delete_clicks == 1:
-        imb.delete({"product_id": id[0]})  # Deletes the selected entry.
+    # Otherwise if the delete button was pressed and a row is selected,
+    elif delete_clicks == 1 and row_index is not None:
+        document = imb.delete({"product_id": product_id})  # Deletes the selected entry.
+
+        # If the entry was deleted,
+        if document is not None:
+            table_patch = Patch()  # Creates a patch for the table data.
+            del table_patch[row_index]  # Removes only the deleted row.
+            selection = []  # Clears the selection (the row positions after the deleted row have moved).
 
     # Otherwise if the add button was pressed,
     elif add_clicks == 1:
@@ -161,29 +322,282 @@ def button_pressed(update_clicks : int, delete_clicks : int, add_clicks : int, p
             product_price = float(product_price)  # Converts the price into a float value.
             product_quantity = int(product_quantity)  # Converts the price into an integer value.
 
-            frame = pandas.DataFrame(all_rows).iloc[-1]  # Builds a DataFrame from the last entry in the table.
-            id = frame["product_id"].tolist()  # Gets the product ID from the DataFrame.
+            # Creates a new entry into the database from the data in the input fields (the server allocates the product ID).
+            document = imb.create({"product_name": product_name, "product_price": product_price,
+                                   "product_quantity": product_quantity})
 
-            # Creates a new entry into the database from the data in the input fields.
-            imb.create({"product_id": id + 1, "product_name": product_name, "product_price": product_price,
-                        "product_quantity": product_quantity})
+            # If the entry was created,
+            if document is not None:
+                table_patch = Patch()  # Creates a patch for the table data.
+                table_patch.append(get_table_rows([document])[0])  # Adds only the new row to the end of the table.
 
         # If something failed,
         except Exception:
             print("Cannot convert!")  # Output an error.
 
-    df = imb.get_data_frame(imb.read())  # Gets the DataFrame from reading all the data in the database.
-    table_data = imb.convert_dataframe_to_dict(df)  # Converts the DataFrame to a dictionary.
+    # Returns the changes to the table data and the selection, and resets the buttons.
+    return table_patch, selection, selection, 0, 0, 0
+
+
+@app.callback(
+    # The elements that will be updated by the returned values.
+    [Output("table", "data", allow_duplicate=True),
+     Output("table", "page_count", allow_duplicate=True),
+     Output("table", "selected_rows", allow_duplicate=True),
+     Output("table", "selected_row_ids", allow_duplicate=True),
+     Output("change_sequence", "data", allow_duplicate=True),
+     Output("batch_status", "children"),
+     Output("button_batch_set_price", "n_clicks"),
+     Output("button_batch_adjust_quantity", "n_clicks"),
+     Output("button_batch_delete", "n_clicks")],
+
+    # The elements that will call this function when interacted with and be passed in as arguments.
+    [Input("button_batch_set_price", "n_clicks"),
+     Input("button_batch_adjust_quantity", "n_clicks"),
+     Input("button_batch_delete", "n_clicks")],
+
+    # The elements that will be passed to this function as arguments (will not call the function directly).
+    [State("input_batch_price", "value"),
+     State("input_batch_quantity_delta", "value"),
+     State("table", "selected_row_ids"),
+     State("table", "page_current"),
+     State("table", "page_size"),
+     State("table", "sort_by"),
+     State("table", "filter_query"),
+     State("session_token", "data")],
+
+    prevent_initial_call=True  # Prevents this function from running when the Dash app starts.
+)
+@imm.instrument("batch_pressed", "callback", profile=True)
+def batch_pressed(set_price_clicks : int, adjust_quantity_clicks : int, delete_clicks : int, price : float,
+                  quantity_delta : float, selected_ids : list, page_current : int, page_size : int, sort_by : list,
+                  filter_query : str, session_token : str) -> (list, int, list, list, str, str, int, int, int):
+    """
+        Applies a batch edit to every selected row in a single bulk write, then reads the page once.
+
+        :param set_price_clicks:            The number of times the set price button was clicked.
+        :param adjust_quantity_clicks:      The number of times the adjust quantity button was clicked.
+        :param delete_clicks:               The number of times the delete selected button was clicked.
+        :param price:                       The price specified in the batch price input field.
+        :param quantity_delta:              The change specified in the batch quantity input field.
+        :param selected_ids:                The product IDs of the selected rows (the selection follows the products,
+                                            so rows moved by a live update are never edited by mistake).
+        :param page_current:                The index of the page shown in the table.
+        :param page_size:                   The number of rows on each page of the table.
+        :param sort_by:                     The columns the table is sorted by.
+        :param filter_query:                The filter applied to the table.
+        :param session_token:               The token of the backend session of the browser tab.
+        :return (list, int, list,
+                 list, str, str,
+                 int, int, int):            The data to populate the table (read again after the edit).
+                                            The number of pages in the table.
+                                            The selected rows (cleared after the edit).
+                                            The product IDs of the selected rows (cleared after the edit).
+                                            The position of the newest change shown in the table.
+                                            The result of the edit shown to the user.
+                                            Reset the set price button click count.
+                                            Reset the adjust quantity button click count.
+                                            Reset the delete selected button click count.
+    """
+    imb.use_session(session_token)  # Uses the backend session of the browser tab.
+
+    # If the user is not logged in,
+    if not imb.is_logged_in():
+        return no_update, no_update, [], [], no_update, "", 0, 0, 0  # Changes nothing to prevent unauthorized access.
+
+    # The below code only runs if the user is logged in.
+
+    product_ids = list(selected_ids or [])  # Gets the product ID of every selected row.
+
+    # If no row is selected,
+    if not product_ids:
+        return no_update, no_update, no_update, no_update, no_update, "Select rows first!", 0, 0, 0  # Outputs an error.
+
+    # If the set price button was pressed,
+    if set_price_clicks == 1:
+        action, value = "set_price", price
+
+    # Otherwise if the adjust quantity button was pressed,
+    elif adjust_quantity_clicks == 1:
+        action, value = "adjust_quantity", quantity_delta
+
+    # Otherwise (the delete selected button was pressed),
+    else:
+        action, value = "delete", None
+
+    results = imb.batch_edit(product_ids, action, value)  # Edits every selected product in one bulk write.
+
+    # If the edit was not valid,
+    if results is None:
+        return no_update, no_update, no_update, no_update, no_update, "Cannot convert!", 0, 0, 0  # Outputs an error.
+
+    position = imb.change_feed.get_position()  # Gets the position after the edit (before reading the page).
+
+    # Reads the page once (the edit can change, remove or reorder any of its rows).
+    table_data, total = imb.read_page(page_current, page_size, sort_by, filter_query)
+
+    # Describes the result of the edit.
+    status = f"{results['modified'] + results['deleted']} of {len(product_ids)} products changed" + \
+             (f" ({len(results['rejected'])} without enough stock)" if results.get("rejected") else "") + \
+             (f" ({len(results['errors'])} failed)" if results["errors"] else "")
+
+    # Returns the page (the change sequence is advanced past the edit, so it is not read again by live_update()).
+    return get_table_rows(table_data), imb.get_page_count(total, page_size), [], [], position, status, 0, 0, 0
+
+
+@app.callback(
+    # The elements that will be updated by the returned values.
+    [Output("table", "data", allow_duplicate=True),
+     Output("table", "page_count", allow_duplicate=True),
+     Output("table", "selected_rows", allow_duplicate=True),
+     Output("table", "selected_row_ids", allow_duplicate=True)],
+
+    # The elements that will call this function when interacted with and be passed in as arguments.
+    [Input("table", "page_current"),
+     Input("table", "page_size"),
+     Input("table", "sort_by"),
+     Input("table", "filter_query")],
+
+    # The elements that will be passed to this function as arguments (will not call the function directly).
+    [State("session_token", "data")],
+
+    prevent_initial_call=True  # Prevents this function from running when the Dash app starts.
+)
+@imm.instrument("table_query_changed", "callback", profile=True)
+def table_query_changed(page_current : int, page_size : int, sort_by : list, filter_query : str,
+                        session_token : str) -> (list, int, list, list):
+    """
+        Reads the page of data to show when the table is paged, sorted or filtered.
+
+        :param page_current:        The index of the page shown in the table.
+        :param page_size:           The number of rows on each page of the table.
+        :param sort_by:             The columns the table is sorted by.
+        :param filter_query:        The filter applied to the table.
+        :param session_token:       The token of the backend session of the browser tab.
+        :return (list, int, list,
+                 list):             The data to populate the table.
+                                    The number of pages in the table.
+                                    The selected rows (cleared, the selection belonged to the rows shown before).
+                                    The product IDs of the selected rows (cleared with the selected rows).
+    """
+
+    imb.use_session(session_token)  # Uses the backend session of the browser tab.
+
+    # If the user is not logged in,
+    if not imb.is_logged_in():
+        return None, 1, [], []  # Returns default (empty) data to prevent unauthorized access.
+
+    # The below code only runs if the user is logged in.
+
+    # Reads only the page of data shown in the table.
+    table_data, total = imb.read_page(page_current, page_size, sort_by, filter_query)
 
-    # Returns the data to populate the table and reset the buttons.
-    return table_data, [{"id": i, "name": i, "deletable": False, "selectable": True} for i in df.columns],\
-           0, 0, 0
+    # Returns the page and the number of pages.
+    return get_table_rows(table_data), imb.get_page_count(total, page_size), [], []
+
+
+@app.callback(
+    # The elements that will be updated by the returned values.
+    [Output("table", "data", allow_duplicate=True),
+     Output("table", "page_count", allow_duplicate=True),
+     Output("table", "selected_rows", allow_duplicate=True),
+     Output("table", "selected_row_ids", allow_duplicate=True),
+     Output("change_sequence", "data")],
+
+    # The elements that will call this function when interacted with and be passed in as arguments.
+    [Input("live_update_interval", "n_intervals")],
+
+    # The elements that will be passed to this function as arguments (will not call the function directly).
+    [State("change_sequence", "data"),
+     State("table", "data"),
+     State("table", "selected_row_ids"),
+     State("table", "page_current"),
+     State("table", "page_size"),
+     State("table", "sort_by"),
+     State("table", "filter_query"),
+     State("session_token", "data")],
+
+    prevent_initial_call=True  # Prevents this function from running when the Dash app starts.
+)
+@imm.instrument("live_update", "callback", profile=True)
+def live_update(n_intervals : int, sequence : str, table_data : list, selected_ids : list, page_current : int,
+                page_size : int, sort_by : list, filter_query : str, session_token : str) -> (Patch, int, list, list,
+                                                                                           str):
+    """
+        Shows the changes made by other users since the table was last updated. Only the changed rows are sent when
+        possible; the page is only read again (usually from the cache) if a change could move rows on or off it.
+
+        :param n_intervals:         The number of times the interval has fired.
+        :param sequence:            The position of the newest change shown in the table (None at first).
+        :param table_data:          The data currently shown in the table.
+        :param selected_ids:        The product IDs of the selected rows.
+        :param page_current:        The index of the page shown in the table.
+        :param page_size:           The number of rows on each page of the table.
+        :param sort_by:             The columns the table is sorted by.
+        :param filter_query:        The filter applied to the table.
+        :param session_token:       The token of the backend session of the browser tab.
+        :return (Patch, int, list,
+                 list, str):        The changes to the table data (or the whole page if it was read again).
+                                    The number of pages in the table (only if the page was read again).
+                                    The selected rows (moved with their products if the page was read again).
+                                    The product IDs of the selected rows (only the products still shown are kept).
+                                    The position of the newest change shown in the table.
+    """
+
+    imb.use_session(session_token)  # Uses the backend session of the browser tab.
+
+    # If the user is not logged in,
+    if not imb.is_logged_in():
+        return no_update, no_update, no_update, no_update, no_update  # Changes nothing (there is no table to update).
+
+    # The below code only runs if the user is logged in.
+
+    # If the table has not seen any changes yet,
+    if sequence is None:
+        latest, changes, complete = imb.change_feed.get_position(), [], False  # Reads the page to start from.
+
+    # Otherwise (the table has seen changes before),
+    else:
+        # Gets the changes it has not seen (the page is read again if another worker served the last update and any
+        #   worker has written since).
+        latest, changes, complete = imb.change_feed.changes_since_position(sequence)
+
+        # If nothing has changed,
+        if complete and not changes:
+            return no_update, no_update, no_update, no_update, no_update  # Changes nothing.
+
+    patches = imb.get_page_patches(changes, table_data or [], sort_by, filter_query) if complete else None
+
+    # If the page must be read again,
+    if patches is None:
+        table_data, total = imb.read_page(page_current, page_size, sort_by, filter_query)  # Reads the page.
+        rows = get_table_rows(table_data)  # Gives every row its product ID.
+        selected_rows, selected_ids = get_row_selection(rows, selected_ids)  # Moves the selection with its products.
+
+        # Returns the whole page.
+        return rows, imb.get_page_count(total, page_size), selected_rows, selected_ids, latest
+
+    # If the page is not affected by the changes,
+    if not patches:
+        return no_update, no_update, no_update, no_update, latest  # Only remembers that the changes were seen.
+
+    table_patch = Patch()  # Holds the changes to the table data.
+
+    # For every changed row,
+    for index, document in patches.items():
+        table_patch[index] = get_table_rows([document])[0]  # Replaces the row (the same product, so the selection stays).
+
+    return table_patch, no_update, no_update, no_update, latest  # Returns the changed rows.
 
 
 @app.callback(
     # The elements that will be updated with the returned values.
     [Output("table", "data", allow_duplicate=True),
+     Output("table", "selected_rows", allow_duplicate=True),
+     Output("table", "selected_row_ids", allow_duplicate=True),
      Output("table", "columns", allow_duplicate=True),
+     Output("table", "page_current"),
+     Output("table", "page_count", allow_duplicate=True),
      Output("h2_login_error", "children"),
      Output("button_login", "children"),
 
@@ -196,32 +610,49 @@ def button_pressed(update_clicks : int, delete_clicks : int, add_clicks : int, p
      Output("button_update", "style"),
      Output("button_delete", "style"),
      Output("button_add", "style"),
-     Output("button_drop_database", "style")],
+     Output("batch_form_container", "style"),
+     Output("button_drop_database", "style"),
+     Output("session_token", "data")],
 
     # The elements that will call this function when interacted with and get passed as arguments.
     [Input("button_login", "n_clicks")],
 
     # The elements that will be passed to this function as arguments.
     [State("input_username", "value"),
-     State("input_password", "value")],
+     State("input_password", "value"),
+     State("table", "page_size"),
+     State("table", "sort_by"),
+     State("table", "filter_query"),
+     State("session_token", "data")],
 
     prevent_initial_call=True  # Prevents this function from calling when the Dash app starts.
 )
-def login_pressed(login_clicks : int, username : str, password : str) -> (dict, list, str, str, dict,
-                                                                          dict, dict, dict, dict,
-                                                                          dict, dict, dict, dict):
+@imm.instrument("login_pressed", "callback", profile=True)
+def login_pressed(login_clicks : int, username : str, password : str, page_size : int, sort_by : list,
+                  filter_query : str, session_token : str) -> (dict, list, list, list, int, int, str, str, dict, dict,
+                                                               dict, dict, dict, dict, dict, dict, dict, dict, str):
     """
         Performs the necessary login function when the button is pressed.
 
         :param login_clicks:                    The number of times the login/logout button was pressed.
         :param username:                        The username entered in the input field.
         :param password:                        The password entered in the input field.
-        :return (dict, list, int,
+        :param page_size:                       The number of rows on each page of the table.
+        :param sort_by:                         The columns the table is sorted by.
+        :param filter_query:                    The filter applied to the table.
+        :param session_token:                   The token of the backend session of the browser tab (None at first).
+        :return (dict, list, list,
+                 list, int, int,
                  str, str, dict,
                  dict, dict, dict,
                  dict, dict, dict,
-                 dict, dict):                   The dictionary to populate the table data.
+                 dict, dict, dict,
+                 str):                          The dictionary to populate the table data.
+                                                The selected rows (cleared when logging in or out).
+                                                The product IDs of the selected rows (cleared with the selected rows).
                                                 The list to define the columns of the table.
+                                                The index of the page shown in the table.
+                                                The number of pages in the table.
                                                 The error occurred when trying to log in (if any).
                                                 The text of the login button.
                                                 The dictionary to set the visibility of the username input.
@@ -232,18 +663,27 @@ def login_pressed(login_clicks : int, username : str, password : str) -> (dict,
                                                 The dictionary to set the visibility of the update button.
                                                 The dictionary to set the visibility of the delete button.
                                                 The dictionary to set the visibility of the add button.
+                                                The dictionary to set the visibility of the batch edit section.
                                                 The dictionary to set the visibility of the drop database button.
+                                                The token of the backend session of the browser tab.
     """
 
+    # If the browser tab does not have a backend session yet,
+    if session_token is None:
+        session_token = imb.create_session_token()  # Creates a token for a new session.
+
+    imb.use_session(session_token)  # Uses the backend session of the browser tab.
+
     columns = []  # Holds the column definition for each row.
     table_data = None  # Holds the data to populate the table.
+    page_count = 1  # Holds the number of pages in the table.
     error_message = ""  # Holds any error message encountered.
     login_button_text = "Login"  # Holds the text to apply to the login button.
     visibility_input_fields = {"display": "inline"}  # Holds the visibility of the login input fields.
     visibility_modification_fields = {"display": "none"}  # Holds the visibility of the modification input fields.
 
     # If the user is logged in when the login (logout) button is pressed,
-    if imb.logged_in:
+    if imb.is_logged_in():
         imb.logout()  # Starts the logout process.
 
     # Otherwise (the user is logged out when the login button is pressed),
@@ -255,20 +695,17 @@ def login_pressed(login_clicks : int, username : str, password : str) -> (dict,
         # The below code exists to determine if the login process failed.
 
         # If the user is not logged in:
-        if not imb.logged_in:
+        if not imb.is_logged_in():
             error_message = "Invalid Credentials!" # Updates the error message.
 
     # If the user is logged in,
-    if imb.logged_in:
-        df = imb.get_data_frame(imb.read())  # Gets a DataFrame from the entire database.
-        table_data = imb.convert_dataframe_to_dict(df)  # Converts the DataFrame into a dictionary.
+    if imb.is_logged_in():
+        table_data, total = imb.read_page(0, page_size, sort_by, filter_query)  # Reads the first page of the database.
+        page_count = imb.get_page_count(total, page_size)  # Gets the number of pages in the table.
         error_message = ""  # Resets the error message (no error occurred).
         login_button_text = "Logout"  # Update the text of the login/logout button.
 
-        # Sets the data for each column in the DataFrame.
-        columns = [
-            {"id": i, "name": i, "deletable": False, "selectable": True} for i in df.columns
-        ]
+        columns = get_columns()  # Sets the data for each column in the table.
 
         # Updates the visibility of the fields.
         visibility_input_fields = {"display": "none"}
@@ -284,10 +721,181 @@ def login_pressed(login_clicks : int, username : str, password : str) -> (dict,
         visibility_modification_fields = {"display": "none"}
 
     # Returns all the data to update the app.
-    return table_data, columns, error_message, login_button_text, visibility_input_fields, visibility_input_fields, \
+    return get_table_rows(table_data), [], [], columns, 0, page_count, error_message, login_button_text, visibility_input_fields, visibility_input_fields, \
            visibility_modification_fields, visibility_modification_fields, visibility_modification_fields, \
            visibility_modification_fields, visibility_modification_fields, visibility_modification_fields, \
-           visibility_modification_fields
+           visibility_modification_fields, visibility_modification_fields, session_token
+
+
+@app.callback(
+    # The elements that are updated with the returned values.
+    Output("header_totals", "children"),
+
+    # The elements that call the function when interacted with (the columns change when logging in or out and the
+    #   change sequence changes when the inventory changes).
+    [Input("table", "columns"),
+     Input("change_sequence", "data")],
+
+    # The elements that are passed to the function as arguments.
+    [State("session_token", "data")],
+
+    prevent_initial_call=True  # Prevents this function from being called when the Dash server starts.
+)
+@imm.instrument("totals_changed", "callback", profile=True)
+def totals_changed(columns : list, sequence : str, session_token : str) -> str:
+    """
+        Shows the live totals of the inventory in the header (read from the summary document, not the products).
+
+        :param columns:         The columns of the table (empty when logged out).
+        :param sequence:        The position of the newest change shown in the table.
+        :param session_token:   The token of the backend session of the browser tab.
+        :return str:            The totals (empty when logged out).
+    """
+
+    imb.use_session(session_token)  # Uses the backend session of the browser tab.
+
+    # If the user is not logged in,
+    if not imb.is_logged_in():
+        return ""  # Shows nothing (nothing should be shown when logged out).
+
+    # The below code only runs if the user is logged in.
+
+    summary = imb.get_summary()  # Reads the summary of the inventory.
+
+    # If the summary could not be read,
+    if summary is None:
+        return "The totals could not be read."  # Shows the error.
+
+    # Returns the totals.
+    return f"{summary['total_units']:,} units worth ${summary['total_value']:,.2f} across {summary['products']:,} " \
+           f"products ({summary['below_reorder_point']:,} below the reorder point of {summary['reorder_point']})"
+
+
+@app.callback(
+    # The elements that are updated with the returned values.
+    [Output("reports_container", "style"),
+     Output("report_inventory_value", "children"),
+     Output("report_low_stock", "children"),
+     Output("report_top_products", "children")],
+
+    # The elements that call the function when interacted with (the columns change when logging in or out and the
+    #   change sequence changes when the inventory changes).
+    [Input("table", "columns"),
+     Input("change_sequence", "data"),
+     Input("table", "filter_query"),
+     Input("report_group_by", "value"),
+     Input("report_low_stock_threshold", "value"),
+     Input("report_top_count", "value"),
+     Input("report_top_by", "value")],
+
+    # The elements that are passed to the function as arguments.
+    [State("session_token", "data")],
+
+    prevent_initial_call=True  # Prevents this function from being called when the Dash server starts.
+)
+@imm.instrument("reports_changed", "callback", profile=True)
+def reports_changed(columns : list, sequence : str, filter_query : str, group_by : str, threshold : int, count : int,
+                    by : str, session_token : str) -> (dict, list, list, list):
+    """
+        Calculates the reports in the database and shows their (small) results.
+
+        :param columns:         The columns of the table (empty when logged out).
+        :param sequence:        The position of the newest change shown in the table.
+        :param filter_query:    The filter applied to the table (the reports only count matching products).
+        :param group_by:        The product field to group the reports by (None for no grouping).
+        :param threshold:       The quantity a product must be below to be low on stock.
+        :param count:           The number of products (or groups) in the top report.
+        :param by:              What the top report ranks by ("value" or "quantity").
+        :param session_token:   The token of the backend session of the browser tab.
+        :return (dict, list,
+                 list, list):   The dictionary to set the visibility of the reports.
+                                The elements of the inventory value panel.
+                                The elements of the low stock panel.
+                                The elements of the top products panel.
+    """
+
+    imb.use_session(session_token)  # Uses the backend session of the browser tab.
+
+    # If the user is not logged in,
+    if not imb.is_logged_in():
+        return {"display": "none"}, [], [], []  # Hides the reports (nothing should be shown when logged out).
+
+    # The below code only runs if the user is logged in.
+
+    threshold = 10 if threshold is None else threshold  # Uses the default threshold if the input is empty.
+    count = 10 if count is None else count  # Uses the default count if the input is empty.
+    totals = imb.get_inventory_value(group_by, 100, filter_query)  # Calculates the value of the inventory.
+
+    # If the inventory is not grouped and its value was calculated,
+    if group_by is None and totals is not None:
+        total = totals[0] if totals else {"total_value": 0, "total_quantity": 0, "products": 0}  # Gets the totals.
+
+        # Shows the totals in a single line.
+        value_panel = [html.H3(f"Total inventory value: ${total['total_value']:,.2f} "
+                               f"({total['total_quantity']:,} units across {total['products']:,} products)")]
+
+    # Otherwise (the totals of every group are shown),
+    else:
+        value_panel = get_report_panel("Inventory value", totals)
+
+    # Returns the visible reports.
+    return {"display": "block"}, value_panel, \
+           get_report_panel(f"Low stock (below {threshold})", imb.get_low_stock(threshold, group_by, 100, filter_query)), \
+           get_report_panel(f"Top {count} by {by}", imb.get_top_products(count, by, group_by, filter_query))
+
+
+@app.callback(
+    # The elements that are updated with the returned values.
+    [Output("search_container", "style"),
+     Output("search_results", "children")],
+
+    # The elements that call the function when interacted with (the columns change when logging in or out and the
+    #   search is only sent once typing pauses, see search_debounce_seconds).
+    [Input("table", "columns"),
+     Input("input_search", "value")],
+
+    # The elements that are passed to the function as arguments.
+    [State("session_token", "data")],
+
+    prevent_initial_call=True  # Prevents this function from being called when the Dash server starts.
+)
+@imm.instrument("search_changed", "callback", profile=True)
+def search_changed(columns : list, text : str, session_token : str) -> (dict, list):
+    """
+        Shows the products whose names match the search box (found with the search index, see imb.search_products()).
+
+        :param columns:         The columns of the table (empty when logged out).
+        :param text:            The text of the search box.
+        :param session_token:   The token of the backend session of the browser tab.
+        :return (dict, list):   The dictionary to set the visibility of the search box.
+                                The elements showing the matching products.
+    """
+
+    imb.use_session(session_token)  # Uses the backend session of the browser tab.
+
+    # If the user is not logged in,
+    if not imb.is_logged_in():
+        return {"display": "none"}, []  # Hides the search box (nothing should be shown when logged out).
+
+    # The below code only runs if the user is logged in.
+
+    # If nothing was searched,
+    if not text or not text.strip():
+        return {"display": "block"}, []  # Shows the search box without results.
+
+    results = imb.search_products(text, search_limit)  # Finds the matching products.
+
+    # If the search failed,
+    if results is None:
+        return {"display": "block"}, [html.P("The products could not be searched.")]  # Shows the error.
+
+    # If no product matches,
+    if not results:
+        return {"display": "block"}, [html.P(f"No products match \"{text}\".")]  # Shows that nothing was found.
+
+    # Returns the matching products in a table.
+    return {"display": "block"}, [dash_table.DataTable(data=results, columns=get_columns(), page_size=search_limit,
+                                                       style_table={"overflowX": "auto"})]
 
 
 @app.callback(
@@ -326,15 +934,21 @@ def update_form(selected_rows):
     # The elements that call the function when interacted with.
     Input("button_drop_database", "n_clicks"),
 
+    # The elements that are passed to the function as arguments.
+    State("session_token", "data"),
+
     prevent_initial_call=True  # Prevents this function from being called when the Dash server starts.
 )
-def delete_database(drop_clicks : int) -> int:
+@imm.instrument("delete_database", "callback", profile=True)
+def delete_database(drop_clicks : int, session_token : str) -> int:
     """
         Deletes the database and user that the program created.
 
         :param drop_clicks:     The number of clicks of the drop database button.
+        :param session_token:   The token of the backend session of the browser tab.
         :return:                Resets the number of clicks of the login button.
     """
+    imb.use_session(session_token)  # Uses the backend session of the browser tab.
     imb.deleteDatabase()  # Calls for the database to be deleted.
 
     return 0  # Returns 0 to update the clicks of the login button (will call the login_pressed() function to log the user out).
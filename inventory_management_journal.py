@@ -0,0 +1,631 @@
+"""
+    :author:        Jacob Whetham
+    :version:       1.0.0, 04 JAN 2024
+    :desc:          This file handles the change journal of the Inventory Management System (an append-only history of
+                    every write, kept in local segment files) and rebuilds the inventory as it was at any point in time.
+
+                    Every record is one compact JSON line holding the product as it was after the write ("s"), the
+                    product ID of a deleted product ("d") or the deletion of every product ("z"), so replaying a
+                    record twice gives the same result (a snapshot may already hold the writes recorded just after
+                    it was taken). Records are added to a buffer and appended to the segment of the process in batches.
+                    Snapshots of every product are written periodically, so a reconstruction starts from the newest
+                    snapshot before the chosen time instead of from the first record.
+
+                    The journal is kept in the directory named by the IMS_JOURNAL_DIRECTORY environment variable
+                    ("inventory_management_journal" in the working directory if it is not set).
+
+                    Example:    python inventory_management_journal.py --at 2024-01-04T12:00:00 --output stock.jsonl
+"""
+
+# Imports
+import argparse     # Allows for reading the command line arguments.
+import datetime     # Allows for reading the point in time to rebuild.
+import heapq        # Allows for merging the segments of every process in time order.
+import json         # Allows for encoding and decoding the records.
+import os           # Allows for listing, naming and replacing the journal files.
+import secrets      # Allows for naming the segments of every journal.
+import threading    # Allows for locking the buffer and flushing it in the background.
+import time         # Allows for timestamping the records and timing the flushes.
+import pymongo      # Allows for reading the operations of bulk writes.
+import inventory_management_storage as ims  # Allows for replaying the records onto an in-memory collection.
+
+# Declare global variables.
+segment_prefix = "journal-"     # The start of the name of every segment file.
+snapshot_prefix = "snapshot-"   # The start of the name of every snapshot file.
+default_directory = "inventory_management_journal"  # The directory of the journal if IMS_JOURNAL_DIRECTORY is not set.
+
+
+def get_default_directory() -> str:
+    """
+        Gets the directory of the journal (IMS_JOURNAL_DIRECTORY, or default_directory if it is not set).
+
+        :return str:        The absolute path of the directory (a relative path is resolved from the working directory
+                            now, so a later change of the working directory does not move the journal).
+    """
+
+    return os.path.abspath(os.environ.get("IMS_JOURNAL_DIRECTORY") or default_directory)  # Returns the directory.
+
+
+def encode_record(record : dict) -> str:
+    """
+        Encodes a record as a single line of compact JSON. The timestamp is always the first field, so records can be
+            skipped without decoding them (see get_record_time()).
+
+        :param record:      The record (it must hold "t", the time of the write).
+        :return str:        The line (ending with a line break).
+    """
+
+    # Returns the line (non-JSON values e.g. dates are stored as text).
+    return json.dumps(record, separators=(",", ":"), default=str) + "\n"
+
+
+def get_record_time(line : str) -> float:
+    """
+        Gets the timestamp of an encoded record without decoding the rest of it.
+
+        :param line:        The line of the record.
+        :return float:      The time of the write, or None if the line is not a complete record.
+    """
+
+    # Makes an attempt,
+    try:
+        return float(line[5:line.index(",")])  # Returns the number following '{"t":'.
+
+    # If the line is not a record (e.g. the last line was cut short by a crash),
+    except ValueError:
+        return None  # Returns nothing.
+
+
+def get_operation_product_ids(operation) -> list:
+    """
+        Gets the product IDs a bulk write operation can change.
+
+        :param operation:   The pymongo operation (InsertOne, UpdateOne, ReplaceOne or DeleteOne).
+        :return list:       The product IDs, or None if the operation does not select products by product ID.
+    """
+
+    kind, query, data, upsert = ims.get_bulk_request(operation)  # Reads the operation.
+
+    # If the operation is an insertion,
+    if kind == "insert":
+        return [data["product_id"]] if "product_id" in data else None  # Returns the product ID of the new document.
+
+    selector = query.get("product_id") if isinstance(query, dict) else None  # Gets how the products are selected.
+
+    # If the products are selected with an operator (e.g. {"$in": [...]}),
+    if isinstance(selector, dict):
+        # If the operator is not a plain list or match,
+        if set(selector) - {"$in", "$eq"}:
+            return None  # Returns nothing (the products cannot be known).
+
+        product_ids = list(selector.get("$in", [])) + ([selector["$eq"]] if "$eq" in selector else [])
+
+    # Otherwise if a single product is selected,
+    elif selector is not None:
+        product_ids = [selector]
+
+    # Otherwise (the products are not selected by product ID),
+    else:
+        return None  # Returns nothing (the products cannot be known).
+
+    new = (data.get("$set", {}) if kind == "update" else data or {}).get("product_id")  # Gets a changed product ID.
+    return product_ids + ([new] if new is not None and new not in product_ids else [])  # Returns the product IDs.
+
+
+class ChangeJournal:
+    """
+        Appends a record of every write to segment files. Records are held in a buffer and appended in batches: when
+        the buffer is full, when its oldest record has waited too long (in the background flusher) or on demand.
+        Every process writes its own segments, so several workers can share the directory.
+    """
+
+    def __init__(self, directory : str, segment_max_bytes : int =16777216, max_pending : int =1000,
+                 max_delay_seconds : float =0.5, snapshot_every : int =100000, snapshot_function=None):
+        """
+            Creates the journal (the directory is created the first time a record is written).
+
+            :param directory:           The directory holding the segments and snapshots (see get_default_directory()).
+            :param segment_max_bytes:   The size a segment grows to before a new segment is started.
+            :param max_pending:         The most records held in the buffer before it is flushed.
+            :param max_delay_seconds:   The longest a record waits before the background flusher writes it.
+            :param snapshot_every:      The number of records written between two snapshots (0 for no snapshots).
+            :param snapshot_function:   The function reading every product for a snapshot (None for no snapshots).
+        """
+
+        self.directory = os.path.abspath(directory) # The directory holding the segments and snapshots.
+        self.segment_max_bytes = segment_max_bytes  # The size a segment grows to before a new one is started.
+        self.max_pending = max_pending              # The most records held before the buffer is flushed.
+        self.max_delay_seconds = max_delay_seconds  # The longest a record waits in the buffer.
+        self.snapshot_every = snapshot_every        # The number of records written between two snapshots.
+        self.snapshot_function = snapshot_function  # The function reading every product for a snapshot.
+        self.enabled = True                         # Whether writes are recorded.
+        self.pending = []                           # The encoded records not yet written.
+        self.oldest = None                          # When the oldest record in the buffer was added.
+        self.lock = threading.Lock()                # Prevents two threads from changing the buffer at once.
+        self.write_lock = threading.Lock()          # Prevents two flushes from writing at once (keeps them in order).
+        self.segment = None                         # The open segment file.
+        self.segment_pid = None                     # The process that opened the segment.
+        self.segment_size = 0                       # The size of the open segment.
+        self.name = secrets.token_hex(4)            # Tells apart the segments of processes reusing the same ID.
+        self.flusher = None                         # The thread flushing the buffer in the background.
+        self.stop_event = threading.Event()         # Tells the background flusher to stop.
+        self.appended = 0                           # How many records were added.
+        self.written = 0                            # How many records were written.
+        self.flushes = 0                            # How many batches were written.
+        self.snapshots = 0                          # How many snapshots were written.
+        self.since_snapshot = 0                     # How many records were written since the last snapshot.
+
+    def append(self, record : dict, timestamp : float =None):
+        """
+            Adds a record to the buffer (flushing the buffer if it is full).
+
+            :param record:      The record e.g. {"o": "s", "d": {...}} (see record_products()).
+            :param timestamp:   The time of the write (now if None).
+        """
+
+        # If writes are not recorded,
+        if not self.enabled:
+            return  # Exits the function.
+
+        line = encode_record({"t": time.time() if timestamp is None else timestamp, **record})  # Encodes the record.
+
+        # Only one thread may change the buffer at a time.
+        with self.lock:
+            self.pending.append(line)  # Adds the record to the buffer.
+            self.appended += 1  # Counts the record.
+
+            # If the buffer was empty,
+            if self.oldest is None:
+                self.oldest = time.monotonic()  # Remembers when the oldest record was added.
+
+            full = len(self.pending) >= self.max_pending  # Whether the buffer is full.
+
+            # If the background flusher is not running in this process (e.g. the process was forked),
+            if self.flusher is None or not self.flusher.is_alive():
+                self.stop_event.clear()  # Allows the flusher to run.
+                self.flusher = threading.Thread(target=self.run, name="change-journal", daemon=True)
+                self.flusher.start()  # Starts the flusher.
+
+        # If the buffer is full,
+        if full:
+            self.flush()  # Writes the records.
+
+    def record_products(self, documents : list, timestamp : float =None):
+        """
+            Records products as they are after a write.
+
+            :param documents:   The products (only the fields shown in the table).
+            :param timestamp:   The time of the write (now if None).
+        """
+
+        # For every product,
+        for document in documents:
+            self.append({"o": "s", "d": document}, timestamp)  # Records the product.
+
+    def record_deletions(self, product_ids : list, timestamp : float =None):
+        """
+            Records the deletion of products.
+
+            :param product_ids: The product IDs of the deleted products.
+            :param timestamp:   The time of the write (now if None).
+        """
+
+        # For every deleted product,
+        for product_id in product_ids:
+            self.append({"o": "d", "i": product_id}, timestamp)  # Records the deletion.
+
+    def record_drop(self, timestamp : float =None):
+        """
+            Records that every product was deleted (the collection was dropped).
+
+            :param timestamp:   The time of the write (now if None).
+        """
+
+        self.append({"o": "z"}, timestamp)  # Records the drop.
+
+    def set_directory(self, directory : str):
+        """
+            Moves the journal to another directory (the records already in the buffer are written to the new one).
+
+            :param directory:   The directory holding the segments and snapshots (a relative path is resolved from
+                                the working directory).
+        """
+
+        # Only one flush may write at a time (the open segment must not be replaced while it is written).
+        with self.write_lock:
+            # If a segment is open in this process,
+            if self.segment is not None and self.segment_pid == os.getpid():
+                self.segment.close()  # Closes it.
+
+            self.directory = os.path.abspath(directory)  # Stores the directory.
+            self.segment = None  # Starts a new segment in the directory at the next flush.
+
+    def open_segment(self, start : float):
+        """
+            Starts a new segment file (named after the time of its first record, the process and the journal).
+
+            :param start:       The time of the earliest record written to the segment (the records wait in the buffer
+                                before they are written, so this is earlier than the time the segment is opened).
+        """
+
+        # If a segment is open in this process,
+        if self.segment is not None and self.segment_pid == os.getpid():
+            self.segment.close()  # Closes it.
+
+        os.makedirs(self.directory, exist_ok=True)  # Creates the directory (if it does not exist).
+        name = f"{segment_prefix}{int(start * 1e9):020d}-{os.getpid()}-{self.name}.jsonl"  # Names the segment.
+        self.segment = open(os.path.join(self.directory, name), "a", encoding="utf-8")  # Opens the segment.
+        self.segment_pid = os.getpid()  # Remembers which process opened it.
+        self.segment_size = 0  # Starts counting its size.
+
+    def flush(self) -> int:
+        """
+            Appends every record in the buffer to the segment of the process with one write.
+
+            :return int:        The number of records written.
+        """
+
+        # Only one flush may write at a time (a later flush must not overtake an earlier one).
+        with self.write_lock:
+            # Only one thread may change the buffer at a time.
+            with self.lock:
+                lines = self.pending  # Takes the records out of the buffer.
+                self.pending = []
+                self.oldest = None
+
+            # If there are no records,
+            if not lines:
+                return 0  # Exits the function (there is nothing to write).
+
+            # Makes an attempt,
+            try:
+                # If no segment is open in this process or the segment is full,
+                if self.segment is None or self.segment_pid != os.getpid() or self.segment_size >= self.segment_max_bytes:
+                    # Starts a new segment, named after the earliest record in it (so a reconstruction reads it).
+                    self.open_segment(min(get_record_time(line) for line in lines))
+
+                data = "".join(lines)  # Joins the records into one write.
+                self.segment.write(data)  # Appends the records.
+                self.segment.flush()  # Hands the records to the operating system.
+                self.segment_size += len(data)  # Counts the size of the segment.
+
+            # If the records could not be written (e.g. the disk is full),
+            except Exception:
+                # Only one thread may change the buffer at a time.
+                with self.lock:
+                    self.pending = lines + self.pending  # Puts the records back in front of the newer ones.
+                    self.oldest = time.monotonic()  # Retries the write once the records have waited again.
+
+                # If the segment is open, it may end with part of a record, so the retry starts a new segment.
+                if self.segment is not None and self.segment_pid == os.getpid():
+                    # Makes an attempt,
+                    try:
+                        self.segment.close()  # Closes the segment.
+
+                    # If the segment could not be closed (its buffered data could not be written either),
+                    except OSError:
+                        pass  # Skips closing it.
+
+                self.segment = None  # Forgets the segment.
+                raise  # Passes the error on.
+
+            # Only one thread may change the counters at a time.
+            with self.lock:
+                self.written += len(lines)  # Counts the records.
+                self.flushes += 1  # Counts the batch.
+                self.since_snapshot += len(lines)  # Counts the records since the last snapshot.
+
+            return len(lines)  # Returns the number of records written.
+
+    def write_snapshot(self, documents : list, timestamp : float) -> str:
+        """
+            Writes a snapshot of every product. The file is written under a temporary name and then renamed, so a
+                reconstruction never reads a partial snapshot.
+
+            :param documents:   Every product (only the fields shown in the table).
+            :param timestamp:   The time the products were read from (it must be taken before reading them).
+            :return str:        The path of the snapshot.
+        """
+
+        os.makedirs(self.directory, exist_ok=True)  # Creates the directory (if it does not exist).
+        path = os.path.join(self.directory, f"{snapshot_prefix}{int(timestamp * 1e9):020d}-{self.name}.jsonl")
+
+        # Writes the snapshot (the first line holds the time it was taken and the number of products).
+        with open(path + ".tmp", "w", encoding="utf-8") as file:
+            file.write(encode_record({"t": timestamp, "n": len(documents)}))
+            file.writelines(encode_record({"t": timestamp, "d": document}) for document in documents)
+
+        os.replace(path + ".tmp", path)  # Publishes the snapshot.
+
+        # Only one thread may change the counters at a time.
+        with self.lock:
+            self.snapshots += 1  # Counts the snapshot.
+            self.since_snapshot = 0  # Starts counting the records since the snapshot.
+
+        return path  # Returns the path of the snapshot.
+
+    def take_snapshot(self) -> str:
+        """
+            Reads every product with the snapshot function and writes a snapshot of them.
+
+            :return str:        The path of the snapshot, or None if there is no snapshot function.
+        """
+
+        # If there is no snapshot function,
+        if self.snapshot_function is None:
+            return None  # Returns nothing.
+
+        timestamp = time.time()  # Records when the snapshot starts (writes during the read are replayed on top).
+        return self.write_snapshot(self.snapshot_function(), timestamp)  # Writes the snapshot.
+
+    def run(self):
+        """
+            Flushes the buffer whenever its oldest record has waited too long, and takes a snapshot whenever enough
+                records were written since the last one (runs in the background thread).
+        """
+
+        # Until the flusher is stopped,
+        while not self.stop_event.wait(self.max_delay_seconds / 2):
+            # Only one thread may read the buffer at a time.
+            with self.lock:
+                due = self.oldest is not None and time.monotonic() - self.oldest >= self.max_delay_seconds
+                snapshot_due = self.snapshot_function is not None and 0 < self.snapshot_every <= self.since_snapshot
+
+            # Makes an attempt,
+            try:
+                # If the oldest record has waited too long,
+                if due:
+                    self.flush()  # Writes the records.
+
+                # If a snapshot is due,
+                if snapshot_due:
+                    self.take_snapshot()  # Writes a snapshot.
+
+            # If an error occurred,
+            except Exception:
+                print("The change journal could not be written!")  # Outputs an error.
+
+    def stop(self):
+        """
+            Stops the background flusher and writes every record left in the buffer.
+        """
+
+        self.stop_event.set()  # Tells the flusher to stop.
+
+        # If the flusher is running,
+        if self.flusher is not None and self.flusher.is_alive():
+            self.flusher.join()  # Waits for it to stop.
+
+        self.flusher = None
+        self.flush()  # Writes every record left in the buffer.
+
+    def get_metrics(self) -> dict:
+        """
+            Gets the size and counters of the journal.
+
+            :return dict:       The records waiting, added and written, the batches written and the snapshots.
+        """
+
+        # Only one thread may read the buffer at a time.
+        with self.lock:
+            # Returns the metrics.
+            return {"pending": len(self.pending), "appended": self.appended, "written": self.written,
+                    "flushes": self.flushes, "snapshots": self.snapshots}
+
+
+def list_files(directory : str, prefix : str) -> list:
+    """
+        Lists the segments or snapshots in a directory, oldest first.
+
+        :param directory:   The directory holding the journal.
+        :param prefix:      segment_prefix or snapshot_prefix.
+        :return list:       (start time in seconds, owner, path) for every file. The owner tells apart the segments
+                            of every process ("<process ID>-<journal name>").
+    """
+
+    files = []  # Holds the files.
+
+    # If the directory does not exist,
+    if not os.path.isdir(directory):
+        return files  # Returns nothing (nothing was recorded).
+
+    # For every file in the directory,
+    for name in os.listdir(directory):
+        # If the file is not a (complete) file of the chosen kind,
+        if not name.startswith(prefix) or not name.endswith(".jsonl"):
+            continue  # Skips the file.
+
+        start, _, owner = name[len(prefix):-len(".jsonl")].partition("-")  # Splits the name.
+        files.append((int(start) / 1e9, owner, os.path.join(directory, name)))  # Adds the file.
+
+    return sorted(files)  # Returns the files, oldest first.
+
+
+def read_segment(path : str, after : float, until : float):
+    """
+        Reads the records of a segment written after a time and up to another (records outside the range are
+            skipped without being decoded).
+
+        :param path:        The path of the segment.
+        :param after:       Records at or before this time are skipped (None to read from the start).
+        :param until:       Records after this time are skipped.
+        :return generator:  A generator of (time, record) pairs, in the order they were written.
+    """
+
+    # Reads the segment.
+    with open(path, encoding="utf-8") as file:
+        # For every line,
+        for line in file:
+            timestamp = get_record_time(line)  # Gets the time of the record.
+
+            # If the line is not a complete record or the record is outside the range,
+            if timestamp is None or (after is not None and timestamp <= after) or timestamp > until:
+                continue  # Skips the record.
+
+            # Makes an attempt,
+            try:
+                yield timestamp, json.loads(line)  # Yields the record.
+
+            # If the record was cut short (e.g. by a crash while it was written),
+            except ValueError:
+                continue  # Skips the record.
+
+
+def apply_record(collection, record : dict):
+    """
+        Applies a single record to a collection.
+
+        :param collection:  The collection being rebuilt (an in-memory collection).
+        :param record:      The record.
+    """
+
+    kind = record.get("o")  # Gets the kind of record.
+
+    # If the record holds a product after a write,
+    if kind == "s":
+        collection.replace_one({"product_id": record["d"]["product_id"]}, record["d"], upsert=True)
+
+    # Otherwise if the record deleted a product,
+    elif kind == "d":
+        collection.delete_one({"product_id": record["i"]})
+
+    # Otherwise if the record deleted every product,
+    elif kind == "z":
+        collection.drop()  # Deletes every product (and the indexes).
+        collection.create_index("product_id", unique=True)  # Finds products by product ID again.
+
+    # Otherwise if the record is an operation of a bulk write (only written by older versions, which recorded the
+    #   operations whose products were not known as they were sent),
+    elif kind == "w":
+        operations = {"insert": lambda: pymongo.InsertOne(record["v"]),
+                      "update": lambda: pymongo.UpdateOne(record["q"], record["v"], upsert=record["u"]),
+                      "replace": lambda: pymongo.ReplaceOne(record["q"], record["v"], upsert=record["u"]),
+                      "delete": lambda: pymongo.DeleteOne(record["q"])}
+
+        # Makes an attempt,
+        try:
+            collection.bulk_write([operations[record["k"]]()])  # Applies the operation.
+
+        # If the operation failed (it also failed when it was first written),
+        except pymongo.errors.PyMongoError:
+            pass  # Skips the operation.
+
+
+def reconstruct(directory : str, at : float =None) -> (list, dict):
+    """
+        Rebuilds every product as it was at a point in time: the newest snapshot taken at or before the time is loaded
+            and the records written after the snapshot are replayed on top of it, merged from every segment in time
+            order. Segments that ended before the snapshot or started after the time are not read.
+
+        :param directory:   The directory holding the journal.
+        :param at:          The point in time (seconds since the epoch, now if None).
+        :return (list,
+                 dict):     Every product at the time, ordered by product ID.
+                            The snapshot used, the segments read and the records replayed.
+    """
+
+    at = time.time() if at is None else at  # Rebuilds the products as they are now if no time was chosen.
+    collection = ims.MemoryClient("journal")["journal"]["products"]  # Creates the collection being rebuilt.
+    collection.create_index("product_id", unique=True)  # Finds products by product ID.
+    snapshots = [snapshot for snapshot in list_files(directory, snapshot_prefix) if snapshot[0] <= at]
+    after = None  # Holds the time of the snapshot (records up to it are already in the snapshot).
+
+    # If a snapshot was taken at or before the time,
+    if snapshots:
+        after = snapshots[-1][0]  # Gets the time of the newest snapshot.
+
+        # Reads the snapshot.
+        with open(snapshots[-1][2], encoding="utf-8") as file:
+            next(file, None)  # Skips the first line (it only describes the snapshot).
+            collection.insert_many([json.loads(line)["d"] for line in file])
+
+    segments = {}  # Holds the segments of every process, oldest first.
+
+    # For every segment,
+    for start, owner, path in list_files(directory, segment_prefix):
+        segments.setdefault(owner, []).append((start, path))  # Adds the segment to its process.
+
+    readers = []  # Holds a reader for the segments of every process.
+    read = []  # Holds the segments that are read.
+
+    # For the segments of every process,
+    for owner, chain in segments.items():
+        # Keeps the segments that started by the time and did not end before the snapshot (a segment ends when
+        #   the next segment of its process starts).
+        kept = [path for index, (start, path) in enumerate(chain)
+                if start <= at and (after is None or index + 1 == len(chain) or chain[index + 1][0] > after)]
+        read.extend(kept)
+
+        # Adds a reader of every kept segment of the process, in order.
+        readers.append((item for path in kept for item in read_segment(path, after, at)))
+
+    replayed = 0  # Counts the records replayed.
+
+    # For every record, in time order across every process,
+    for timestamp, record in heapq.merge(*readers, key=lambda item: item[0]):
+        apply_record(collection, record)  # Applies the record.
+        replayed += 1  # Counts the record.
+
+    documents = list(collection.find({}, {"_id": 0}, sort=[("product_id", pymongo.ASCENDING)]))  # Gets the products.
+
+    # Returns the products and how they were rebuilt.
+    return documents, {"at": at, "snapshot": snapshots[-1][2] if snapshots else None, "segments": read,
+                       "records": replayed}
+
+
+def parse_time(text : str) -> float:
+    """
+        Reads a point in time from the command line.
+
+        :param text:        An ISO 8601 date and time (local time unless it has an offset) or seconds since the epoch.
+        :return float:      The time in seconds since the epoch.
+    """
+
+    # Makes an attempt,
+    try:
+        return float(text)  # Returns the seconds since the epoch.
+
+    # If the time is not a number,
+    except ValueError:
+        return datetime.datetime.fromisoformat(text).timestamp()  # Returns the date and time.
+
+
+def main(arguments : list =None):
+    """
+        Rebuilds the inventory at a point in time from the command line and writes it as JSON Lines.
+
+        :param arguments:   The command line arguments (sys.argv if None).
+    """
+
+    parser = argparse.ArgumentParser(description="Rebuilds the inventory at a point in time from the change journal.")
+    parser.add_argument("--directory", default=get_default_directory(),
+                        help="The directory of the journal (IMS_JOURNAL_DIRECTORY if not given).")
+    parser.add_argument("--at", type=parse_time, default=None,
+                        help="The point in time (ISO 8601 or seconds since the epoch, now if not given).")
+    parser.add_argument("--output", default=None, help="The JSON Lines file the products are written to.")
+    options = parser.parse_args(arguments)
+
+    start = time.perf_counter()  # Records when the reconstruction started.
+    documents, info = reconstruct(options.directory, options.at)  # Rebuilds the products.
+    seconds = time.perf_counter() - start  # Gets how long the reconstruction took.
+
+    # If the products should be written to a file,
+    if options.output:
+        # Writes every product on its own line.
+        with open(options.output, "w", encoding="utf-8") as file:
+            file.writelines(json.dumps(document) + "\n" for document in documents)
+
+    # Adds up the units in stock.
+    units = sum(document.get("product_quantity") or 0 for document in documents
+                if isinstance(document.get("product_quantity"), (int, float)))
+
+    # Outputs how the inventory was rebuilt.
+    print(f"Rebuilt {len(documents)} products ({units} units) as of "
+          f"{datetime.datetime.fromtimestamp(info['at']).isoformat()} in {seconds:.3f}s.")
+    print(f"Snapshot: {info['snapshot'] or 'none'}; segments read: {len(info['segments'])}; "
+          f"records replayed: {info['records']}.")
+
+
+# The below code runs as soon as the program starts.
+if __name__ == "__main__":
+    main()  # Runs the reconstruction.
@@ -0,0 +1,414 @@
+"""
+    :author:        Jacob Whetham
+    :version:       1.0.0, 04 JAN 2024
+    :desc:          This file load tests the dashboard of the Inventory Management System over HTTP, sending the same
+                    callback requests a browser sends. Every simulated user logs in with its own session and then
+                    pages, sorts and filters the table until the test ends, sending a live update after every few
+                    pages like the interval of an open tab. Give --workers to start the production server (see
+                    inventory_management_wsgi.py) with every number of workers in turn and compare the throughput,
+                    which shows how serving scales with the cores.
+
+                    Example:    python inventory_management_load_test.py --workers 1 2 4 --users 32 --duration 20
+                                python inventory_management_load_test.py --url http://localhost:8050 --users 16
+"""
+
+# Imports
+import argparse         # Allows for reading the command line arguments.
+import datetime         # Allows for recording when the load test ran.
+import http.client      # Allows for sending requests over a kept-alive connection.
+import json             # Allows for encoding the requests and writing the results.
+import os               # Allows for counting the cores and finding the driver.
+import platform         # Allows for recording the machine the load test ran on.
+import random           # Allows for choosing the pages to read.
+import secrets          # Allows for creating the session token of every simulated user.
+import subprocess       # Allows for starting the production server.
+import sys              # Allows for starting the server with the same Python.
+import threading        # Allows for simulating many users at once.
+import time             # Allows for timing requests.
+import urllib.parse     # Allows for reading the URL of the dashboard.
+import inventory_management_benchmark as imbm  # Allows for sharing the percentile calculation.
+
+# Declare global variables.
+default_url = "http://localhost:8050"                   # The dashboard tested when no server is started.
+default_storage_path = "inventory_management_load_test.sqlite3"  # The SQLite file of the servers started by the test.
+page_size = 25                                          # The number of rows on every page read.
+sort_fields = ["product_id", "product_name", "product_price", "product_quantity"]  # The columns sorted by.
+startup_timeout_seconds = 60.0                          # How long to wait for a started server to answer.
+live_update_every = 4                                   # The number of pages read between two live updates.
+
+
+def open_connection(url : str) -> http.client.HTTPConnection:
+    """
+        Opens a connection to the dashboard (kept alive between requests, like a browser).
+
+        :param url:                 The URL of the dashboard.
+        :return HTTPConnection:     The connection.
+    """
+
+    location = urllib.parse.urlsplit(url)  # Splits the URL.
+    return http.client.HTTPConnection(location.hostname, location.port or 80, timeout=30)  # Returns the connection.
+
+
+def get_callbacks(url : str) -> list:
+    """
+        Gets the callbacks of the dashboard (the same list the browser reads when the page loads).
+
+        :param url:         The URL of the dashboard.
+        :return list:       The callbacks (their outputs, inputs and states).
+    """
+
+    connection = open_connection(url)  # Connects to the dashboard.
+    connection.request("GET", "/_dash-dependencies")  # Asks for the callbacks.
+    response = connection.getresponse()  # Waits for the answer.
+    callbacks = json.loads(response.read())  # Reads the callbacks.
+    connection.close()  # Closes the connection.
+    return callbacks  # Returns the callbacks.
+
+
+def find_callback(callbacks : list, trigger : str) -> dict:
+    """
+        Finds the callback called when a property changes.
+
+        :param callbacks:   The callbacks of the dashboard.
+        :param trigger:     The property that calls the callback e.g. "button_login.n_clicks".
+        :return dict:       The callback (an error is raised if none is found).
+    """
+
+    # For every callback,
+    for callback in callbacks:
+        # If the property is the first input of the callback,
+        if callback["inputs"] and f"{callback['inputs'][0]['id']}.{callback['inputs'][0]['property']}" == trigger:
+            return callback  # Returns the callback.
+
+    raise ValueError(f"No callback is called by {trigger}.")  # Refuses the trigger.
+
+
+def build_request(callback : dict, values : dict) -> dict:
+    """
+        Builds the body of a callback request like the browser does.
+
+        :param callback:    The callback.
+        :param values:      The value of every input and state, keyed by "<id>.<property>" (missing values are None).
+        :return dict:       The body of the request.
+    """
+
+    # Splits the outputs ("..a.b...c.d.." for several outputs, "a.b" for a single output).
+    names = callback["output"][2:-2].split("...") if callback["output"].startswith("..") else [callback["output"]]
+    outputs = [dict(zip(("id", "property"), name.rsplit(".", 1))) for name in names]
+
+    # Gets the value of every input and state.
+    inputs = [dict(item, value=values.get(f"{item['id']}.{item['property']}")) for item in callback["inputs"]]
+    state = [dict(item, value=values.get(f"{item['id']}.{item['property']}")) for item in callback["state"]]
+
+    # Returns the body of the request.
+    return {"output": callback["output"],
+            "outputs": outputs if callback["output"].startswith("..") else outputs[0],
+            "inputs": inputs,
+            "state": state,
+            "changedPropIds": [f"{callback['inputs'][0]['id']}.{callback['inputs'][0]['property']}"]}
+
+
+def call(connection : http.client.HTTPConnection, body : dict) -> dict:
+    """
+        Sends a callback request.
+
+        :param connection:  The connection to the dashboard.
+        :param body:        The body of the request (see build_request()).
+        :return dict:       The properties updated by the callback (an error is raised if the request failed).
+    """
+
+    # Sends the request.
+    connection.request("POST", "/_dash-update-component", json.dumps(body),
+                       {"Content-Type": "application/json"})
+    response = connection.getresponse()  # Waits for the answer.
+    data = response.read()  # Reads the answer.
+
+    # If the callback failed,
+    if response.status not in (200, 204):
+        raise RuntimeError(f"The callback failed with status {response.status}.")  # Reports the failure.
+
+    return json.loads(data).get("response", {}) if data else {}  # Returns the updated properties.
+
+
+def simulate_user(url : str, callbacks : list, username : str, password : str, deadline : float, seed : int,
+                  samples : list, errors : list, live_samples : list):
+    """
+        Logs a simulated user in with its own session and reads pages of the table until the deadline, sending a
+            live update after every few pages.
+
+        :param url:         The URL of the dashboard.
+        :param callbacks:   The callbacks of the dashboard.
+        :param username:    The username to log in with.
+        :param password:    The password to log in with.
+        :param deadline:    When to stop (time.perf_counter()).
+        :param seed:        The seed of the pages chosen.
+        :param samples:     Receives how long every page read took.
+        :param errors:      Receives every failed request.
+        :param live_samples:    Receives how long every live update took and whether it sent the page again.
+    """
+
+    generator = random.Random(seed)  # Creates the random generator.
+    connection = open_connection(url)  # Connects to the dashboard.
+    token = secrets.token_urlsafe(16)  # Creates the session of the user (like a new browser tab).
+    login = find_callback(callbacks, "button_login.n_clicks")  # Gets the login callback.
+    read = find_callback(callbacks, "table.page_current")  # Gets the callback reading a page.
+    live = find_callback(callbacks, "live_update_interval.n_intervals")  # Gets the live update callback.
+    timings = []  # Holds how long every page read of this user took.
+    live_timings = []  # Holds how long every live update of this user took and whether it sent the page again.
+    position = None  # Holds the position of the newest change shown (see live_update() in the frontend).
+    table_data = None  # Holds the rows shown in the table.
+
+    # Makes an attempt,
+    try:
+        # Logs the user in.
+        response = call(connection, build_request(login, {"button_login.n_clicks": 1,
+                                                          "input_username.value": username,
+                                                          "input_password.value": password,
+                                                          "table.page_size": page_size,
+                                                          "session_token.data": token}))
+
+        # If the login failed,
+        if response.get("button_login", {}).get("children") != "Logout":
+            raise RuntimeError("The login failed.")  # Reports the failure.
+
+        # Until the deadline,
+        while time.perf_counter() < deadline:
+            field = generator.choice(sort_fields)  # Chooses the column to sort by.
+
+            # Chooses the page, sorting and filter (most pages are near the start, like real users).
+            values = {"table.page_current": min(int(generator.expovariate(0.2)), 40),
+                      "table.page_size": page_size,
+                      "table.sort_by": [{"column_id": field, "direction": generator.choice(["asc", "desc"])}],
+                      "table.filter_query": generator.choice(["", "", "", "{product_quantity} < 100"]),
+                      "session_token.data": token}
+
+            start = time.perf_counter()  # Records when the request started.
+
+            # Makes an attempt,
+            try:
+                response = call(connection, build_request(read, values))  # Reads the page.
+                timings.append(time.perf_counter() - start)  # Records how long the request took.
+                table_data = response.get("table", {}).get("data", table_data)  # Remembers the rows shown.
+
+                # If a live update is due,
+                if len(timings) % live_update_every == 0:
+                    start = time.perf_counter()  # Records when the live update started.
+
+                    # Opens another connection (a browser spreads its requests over several connections, so the live
+                    #   update may be served by another worker than the page).
+                    live_connection = open_connection(url)
+
+                    # Makes an attempt,
+                    try:
+                        # Asks for the changes since the position shown (like the interval of the tab).
+                        response = call(live_connection, build_request(live, dict(values, **{
+                            "live_update_interval.n_intervals": len(live_timings) + 1,
+                            "change_sequence.data": position,
+                            "table.data": table_data,
+                            "table.selected_row_ids": []})))
+
+                    # Whether or not the live update succeeded,
+                    finally:
+                        live_connection.close()  # Closes the connection.
+
+                    # Records how long the live update took and whether it sent the page again.
+                    live_timings.append((time.perf_counter() - start, "data" in response.get("table", {})))
+                    position = response.get("change_sequence", {}).get("data", position)  # Remembers the position.
+
+            # If the request failed,
+            except Exception as error:
+                errors.append(str(error))  # Records the failure.
+                connection.close()  # Drops the broken connection (the next request reconnects).
+
+    # If the login failed,
+    except Exception as error:
+        errors.append(str(error))  # Records the failure.
+
+    connection.close()  # Closes the connection.
+    samples.extend(timings)  # Hands in the timings (list.extend is thread-safe).
+    live_samples.extend(live_timings)
+
+
+def run_load(url : str, users : int, duration : float, username : str, password : str, seed : int =0) -> dict:
+    """
+        Simulates users reading pages of the dashboard at the same time and measures the throughput.
+
+        :param url:         The URL of the dashboard.
+        :param users:       The number of simulated users.
+        :param duration:    How long the users read pages, in seconds.
+        :param username:    The username to log in with.
+        :param password:    The password to log in with.
+        :param seed:        The seed of the pages chosen.
+        :return dict:       The requests, errors, throughput and latency percentiles (milliseconds), and the live
+                            updates sent and how many of them sent the page again.
+    """
+
+    callbacks = get_callbacks(url)  # Gets the callbacks of the dashboard.
+    samples = []  # Holds how long every page read took.
+    live_samples = []  # Holds how long every live update took and whether it sent the page again.
+    errors = []  # Holds every failed request.
+    start = time.perf_counter()  # Records when the load test started.
+    deadline = start + duration  # Records when the users stop.
+
+    # Creates a thread for every simulated user.
+    threads = [threading.Thread(target=simulate_user,
+                                args=(url, callbacks, username, password, deadline, seed + i, samples, errors,
+                                      live_samples))
+               for i in range(users)]
+
+    # For every simulated user,
+    for thread in threads:
+        thread.start()  # Starts the user.
+
+    # For every simulated user,
+    for thread in threads:
+        thread.join()  # Waits for the user to stop.
+
+    elapsed = time.perf_counter() - start  # Gets how long the load test took.
+    samples.sort()  # Orders the samples from fastest to slowest.
+    live_timings = sorted(seconds for seconds, reloaded in live_samples)  # Orders the live updates the same way.
+
+    # Returns the measurements.
+    return {"users": users,
+            "requests": len(samples),
+            "errors": len(errors),
+            "seconds": elapsed,
+            "requests_per_second": len(samples) / elapsed if elapsed > 0 else None,
+            "p50_ms": imbm.percentile(samples, 0.50) * 1000 if samples else None,
+            "p99_ms": imbm.percentile(samples, 0.99) * 1000 if samples else None,
+            "live_updates": len(live_samples),
+            "live_update_reloads": sum(1 for seconds, reloaded in live_samples if reloaded),
+            "live_update_p50_ms": imbm.percentile(live_timings, 0.50) * 1000 if live_timings else None,
+            "first_error": errors[0] if errors else None}
+
+
+def start_server(workers : int, threads : int, port : int, storage : str, storage_path : str) -> subprocess.Popen:
+    """
+        Starts the production server with driver.py and waits until it answers.
+
+        :param workers:         The number of worker processes.
+        :param threads:         The number of threads in every worker.
+        :param port:            The port to serve the dashboard on.
+        :param storage:         The storage engine ("mongo" or "sqlite").
+        :param storage_path:    The SQLite file used by the sqlite storage engine.
+        :return Popen:          The server process.
+    """
+
+    driver = os.path.join(os.path.dirname(os.path.abspath(__file__)), "driver.py")  # Finds the driver.
+
+    # Starts the server.
+    process = subprocess.Popen([sys.executable, driver, "--storage", storage, "--sqlite-path", storage_path,
+                                "--workers", str(workers), "--threads", str(threads), "--port", str(port)])
+    deadline = time.perf_counter() + startup_timeout_seconds  # Records when to give up waiting.
+
+    # Until the server answers,
+    while True:
+        # Makes an attempt,
+        try:
+            get_callbacks(f"http://localhost:{port}")  # Asks for the callbacks.
+            return process  # Returns the server process (it answered).
+
+        # If the server does not answer yet,
+        except (OSError, http.client.HTTPException, ValueError):
+            # If the server stopped or took too long,
+            if process.poll() is not None or time.perf_counter() > deadline:
+                process.kill()  # Stops the server.
+                raise RuntimeError(f"The server with {workers} workers did not start.")  # Reports the failure.
+
+            time.sleep(0.5)  # Waits before asking again.
+
+
+def stop_server(process : subprocess.Popen):
+    """
+        Stops a server started by start_server().
+
+        :param process:     The server process.
+    """
+
+    process.terminate()  # Asks gunicorn to stop (it stops its workers).
+
+    # Makes an attempt,
+    try:
+        process.wait(timeout=30)  # Waits for the server to stop.
+
+    # If the server did not stop in time,
+    except subprocess.TimeoutExpired:
+        process.kill()  # Stops the server.
+
+
+def main(arguments : list =None):
+    """
+        Runs the load test from the command line and writes the results.
+
+        :param arguments:   The command line arguments (sys.argv if None).
+    """
+
+    parser = argparse.ArgumentParser(description="Load tests the Inventory Management System dashboard.")
+    parser.add_argument("--url", default=default_url, help="The dashboard to test (ignored if --workers is given).")
+    parser.add_argument("--workers", type=int, nargs="*", default=None,
+                        help="Start the production server with every number of workers in turn and test each one.")
+    parser.add_argument("--threads", type=int, default=4, help="The threads in every worker of a started server.")
+    parser.add_argument("--port", type=int, default=8060, help="The port of a started server.")
+    parser.add_argument("--storage", choices=["mongo", "sqlite"], default="sqlite",
+                        help="The storage engine of a started server.")
+    parser.add_argument("--sqlite-path", default=default_storage_path, help="The SQLite file of a started server.")
+    parser.add_argument("--users", type=int, default=16, help="The number of simulated users.")
+    parser.add_argument("--duration", type=float, default=15.0, help="How long every test runs, in seconds.")
+    parser.add_argument("--username", default="user", help="The username every simulated user logs in with.")
+    parser.add_argument("--password", default="password", help="The password every simulated user logs in with.")
+    parser.add_argument("--output", default="load_test_results.json", help="The file the results are written to.")
+    options = parser.parse_args(arguments)
+
+    runs = []  # Holds the results of every test.
+
+    # If servers should be started,
+    if options.workers:
+        # For every number of workers,
+        for workers in options.workers:
+            process = start_server(workers, options.threads, options.port, options.storage, options.sqlite_path)
+
+            # Makes an attempt,
+            try:
+                # Tests the server.
+                result = run_load(f"http://localhost:{options.port}", options.users, options.duration,
+                                  options.username, options.password)
+
+            # Whether or not the test succeeded,
+            finally:
+                stop_server(process)  # Stops the server.
+
+            runs.append({"workers": workers, "threads": options.threads, **result})  # Keeps the results.
+
+    # Otherwise (a running dashboard is tested),
+    else:
+        runs.append({"url": options.url, **run_load(options.url, options.users, options.duration, options.username,
+                                                    options.password)})
+
+    # For every test,
+    for run in runs:
+        # Compares the throughput with the first test (how serving scales with the workers).
+        run["speedup"] = run["requests_per_second"] / runs[0]["requests_per_second"] \
+            if run["requests_per_second"] and runs[0]["requests_per_second"] else None
+
+        # Outputs the results of the test.
+        print(f"workers={run.get('workers', '-')} users={run['users']} requests={run['requests']} "
+              f"errors={run['errors']} rps={run['requests_per_second'] or 0:.1f} p50={run['p50_ms'] or 0:.1f}ms "
+              f"p99={run['p99_ms'] or 0:.1f}ms speedup={run['speedup'] or 0:.2f}x "
+              f"live_updates={run['live_updates']} reloads={run['live_update_reloads']}")
+
+    # Writes the results.
+    with open(options.output, "w", encoding="utf-8") as file:
+        json.dump({"created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                   "python": platform.python_version(),
+                   "machine": platform.platform(),
+                   "cores": os.cpu_count(),
+                   "users": options.users,
+                   "duration_seconds": options.duration,
+                   "runs": runs}, file, indent=2, sort_keys=True)
+
+    print(f"The results were written to {options.output}.")  # Outputs where the results are.
+
+
+# The below code runs as soon as the program starts.
+if __name__ == "__main__":
+    main()  # Runs the load test.
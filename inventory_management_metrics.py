@@ -0,0 +1,450 @@
+"""
+    :author:        Jacob Whetham
+    :version:       1.0.0, 04 JAN 2024
+    :desc:          This file handles the metrics of the Inventory Management System (timings, counters and profiles).
+                    The metrics are served in the Prometheus text format from the "/metrics" route of the Dash server.
+                    Every metric (and whether profiling is enabled) belongs to the process serving the request, so
+                    when gunicorn serves the dashboard with several workers, each worker reports its own values and its
+                    process ID (ims_process_info) and a scraper should treat every worker as a separate target.
+"""
+
+# Imports
+import collections  # Allows for holding a limited number of recent profiles.
+import cProfile     # Allows for profiling requests.
+import functools    # Allows for keeping the name and docstring of instrumented functions.
+import hmac         # Allows for comparing the profiling token without leaking it through timing.
+import inspect      # Allows for checking whether instrumented functions are coroutine functions.
+import io           # Allows for writing profiles to text.
+import os           # Allows for reading the profiling token and the ID of the process.
+import pstats       # Allows for summarizing profiles.
+import threading    # Allows for locking the metrics between the threads serving requests.
+import time         # Allows for timing operations.
+
+# Declare global variables.
+duration_buckets = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]  # Histogram bounds (s).
+size_buckets = [100, 1000, 10000, 100000, 1000000, 10000000]    # The histogram bounds of counts and bytes.
+counters = {}                                                   # The counters, keyed by (name, labels).
+histograms = {}                                                 # The histograms, keyed by (name, labels).
+collectors = []                                                 # Functions returning extra gauges when rendering.
+metrics_lock = threading.Lock()                                 # Prevents two threads from changing the metrics at once.
+profiling_enabled = False                                       # Whether instrumented requests are profiled.
+profile_limit = 20                                              # The number of recent profiles kept.
+recent_profiles = collections.deque(maxlen=profile_limit)       # The most recent profiles (newest last).
+profile_lock = threading.Lock()                                 # Held while a call is profiled (one at a time per process).
+profiling_token = os.environ.get("IMS_PROFILING_TOKEN")         # The token allowing profiling to be changed (None: never).
+
+# The help text of every metric (shown in the "/metrics" output).
+metric_help = {"ims_operation_seconds": "How long instrumented operations took.",
+               "ims_operation_calls_total": "How many times instrumented operations were called.",
+               "ims_operation_errors_total": "How many instrumented operations raised an error or reported a failure.",
+               "ims_documents_returned": "How many documents instrumented operations returned.",
+               "ims_payload_bytes": "How many bytes Dash sent back for each callback output."}
+
+
+def get_key(name : str, labels : dict) -> tuple:
+    """
+        Gets the key of a metric.
+
+        :param name:        The name of the metric.
+        :param labels:      The labels of the metric.
+        :return tuple:      The key (equal labels always create the same key).
+    """
+
+    return name, tuple(sorted(labels.items()))  # Returns the key.
+
+
+def increment(name : str, value : float =1, **labels):
+    """
+        Adds to a counter.
+
+        :param name:        The name of the counter.
+        :param value:       The amount to add.
+        :param labels:      The labels of the counter e.g. operation="read_page".
+    """
+
+    key = get_key(name, labels)  # Gets the key of the counter.
+
+    # Only one thread may change the metrics at a time.
+    with metrics_lock:
+        counters[key] = counters.get(key, 0) + value  # Adds to the counter.
+
+
+def observe(name : str, value : float, buckets : list =None, **labels):
+    """
+        Records a value in a histogram.
+
+        :param name:        The name of the histogram.
+        :param value:       The value to record.
+        :param buckets:     The upper bounds of the buckets. If None, duration_buckets is used.
+        :param labels:      The labels of the histogram e.g. operation="read_page".
+    """
+
+    key = get_key(name, labels)  # Gets the key of the histogram.
+    buckets = duration_buckets if buckets is None else buckets  # Uses the duration buckets if none were given.
+
+    # Only one thread may change the metrics at a time.
+    with metrics_lock:
+        histogram = histograms.get(key)  # Gets the histogram.
+
+        # If the histogram does not exist yet,
+        if histogram is None:
+            histogram = {"buckets": buckets, "counts": [0] * len(buckets), "sum": 0.0, "count": 0}  # Creates it.
+            histograms[key] = histogram  # Stores the histogram.
+
+        # For every bucket,
+        for i, bound in enumerate(histogram["buckets"]):
+            # If the value fits in the bucket,
+            if value <= bound:
+                histogram["counts"][i] += 1  # Counts the value (buckets are added up when rendering).
+                break
+
+        histogram["sum"] += value  # Adds the value to the sum.
+        histogram["count"] += 1  # Counts the value.
+
+
+def register_collector(collector):
+    """
+        Adds a function that returns extra gauges every time the metrics are rendered (e.g. the size of a cache).
+
+        :param collector:   A function returning a dictionary of {name: value} or {name: (value, labels)}.
+    """
+
+    collectors.append(collector)  # Stores the function.
+
+
+def record_call(labels : dict, seconds : float, result, failed : bool, count_documents, is_failure):
+    """
+        Records the metrics of a finished call to an instrumented function.
+
+        :param labels:              The labels of the metrics (layer and operation).
+        :param seconds:             How long the call took.
+        :param result:              The result of the call (None if it raised an error).
+        :param failed:              Whether the call raised an error.
+        :param count_documents:     A function getting the number of documents from the result, if any.
+        :param is_failure:          A function checking whether the result reports a failure, if any.
+    """
+
+    increment("ims_operation_calls_total", **labels)  # Counts the call.
+    observe("ims_operation_seconds", seconds, **labels)  # Records how long the call took.
+
+    # If the call raised an error or its result reports a failure,
+    if failed or (is_failure is not None and is_failure(result)):
+        increment("ims_operation_errors_total", **labels)  # Counts the error.
+
+    # Otherwise if the result holds documents,
+    elif count_documents is not None:
+        observe("ims_documents_returned", count_documents(result), size_buckets, **labels)  # Records them.
+
+
+def instrument(operation : str, layer : str ="backend", count_documents=None, is_failure=None, profile : bool =False):
+    """
+        Creates a decorator that times a function (or coroutine function) and counts its calls, errors and
+        returned documents.
+
+        :param operation:           The name of the operation (the "operation" label).
+        :param layer:               The layer of the operation (the "layer" label) e.g. "backend" or "callback".
+        :param count_documents:     A function getting the number of documents from the result, if any.
+        :param is_failure:          A function checking whether the result reports a failure (e.g. None), if any.
+        :param profile:             Whether calls are profiled while profiling is enabled (use for whole requests).
+        :return function:           The decorator.
+    """
+
+    labels = {"layer": layer, "operation": operation}  # Holds the labels of the metrics.
+
+    def decorator(function):
+        """
+            Wraps a function with the instrumentation.
+
+            :param function:        The function to instrument.
+            :return function:       The instrumented function.
+        """
+
+        # If the function is a coroutine function,
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def instrumented_async(*args, **kwargs):
+                """
+                    Awaits the coroutine function while timing it and counting its calls, errors and documents.
+
+                    :return object:     The result of the coroutine function.
+                """
+
+                start = time.perf_counter()  # Records when the call started.
+                result, failed = None, True  # Holds the result of the call and whether it raised an error.
+
+                # Makes an attempt,
+                try:
+                    result = await function(*args, **kwargs)  # Awaits the coroutine function.
+                    failed = False  # Marks the call as finished without an error.
+                    return result  # Returns the result of the coroutine function.
+
+                # Once the call has finished (or failed),
+                finally:
+                    record_call(labels, time.perf_counter() - start, result, failed, count_documents, is_failure)
+
+            return instrumented_async  # Returns the instrumented coroutine function.
+
+        @functools.wraps(function)
+        def instrumented(*args, **kwargs):
+            """
+                Calls the function while timing it and counting its calls, errors and returned documents.
+
+                :return object:     The result of the function.
+            """
+
+            profiler = None  # Holds the profiler of the call (if it is profiled).
+
+            # Whether the call is profiled (only one profiler may run in a process, so a call made while another call
+            #   is profiled, including a call nested in the profiled call, is not profiled).
+            locked = profile and profiling_enabled and profile_lock.acquire(blocking=False)
+
+            start = time.perf_counter()  # Records when the call started.
+            result, failed = None, True  # Holds the result of the call and whether it raised an error.
+
+            # Makes an attempt,
+            try:
+                # If the call is profiled,
+                if locked:
+                    profiler = cProfile.Profile()  # Creates the profiler.
+
+                    # Makes an attempt,
+                    try:
+                        profiler.enable()  # Starts profiling.
+
+                    # If another profiling tool is active (e.g. a debugger),
+                    except ValueError:
+                        profiler = None  # Runs the call without profiling it.
+
+                result = function(*args, **kwargs)  # Calls the function.
+                failed = False  # Marks the call as finished without an error.
+                return result  # Returns the result of the function.
+
+            # Once the call has finished (or failed),
+            finally:
+                seconds = time.perf_counter() - start  # Records how long the call took.
+
+                # If the call was profiled,
+                if locked:
+                    # Makes an attempt,
+                    try:
+                        # If the profiler started,
+                        if profiler is not None:
+                            profiler.disable()  # Stops profiling.
+                            store_profile(operation, seconds, profiler)  # Stores the profile.
+
+                    # Once the profile is stored (or failed),
+                    finally:
+                        profile_lock.release()  # Lets the next call be profiled.
+
+                record_call(labels, seconds, result, failed, count_documents, is_failure)  # Records the metrics.
+
+        return instrumented  # Returns the instrumented function.
+
+    return decorator  # Returns the decorator.
+
+
+def store_profile(operation : str, seconds : float, profiler : cProfile.Profile):
+    """
+        Summarizes a profile and keeps it with the most recent profiles.
+
+        :param operation:   The name of the profiled operation.
+        :param seconds:     How long the operation took.
+        :param profiler:    The profiler of the operation.
+    """
+
+    text = io.StringIO()  # Holds the summary.
+    pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(25)  # Writes the 25 slowest calls.
+
+    # Stores the profile.
+    recent_profiles.append({"operation": operation, "seconds": seconds, "time": time.time(), "stats": text.getvalue()})
+
+
+def set_profiling(enabled : bool):
+    """
+        Turns the profiling of instrumented requests on or off while the server is running.
+
+        :param enabled:     Whether requests should be profiled.
+    """
+
+    # Declare which variables use the global scope.
+    global profiling_enabled
+
+    profiling_enabled = enabled  # Updates whether requests are profiled.
+
+
+def format_labels(labels) -> str:
+    """
+        Formats labels in the Prometheus text format.
+
+        :param labels:      The (name, value) pairs of the labels.
+        :return str:        The labels e.g. '{layer="backend",operation="read"}' (empty if there are none).
+    """
+
+    # If there are no labels,
+    if not labels:
+        return ""  # Returns nothing.
+
+    # Escapes every value and joins the labels.
+    parts = [f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+             for name, value in labels]
+
+    return "{" + ",".join(parts) + "}"  # Returns the labels.
+
+
+def render() -> str:
+    """
+        Renders every metric in the Prometheus text format.
+
+        :return str:        The metrics.
+    """
+
+    lines = []  # Holds the lines of the output.
+
+    # Only one thread may read the metrics at a time.
+    with metrics_lock:
+        counter_items = sorted(counters.items())  # Copies the counters.
+
+        # Copies the histograms.
+        histogram_items = sorted((key, dict(histogram, counts=list(histogram["counts"])))
+                                 for key, histogram in histograms.items())
+
+    written = set()  # Holds the names whose type has been written.
+
+    # For every counter,
+    for (name, labels), value in counter_items:
+        # If the type of the counter has not been written,
+        if name not in written:
+            lines.append(f"# HELP {name} {metric_help.get(name, name)}")  # Writes the help text.
+            lines.append(f"# TYPE {name} counter")  # Writes the type.
+            written.add(name)  # Remembers the name.
+
+        lines.append(f"{name}{format_labels(labels)} {value}")  # Writes the value.
+
+    # For every histogram,
+    for (name, labels), histogram in histogram_items:
+        # If the type of the histogram has not been written,
+        if name not in written:
+            lines.append(f"# HELP {name} {metric_help.get(name, name)}")  # Writes the help text.
+            lines.append(f"# TYPE {name} histogram")  # Writes the type.
+            written.add(name)  # Remembers the name.
+
+        cumulative = 0  # Holds the number of values in the bucket and every smaller bucket.
+
+        # For every bucket,
+        for bound, count in zip(histogram["buckets"], histogram["counts"]):
+            cumulative += count  # Adds the values of the bucket.
+            lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {cumulative}")  # Writes the bucket.
+
+        lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {histogram['count']}")
+        lines.append(f"{name}_sum{format_labels(labels)} {histogram['sum']}")  # Writes the sum.
+        lines.append(f"{name}_count{format_labels(labels)} {histogram['count']}")  # Writes the count.
+
+    # For every extra source of gauges,
+    for collector in collectors:
+        # For every gauge,
+        for name, value in sorted(collector().items()):
+            value, labels = value if isinstance(value, tuple) else (value, {})  # Splits the value from its labels.
+
+            # If the type of the gauge has not been written,
+            if name not in written:
+                lines.append(f"# TYPE {name} gauge")  # Writes the type.
+                written.add(name)  # Remembers the name.
+
+            lines.append(f"{name}{format_labels(sorted(labels.items()))} {value}")  # Writes the value.
+
+    lines.append("# HELP ims_process_info The process (worker) the metrics belong to.")  # Writes the help text.
+    lines.append("# TYPE ims_process_info gauge")  # Writes the type of the process gauge.
+    lines.append(f"ims_process_info{format_labels((('pid', os.getpid()),))} 1")  # Writes the process ID.
+    lines.append("# TYPE ims_profiling_enabled gauge")  # Writes the type of the profiling gauge.
+    lines.append(f"ims_profiling_enabled {int(profiling_enabled)}")  # Writes whether profiling is enabled.
+    return "\n".join(lines) + "\n"  # Returns the metrics.
+
+
+def register_routes(server):
+    """
+        Adds the metrics routes to the Flask server underlying the Dash app:
+            "/metrics"                      The metrics in the Prometheus text format.
+            "/metrics/profiling"            Whether profiling is enabled (a POST with "enabled=true" or "enabled=false"
+                                            and the "X-Profiling-Token" header changes it, see profiling_token).
+            "/metrics/profiles"             The most recent profiles.
+        It also records the size of every callback response Dash sends. Every route only reports (and changes) the
+            process serving the request, whose ID is included in every response.
+
+        :param server:      The Flask server (app.server).
+    """
+
+    import flask  # Allows for responding to requests (Flask is installed with Dash).
+
+    @server.route("/metrics")
+    def metrics_route():
+        """
+            Serves the metrics.
+
+            :return Response:   The metrics in the Prometheus text format.
+        """
+
+        return flask.Response(render(), mimetype="text/plain; version=0.0.4")  # Returns the metrics.
+
+    @server.route("/metrics/profiling", methods=["GET", "POST"])
+    def profiling_route():
+        """
+            Serves (and, for a POST carrying the profiling token, changes) whether profiling is enabled.
+
+            :return Response:   Whether profiling is enabled in this process and its ID (403 if a change is refused,
+                                400 if no state was given).
+        """
+
+        # If the state should be changed,
+        if flask.request.method == "POST":
+            token = flask.request.headers.get("X-Profiling-Token", "").encode("utf-8")  # Gets the token sent.
+
+            # If no token is configured or the token does not match,
+            if profiling_token is None or not hmac.compare_digest(token, profiling_token.encode("utf-8")):
+                error = "Set IMS_PROFILING_TOKEN and send it in the X-Profiling-Token header."
+                return flask.jsonify({"error": error}), 403  # Refuses the change.
+
+            enabled = flask.request.values.get("enabled")  # Gets the requested state (from the form or the URL).
+
+            # If no state was requested,
+            if enabled is None:
+                return flask.jsonify({"error": "Specify enabled=true or enabled=false."}), 400  # Refuses the request.
+
+            set_profiling(enabled.lower() in ("1", "true", "yes", "on"))  # Updates whether requests are profiled.
+
+        # Returns whether profiling is enabled (only in this process, other workers keep their own state).
+        return flask.jsonify({"profiling_enabled": profiling_enabled, "pid": os.getpid()})
+
+    @server.route("/metrics/profiles")
+    def profiles_route():
+        """
+            Serves the most recent profiles.
+
+            :return Response:   The profiles of this process (newest first) as text.
+        """
+
+        # Writes every profile under a heading.
+        text = "\n".join(f"=== {profile['operation']} ({profile['seconds'] * 1000:.3f} ms) ===\n{profile['stats']}"
+                         for profile in reversed(list(recent_profiles)))
+
+        heading = f"Profiles of process {os.getpid()}\n\n"  # Names the process the profiles belong to.
+        return flask.Response(heading + (text or "No profiles recorded.\n"), mimetype="text/plain")  # Returns them.
+
+    @server.after_request
+    def record_payload(response):
+        """
+            Records the size of every callback response Dash sends.
+
+            :param response:    The response to the request.
+            :return Response:   The same response.
+        """
+
+        # If the request was a Dash callback,
+        if flask.request.path.endswith("/_dash-update-component"):
+            body = flask.request.get_json(silent=True) or {}  # Gets the request (already parsed by Dash).
+            output = str(body.get("output", "unknown"))  # Gets the outputs of the callback.
+
+            # If the size of the response is known,
+            if response.content_length is not None:
+                observe("ims_payload_bytes", response.content_length, size_buckets, output=output)  # Records the size.
+
+        return response  # Returns the response.
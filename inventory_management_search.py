@@ -0,0 +1,322 @@
+"""
+    :author:        Jacob Whetham
+    :version:       1.0.0, 04 JAN 2024
+    :desc:          This file handles the product search of the Inventory Management System (an in-process inverted
+                    index of the words in every product name, so type-ahead lookups never scan the collection).
+"""
+
+# Imports
+import bisect       # Allows for finding the words starting with a prefix in the sorted vocabulary.
+import heapq        # Allows for finding the first products without sorting every match.
+import re           # Allows for splitting product names into words.
+import threading    # Allows for locking the index between the threads serving requests.
+import time         # Allows for timing how old the index is.
+
+# Declare global variables.
+word_pattern = re.compile(r"\w+")   # A word of a product name (letters, digits and underscores).
+last_character = "\U0010ffff"       # A character sorted after every other (ends the range of a prefix).
+
+
+def get_terms(text) -> list:
+    """
+        Gets the words of a text as they are indexed (lower case, without duplicates, in the order they appear).
+
+        :param text:            The text (e.g. a product name or a search).
+        :return list:           The words (empty if the text is not text).
+    """
+
+    # If the text is not text (e.g. a null name),
+    if not isinstance(text, str):
+        return []  # Returns no words.
+
+    return list(dict.fromkeys(word.casefold() for word in word_pattern.findall(text)))  # Returns the words.
+
+
+class SearchIndex:
+    """
+        Holds the product IDs of the products whose names contain every word (an inverted index), and every distinct
+        word in sorted order so the words starting with a prefix are found with a binary search. The index is kept
+        current by applying the changes in the change feed, and is read again from the database when a change cannot
+        be applied (e.g. a bulk write).
+    """
+
+    def __init__(self, max_age_seconds : float =30.0):
+        """
+            Creates an empty index (it is read from the database the first time it is used).
+
+            :param max_age_seconds:     How long the index is used before it is read again from the database (this
+                                        catches writes the change feed did not see, e.g. from other processes).
+        """
+
+        self.max_age_seconds = max_age_seconds  # How long the index is used before it is read again.
+        self.lock = threading.RLock()           # Prevents two threads from changing the index at once.
+        self.loaded = None                      # When the index was read from the database (None if never).
+        self.sequence = 0                       # The sequence number of the newest change applied.
+        self.reloads = 0                        # How many times the index was read from the database.
+        self.searches = 0                       # How many searches the index served.
+        self.clear()                            # Creates the empty index.
+
+    def clear(self):
+        """
+            Empties the index.
+        """
+
+        self.postings = {}      # The product IDs of the products containing every word.
+        self.vocabulary = []    # Every word in the index, in sorted order.
+        self.terms = {}         # The words of every product, keyed by its product ID.
+
+    def add(self, product_id : int, name):
+        """
+            Adds a product to the index.
+
+            :param product_id:      The product ID of the product.
+            :param name:            The name of the product.
+        """
+
+        terms = get_terms(name)  # Gets the words of the name.
+        self.terms[product_id] = terms  # Remembers the words (to remove the product later).
+
+        # For every word,
+        for term in terms:
+            # If the word is new,
+            if term not in self.postings:
+                self.postings[term] = set()  # Creates its product IDs.
+                bisect.insort(self.vocabulary, term)  # Adds it to the vocabulary.
+
+            self.postings[term].add(product_id)  # Adds the product.
+
+    def remove(self, product_id : int):
+        """
+            Removes a product from the index (nothing happens if it is not held).
+
+            :param product_id:      The product ID of the product.
+        """
+
+        # For every word of the product,
+        for term in self.terms.pop(product_id, []):
+            postings = self.postings[term]  # Gets the products containing the word.
+            postings.discard(product_id)  # Removes the product.
+
+            # If no product contains the word anymore,
+            if not postings:
+                del self.postings[term]  # Forgets the word.
+                del self.vocabulary[bisect.bisect_left(self.vocabulary, term)]  # Removes it from the vocabulary.
+
+    def set_document(self, document : dict):
+        """
+            Stores a product in the index, replacing its previous name.
+
+            :param document:        The product (its product ID and name are used).
+        """
+
+        product_id = document.get("product_id")  # Gets the product ID.
+
+        # If the product has no product ID (it cannot be shown in the results),
+        if product_id is None:
+            return  # Exits the function.
+
+        # If the words of the name did not change,
+        if self.terms.get(product_id) == get_terms(document.get("product_name")):
+            return  # Exits the function (there is nothing to change).
+
+        self.remove(product_id)  # Removes the previous name.
+        self.add(product_id, document.get("product_name"))  # Adds the new name.
+
+    def load(self, documents, sequence : int):
+        """
+            Replaces the index with a set of documents. The documents are read into a new index that replaces the
+                current one only once every document was read, so a read that fails part way never leaves a partly
+                filled index that looks up to date.
+
+            :param documents:       The documents (every product in the collection).
+            :param sequence:        The sequence number of the newest change the documents include.
+        """
+
+        # Only one thread may change the index at a time.
+        with self.lock:
+            postings = {}  # Holds the product IDs of the products containing every word until every document is read.
+            terms = {}  # Holds the words of every product until every document is read.
+
+            # Makes an attempt,
+            try:
+                # For every document,
+                for document in documents:
+                    product_id = document.get("product_id")  # Gets the product ID.
+
+                    # If the product has a product ID,
+                    if product_id is not None:
+                        terms[product_id] = get_terms(document.get("product_name"))  # Remembers the words of the name.
+
+                        # For every word,
+                        for term in terms[product_id]:
+                            postings.setdefault(term, set()).add(product_id)  # Adds the product.
+
+            # If the documents could not be read,
+            except Exception:
+                self.clear()  # Empties the index.
+                self.loaded = None  # Marks the index as unusable (it is read again on the next use).
+                raise  # Passes the error on.
+
+            self.postings, self.terms = postings, terms  # Swaps in the new index.
+            self.vocabulary = sorted(postings)  # Sorts every word once (instead of once per new word).
+            self.sequence = sequence  # Remembers the newest change included.
+            self.loaded = time.monotonic()  # Remembers when the index was read.
+            self.reloads += 1  # Counts the read.
+
+    def apply_changes(self, changes : list) -> bool:
+        """
+            Applies changes from the change feed to the index.
+
+            :param changes:         The changes (see ChangeFeed.changes_since()).
+            :return bool:           Whether every change was applied (otherwise the index must be read again).
+        """
+
+        # For every change,
+        for change in changes:
+            fields = change.get("fields")  # Gets the fields the change updated (None if unknown).
+
+            # If any document may have changed, or an update may have moved the name to another product ID,
+            if change["type"] == "reset" or (change["type"] == "update" and (fields is None or "product_id" in fields)):
+                return False  # Returns that the index must be read again.
+
+            # If the product was deleted,
+            if change["type"] == "delete":
+                self.remove(change["product_id"])  # Removes it.
+                continue
+
+            # If the update did not change the name,
+            if change["type"] == "update" and "product_name" not in fields:
+                continue  # Skips the change.
+
+            # If the new document is not known,
+            if change.get("document") is None:
+                return False  # Returns that the index must be read again.
+
+            self.set_document(change["document"])  # Stores the new name.
+
+        return True  # Returns that every change was applied.
+
+    def refresh(self, change_feed, read_documents):
+        """
+            Brings the index up to date, applying the changes made since it was last refreshed or reading it again
+            from the database if it is too old or a change cannot be applied.
+
+            :param change_feed:     The change feed holding the recent writes.
+            :param read_documents:  A function returning every document in the collection (called to read it again).
+        """
+
+        # Only one thread may change the index at a time (the changes must be applied in order).
+        with self.lock:
+            # If the index has been read and is not too old,
+            if self.loaded is not None and time.monotonic() - self.loaded <= self.max_age_seconds:
+                latest, changes, complete = change_feed.changes_since(self.sequence)  # Gets the new changes.
+
+                # If every change was still held and was applied,
+                if complete and self.apply_changes(changes):
+                    self.sequence = latest  # Remembers the newest change applied.
+                    return  # Exits the function (the index is up to date).
+
+            # The changes made while the documents are read are applied again later (applying a change twice is harmless).
+            sequence = change_feed.get_sequence()  # Gets the newest change before the documents are read.
+            self.load(read_documents(), sequence)  # Reads the index again.
+
+    def get_prefix_range(self, prefix : str) -> (int, int):
+        """
+            Gets where the words starting with a prefix are in the vocabulary.
+
+            :param prefix:          The prefix (lower case).
+            :return (int, int):     The position of the first word and the position after the last word.
+        """
+
+        # Returns the range (every word starting with the prefix sorts between the prefix and the prefix followed by
+        #   the last character).
+        return bisect.bisect_left(self.vocabulary, prefix), bisect.bisect_left(self.vocabulary, prefix + last_character)
+
+    def search(self, text : str, limit : int =20, prefix : bool =True) -> list:
+        """
+            Finds the products whose names contain every word of a search. In a prefix search the last word only has to
+                start a word of the name (e.g. "blue wid" finds "Blue Widget"), so results appear while typing.
+                Full-text results are ordered by product ID; prefix results are ordered by the first word matching
+                the prefix (a whole-word match first), then by product ID.
+
+            :param text:            The search.
+            :param limit:           The most product IDs returned.
+            :param prefix:          Whether the last word is matched as a prefix.
+            :return list:           The product IDs of the matching products.
+        """
+
+        terms = get_terms(text)  # Gets the words of the search.
+
+        # If the search has no words,
+        if not terms or limit <= 0:
+            return []  # Returns no products.
+
+        # Only one thread may use the index at a time.
+        with self.lock:
+            self.searches += 1  # Counts the search.
+            whole = terms[:-1] if prefix else terms  # Gets the words that must match whole.
+            candidates = None  # Holds the products containing every whole word (None if there are none).
+
+            # For every whole word, starting with the rarest (so the candidates shrink as fast as possible),
+            for term in sorted(whole, key=lambda term: len(self.postings.get(term, ()))):
+                postings = self.postings.get(term, set())  # Gets the products containing the word.
+                candidates = set(postings) if candidates is None else candidates & postings  # Keeps the common ones.
+
+                # If no product contains every word so far,
+                if not candidates:
+                    return []  # Returns no products.
+
+            # If every word must match whole,
+            if not prefix:
+                return heapq.nsmallest(limit, candidates)  # Returns the first products.
+
+            start, end = self.get_prefix_range(terms[-1])  # Finds the words starting with the last word.
+
+            # If there are fewer candidates than words starting with the prefix,
+            if candidates is not None and len(candidates) < end - start:
+                ranked = []  # Holds the first matching word and product ID of every candidate.
+
+                # For every candidate,
+                for product_id in candidates:
+                    matches = [term for term in self.terms[product_id] if term.startswith(terms[-1])]
+
+                    # If a word of the name starts with the prefix,
+                    if matches:
+                        ranked.append((min(matches), product_id))  # Ranks it by its first matching word.
+
+                return [product_id for match, product_id in sorted(ranked)[:limit]]  # Returns the first products.
+
+            results = []  # Holds the product IDs found.
+            found = set()  # Holds the product IDs found (to skip a product matching several words).
+
+            # For every word starting with the prefix, in sorted order (so only the first products are looked at),
+            for term in self.vocabulary[start:end]:
+                postings = self.postings[term]  # Gets the products containing the word.
+
+                # For each of the first products containing the word (and every whole word). Taking the limit is enough:
+                #   at most len(results) of them were already found, and only limit - len(results) more are needed.
+                for product_id in heapq.nsmallest(limit, postings if candidates is None else postings & candidates):
+                    # If the product was not found already,
+                    if product_id not in found:
+                        found.add(product_id)  # Remembers the product.
+                        results.append(product_id)  # Adds the product.
+
+                        # If enough products were found,
+                        if len(results) >= limit:
+                            return results  # Returns the products.
+
+            return results  # Returns every product found.
+
+    def get_metrics(self) -> dict:
+        """
+            Gets the size and usage counters of the index.
+
+            :return dict:           The products and distinct words held, and how many times the index was read and
+                                    served a search.
+        """
+
+        # Only one thread may use the index at a time.
+        with self.lock:
+            # Returns the metrics.
+            return {"products": len(self.terms), "terms": len(self.vocabulary), "reloads": self.reloads,
+                    "searches": self.searches}
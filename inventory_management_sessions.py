@@ -0,0 +1,267 @@
+"""
+    :author:        Jacob Whetham
+    :version:       1.0.0, 04 JAN 2024
+    :desc:          This file handles the session store of the Inventory Management System (the login state of every
+                    browser tab, kept outside of the processes serving the dashboard so any worker can serve any tab).
+"""
+
+# Imports
+import base64       # Allows for encoding the sealing key.
+import json         # Allows for storing session records as text.
+import os           # Allows for noticing that the process was forked (e.g. into a worker).
+import sqlite3      # Allows for sharing the sessions between processes through a file.
+import threading    # Allows for locking the sessions and giving every thread its own connection.
+import time         # Allows for expiring sessions.
+from cryptography.fernet import Fernet, InvalidToken            # Allows for sealing passwords (AES with an HMAC).
+from cryptography.hazmat.primitives import hashes               # Allows for choosing the hash of the key derivation.
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF        # Allows for deriving the sealing key from the secret.
+
+
+def get_cipher(secret : bytes) -> Fernet:
+    """
+        Gets the cipher sealing passwords with a secret key (the key is derived from the secret with HKDF, so any
+            secret e.g. the text of IMS_SESSION_SECRET can be used).
+
+        :param secret:      The secret key shared by every worker.
+        :return Fernet:     The cipher.
+    """
+
+    # Derives the key of the cipher from the secret.
+    key = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b"inventory management session").derive(secret)
+    return Fernet(base64.urlsafe_b64encode(key))  # Returns the cipher.
+
+
+def seal(secret : bytes, text : str) -> str:
+    """
+        Encrypts a password so the session store never holds it in plain text.
+
+        :param secret:      The secret key shared by every worker.
+        :param text:        The password.
+        :return str:        The sealed password (sealing a password twice gives different text).
+    """
+
+    return get_cipher(secret).encrypt(text.encode("utf-8")).decode("ascii")  # Returns the sealed password.
+
+
+def unseal(secret : bytes, sealed : str) -> str:
+    """
+        Decrypts a password sealed with seal().
+
+        :param secret:      The secret key shared by every worker.
+        :param sealed:      The sealed password.
+        :return str:        The password, or None if it was not sealed with the secret key.
+    """
+
+    # Makes an attempt,
+    try:
+        return get_cipher(secret).decrypt(sealed.encode("ascii")).decode("utf-8")  # Returns the decrypted password.
+
+    # If the sealed password was not created with the secret key (or is not valid text),
+    except (InvalidToken, ValueError, AttributeError):
+        return None  # Returns nothing (the password cannot be trusted).
+
+
+class SessionStore:
+    """
+        Holds the login state of every session in the memory of this process (used when a single process serves the
+        dashboard). Every record is a dict e.g. {"username": ..., "credential": <sealed password>}.
+    """
+
+    def __init__(self, max_age_seconds : float =43200.0):
+        """
+            Creates an empty store.
+
+            :param max_age_seconds:     How long a session stays logged in after its login.
+        """
+
+        self.max_age_seconds = max_age_seconds  # How long a session stays logged in after its login.
+        self.records = {}                       # The record and expiry time of every session, keyed by its token.
+        self.counters = {}                      # The value of every counter, keyed by its name.
+        self.lock = threading.Lock()            # Prevents two threads from changing the records at once.
+
+    def get(self, token : str) -> dict:
+        """
+            Gets the record of a session.
+
+            :param token:       The token of the session.
+            :return dict:       The record, or None if the session is not logged in (or its login expired).
+        """
+
+        # Only one thread may change the records at a time.
+        with self.lock:
+            entry = self.records.get(token)  # Gets the record and its expiry time.
+
+            # If the session is not logged in,
+            if entry is None:
+                return None  # Returns nothing.
+
+            # If the login expired,
+            if entry[1] <= time.time():
+                del self.records[token]  # Forgets the session.
+                return None  # Returns nothing.
+
+            return dict(entry[0])  # Returns a copy of the record.
+
+    def set(self, token : str, record : dict):
+        """
+            Stores the record of a session (when it logs in) and removes every expired session.
+
+            :param token:       The token of the session.
+            :param record:      The record.
+        """
+
+        now = time.time()  # Gets the current time.
+
+        # Only one thread may change the records at a time.
+        with self.lock:
+            # Removes every expired session (a session that is never used again is never read again either).
+            self.records = {key: entry for key, entry in self.records.items() if entry[1] > now}
+            self.records[token] = (dict(record), now + self.max_age_seconds)  # Stores the record.
+
+    def delete(self, token : str):
+        """
+            Forgets the record of a session (when it logs out).
+
+            :param token:       The token of the session.
+        """
+
+        # Only one thread may change the records at a time.
+        with self.lock:
+            self.records.pop(token, None)  # Forgets the record.
+
+    def get_counter(self, name : str) -> int:
+        """
+            Gets the value of a counter shared by every process using the store (e.g. the number of writes made).
+
+            :param name:        The name of the counter.
+            :return int:        The value (0 if the counter was never increased).
+        """
+
+        # Only one thread may change the counters at a time.
+        with self.lock:
+            return self.counters.get(name, 0)  # Returns the value.
+
+    def increment_counter(self, name : str) -> int:
+        """
+            Adds one to a counter shared by every process using the store.
+
+            :param name:        The name of the counter.
+            :return int:        The new value.
+        """
+
+        # Only one thread may change the counters at a time.
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + 1  # Adds one to the counter.
+            return self.counters[name]  # Returns the new value.
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+        Holds the login state of every session in a SQLite file, so every worker process on the host sees the same
+        sessions (a tab logged in through one worker is logged in on every worker).
+    """
+
+    def __init__(self, path : str, max_age_seconds : float =43200.0):
+        """
+            Creates the store (the file and its table are created the first time they are used).
+
+            :param path:                The path of the SQLite file.
+            :param max_age_seconds:     How long a session stays logged in after its login.
+        """
+
+        super().__init__(max_age_seconds)  # Sets the shared settings.
+        self.path = path                    # The path of the SQLite file.
+        self.local = threading.local()      # The connection of every thread.
+
+    def get_connection(self) -> sqlite3.Connection:
+        """
+            Gets the connection of the calling thread, opening it the first time it is used in the process.
+
+            :return Connection:     The connection to the SQLite file.
+        """
+
+        # If the thread has no connection yet, or the connection was opened before the process was forked,
+        if getattr(self.local, "pid", None) != os.getpid():
+            connection = sqlite3.connect(self.path, isolation_level=None)  # Opens the file (every change is committed).
+            connection.execute("PRAGMA journal_mode=WAL")  # Lets every worker read while a session is written.
+            connection.execute("PRAGMA busy_timeout=5000")  # Waits for the writes of other workers.
+            connection.execute("CREATE TABLE IF NOT EXISTS sessions "
+                               "(token TEXT PRIMARY KEY, record TEXT NOT NULL, expires REAL NOT NULL)")
+            connection.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self.local.connection = connection  # Keeps the connection for the thread.
+            self.local.pid = os.getpid()  # Remembers which process opened it.
+
+        return self.local.connection  # Returns the connection.
+
+    def get(self, token : str) -> dict:
+        """
+            Gets the record of a session.
+
+            :param token:       The token of the session.
+            :return dict:       The record, or None if the session is not logged in (or its login expired).
+        """
+
+        # Reads the record (an expired login is ignored).
+        row = self.get_connection().execute("SELECT record FROM sessions WHERE token = ? AND expires > ?",
+                                            (token, time.time())).fetchone()
+        return None if row is None else json.loads(row[0])  # Returns the record.
+
+    def set(self, token : str, record : dict):
+        """
+            Stores the record of a session (when it logs in) and removes every expired session.
+
+            :param token:       The token of the session.
+            :param record:      The record.
+        """
+
+        connection = self.get_connection()  # Gets the connection of the thread.
+        now = time.time()  # Gets the current time.
+        connection.execute("DELETE FROM sessions WHERE expires <= ?", (now,))  # Removes every expired session.
+        connection.execute("INSERT OR REPLACE INTO sessions (token, record, expires) VALUES (?, ?, ?)",
+                           (token, json.dumps(record), now + self.max_age_seconds))  # Stores the record.
+
+    def delete(self, token : str):
+        """
+            Forgets the record of a session (when it logs out).
+
+            :param token:       The token of the session.
+        """
+
+        self.get_connection().execute("DELETE FROM sessions WHERE token = ?", (token,))  # Forgets the record.
+
+    def get_counter(self, name : str) -> int:
+        """
+            Gets the value of a counter shared by every worker (e.g. the number of writes made).
+
+            :param name:        The name of the counter.
+            :return int:        The value (0 if the counter was never increased).
+        """
+
+        row = self.get_connection().execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()
+        return 0 if row is None else row[0]  # Returns the value.
+
+    def increment_counter(self, name : str) -> int:
+        """
+            Adds one to a counter shared by every worker.
+
+            :param name:        The name of the counter.
+            :return int:        The new value (no other worker gets the same value).
+        """
+
+        connection = self.get_connection()  # Gets the connection of the thread.
+        connection.execute("BEGIN IMMEDIATE")  # Stops other workers from increasing the counter until it is read.
+
+        # Makes an attempt,
+        try:
+            # Adds one to the counter (creating it if it does not exist).
+            connection.execute("INSERT INTO counters (name, value) VALUES (?, 1) "
+                               "ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,))
+            value = connection.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()[0]
+
+        # If the counter could not be increased,
+        except Exception:
+            connection.execute("ROLLBACK")  # Undoes the change.
+            raise  # Passes the error on.
+
+        connection.execute("COMMIT")  # Publishes the new value.
+        return value  # Returns the new value.
@@ -0,0 +1,578 @@
+"""
+    :author:        Jacob Whetham
+    :version:       1.0.0, 04 JAN 2024
+    :desc:          This file handles the inventory snapshot of the Inventory Management System (every product held in
+                    process as typed NumPy columns, so pages of the table are filtered, sorted and sliced without
+                    reading the database).
+"""
+
+# Imports
+import re           # Allows for regular expressions ($regex conditions).
+import threading    # Allows for locking the snapshot between the threads serving requests.
+import time         # Allows for timing how old the snapshot is.
+import numpy        # Allows for typed column arrays and vectorized filtering and sorting.
+
+# Declare global variables.
+#   The kind of every value held in a number column (product_id is always a whole number).
+missing_kind = 0    # The document does not have the field.
+null_kind = 1       # The field is null.
+integer_kind = 2    # The field is a whole number.
+float_kind = 3      # The field is a decimal number.
+missing_code = -1   # The name code of a document without a product_name field.
+null_code = -2      # The name code of a null product_name.
+largest_exact_integer = 2 ** 53  # Whole numbers larger than this cannot be held exactly in a float64 column.
+
+number_fields = ("product_price", "product_quantity")  # The number columns besides the product ID.
+
+# The comparison operators supported in queries, mapped to their NumPy (and Python) equivalents.
+comparisons = {"$eq": lambda left, right: left == right,
+               "$gt": lambda left, right: left > right,
+               "$gte": lambda left, right: left >= right,
+               "$lt": lambda left, right: left < right,
+               "$lte": lambda left, right: left <= right}
+
+
+class InventorySnapshot:
+    """
+        Holds every product as typed columns: an int64 array of product IDs, a float64 array (with the kind of every
+        value) for the price and quantity, and an int32 array of codes into an interned table of product names.
+        A dictionary maps each product ID to its row. The snapshot is kept current by applying the changes in the
+        change feed, and is read again from the database when a change cannot be applied (e.g. a bulk write).
+    """
+
+    def __init__(self, max_age_seconds : float =30.0, capacity : int =1024):
+        """
+            Creates an empty snapshot (it is read from the database the first time it is used).
+
+            :param max_age_seconds:     How long the snapshot is used before it is read again from the database (this
+                                        catches writes the change feed did not see, e.g. from other processes).
+            :param capacity:            The number of rows the columns hold before they grow.
+        """
+
+        self.max_age_seconds = max_age_seconds  # How long the snapshot is used before it is read again.
+        self.lock = threading.RLock()           # Prevents two threads from changing the snapshot at once.
+        self.loaded = None                      # When the snapshot was read from the database (None if never).
+        self.failed = None                      # When a document last could not be held (None if it has not failed).
+        self.failed_sequence = 0                # The sequence number of the newest change when it failed.
+        self.sequence = 0                       # The sequence number of the newest change applied.
+        self.reloads = 0                        # How many times the snapshot was read from the database.
+        self.served = 0                         # How many pages were served from the snapshot.
+        self.refused = 0                        # How many queries the snapshot could not serve.
+        self.clear(capacity)                    # Creates the empty columns.
+
+    def clear(self, capacity : int =1024):
+        """
+            Empties the snapshot.
+
+            :param capacity:        The number of rows the new columns hold before they grow.
+        """
+
+        self.size = 0                                                   # The number of rows in use.
+        self.ids = numpy.zeros(capacity, dtype="int64")                 # The product ID of every row.
+        self.numbers = {field: numpy.zeros(capacity, dtype="float64") for field in number_fields}  # The numbers.
+        self.kinds = {field: numpy.zeros(capacity, dtype="int8") for field in number_fields}      # Their kinds.
+        self.name_codes = numpy.zeros(capacity, dtype="int32")          # The code of the name of every row.
+        self.names = []                                                 # The interned names, indexed by their code.
+        self.codes = {}                                                 # The code of every interned name.
+        self.name_ranks = None                                          # The sort position of every name (if known).
+        self.rows = {}                                                  # The row of every product ID.
+
+    def grow(self, capacity : int):
+        """
+            Makes the columns hold at least a number of rows (doubling their size, so growing is rare).
+
+            :param capacity:        The number of rows needed.
+        """
+
+        # If the columns are already big enough,
+        if capacity <= len(self.ids):
+            return  # Exits the function.
+
+        capacity = max(capacity, len(self.ids) * 2)  # Doubles the size of the columns.
+        self.ids = numpy.resize(self.ids, capacity)  # Grows every column (the rows in use are kept).
+        self.name_codes = numpy.resize(self.name_codes, capacity)
+
+        # For every number column,
+        for field in number_fields:
+            self.numbers[field] = numpy.resize(self.numbers[field], capacity)
+            self.kinds[field] = numpy.resize(self.kinds[field], capacity)
+
+    def intern(self, name) -> int:
+        """
+            Gets the code of a name, adding it to the table of names if it is new.
+
+            :param name:            The name (None if it is null).
+            :return int:            The code of the name.
+        """
+
+        # If the name is null,
+        if name is None:
+            return null_code
+
+        # If the name is new,
+        if name not in self.codes:
+            self.codes[name] = len(self.names)  # Gives the name the next code.
+            self.names.append(name)  # Stores the name.
+            self.name_ranks = None  # Forgets the sort positions (they must include the new name).
+
+        return self.codes[name]  # Returns the code of the name.
+
+    @staticmethod
+    def encode_number(document : dict, field : str) -> (float, int):
+        """
+            Gets the value and kind of a number field of a document.
+
+            :param document:        The document.
+            :param field:           The field.
+            :return (float, int):   The value (0 if it is not a number) and its kind (a ValueError is raised if the
+                                    value cannot be held in the column).
+        """
+
+        # If the document does not have the field,
+        if field not in document:
+            return 0.0, missing_kind
+
+        value = document[field]  # Gets the value.
+
+        # If the value is null,
+        if value is None:
+            return 0.0, null_kind
+
+        # Otherwise if the value is a whole number that can be held exactly,
+        elif isinstance(value, int) and not isinstance(value, bool) and abs(value) <= largest_exact_integer:
+            return float(value), integer_kind
+
+        # Otherwise if the value is a decimal number (NaN is left to the database, it sorts differently),
+        elif isinstance(value, float) and value == value:
+            return value, float_kind
+
+        raise ValueError(f"{field} cannot be held in the snapshot: {value!r}")  # Refuses the value.
+
+    def encode_document(self, document : dict) -> (int, dict, int):
+        """
+            Gets the values of a document in the form held by the columns.
+
+            :param document:        The document.
+            :return (int, dict,
+                     int):          The product ID.
+                                    The (value, kind) of every number field.
+                                    The code of the name (a ValueError is raised if the document cannot be held).
+        """
+
+        product_id = document.get("product_id")  # Gets the product ID.
+
+        # If the product ID is not a whole number,
+        if not isinstance(product_id, int) or isinstance(product_id, bool):
+            raise ValueError(f"product_id cannot be held in the snapshot: {product_id!r}")  # Refuses the document.
+
+        numbers = {field: self.encode_number(document, field) for field in number_fields}  # Gets the numbers.
+
+        # If the document does not have a name,
+        if "product_name" not in document:
+            code = missing_code
+
+        # Otherwise if the name is text or null,
+        elif document["product_name"] is None or isinstance(document["product_name"], str):
+            code = self.intern(document["product_name"])  # Gets the code of the name.
+
+        # Otherwise (the name is neither),
+        else:
+            # Refuses the document.
+            raise ValueError(f"product_name cannot be held in the snapshot: {document['product_name']!r}")
+
+        return product_id, numbers, code  # Returns the values.
+
+    def set_row(self, document : dict):
+        """
+            Adds a document to the snapshot, or replaces the row of its product ID.
+
+            :param document:        The document.
+        """
+
+        product_id, numbers, name = self.encode_document(document)  # Gets the values of the document.
+        row = self.rows.get(product_id)  # Gets the row of the product.
+
+        # If the product is new,
+        if row is None:
+            self.grow(self.size + 1)  # Makes room for the row.
+            row = self.size  # Adds the row at the end.
+            self.size += 1
+            self.rows[product_id] = row
+
+        self.ids[row] = product_id  # Stores the values of the document.
+        self.name_codes[row] = name
+
+        # For every number column,
+        for field, (value, kind) in numbers.items():
+            self.numbers[field][row] = value
+            self.kinds[field][row] = kind
+
+    def remove_row(self, product_id : int):
+        """
+            Removes the row of a product (the last row is moved into its place, so the rows stay packed).
+
+            :param product_id:      The product ID.
+        """
+
+        row = self.rows.pop(product_id, None)  # Gets (and forgets) the row of the product.
+
+        # If the product is not in the snapshot,
+        if row is None:
+            return  # Exits the function.
+
+        last = self.size - 1  # Gets the last row.
+
+        # If the row is not the last row,
+        if row != last:
+            self.ids[row] = self.ids[last]  # Moves the last row into the place of the removed row.
+            self.name_codes[row] = self.name_codes[last]
+
+            # For every number column,
+            for field in number_fields:
+                self.numbers[field][row] = self.numbers[field][last]
+                self.kinds[field][row] = self.kinds[field][last]
+
+            self.rows[int(self.ids[row])] = row  # Updates the row of the moved product.
+
+        self.size = last  # Forgets the last row.
+
+    def load(self, documents, sequence : int):
+        """
+            Replaces the snapshot with a set of documents. The documents are read into new columns that replace the
+                current ones only once every document was read, so a read that fails part way (e.g. a lost connection)
+                never leaves a partly filled snapshot that looks up to date.
+
+            :param documents:       The documents (every product in the collection).
+            :param sequence:        The sequence number of the newest change the documents include.
+        """
+
+        # Only one thread may change the snapshot at a time.
+        with self.lock:
+            staging = InventorySnapshot(self.max_age_seconds)  # Holds the new columns until every document is read.
+
+            # Makes an attempt,
+            try:
+                # For every document,
+                for document in documents:
+                    staging.set_row(document)  # Adds the document.
+
+            # If a document cannot be held in the snapshot, or the documents could not be read,
+            except Exception:
+                self.clear()  # Empties the snapshot.
+                self.loaded = None  # Marks the snapshot as unusable (it is read again on the next use).
+                raise  # Passes the error on.
+
+            # Swaps in the new columns (this also forgets names no longer in use).
+            self.size, self.ids, self.numbers, self.kinds = staging.size, staging.ids, staging.numbers, staging.kinds
+            self.name_codes, self.names, self.codes = staging.name_codes, staging.names, staging.codes
+            self.name_ranks, self.rows = staging.name_ranks, staging.rows
+            self.sequence = sequence  # Remembers the newest change included.
+            self.loaded = time.monotonic()  # Remembers when the snapshot was read.
+            self.reloads += 1  # Counts the read.
+
+    def apply_changes(self, changes : list) -> bool:
+        """
+            Applies changes from the change feed to the snapshot.
+
+            :param changes:         The changes (see ChangeFeed.changes_since()).
+            :return bool:           Whether every change was applied (otherwise the snapshot must be read again).
+        """
+
+        # For every change,
+        for change in changes:
+            fields = change.get("fields")  # Gets the fields the change updated (None if unknown).
+
+            # If any document may have changed, or an update may have moved the row to another product ID,
+            if change["type"] == "reset" or (change["type"] == "update" and (fields is None or "product_id" in fields)):
+                return False  # Returns that the snapshot must be read again.
+
+            # If the product was deleted,
+            if change["type"] == "delete":
+                self.remove_row(change["product_id"])  # Removes its row.
+                continue
+
+            # If the new document is not known,
+            if change.get("document") is None:
+                return False  # Returns that the snapshot must be read again.
+
+            # Makes an attempt,
+            try:
+                self.set_row(change["document"])  # Stores the new document.
+
+            # If the document cannot be held in the snapshot,
+            except ValueError:
+                return False  # Returns that the snapshot must be read again.
+
+        return True  # Returns that every change was applied.
+
+    def refresh(self, change_feed, read_documents) -> bool:
+        """
+            Brings the snapshot up to date, applying the changes made since it was last refreshed or reading it again
+            from the database if it is too old or a change cannot be applied.
+
+            :param change_feed:     The change feed holding the recent writes.
+            :param read_documents:  A function returning every document in the collection (called to read it again).
+            :return bool:           Whether the snapshot can be used (False if a document cannot be held in it).
+        """
+
+        # Only one thread may change the snapshot at a time (the changes must be applied in order).
+        with self.lock:
+            # If the snapshot has been read and is not too old,
+            if self.loaded is not None and time.monotonic() - self.loaded <= self.max_age_seconds:
+                latest, changes, complete = change_feed.changes_since(self.sequence)  # Gets the new changes.
+
+                # If every change was still held and was applied,
+                if complete and self.apply_changes(changes):
+                    self.sequence = latest  # Remembers the newest change applied.
+                    return True  # Returns that the snapshot is up to date.
+
+            # If a document could not be held when the snapshot was last read, and the failure is not too old,
+            if self.failed is not None and time.monotonic() - self.failed <= self.max_age_seconds:
+                latest, changes, complete = change_feed.changes_since(self.failed_sequence)  # Gets the new changes.
+
+                # If no change since could have replaced every document (a bulk write or a drop),
+                if complete and not any(change["type"] == "reset" for change in changes):
+                    self.refused += 1  # Counts the query.
+                    return False  # Returns that the snapshot cannot be used (without reading it again).
+
+            # The changes made while the documents are read are applied again later (applying a change twice is harmless).
+            sequence = change_feed.get_sequence()  # Gets the newest change before the documents are read.
+
+            # Makes an attempt,
+            try:
+                self.load(read_documents(), sequence)  # Reads the snapshot again.
+
+            # If a document cannot be held in the snapshot,
+            except ValueError:
+                self.failed = time.monotonic()  # Remembers the failure (so it is not read again on every request).
+                self.failed_sequence = sequence  # Remembers the newest change before the documents were read.
+                self.refused += 1  # Counts the query.
+                return False  # Returns that the snapshot cannot be used.
+
+            self.failed = None  # Forgets any earlier failure.
+            return True  # Returns that the snapshot is up to date.
+
+    def get_name_ranks(self) -> numpy.ndarray:
+        """
+            Gets the sort position of every interned name (text is ordered by its characters, like MongoDB).
+
+            :return ndarray:        The position of every name, indexed by its code.
+        """
+
+        # If the positions are not known,
+        if self.name_ranks is None:
+            order = sorted(range(len(self.names)), key=self.names.__getitem__)  # Sorts the codes by their names.
+            self.name_ranks = numpy.zeros(len(self.names), dtype="int64")  # Holds the position of every code.
+            self.name_ranks[order] = numpy.arange(len(self.names))  # Stores the positions.
+
+        return self.name_ranks  # Returns the positions.
+
+    def match_condition(self, field : str, operator : str, target, options : str) -> numpy.ndarray:
+        """
+            Gets the rows matching a single condition (with the same results as MongoDB).
+
+            :param field:           The field of the condition.
+            :param operator:        The operator e.g. "$gte".
+            :param target:          The value the operator compares against.
+            :param options:         The options of a $regex condition (e.g. "i").
+            :return ndarray:        A boolean mask of the rows in use (a ValueError is raised for unsupported conditions).
+        """
+
+        # If the value is not a number or text (e.g. null, which also matches missing fields),
+        if isinstance(target, bool) or not isinstance(target, (int, float, str)):
+            raise ValueError(f"Unsupported value: {target!r}")
+
+        # If the operator is an inequality,
+        if operator == "$ne":
+            return ~self.match_condition(field, "$eq", target, options)  # Matches every row that is not equal.
+
+        # If the operator is not supported,
+        if operator not in comparisons and operator != "$regex":
+            raise ValueError(f"Unsupported operator: {operator}")
+
+        # If the field is the name,
+        if field == "product_name":
+            # If the condition is a regular expression,
+            if operator == "$regex":
+                pattern = re.compile(target, re.IGNORECASE if "i" in options else 0)  # Compiles the expression.
+                table = [pattern.search(name) is not None for name in self.names]  # Matches every distinct name.
+
+            # Otherwise if the value is text,
+            elif isinstance(target, str):
+                table = [comparisons[operator](name, target) for name in self.names]  # Compares every distinct name.
+
+            # Otherwise (a number is never equal to, or ordered with, text),
+            else:
+                table = [False] * len(self.names)
+
+            codes = self.name_codes[:self.size]  # Gets the name code of every row.
+            table = numpy.array(table + [False, False], dtype=bool)  # Adds the missing and null codes (never matched).
+            return table[codes]  # Looks up the result of every row by its code (-1 and -2 index the added entries).
+
+        # If the field is not a number field,
+        if field != "product_id" and field not in number_fields:
+            raise ValueError(f"Unsupported field: {field}")
+
+        # If the condition is a regular expression or the value is text (neither matches a number),
+        if operator == "$regex" or isinstance(target, str):
+            return numpy.zeros(self.size, dtype=bool)
+
+        # If the field is the product ID (every row has one),
+        if field == "product_id":
+            return comparisons[operator](self.ids[:self.size], target)
+
+        values = self.numbers[field][:self.size]  # Gets the numbers of every row.
+        present = self.kinds[field][:self.size] >= integer_kind  # Gets the rows holding a number.
+        return present & comparisons[operator](values, target)  # Compares the numbers.
+
+    def match(self, query : dict) -> numpy.ndarray:
+        """
+            Gets the rows matching a query. Supports the queries created from the filters of the DataTable: equalities,
+            comparisons and regular expressions on the product fields, joined with $and.
+
+            :param query:           The query.
+            :return ndarray:        A boolean mask of the rows in use (a ValueError is raised for unsupported queries).
+        """
+
+        mask = numpy.ones(self.size, dtype=bool)  # Holds the rows matching every condition so far.
+
+        # For every key in the query,
+        for key, condition in query.items():
+            # If the key joins other queries,
+            if key == "$and":
+                # For every joined query,
+                for part in condition:
+                    mask &= self.match(part)  # Keeps the rows matching it.
+
+            # Otherwise if the key is another operator,
+            elif key.startswith("$"):
+                raise ValueError(f"Unsupported operator: {key}")
+
+            # Otherwise if the condition is a set of operators,
+            elif isinstance(condition, dict):
+                options = condition.get("$options", "")  # Gets the options of a regular expression.
+
+                # For every operator,
+                for operator, target in condition.items():
+                    # If the operator is not the options of a regular expression,
+                    if operator != "$options":
+                        mask &= self.match_condition(key, operator, target, options)  # Keeps the matching rows.
+
+            # Otherwise (the condition is a plain value),
+            else:
+                mask &= self.match_condition(key, "$eq", condition, "")  # Keeps the equal rows.
+
+        return mask  # Returns the matching rows.
+
+    def get_sort_keys(self, rows : numpy.ndarray, sort : list) -> list:
+        """
+            Gets the keys ordering rows like MongoDB (missing and null values first, then values).
+
+            :param rows:            The rows to order.
+            :param sort:            The (field, direction) pairs, from the most to the least significant.
+            :return list:           The keys for numpy.lexsort (from the least to the most significant).
+        """
+
+        keys = []  # Holds the keys, from the most to the least significant.
+
+        # For every field sorted by,
+        for field, direction in sort:
+            # If the field is the product ID (every row has one),
+            if field == "product_id":
+                field_keys = [self.ids[rows]]
+
+            # Otherwise if the field is the name,
+            elif field == "product_name":
+                codes = self.name_codes[rows]  # Gets the name codes of the rows.
+                present = codes >= 0  # Gets the rows holding text.
+                ranks = numpy.append(self.get_name_ranks(), [0, 0])[codes]  # Gets the position of every name.
+                field_keys = [present.astype("int64"), ranks]
+
+            # Otherwise if the field is a number field,
+            elif field in number_fields:
+                present = self.kinds[field][rows] >= integer_kind  # Gets the rows holding a number.
+                field_keys = [present.astype("int64"), numpy.where(present, self.numbers[field][rows], 0.0)]
+
+            # Otherwise (the field is not held in the snapshot),
+            else:
+                raise ValueError(f"Unsupported field: {field}")
+
+            keys += [-key if direction < 0 else key for key in field_keys]  # Reverses descending keys.
+
+        return keys[::-1]  # Returns the keys, from the least to the most significant.
+
+    def get_record(self, row : int) -> dict:
+        """
+            Gets the document held in a row.
+
+            :param row:             The row.
+            :return dict:           The document (fields the document does not have are left out, like MongoDB).
+        """
+
+        record = {"product_id": int(self.ids[row])}  # Holds the document.
+        code = int(self.name_codes[row])  # Gets the name code of the row.
+
+        # If the document has a name,
+        if code != missing_code:
+            record["product_name"] = None if code == null_code else self.names[code]
+
+        # For every number column,
+        for field in number_fields:
+            kind = self.kinds[field][row]  # Gets the kind of the value.
+
+            # If the document has the field,
+            if kind != missing_kind:
+                value = self.numbers[field][row]  # Gets the value.
+                record[field] = None if kind == null_kind else int(value) if kind == integer_kind else float(value)
+
+        return record  # Returns the document.
+
+    def read_page(self, query : dict, sort : list, skip : int, limit : int) -> (list, int):
+        """
+            Reads a page of documents from the snapshot.
+
+            :param query:           The query (see match()).
+            :param sort:            The (field, direction) pairs to sort by.
+            :param skip:            The number of documents to skip.
+            :param limit:           The most documents returned.
+            :return (list, int):    The documents on the page.
+                                    The total number of documents matching the query.
+                                    A ValueError is raised if the query or sort cannot be served from the snapshot.
+        """
+
+        # Only one thread may use the snapshot at a time.
+        with self.lock:
+            # Makes an attempt,
+            try:
+                rows = numpy.flatnonzero(self.match(query))  # Gets the matching rows.
+                keys = self.get_sort_keys(rows, sort)  # Gets the keys ordering them.
+
+            # If the query or sort cannot be served,
+            except (ValueError, re.error):
+                self.refused += 1  # Counts the refusal.
+                raise ValueError("The query cannot be served from the snapshot.")
+
+            # If the rows are sorted,
+            if keys:
+                rows = rows[numpy.lexsort(keys)]  # Sorts the rows.
+
+            self.served += 1  # Counts the page.
+            return [self.get_record(row) for row in rows[skip:skip + limit]], len(rows)  # Returns the page.
+
+    def get_metrics(self) -> dict:
+        """
+            Gets the size and usage counters of the snapshot.
+
+            :return dict:           The rows and distinct names held, the bytes used by the columns, and how many
+                                    times the snapshot was read, served a page and refused a query.
+        """
+
+        # Only one thread may use the snapshot at a time.
+        with self.lock:
+            # Adds up the bytes used by the columns.
+            column_bytes = self.ids.nbytes + self.name_codes.nbytes + \
+                sum(self.numbers[field].nbytes + self.kinds[field].nbytes for field in number_fields)
+
+            # Returns the metrics.
+            return {"rows": self.size, "names": len(self.names), "bytes": column_bytes, "reloads": self.reloads,
+                    "served": self.served, "refused": self.refused}
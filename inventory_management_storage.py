@@ -0,0 +1,1961 @@
+"""
+    :author:        Jacob Whetham
+    :version:       1.0.0, 04 JAN 2024
+    :desc:          This file handles the local storage engines of the Inventory Management System (in memory and
+                    SQLite). Each engine provides the part of the PyMongo client, database and collection interface
+                    the backend uses, so every backend function works the same without a MongoDB server.
+"""
+
+# Imports
+import contextlib   # Allows for creating transactions used with the "with" statement.
+import json         # Allows for storing documents as JSON text (SQLite).
+import re           # Allows for regular expressions (field names and $regex conditions).
+import sqlite3      # Allows for the use of SQLite.
+import threading    # Allows for locking the engines between the threads serving requests.
+import types        # Allows for creating the results of writes.
+import bson         # Allows for creating "_id" values (installed with PyMongo).
+import pymongo      # Allows for raising the same errors as MongoDB.
+import inventory_management_cache as imc    # Allows for matching queries and applying updates in memory.
+
+# Declare global variables.
+engines = ("memory", "sqlite")                  # The storage engines provided by this file.
+memory_clients = {}                             # The in-memory clients, keyed by their name (shared by every login).
+memory_clients_lock = threading.Lock()          # Prevents two threads from creating the same in-memory client.
+field_pattern = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")  # The field names that can be used in SQL.
+
+
+def get_sort_key(value) -> tuple:
+    """
+        Gets the key that orders a value the way MongoDB orders values of different types.
+
+        :param value:       The value (None if the field is missing).
+        :return tuple:      The key (missing/null values, then numbers, then text, then everything else).
+    """
+
+    # If the value is missing,
+    if value is None:
+        return 0, 0
+
+    # Otherwise if the value is a boolean (ordered after text by MongoDB),
+    elif isinstance(value, bool):
+        return 3, value
+
+    # Otherwise if the value is a number,
+    elif isinstance(value, (int, float)):
+        return 1, value
+
+    # Otherwise if the value is text,
+    elif isinstance(value, str):
+        return 2, value
+
+    return 4, str(value)  # Orders every other value by its text.
+
+
+def get_sort_spec(key_or_list, direction : int =None) -> list:
+    """
+        Converts the arguments of a PyMongo sort into (field, direction) pairs.
+
+        :param key_or_list:     A field name, a list of (field, direction) pairs or a dictionary of them.
+        :param direction:       The direction of a single field.
+        :return list:           The (field, direction) pairs.
+    """
+
+    # If a single field was given,
+    if isinstance(key_or_list, str):
+        return [(key_or_list, pymongo.ASCENDING if direction is None else direction)]
+
+    # Otherwise if a dictionary was given,
+    elif isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+
+    return [] if key_or_list is None else list(key_or_list)  # Returns the pairs.
+
+
+def sort_documents(documents : list, sort : list) -> list:
+    """
+        Sorts documents by (field, direction) pairs.
+
+        :param documents:   The documents to sort.
+        :param sort:        The (field, direction) pairs, from the most to the least significant.
+        :return list:       The sorted documents.
+    """
+
+    documents = list(documents)  # Copies the list of documents.
+
+    # For every field, from the least to the most significant (each sort keeps the order of equal documents),
+    for field, direction in reversed(sort):
+        documents.sort(key=lambda document: get_sort_key(document.get(field)), reverse=direction < 0)
+
+    return documents  # Returns the sorted documents.
+
+
+def apply_projection(document : dict, projection : dict) -> dict:
+    """
+        Copies the fields of a document chosen by a projection.
+
+        :param document:    The document.
+        :param projection:  The projection e.g. {"_id": 0, "product_id": 1}. If None, every field is copied.
+        :return dict:       The projected copy of the document.
+    """
+
+    # If there is no projection,
+    if not projection:
+        return dict(document)  # Copies every field.
+
+    fields = {field: value for field, value in projection.items() if field != "_id"}  # Gets the fields besides "_id".
+    include_id = bool(projection.get("_id", 1))  # Whether the "_id" field is kept.
+
+    # If the projection lists the fields to keep,
+    if any(fields.values()):
+        projected = {field: document[field] for field, value in fields.items() if value and field in document}
+
+        # If the "_id" field is kept,
+        if include_id and "_id" in document:
+            projected = {"_id": document["_id"], **projected}  # Keeps the "_id" field first (like MongoDB).
+
+    # Otherwise (the projection lists the fields to remove),
+    else:
+        projected = {field: value for field, value in document.items() if field not in fields}
+
+        # If the "_id" field is removed,
+        if not include_id:
+            projected.pop("_id", None)
+
+    return projected  # Returns the projected copy.
+
+
+def evaluate(expression, document : dict):
+    """
+        Evaluates an aggregation expression against a document. Supports field paths (e.g. "$product_price"),
+        literals and the operators used by the backend ($multiply, $add, $subtract, $ifNull, $cond, $isNumber,
+        $eq, $ne, $lt, $lte, $gt, $gte and $literal).
+
+        :param expression:  The expression.
+        :param document:    The document.
+        :return object:     The value of the expression (an error is raised for unsupported operators).
+    """
+
+    # If the expression is a field path,
+    if isinstance(expression, str) and expression.startswith("$"):
+        return document.get(expression[1:])  # Returns the value of the field.
+
+    # Otherwise if the expression is a list,
+    elif isinstance(expression, list):
+        return [evaluate(item, document) for item in expression]  # Evaluates every item.
+
+    # Otherwise if the expression is a literal,
+    elif not isinstance(expression, dict):
+        return expression  # Returns the literal.
+
+    # If the expression is not a single operator,
+    if len(expression) != 1:
+        raise ValueError(f"Unsupported expression: {expression}")  # Refuses the expression.
+
+    operator, arguments = next(iter(expression.items()))  # Gets the operator and its arguments.
+
+    # If the operator returns its argument as it is,
+    if operator == "$literal":
+        return arguments
+
+    # Otherwise if the operator chooses between two expressions (only the chosen expression is evaluated),
+    elif operator == "$cond":
+        condition, then, otherwise = (arguments["if"], arguments["then"], arguments["else"]) \
+            if isinstance(arguments, dict) else arguments
+        return evaluate(then if evaluate(condition, document) else otherwise, document)
+
+    values = evaluate(arguments if isinstance(arguments, list) else [arguments], document)  # Evaluates the arguments.
+
+    # If the operator returns the first value that is not null,
+    if operator == "$ifNull":
+        return next((value for value in values if value is not None), None)
+
+    # Otherwise if the operator checks for a number,
+    elif operator == "$isNumber":
+        return isinstance(values[0], (int, float)) and not isinstance(values[0], bool)
+
+    # Otherwise if the operator is arithmetic (null if any value is null, like MongoDB),
+    elif operator in ("$multiply", "$add", "$subtract"):
+        # If any value is missing,
+        if any(value is None for value in values):
+            return None
+
+        # If the operator subtracts,
+        if operator == "$subtract":
+            return values[0] - values[1]
+
+        result = 1 if operator == "$multiply" else 0  # Holds the result.
+
+        # For every value,
+        for value in values:
+            result = result * value if operator == "$multiply" else result + value
+
+        return result  # Returns the result.
+
+    # Otherwise if the operator compares two values (values of different types are ordered like MongoDB),
+    elif operator in ("$eq", "$ne", "$lt", "$lte", "$gt", "$gte"):
+        first, second = get_sort_key(values[0]), get_sort_key(values[1])  # Gets the keys of the values.
+        return {"$eq": first == second, "$ne": first != second, "$lt": first < second, "$lte": first <= second,
+                "$gt": first > second, "$gte": first >= second}[operator]
+
+    raise ValueError(f"Unsupported operator: {operator}")  # Refuses the operator.
+
+
+def project_document(document : dict, specification : dict) -> dict:
+    """
+        Applies the $project stage of an aggregation pipeline to a document.
+
+        :param document:        The document.
+        :param specification:   The $project stage e.g. {"_id": 0, "group": "$_id", "total_value": 1}.
+        :return dict:           The projected document.
+    """
+
+    fields = {field: value for field, value in specification.items() if field != "_id"}  # Gets the fields besides "_id".
+
+    # If the stage only lists the fields to remove,
+    if all(isinstance(value, (bool, int)) and not value for value in fields.values()):
+        return apply_projection(document, specification)  # Removes the fields.
+
+    projected = {}  # Holds the projected document.
+    identifier = specification.get("_id", 1)  # Gets what happens to the "_id" field.
+
+    # If the "_id" field is kept as it is,
+    if isinstance(identifier, (bool, int)) and identifier:
+        # If the document has an "_id" field,
+        if "_id" in document:
+            projected["_id"] = document["_id"]  # Keeps it.
+
+    # Otherwise if the "_id" field is calculated,
+    elif not isinstance(identifier, (bool, int)):
+        projected["_id"] = evaluate(identifier, document)  # Calculates it.
+
+    # For every other field,
+    for field, value in fields.items():
+        # If the field is kept as it is,
+        if isinstance(value, (bool, int)) and value:
+            # If the document has the field,
+            if field in document:
+                projected[field] = document[field]  # Keeps it.
+
+        # Otherwise (the field is calculated),
+        else:
+            projected[field] = evaluate(value, document)  # Calculates it.
+
+    return projected  # Returns the projected document.
+
+
+def group_documents(documents : list, specification : dict) -> list:
+    """
+        Applies the $group stage of an aggregation pipeline. Supports the $sum, $avg, $min, $max, $first, $last
+        and $push accumulators.
+
+        :param documents:       The documents to group.
+        :param specification:   The $group stage e.g. {"_id": "$product_name", "units": {"$sum": "$product_quantity"}}.
+        :return list:           One document for every group, in the order the groups were first seen.
+    """
+
+    groups = {}  # Holds the key and accumulated values of every group, keyed by the key as text.
+
+    # For every document,
+    for document in documents:
+        key = evaluate(specification["_id"], document)  # Gets the key of the group of the document.
+        group = groups.setdefault(json.dumps(key, sort_keys=True, default=str), {"_id": key})  # Gets the group.
+
+        # For every accumulated field,
+        for field, accumulator in specification.items():
+            # If the field is the key of the group,
+            if field == "_id":
+                continue  # Skips it (it is not accumulated).
+
+            operator, argument = next(iter(accumulator.items()))  # Gets the accumulator and its argument.
+            value = evaluate(argument, document)  # Evaluates the argument.
+            number = isinstance(value, (int, float)) and not isinstance(value, bool)  # Whether the value is a number.
+
+            # If the values are added up (values that are not numbers are ignored, like MongoDB),
+            if operator == "$sum":
+                group[field] = group.get(field, 0) + (value if number else 0)
+
+            # Otherwise if the values are averaged,
+            elif operator == "$avg":
+                total, count = group.get(field, (0, 0))  # Gets the running total and count.
+                group[field] = (total + value, count + 1) if number else (total, count)
+
+            # Otherwise if the lowest or highest value is kept (missing values are ignored),
+            elif operator in ("$min", "$max"):
+                # If the value is not missing,
+                if value is not None:
+                    current = group.get(field)  # Gets the value kept so far.
+                    better = get_sort_key(value) < get_sort_key(current) if operator == "$min" else \
+                        get_sort_key(value) > get_sort_key(current)
+
+                    # If no value was kept yet or the value is better,
+                    if current is None or better:
+                        group[field] = value  # Keeps the value.
+
+            # Otherwise if the first value is kept,
+            elif operator == "$first":
+                group.setdefault(field, value)
+
+            # Otherwise if the last value is kept,
+            elif operator == "$last":
+                group[field] = value
+
+            # Otherwise if every value is kept,
+            elif operator == "$push":
+                group.setdefault(field, []).append(value)
+
+            # Otherwise (the accumulator is not supported),
+            else:
+                raise ValueError(f"Unsupported accumulator: {operator}")  # Refuses the accumulator.
+
+    # For every group,
+    for group in groups.values():
+        # For every accumulated field,
+        for field, accumulator in specification.items():
+            # If the field is an average,
+            if field != "_id" and "$avg" in accumulator:
+                total, count = group.get(field, (0, 0))  # Gets the running total and count.
+                group[field] = total / count if count else None  # Calculates the average.
+
+    return list(groups.values())  # Returns the groups.
+
+
+def run_pipeline(documents : list, pipeline : list) -> list:
+    """
+        Runs the stages of an aggregation pipeline in memory. Supports the $match, $sort, $skip, $limit,
+        $addFields, $set, $project, $group and $count stages.
+
+        :param documents:   The documents going into the pipeline.
+        :param pipeline:    The stages of the pipeline.
+        :return list:       The documents coming out of the pipeline (an error is raised for unsupported stages).
+    """
+
+    # For every stage of the pipeline,
+    for stage in pipeline:
+        name, specification = next(iter(stage.items()))  # Gets the name and specification of the stage.
+
+        # If the stage filters the documents,
+        if name == "$match":
+            documents = [document for document in documents if imc.document_matches(specification, document)]
+
+        # Otherwise if the stage sorts the documents,
+        elif name == "$sort":
+            documents = sort_documents(documents, get_sort_spec(specification))
+
+        # Otherwise if the stage skips documents,
+        elif name == "$skip":
+            documents = documents[specification:]
+
+        # Otherwise if the stage limits the number of documents,
+        elif name == "$limit":
+            documents = documents[:specification]
+
+        # Otherwise if the stage adds fields,
+        elif name in ("$addFields", "$set"):
+            documents = [{**document, **{field: evaluate(expression, document)
+                                         for field, expression in specification.items()}} for document in documents]
+
+        # Otherwise if the stage chooses the fields,
+        elif name == "$project":
+            documents = [project_document(document, specification) for document in documents]
+
+        # Otherwise if the stage groups the documents,
+        elif name == "$group":
+            documents = group_documents(documents, specification)
+
+        # Otherwise if the stage counts the documents,
+        elif name == "$count":
+            documents = [{specification: len(documents)}] if documents else []
+
+        # Otherwise (the stage is not supported),
+        else:
+            raise ValueError(f"Unsupported stage: {name}")  # Refuses the stage.
+
+    return list(documents)  # Returns the documents.
+
+
+def get_upsert_document(query : dict, data : dict) -> dict:
+    """
+        Creates the document inserted by an upsert that matched nothing (like MongoDB, the equality conditions of the
+        query are used as the starting fields).
+
+        :param query:       The query of the upsert.
+        :param data:        The update (or replacement document) of the upsert.
+        :return dict:       The document to insert.
+    """
+
+    document = {}  # Holds the starting fields.
+
+    # For every condition of the query,
+    for field, condition in query.items():
+        # If the condition is an operator ($and, $or, ...),
+        if field.startswith("$"):
+            continue  # Skips it (it is not an equality).
+
+        # If the condition is an $eq operator,
+        if isinstance(condition, dict) and set(condition) == {"$eq"}:
+            document[field] = condition["$eq"]
+
+        # Otherwise if the condition is a plain value,
+        elif not isinstance(condition, dict) or not any(name.startswith("$") for name in condition):
+            document[field] = condition
+
+    # If the upsert is a replacement document,
+    if imc.get_update_fields(data) is None:
+        return {**({"_id": document["_id"]} if "_id" in document else {}), **data}  # Only keeps the "_id" field.
+
+    return imc.apply_update(document, data)  # Applies the update to the starting fields.
+
+
+def get_bulk_request(request) -> (str, dict, dict, bool):
+    """
+        Reads a PyMongo bulk write operation.
+
+        :param request:     The operation (InsertOne, UpdateOne, ReplaceOne or DeleteOne).
+        :return (str, dict,
+                 dict,
+                 bool):     The kind of operation ("insert", "update", "replace" or "delete").
+                            The query of the operation (None for insertions).
+                            The document or update of the operation (None for deletions).
+                            Whether the operation is an upsert.
+    """
+
+    # PyMongo does not expose the parts of its operations, so they are read from their (long stable) attributes.
+
+    # If the operation is an insertion,
+    if isinstance(request, pymongo.InsertOne):
+        return "insert", None, request._doc, False
+
+    # Otherwise if the operation is an update,
+    elif isinstance(request, pymongo.UpdateOne):
+        return "update", request._filter, request._doc, bool(request._upsert)
+
+    # Otherwise if the operation is a replacement,
+    elif isinstance(request, pymongo.ReplaceOne):
+        return "replace", request._filter, request._doc, bool(request._upsert)
+
+    # Otherwise if the operation is a deletion,
+    elif isinstance(request, pymongo.DeleteOne):
+        return "delete", request._filter, None, False
+
+    raise TypeError(f"Unsupported operation: {request}")  # Refuses the operation.
+
+
+def get_index_name(keys : list) -> str:
+    """
+        Gets the default name of an index (the same name MongoDB gives it).
+
+        :param keys:        The (field, direction) pairs of the index.
+        :return str:        The name e.g. "product_name_1_product_id_1".
+    """
+
+    return "_".join(f"{field}_{direction}" for field, direction in keys)  # Returns the name.
+
+
+class StorageCursor:
+    """
+        The result of a search in a local storage engine (the part of the PyMongo Cursor the backend uses).
+    """
+
+    def __init__(self, collection, query : dict, projection : dict):
+        """
+            Creates a cursor that has not read anything yet.
+
+            :param collection:      The collection to search.
+            :param query:           The query of the search.
+            :param projection:      The fields to return (None for every field).
+        """
+
+        self.collection = collection    # The collection to search.
+        self.query = query or {}        # The query of the search.
+        self.projection = projection    # The fields to return.
+        self.sort_spec = []             # The (field, direction) pairs the results are sorted by.
+        self.skip_count = 0             # The number of results skipped.
+        self.limit_count = 0            # The most results returned (0 for no limit).
+        self.results = None             # The results (read the first time the cursor is iterated).
+
+    def sort(self, key_or_list, direction : int =None):
+        """
+            Sorts the results.
+
+            :param key_or_list:     A field name or a list of (field, direction) pairs.
+            :param direction:       The direction of a single field.
+            :return StorageCursor:  The cursor.
+        """
+
+        self.sort_spec = get_sort_spec(key_or_list, direction)  # Stores the sort.
+        return self  # Returns the cursor (so calls can be chained).
+
+    def skip(self, count : int):
+        """
+            Skips results.
+
+            :param count:           The number of results to skip.
+            :return StorageCursor:  The cursor.
+        """
+
+        self.skip_count = count  # Stores the number of results to skip.
+        return self  # Returns the cursor (so calls can be chained).
+
+    def limit(self, count : int):
+        """
+            Limits the number of results.
+
+            :param count:           The most results returned (0 for no limit).
+            :return StorageCursor:  The cursor.
+        """
+
+        self.limit_count = count  # Stores the limit.
+        return self  # Returns the cursor (so calls can be chained).
+
+    def batch_size(self, size : int):
+        """
+            Accepts a batch size (the results are held locally, so there are no round trips to batch).
+
+            :param size:            The batch size.
+            :return StorageCursor:  The cursor.
+        """
+
+        return self  # Returns the cursor (so calls can be chained).
+
+    def explain(self) -> dict:
+        """
+            Reports how the engine runs the search.
+
+            :return dict:           The plan in the shape of the MongoDB explain output.
+        """
+
+        return self.collection.explain_query(self.query, self.sort_spec)  # Returns the plan.
+
+    def close(self):
+        """
+            Closes the cursor (releases its results).
+        """
+
+        self.results = iter(())  # Empties the results.
+
+    def __iter__(self):
+        """
+            Gets the iterator of the results.
+
+            :return StorageCursor:  The cursor.
+        """
+
+        return self  # Returns the cursor (it is its own iterator, like a PyMongo Cursor).
+
+    def __next__(self) -> dict:
+        """
+            Gets the next result, reading every result the first time it is called.
+
+            :return dict:           The next result (StopIteration is raised when there are no results left).
+        """
+
+        # If the results have not been read yet,
+        if self.results is None:
+            # Reads the results.
+            documents = self.collection.find_documents(self.query, self.sort_spec, self.skip_count, self.limit_count)
+            self.results = (apply_projection(document, self.projection) for document in documents)
+
+        return next(self.results)  # Returns the next result.
+
+
+class StorageCollection:
+    """
+        A collection in a local storage engine (the part of the PyMongo Collection the backend uses). The engines
+        provide find_documents(), count_matching(), insert_document(), replace_document(), remove_document(),
+        add_index(), explain_query() and drop(); everything else is shared.
+    """
+
+    def __init__(self, database, name : str):
+        """
+            Creates a reference to a collection.
+
+            :param database:    The database holding the collection.
+            :param name:        The name of the collection.
+        """
+
+        self.database = database                    # The database holding the collection.
+        self.name = name                            # The name of the collection.
+        self.full_name = f"{database.name}.{name}"  # The name of the collection within the engine.
+
+    def transaction(self, write : bool =True):
+        """
+            Starts a transaction (writes within it are applied together and no other thread can interleave).
+
+            :param write:       Whether the transaction writes (a read-only transaction does not lock out the writers
+                                of other processes).
+            :return object:     The context manager of the transaction.
+        """
+
+        return self.database.client.transaction(write)  # Returns the transaction of the engine.
+
+    def find(self, filter : dict =None, projection : dict =None, batch_size : int =0, sort : list =None,
+             skip : int =0, limit : int =0) -> StorageCursor:
+        """
+            Searches the collection.
+
+            :param filter:          The query of the search.
+            :param projection:      The fields to return (None for every field).
+            :param batch_size:      Ignored (the results are held locally).
+            :param sort:            The (field, direction) pairs to sort by, if any.
+            :param skip:            The number of results to skip.
+            :param limit:           The most results returned (0 for no limit).
+            :return StorageCursor:  The cursor of the search.
+        """
+
+        return StorageCursor(self, filter, projection).sort(sort).skip(skip).limit(limit)  # Returns the cursor.
+
+    def find_one(self, filter : dict =None, projection : dict =None, sort : list =None) -> dict:
+        """
+            Gets the first document matching a query.
+
+            :param filter:          The query.
+            :param projection:      The fields to return (None for every field).
+            :param sort:            The (field, direction) pairs to sort by, if any.
+            :return dict:           The document, or None if nothing matched.
+        """
+
+        return next(self.find(filter, projection, sort=sort, limit=1), None)  # Returns the first document.
+
+    def count_documents(self, filter : dict) -> int:
+        """
+            Counts the documents matching a query.
+
+            :param filter:          The query.
+            :return int:            The number of matching documents.
+        """
+
+        # Only one thread may use the engine at a time.
+        with self.transaction(write=False):
+            return self.count_matching(filter or {})  # Returns the number of matching documents.
+
+    def estimated_document_count(self) -> int:
+        """
+            Counts every document in the collection.
+
+            :return int:            The number of documents.
+        """
+
+        return self.count_documents({})  # Returns the number of documents.
+
+    def find_match(self, query : dict, sort : list =None) -> dict:
+        """
+            Gets the first document matching a query (the transaction must already be started).
+
+            :param query:           The query.
+            :param sort:            The (field, direction) pairs to sort by, if any.
+            :return dict:           The document, or None if nothing matched.
+        """
+
+        return next(iter(self.find_documents(query or {}, get_sort_spec(sort), 0, 1)), None)  # Returns the document.
+
+    def insert_new(self, document : dict) -> object:
+        """
+            Inserts a document, giving it an "_id" field if it does not have one (the transaction must already be
+            started).
+
+            :param document:        The document (an "_id" field is added to it, like PyMongo).
+            :return object:         The "_id" of the document.
+        """
+
+        # If the document does not have an "_id" field,
+        if "_id" not in document:
+            document["_id"] = bson.ObjectId()  # Gives it a new "_id".
+
+        self.insert_document(dict(document))  # Inserts a copy of the document.
+        return document["_id"]  # Returns the "_id" of the document.
+
+    def write_one(self, kind : str, query : dict, data : dict, upsert : bool, sort : list =None) -> (dict, dict):
+        """
+            Updates, replaces or deletes the first document matching a query (the transaction must already be
+            started).
+
+            :param kind:            The kind of write ("update", "replace" or "delete").
+            :param query:           The query of the document.
+            :param data:            The update or replacement document (None for deletions).
+            :param upsert:          Whether a document is inserted if nothing matched.
+            :param sort:            The (field, direction) pairs choosing the first matching document, if any.
+            :return (dict, dict):   The document before the write (None if nothing matched).
+                                    The document after the write (None if it was deleted or nothing matched).
+        """
+
+        previous = self.find_match(query, sort)  # Gets the document to write.
+
+        # If a document matched,
+        if previous is not None:
+            # If the document is deleted,
+            if kind == "delete":
+                self.remove_document(previous)  # Deletes it.
+                return previous, None  # Returns the deleted document.
+
+            # If the document is replaced,
+            if kind == "replace":
+                # If the replacement document has update operators,
+                if imc.get_update_fields(data) is not None:
+                    raise ValueError("The replacement document must not contain update operators.")
+
+                document = dict(data)  # Copies the replacement document.
+
+            # Otherwise (the document is updated),
+            else:
+                document = imc.apply_update(previous, data)  # Applies the update.
+
+            document["_id"] = previous["_id"]  # Keeps the "_id" of the document.
+
+            # If the document changed,
+            if document != previous:
+                self.replace_document(previous, document)  # Stores the new document.
+
+            return previous, document  # Returns the document before and after the write.
+
+        # If a document should be inserted when nothing matched,
+        if upsert and kind != "delete":
+            document = get_upsert_document(query, data)  # Creates the document.
+            self.insert_new(document)  # Inserts it.
+            return None, document  # Returns the inserted document.
+
+        return None, None  # Returns that nothing matched.
+
+    def insert_one(self, document : dict) -> types.SimpleNamespace:
+        """
+            Inserts a document.
+
+            :param document:        The document (an "_id" field is added to it, like PyMongo).
+            :return SimpleNamespace:    The result (with "inserted_id").
+        """
+
+        # Applies the write in a transaction.
+        with self.transaction():
+            return types.SimpleNamespace(inserted_id=self.insert_new(document), acknowledged=True)
+
+    def insert_many(self, documents : list, ordered : bool =True) -> types.SimpleNamespace:
+        """
+            Inserts documents.
+
+            :param documents:       The documents (an "_id" field is added to each, like PyMongo).
+            :param ordered:         Whether to stop at the first error.
+            :return SimpleNamespace:    The result (with "inserted_ids").
+        """
+
+        self.bulk_write([pymongo.InsertOne(document) for document in documents], ordered)  # Inserts the documents.
+        return types.SimpleNamespace(inserted_ids=[document.get("_id") for document in documents], acknowledged=True)
+
+    def update_one(self, filter : dict, update : dict, upsert : bool =False) -> types.SimpleNamespace:
+        """
+            Updates the first document matching a query.
+
+            :param filter:          The query.
+            :param update:          The update e.g. {"$set": {...}}.
+            :param upsert:          Whether a document is inserted if nothing matched.
+            :return SimpleNamespace:    The result (with "matched_count", "modified_count" and "upserted_id").
+        """
+
+        # Applies the write in a transaction.
+        with self.transaction():
+            previous, document = self.write_one("update", filter, update, upsert)
+
+        return self.get_write_result(previous, document)  # Returns the result.
+
+    def replace_one(self, filter : dict, replacement : dict, upsert : bool =False) -> types.SimpleNamespace:
+        """
+            Replaces the first document matching a query.
+
+            :param filter:          The query.
+            :param replacement:     The replacement document.
+            :param upsert:          Whether a document is inserted if nothing matched.
+            :return SimpleNamespace:    The result (with "matched_count", "modified_count" and "upserted_id").
+        """
+
+        # Applies the write in a transaction.
+        with self.transaction():
+            previous, document = self.write_one("replace", filter, replacement, upsert)
+
+        return self.get_write_result(previous, document)  # Returns the result.
+
+    def delete_one(self, filter : dict) -> types.SimpleNamespace:
+        """
+            Deletes the first document matching a query.
+
+            :param filter:          The query.
+            :return SimpleNamespace:    The result (with "deleted_count").
+        """
+
+        # Applies the write in a transaction.
+        with self.transaction():
+            previous, document = self.write_one("delete", filter, None, False)
+
+        return types.SimpleNamespace(deleted_count=0 if previous is None else 1, acknowledged=True)
+
+    @staticmethod
+    def get_write_result(previous : dict, document : dict) -> types.SimpleNamespace:
+        """
+            Creates the result of an update or replacement.
+
+            :param previous:        The document before the write (None if nothing matched).
+            :param document:        The document after the write (None if nothing was written).
+            :return SimpleNamespace:    The result (with "matched_count", "modified_count" and "upserted_id").
+        """
+
+        # Returns the result.
+        return types.SimpleNamespace(matched_count=0 if previous is None else 1,
+                                     modified_count=int(previous is not None and previous != document),
+                                     upserted_id=document["_id"] if previous is None and document else None,
+                                     acknowledged=True)
+
+    def find_one_and_update(self, filter : dict, update : dict, projection : dict =None, sort : list =None,
+                            upsert : bool =False, return_document : bool =pymongo.ReturnDocument.BEFORE) -> dict:
+        """
+            Updates the first document matching a query and returns it.
+
+            :param filter:          The query.
+            :param update:          The update e.g. {"$set": {...}}.
+            :param projection:      The fields to return (None for every field).
+            :param sort:            The (field, direction) pairs choosing the first matching document, if any.
+            :param upsert:          Whether a document is inserted if nothing matched.
+            :param return_document: Whether the document is returned as it was before or after the update.
+            :return dict:           The document, or None if nothing matched (and no document was upserted).
+        """
+
+        # Applies the write in a transaction.
+        with self.transaction():
+            previous, document = self.write_one("update", filter, update, upsert, sort)
+
+        # Gets the document to return.
+        returned = document if return_document == pymongo.ReturnDocument.AFTER else previous
+        return None if returned is None else apply_projection(returned, projection)  # Returns the document.
+
+    def find_one_and_delete(self, filter : dict, projection : dict =None, sort : list =None) -> dict:
+        """
+            Deletes the first document matching a query and returns it.
+
+            :param filter:          The query.
+            :param projection:      The fields to return (None for every field).
+            :param sort:            The (field, direction) pairs choosing the first matching document, if any.
+            :return dict:           The deleted document, or None if nothing matched.
+        """
+
+        # Applies the write in a transaction.
+        with self.transaction():
+            previous, document = self.write_one("delete", filter, None, False, sort)
+
+        return None if previous is None else apply_projection(previous, projection)  # Returns the deleted document.
+
+    def bulk_write(self, requests : list, ordered : bool =True) -> types.SimpleNamespace:
+        """
+            Applies a list of PyMongo write operations in one transaction.
+
+            :param requests:        The operations (InsertOne, UpdateOne, ReplaceOne or DeleteOne).
+            :param ordered:         Whether to stop at the first error.
+            :return SimpleNamespace:    The result (with the counts of every kind of write). A BulkWriteError with
+                                        the same details as MongoDB is raised if any operation failed.
+        """
+
+        # Holds the counts and errors, in the shape of the details of a MongoDB BulkWriteError.
+        details = {"writeErrors": [], "nInserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0, "nUpserted": 0,
+                   "upserted": []}
+
+        # Applies the writes in a transaction.
+        with self.transaction():
+            # For every operation,
+            for index, request in enumerate(requests):
+                # Makes an attempt,
+                try:
+                    kind, query, data, upsert = get_bulk_request(request)  # Reads the operation.
+
+                    # If the operation is an insertion,
+                    if kind == "insert":
+                        self.insert_new(data)  # Inserts the document.
+                        details["nInserted"] += 1  # Counts the insertion.
+                        continue
+
+                    previous, document = self.write_one(kind, query, data, upsert)  # Applies the write.
+
+                    # If a document was deleted,
+                    if kind == "delete":
+                        details["nRemoved"] += 0 if previous is None else 1
+
+                    # Otherwise if a document was upserted,
+                    elif previous is None and document is not None:
+                        details["nUpserted"] += 1
+                        details["upserted"].append({"index": index, "_id": document["_id"]})
+
+                    # Otherwise if a document matched,
+                    elif previous is not None:
+                        details["nMatched"] += 1
+                        details["nModified"] += int(previous != document)
+
+                # If the operation broke a unique index,
+                except pymongo.errors.DuplicateKeyError as error:
+                    details["writeErrors"].append({"index": index, "code": 11000, "errmsg": str(error)})
+
+                # If the operation is not valid,
+                except (TypeError, ValueError) as error:
+                    details["writeErrors"].append({"index": index, "code": 2, "errmsg": str(error)})
+
+                # If an operation failed and the writes are ordered,
+                if details["writeErrors"] and ordered:
+                    break  # Stops at the failed operation (like MongoDB).
+
+        # If any operation failed,
+        if details["writeErrors"]:
+            raise pymongo.errors.BulkWriteError(details)  # Reports what was and was not written.
+
+        # Returns the counts of the writes.
+        return types.SimpleNamespace(inserted_count=details["nInserted"], matched_count=details["nMatched"],
+                                     modified_count=details["nModified"], deleted_count=details["nRemoved"],
+                                     upserted_count=details["nUpserted"],
+                                     upserted_ids={item["index"]: item["_id"] for item in details["upserted"]},
+                                     acknowledged=True)
+
+    def aggregate(self, pipeline : list) -> StorageCursor:
+        """
+            Runs an aggregation pipeline. The leading $match, $sort, $skip and $limit stages are answered by the engine
+            (using its indexes); the other stages run in memory.
+
+            :param pipeline:        The stages of the pipeline.
+            :return iterator:       The documents coming out of the pipeline.
+        """
+
+        leading = {"$match": {}, "$sort": [], "$skip": 0, "$limit": 0}  # Holds the stages answered by the engine.
+        position = 0  # Holds the position of the first stage run in memory.
+
+        # For every stage the engine can answer (in the order the engine applies them),
+        for name in leading:
+            # If the next stage of the pipeline is the stage,
+            if position < len(pipeline) and name in pipeline[position]:
+                leading[name] = pipeline[position][name]  # Gets the specification of the stage.
+                position += 1  # Moves to the next stage.
+
+        # Reads the documents going into the rest of the pipeline.
+        documents = self.find_documents(leading["$match"], get_sort_spec(leading["$sort"]), leading["$skip"],
+                                        leading["$limit"])
+
+        return iter(run_pipeline(documents, pipeline[position:]))  # Runs the rest of the pipeline.
+
+    def create_index(self, keys, name : str =None, unique : bool =False, **kwargs) -> str:
+        """
+            Creates an index (creating an index that already exists does nothing).
+
+            :param keys:            A field name or a list of (field, direction) pairs.
+            :param name:            The name of the index. If None, the MongoDB default name is used.
+            :param unique:          Whether two documents may not share the indexed values.
+            :return str:            The name of the index.
+        """
+
+        keys = get_sort_spec(keys)  # Gets the (field, direction) pairs.
+        name = get_index_name(keys) if name is None else name  # Gets the name of the index.
+
+        # Creates the index in a transaction.
+        with self.transaction():
+            self.add_index(keys, name, unique)
+
+        return name  # Returns the name of the index.
+
+    def watch(self, *args, **kwargs):
+        """
+            Refuses to open a change stream (the local engines do not have one).
+        """
+
+        # Raises the same error as a MongoDB server that does not support change streams.
+        raise pymongo.errors.OperationFailure("The local storage engines do not support change streams.")
+
+
+class StorageDatabase:
+    """
+        A database in a local storage engine (the part of the PyMongo Database the backend uses).
+    """
+
+    def __init__(self, client, name : str):
+        """
+            Creates a reference to a database.
+
+            :param client:      The client of the engine.
+            :param name:        The name of the database.
+        """
+
+        self.client = client    # The client of the engine.
+        self.name = name        # The name of the database.
+
+    def __getitem__(self, name : str) -> StorageCollection:
+        """
+            Gets a collection of the database (it is created when it is first written to).
+
+            :param name:        The name of the collection.
+            :return StorageCollection:  The collection.
+        """
+
+        return self.client.get_collection(self, name)  # Returns the collection.
+
+    def list_collection_names(self, filter : dict =None) -> list:
+        """
+            Gets the names of every collection in the database.
+
+            :param filter:      Only lists the collection with a name, if given e.g. {"name": "products"}.
+            :return list:       The names of the collections.
+        """
+
+        names = self.client.list_collection_names(self.name)  # Gets the names.
+        return names if not filter else [name for name in names if name == filter.get("name")]  # Returns the names.
+
+
+class MemoryCollection(StorageCollection):
+    """
+        A collection held in memory. Documents are found by "_id" and by every single-field index through hash
+        indexes (e.g. the unique product_id index); other queries scan the collection.
+    """
+
+    def __init__(self, database, name : str):
+        """
+            Creates an empty collection.
+
+            :param database:    The database holding the collection.
+            :param name:        The name of the collection.
+        """
+
+        super().__init__(database, name)  # Creates the reference to the collection.
+        self.documents = {}                                             # The documents, keyed by their "_id".
+        self.indexes = {"_id_": {"key": [("_id", 1)], "unique": True}}  # The definition of every index.
+        self.hash_indexes = {}                                          # The "_id" values of every value of a field.
+        self.unique_fields = set()                                      # The fields with a unique index.
+
+    @staticmethod
+    def get_hash_value(value):
+        """
+            Gets a value that can be used as a dictionary key.
+
+            :param value:       The value.
+            :return object:     The value, or its JSON text if it cannot be used as a key (e.g. a list).
+        """
+
+        # Makes an attempt,
+        try:
+            hash(value)  # Checks whether the value can be used as a key.
+            return value  # Returns the value.
+
+        # If the value cannot be used as a key,
+        except TypeError:
+            return json.dumps(value, sort_keys=True, default=str)  # Returns its JSON text.
+
+    def get_candidates(self, query : dict) -> list:
+        """
+            Gets the documents that could match a query, using the hash indexes when the query has an equality on
+            an indexed field.
+
+            :param query:       The query.
+            :return list:       The candidate documents (every document if no index can be used).
+        """
+
+        # For every field with a hash index (and "_id"),
+        for field in ["_id", *self.hash_indexes]:
+            condition = query.get(field)  # Gets the condition on the field.
+
+            # If the field has no condition,
+            if field not in query:
+                continue
+
+            # Gets the values the field must equal (None if the condition is not an equality).
+            if isinstance(condition, dict) and set(condition) == {"$eq"}:
+                values = [condition["$eq"]]
+            elif isinstance(condition, dict) and set(condition) == {"$in"}:
+                values = list(condition["$in"])
+            elif isinstance(condition, dict) and any(name.startswith("$") for name in condition):
+                values = None
+            else:
+                values = [condition]
+
+            # If the condition is an equality,
+            if values is not None:
+                # If the field is "_id",
+                if field == "_id":
+                    keys = [self.get_hash_value(value) for value in values]  # The "_id" values are the keys.
+
+                # Otherwise (the field has a hash index),
+                else:
+                    index = self.hash_indexes[field]  # Gets the index of the field.
+                    keys = [key for value in values for key in index.get(self.get_hash_value(value), ())]
+
+                # Returns the documents with the values.
+                return [self.documents[key] for key in dict.fromkeys(keys) if key in self.documents]
+
+        return list(self.documents.values())  # Returns every document.
+
+    def find_documents(self, query : dict, sort : list, skip : int, limit : int) -> list:
+        """
+            Gets copies of the documents matching a query.
+
+            :param query:       The query.
+            :param sort:        The (field, direction) pairs to sort by.
+            :param skip:        The number of documents to skip.
+            :param limit:       The most documents returned (0 for no limit).
+            :return list:       The documents.
+        """
+
+        # Only one thread may use the engine at a time.
+        with self.transaction(write=False):
+            candidates = self.get_candidates(query or {})  # Gets the documents that could match.
+
+            # If the documents are not sorted,
+            if not sort:
+                matched = []  # Holds the matching documents.
+
+                # For every candidate,
+                for document in candidates:
+                    # If the candidate matches,
+                    if imc.document_matches(query or {}, document):
+                        matched.append(document)  # Stores the document.
+
+                        # If enough documents were found,
+                        if limit and len(matched) >= skip + limit:
+                            break  # Stops searching.
+
+            # Otherwise (the documents are sorted),
+            else:
+                matched = sort_documents([document for document in candidates
+                                          if imc.document_matches(query or {}, document)], sort)
+
+            # Returns copies of the requested documents (so the stored documents cannot be changed by callers).
+            return [dict(document) for document in matched[skip:skip + limit if limit else None]]
+
+    def count_matching(self, query : dict) -> int:
+        """
+            Counts the documents matching a query (the transaction must already be started).
+
+            :param query:       The query.
+            :return int:        The number of matching documents.
+        """
+
+        return sum(1 for document in self.get_candidates(query) if imc.document_matches(query, document))
+
+    def check_unique(self, document : dict, previous : dict =None):
+        """
+            Checks that a document does not share the values of a unique index with another document.
+
+            :param document:    The document being stored.
+            :param previous:    The document it replaces (None if it is inserted).
+        """
+
+        # For every field with a unique index,
+        for field in self.unique_fields:
+            holders = self.hash_indexes[field].get(self.get_hash_value(document.get(field)), set())  # Gets the holders.
+
+            # If another document holds the value,
+            if holders - ({self.get_hash_value(previous["_id"])} if previous is not None else set()):
+                # Raises the same error as MongoDB.
+                raise pymongo.errors.DuplicateKeyError(
+                    f"E11000 duplicate key error collection: {self.full_name} index: {field} dup key: "
+                    f"{{ {field}: {document.get(field)!r} }}", 11000)
+
+    def index_document(self, document : dict, add : bool):
+        """
+            Adds a document to (or removes it from) every hash index.
+
+            :param document:    The document.
+            :param add:         Whether the document is added (otherwise it is removed).
+        """
+
+        key = self.get_hash_value(document["_id"])  # Gets the key of the document.
+
+        # For every hash index,
+        for field, index in self.hash_indexes.items():
+            value = self.get_hash_value(document.get(field))  # Gets the indexed value.
+
+            # If the document is added,
+            if add:
+                index.setdefault(value, set()).add(key)
+
+            # Otherwise (the document is removed),
+            else:
+                index.get(value, set()).discard(key)
+
+                # If no document holds the value anymore,
+                if not index.get(value, True):
+                    del index[value]  # Forgets the value.
+
+    def insert_document(self, document : dict):
+        """
+            Stores a new document (the transaction must already be started).
+
+            :param document:    The document (with an "_id" field).
+        """
+
+        key = self.get_hash_value(document["_id"])  # Gets the key of the document.
+
+        # If another document has the same "_id",
+        if key in self.documents:
+            # Raises the same error as MongoDB.
+            raise pymongo.errors.DuplicateKeyError(f"E11000 duplicate key error collection: {self.full_name} "
+                                                   f"index: _id_ dup key: {{ _id: {document['_id']!r} }}", 11000)
+
+        self.check_unique(document)  # Checks the unique indexes.
+        self.documents[key] = document  # Stores the document.
+        self.index_document(document, True)  # Adds the document to the hash indexes.
+
+    def replace_document(self, previous : dict, document : dict):
+        """
+            Replaces a stored document (the transaction must already be started).
+
+            :param previous:    The stored document.
+            :param document:    The new document (with the same "_id").
+        """
+
+        self.check_unique(document, previous)  # Checks the unique indexes.
+        self.index_document(self.documents[self.get_hash_value(previous["_id"])], False)  # Removes the old values.
+        self.documents[self.get_hash_value(document["_id"])] = document  # Stores the new document.
+        self.index_document(document, True)  # Adds the new values.
+
+    def remove_document(self, document : dict):
+        """
+            Removes a stored document (the transaction must already be started).
+
+            :param document:    The stored document.
+        """
+
+        stored = self.documents.pop(self.get_hash_value(document["_id"]))  # Removes the document.
+        self.index_document(stored, False)  # Removes it from the hash indexes.
+
+    def add_index(self, keys : list, name : str, unique : bool):
+        """
+            Creates an index (the transaction must already be started). Single-field indexes are kept as hash indexes;
+            compound indexes are only recorded (queries on them scan the collection).
+
+            :param keys:        The (field, direction) pairs of the index.
+            :param name:        The name of the index.
+            :param unique:      Whether two documents may not share the indexed value.
+        """
+
+        # If the index already exists,
+        if name in self.indexes:
+            return  # Exits the function (creating an index that exists does nothing).
+
+        # If the index is on a single field,
+        if len(keys) == 1:
+            field = keys[0][0]  # Gets the field.
+            index = {}  # Holds the "_id" values of every value of the field.
+
+            # For every document,
+            for key, document in self.documents.items():
+                holders = index.setdefault(self.get_hash_value(document.get(field)), set())  # Gets the holders.
+
+                # If the index is unique and another document holds the value,
+                if unique and holders:
+                    # Raises the same error as MongoDB.
+                    raise pymongo.errors.DuplicateKeyError(f"E11000 duplicate key error collection: {self.full_name} "
+                                                           f"index: {name}", 11000)
+
+                holders.add(key)  # Stores the "_id" of the document.
+
+            self.hash_indexes[field] = index  # Stores the index.
+
+            # If the index is unique,
+            if unique:
+                self.unique_fields.add(field)  # Checks the field on every write.
+
+        self.indexes[name] = {"key": keys, "unique": unique}  # Records the index.
+
+    def index_information(self) -> dict:
+        """
+            Gets the definition of every index.
+
+            :return dict:       The definitions, keyed by the names of the indexes.
+        """
+
+        return dict(self.indexes)  # Returns the definitions.
+
+    def explain_query(self, query : dict, sort : list) -> dict:
+        """
+            Reports how a query is run.
+
+            :param query:       The query.
+            :param sort:        The (field, direction) pairs to sort by.
+            :return dict:       The plan in the shape of the MongoDB explain output.
+        """
+
+        # Gets the field whose hash index is used (None if the collection is scanned).
+        field = next((field for field in ["_id", *self.hash_indexes] if field in query and
+                      (not isinstance(query[field], dict) or set(query[field]) <= {"$eq", "$in"})), None)
+
+        # If an index is used,
+        if field is not None:
+            name = next(name for name, index in self.indexes.items() if index["key"][0][0] == field)
+            plan = {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": name}}
+
+        # Otherwise (the collection is scanned),
+        else:
+            plan = {"stage": "COLLSCAN"}
+
+        # If the documents are sorted,
+        if sort:
+            plan = {"stage": "SORT", "inputStage": plan}  # Sorts them in memory.
+
+        return {"queryPlanner": {"winningPlan": plan}, "executionStats": {}}  # Returns the plan.
+
+    def drop(self):
+        """
+            Deletes every document and index of the collection.
+        """
+
+        # Only one thread may use the engine at a time.
+        with self.transaction():
+            self.documents.clear()  # Deletes the documents.
+            self.indexes = {"_id_": {"key": [("_id", 1)], "unique": True}}  # Deletes the indexes.
+            self.hash_indexes.clear()
+            self.unique_fields.clear()
+
+
+class MemoryClient:
+    """
+        The client of an in-memory storage engine (the part of the PyMongo MongoClient the backend uses). The data
+        lives as long as the process; every login to the same engine shares it.
+    """
+
+    def __init__(self, name : str):
+        """
+            Creates an empty engine.
+
+            :param name:        The name of the engine.
+        """
+
+        self.name = name                    # The name of the engine.
+        self.collections = {}               # The collections, keyed by (database, collection).
+        self.lock = threading.RLock()       # Prevents two threads from using the engine at once.
+
+    @contextlib.contextmanager
+    def transaction(self, write : bool =True):
+        """
+            Holds the lock of the engine (writes in memory cannot fail half way, so there is nothing to roll back).
+
+            :param write:       Whether the transaction writes (ignored, every transaction holds the lock).
+        """
+
+        # Only one thread may use the engine at a time.
+        with self.lock:
+            yield  # Runs the body of the transaction.
+
+    def __getitem__(self, name : str) -> StorageDatabase:
+        """
+            Gets a database of the engine.
+
+            :param name:        The name of the database.
+            :return StorageDatabase:    The database.
+        """
+
+        return StorageDatabase(self, name)  # Returns the database.
+
+    def get_collection(self, database : StorageDatabase, name : str) -> MemoryCollection:
+        """
+            Gets a collection of the engine, creating it the first time it is used.
+
+            :param database:    The database holding the collection.
+            :param name:        The name of the collection.
+            :return MemoryCollection:   The collection.
+        """
+
+        # Only one thread may use the engine at a time.
+        with self.lock:
+            # If the collection does not exist,
+            if (database.name, name) not in self.collections:
+                self.collections[(database.name, name)] = MemoryCollection(database, name)  # Creates it.
+
+            return self.collections[(database.name, name)]  # Returns the collection.
+
+    def list_collection_names(self, database : str) -> list:
+        """
+            Gets the names of every collection in a database.
+
+            :param database:    The name of the database.
+            :return list:       The names of the collections that hold documents.
+        """
+
+        # Only one thread may use the engine at a time.
+        with self.lock:
+            return [name for (owner, name), collection in self.collections.items()
+                    if owner == database and collection.documents]
+
+    def drop_database(self, name : str):
+        """
+            Deletes every collection of a database.
+
+            :param name:        The name of the database.
+        """
+
+        # Only one thread may use the engine at a time.
+        with self.lock:
+            # For every collection of the database,
+            for key in [key for key in self.collections if key[0] == name]:
+                del self.collections[key]  # Deletes the collection.
+
+    def server_info(self) -> dict:
+        """
+            Gets information about the engine.
+
+            :return dict:       The name of the engine.
+        """
+
+        return {"version": "memory", "storageEngine": {"name": "memory"}}  # Returns the information.
+
+    def close(self):
+        """
+            Does nothing (the data must outlive every login).
+        """
+
+
+class SQLiteCollection(StorageCollection):
+    """
+        A collection held in a SQLite table. Every document is stored as JSON text; indexes are SQLite expression
+        indexes on the fields, so queries and sorts on indexed fields are answered by SQLite without a scan.
+    """
+
+    def __init__(self, database, name : str):
+        """
+            Creates a reference to a collection (the table is created when it is first used).
+
+            :param database:    The database holding the collection.
+            :param name:        The name of the collection.
+        """
+
+        super().__init__(database, name)  # Creates the reference to the collection.
+        self.table = '"' + self.full_name.replace('"', '""') + '"'  # The quoted name of the table.
+        self.connection = database.client.connection  # The connection to the SQLite file.
+        self.created = False  # Whether the table is known to exist.
+
+    def create_table(self):
+        """
+            Creates the table of the collection and its unique "_id" index (if they do not exist).
+        """
+
+        # If the table is already known to exist,
+        if self.created:
+            return  # Exits the function.
+
+        self.connection.execute(f"CREATE TABLE IF NOT EXISTS {self.table} (document TEXT NOT NULL)")
+        self.connection.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS "{self.full_name.replace(chr(34), "")}._id_" '
+                                f"ON {self.table} ({self.get_field_sql('_id')})")
+        self.created = True  # Remembers that the table exists.
+
+    @staticmethod
+    def get_field_sql(field : str) -> str:
+        """
+            Gets the SQL expression of a field (the same expression is used by the indexes, so SQLite can use them).
+
+            :param field:       The name of the field.
+            :return str:        The expression (an error is raised if the field cannot be used in SQL).
+        """
+
+        # If the field cannot be used in SQL (e.g. a nested field),
+        if not field_pattern.match(field):
+            raise ValueError(f"Unsupported field: {field}")  # Refuses the field.
+
+        return f"json_extract(document, '$.{field}')"  # Returns the expression.
+
+    @staticmethod
+    def encode_value(value):
+        """
+            Converts a value into a value SQLite can compare with the stored JSON values.
+
+            :param value:       The value.
+            :return object:     The value (an error is raised if it cannot be compared in SQL).
+        """
+
+        # If the value is an "_id" created by the engine,
+        if isinstance(value, bson.ObjectId):
+            return str(value)  # Returns its text (it is stored as text).
+
+        # If the value is not a number, text, boolean or null,
+        if value is not None and not isinstance(value, (bool, int, float, str)):
+            raise ValueError(f"Unsupported value: {value!r}")  # Refuses the value.
+
+        return value  # Returns the value.
+
+    def translate_condition(self, field : str, operator : str, target, condition : dict) -> (str, list):
+        """
+            Translates a single condition of a query into SQL (with the same results as MongoDB).
+
+            :param field:       The field of the condition.
+            :param operator:    The operator e.g. "$gte".
+            :param target:      The value the operator compares against.
+            :param condition:   Every operator of the field (for the options of a regular expression).
+            :return (str, list):    The SQL and its parameters (an error is raised for unsupported conditions).
+        """
+
+        column = self.get_field_sql(field)  # Gets the expression of the field.
+
+        # If the operator is an equality,
+        if operator == "$eq":
+            # Matches a missing or null field, or the value.
+            return (f"{column} IS NULL", []) if target is None else (f"{column} = ?", [self.encode_value(target)])
+
+        # Otherwise if the operator is an inequality (a missing field is not equal to any value, like MongoDB),
+        elif operator == "$ne":
+            return (f"{column} IS NOT NULL", []) if target is None else \
+                (f"({column} IS NULL OR {column} != ?)", [self.encode_value(target)])
+
+        # Otherwise if the operator is a membership test,
+        elif operator in ("$in", "$nin"):
+            values = [self.encode_value(value) for value in target if value is not None]  # Gets the values.
+            has_null = any(value is None for value in target)  # Whether a missing field is in the list.
+            placeholders = ", ".join("?" * len(values))  # Creates the placeholders of the values.
+
+            # If the field must be in the list,
+            if operator == "$in":
+                parts = ([f"{column} IN ({placeholders})"] if values else []) + ([f"{column} IS NULL"] if has_null else [])
+                return "(" + (" OR ".join(parts) or "0") + ")", values
+
+            # Otherwise (the field must not be in the list),
+            outside = f"{column} NOT IN ({placeholders})" if values else "1"
+            return (f"({column} IS NOT NULL AND {outside})" if has_null else f"({column} IS NULL OR {outside})"), values
+
+        # Otherwise if the operator checks for the field,
+        elif operator == "$exists":
+            return f"json_type(document, '$.{field}') IS {'NOT ' if target else ''}NULL", []
+
+        # Otherwise if the operator is a regular expression,
+        elif operator == "$regex":
+            return f"regexp(?, ?, {column})", [target, condition.get("$options", "")]
+
+        # Otherwise if the operator is the options of a regular expression,
+        elif operator == "$options":
+            return "1", []  # Matches everything (the options are read with the regular expression).
+
+        # Otherwise if the operator is a comparison,
+        elif operator in ("$gt", "$gte", "$lt", "$lte"):
+            symbol = {"$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}[operator]  # Gets the SQL operator.
+
+            # If the value is a number (SQLite orders every number before every text, so "< ''" keeps numbers only),
+            if isinstance(target, (int, float)) and not isinstance(target, bool):
+                return f"({column} {symbol} ? AND {column} < '')", [target]
+
+            # Otherwise if the value is text (">= ''" keeps text only),
+            elif isinstance(target, str):
+                return f"({column} {symbol} ? AND {column} >= '')", [target]
+
+        raise ValueError(f"Unsupported condition: {field} {operator} {target!r}")  # Refuses the condition.
+
+    def translate_query(self, query : dict) -> (str, list):
+        """
+            Translates a MongoDB query into SQL (with the same results as MongoDB).
+
+            :param query:       The query.
+            :return (str, list):    The SQL and its parameters (an error is raised for unsupported queries).
+        """
+
+        parts = []  # Holds the SQL of every condition.
+        parameters = []  # Holds the parameters of every condition.
+
+        # For every key in the query,
+        for key, condition in query.items():
+            # If the key joins other queries,
+            if key in ("$and", "$or", "$nor"):
+                # If there are no queries to join,
+                if not condition:
+                    raise ValueError(f"{key} must be a non-empty list")  # Refuses the query (like MongoDB).
+
+                translated = [self.translate_query(part) for part in condition]  # Translates every query.
+                joined = (" AND " if key == "$and" else " OR ").join(f"({sql})" for sql, values in translated)
+                parts.append(f"NOT ({joined})" if key == "$nor" else f"({joined})")
+                parameters += [value for sql, values in translated for value in values]
+
+            # Otherwise if the key is an unsupported operator,
+            elif key.startswith("$"):
+                raise ValueError(f"Unsupported operator: {key}")  # Refuses the query.
+
+            # Otherwise if the condition is a set of operators,
+            elif isinstance(condition, dict) and condition and all(name.startswith("$") for name in condition):
+                # For every operator,
+                for operator, target in condition.items():
+                    sql, values = self.translate_condition(key, operator, target, condition)  # Translates it.
+                    parts.append(sql)
+                    parameters += values
+
+            # Otherwise (the condition is a plain value),
+            else:
+                sql, values = self.translate_condition(key, "$eq", condition, {})  # Translates the equality.
+                parts.append(sql)
+                parameters += values
+
+        return " AND ".join(parts) or "1", parameters  # Returns the SQL and its parameters.
+
+    def decode_document(self, text : str) -> dict:
+        """
+            Converts a stored document back into a dictionary.
+
+            :param text:        The JSON text of the document.
+            :return dict:       The document.
+        """
+
+        return json.loads(text)  # Returns the document.
+
+    def find_documents(self, query : dict, sort : list, skip : int, limit : int) -> list:
+        """
+            Gets the documents matching a query. The query, sort, skip and limit are run by SQLite when they can be
+            translated; otherwise the documents are filtered and sorted in memory.
+
+            :param query:       The query.
+            :param sort:        The (field, direction) pairs to sort by.
+            :param skip:        The number of documents to skip.
+            :param limit:       The most documents returned (0 for no limit).
+            :return list:       The documents.
+        """
+
+        # Only one thread may use the engine at a time.
+        with self.transaction(write=False):
+            self.create_table()  # Creates the table (if it does not exist).
+
+            # Makes an attempt,
+            try:
+                where, parameters = self.translate_query(query or {})  # Translates the query.
+
+                # Translates the sort (the rowid keeps documents that sort equally in insertion order).
+                order = ", ".join(f"{self.get_field_sql(field)} {'DESC' if direction < 0 else 'ASC'}"
+                                  for field, direction in sort)
+                order = f"{order}, rowid" if order else "rowid"
+
+                # Runs the query in SQLite.
+                rows = self.connection.execute(f"SELECT document FROM {self.table} WHERE {where} ORDER BY {order} "
+                                               f"LIMIT ? OFFSET ?", parameters + [limit or -1, skip]).fetchall()
+                return [self.decode_document(row[0]) for row in rows]  # Returns the documents.
+
+            # If the query or sort cannot be translated,
+            except ValueError:
+                rows = self.connection.execute(f"SELECT document FROM {self.table} ORDER BY rowid").fetchall()
+
+        # Filters and sorts every document in memory.
+        documents = [document for document in (self.decode_document(row[0]) for row in rows)
+                     if imc.document_matches(query or {}, document)]
+        documents = sort_documents(documents, sort) if sort else documents
+        return documents[skip:skip + limit if limit else None]  # Returns the requested documents.
+
+    def count_matching(self, query : dict) -> int:
+        """
+            Counts the documents matching a query (the transaction must already be started).
+
+            :param query:       The query.
+            :return int:        The number of matching documents.
+        """
+
+        self.create_table()  # Creates the table (if it does not exist).
+
+        # Makes an attempt,
+        try:
+            where, parameters = self.translate_query(query)  # Translates the query.
+            return self.connection.execute(f"SELECT COUNT(*) FROM {self.table} WHERE {where}", parameters).fetchone()[0]
+
+        # If the query cannot be translated,
+        except ValueError:
+            return len(self.find_documents(query, [], 0, 0))  # Counts the documents in memory.
+
+    @staticmethod
+    def encode_document(document : dict) -> str:
+        """
+            Converts a document into JSON text.
+
+            :param document:    The document.
+            :return str:        The JSON text ("_id" values created by the engine are stored as text).
+        """
+
+        return json.dumps(document, default=str)  # Returns the JSON text.
+
+    def run_write(self, sql : str, parameters : list):
+        """
+            Runs a write, raising the same error as MongoDB if it breaks a unique index.
+
+            :param sql:         The SQL of the write.
+            :param parameters:  The parameters of the write.
+        """
+
+        # Makes an attempt,
+        try:
+            self.connection.execute(sql, parameters)  # Runs the write.
+
+        # If the write broke a unique index,
+        except sqlite3.IntegrityError as error:
+            # Raises the same error as MongoDB.
+            raise pymongo.errors.DuplicateKeyError(f"E11000 duplicate key error collection: {self.full_name} "
+                                                   f"({error})", 11000)
+
+    def insert_document(self, document : dict):
+        """
+            Stores a new document (the transaction must already be started).
+
+            :param document:    The document (with an "_id" field).
+        """
+
+        self.create_table()  # Creates the table (if it does not exist).
+        self.run_write(f"INSERT INTO {self.table} (document) VALUES (?)", [self.encode_document(document)])
+
+    def replace_document(self, previous : dict, document : dict):
+        """
+            Replaces a stored document (the transaction must already be started).
+
+            :param previous:    The stored document.
+            :param document:    The new document (with the same "_id").
+        """
+
+        self.run_write(f"UPDATE {self.table} SET document = ? WHERE {self.get_field_sql('_id')} = ?",
+                       [self.encode_document(document), self.encode_value(previous["_id"])])
+
+    def remove_document(self, document : dict):
+        """
+            Removes a stored document (the transaction must already be started).
+
+            :param document:    The stored document.
+        """
+
+        self.connection.execute(f"DELETE FROM {self.table} WHERE {self.get_field_sql('_id')} = ?",
+                                [self.encode_value(document["_id"])])
+
+    def add_index(self, keys : list, name : str, unique : bool):
+        """
+            Creates a SQLite expression index on the fields (the transaction must already be started).
+
+            :param keys:        The (field, direction) pairs of the index.
+            :param name:        The name of the index.
+            :param unique:      Whether two documents may not share the indexed values.
+        """
+
+        self.create_table()  # Creates the table (if it does not exist).
+        columns = ", ".join(f"{self.get_field_sql(field)} {'DESC' if direction < 0 else 'ASC'}" for field, direction in keys)
+        index = '"' + f"{self.full_name}.{name}".replace('"', '""') + '"'  # Gets the quoted name of the index.
+
+        # Creates the index.
+        self.run_write(f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {index} ON {self.table} ({columns})", [])
+
+    def index_information(self) -> dict:
+        """
+            Gets the names of every index.
+
+            :return dict:       The indexes, keyed by their names.
+        """
+
+        # Only one thread may use the engine at a time.
+        with self.transaction(write=False):
+            self.create_table()  # Creates the table (if it does not exist).
+            rows = self.connection.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ?",
+                                           [self.full_name]).fetchall()
+
+        return {row[0][len(self.full_name) + 1:]: {} for row in rows}  # Returns the names without the prefix.
+
+    def explain_query(self, query : dict, sort : list) -> dict:
+        """
+            Reports how SQLite runs a query.
+
+            :param query:       The query.
+            :param sort:        The (field, direction) pairs to sort by.
+            :return dict:       The plan in the shape of the MongoDB explain output.
+        """
+
+        # Makes an attempt,
+        try:
+            where, parameters = self.translate_query(query or {})  # Translates the query.
+            order = ", ".join(f"{self.get_field_sql(field)} {'DESC' if direction < 0 else 'ASC'}" for field, direction in sort)
+
+            # Only one thread may use the engine at a time.
+            with self.transaction(write=False):
+                self.create_table()  # Creates the table (if it does not exist).
+                rows = self.connection.execute(f"EXPLAIN QUERY PLAN SELECT document FROM {self.table} WHERE {where}"
+                                               f"{' ORDER BY ' + order if order else ''}", parameters).fetchall()
+
+        # If the query cannot be translated,
+        except ValueError:
+            return {"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}, "executionStats": {}}  # Scans in memory.
+
+        plan = None  # Holds the innermost stage so far.
+
+        # For every step of the SQLite plan (the detail is the last column),
+        for row in rows:
+            detail = row[-1]  # Gets the description of the step.
+            match = re.search(r"USING (?:COVERING )?INDEX (\S+)", detail)  # Gets the index used.
+
+            # If the step sorts in memory,
+            if "TEMP B-TREE" in detail:
+                plan = {"stage": "SORT", **({"inputStage": plan} if plan else {})}
+
+            # Otherwise if the step uses an index,
+            elif match:
+                name = match.group(1).strip('"')[len(self.full_name) + 1:]  # Removes the name of the table.
+                plan = {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": name}}
+
+            # Otherwise if the step scans the table,
+            elif detail.startswith("SCAN"):
+                plan = {"stage": "COLLSCAN"}
+
+        return {"queryPlanner": {"winningPlan": plan or {"stage": "COLLSCAN"}}, "executionStats": {}}  # Returns it.
+
+    def drop(self):
+        """
+            Deletes the table of the collection (and its indexes).
+        """
+
+        # Only one thread may use the engine at a time.
+        with self.transaction():
+            self.connection.execute(f"DROP TABLE IF EXISTS {self.table}")  # Deletes the table.
+            self.created = False  # Remembers that the table no longer exists.
+
+
+class SQLiteClient:
+    """
+        The client of a SQLite storage engine (the part of the PyMongo MongoClient the backend uses). Every database
+        and collection is a table in the same SQLite file; "<database>.<collection>" is the name of the table.
+    """
+
+    def __init__(self, path : str):
+        """
+            Opens the SQLite file (creating it if it does not exist).
+
+            :param path:        The path of the SQLite file (":memory:" for a temporary database).
+        """
+
+        self.path = path                    # The path of the SQLite file.
+        self.lock = threading.RLock()       # Prevents two threads from using the connection at once.
+        self.depth = 0                      # How many transactions are nested in the current one.
+        self.collections = {}               # The references to the collections, keyed by (database, collection).
+
+        # Opens the connection (transactions are started explicitly, see transaction()).
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")  # Lets other processes read while a write is applied.
+        self.connection.execute("PRAGMA busy_timeout=5000")  # Waits for the writes of other processes.
+
+        # Adds the function used by $regex conditions.
+        self.connection.create_function("regexp", 3, lambda pattern, options, value: int(
+            isinstance(value, str) and re.search(pattern, value, re.IGNORECASE if "i" in options else 0) is not None),
+            deterministic=True)
+
+    @contextlib.contextmanager
+    def transaction(self, write : bool =True):
+        """
+            Runs the body in a SQLite transaction (nested transactions join the outer transaction). The transaction
+            is committed if the body succeeds and rolled back if it raises an error.
+
+            :param write:       Whether the transaction writes. A writing transaction takes the write lock at once
+                                (so it never fails to upgrade a read half way); a read-only transaction is deferred,
+                                so it reads its snapshot while other processes write (WAL mode).
+        """
+
+        # Only one thread may use the connection at a time.
+        with self.lock:
+            # If this is the outermost transaction,
+            if self.depth == 0:
+                # Starts the transaction (a writing transaction locks out other writers).
+                self.connection.execute("BEGIN IMMEDIATE" if write else "BEGIN DEFERRED")
+
+            self.depth += 1  # Counts the transaction.
+
+            # Makes an attempt,
+            try:
+                yield  # Runs the body of the transaction.
+
+            # If the body raised an error,
+            except BaseException:
+                self.depth -= 1  # Stops counting the transaction.
+
+                # If this is the outermost transaction,
+                if self.depth == 0:
+                    self.connection.execute("ROLLBACK")  # Undoes every write of the transaction.
+
+                raise  # Passes the error on.
+
+            self.depth -= 1  # Stops counting the transaction.
+
+            # If this is the outermost transaction,
+            if self.depth == 0:
+                self.connection.execute("COMMIT")  # Applies every write of the transaction.
+
+    def __getitem__(self, name : str) -> StorageDatabase:
+        """
+            Gets a database of the engine.
+
+            :param name:        The name of the database.
+            :return StorageDatabase:    The database.
+        """
+
+        return StorageDatabase(self, name)  # Returns the database.
+
+    def get_collection(self, database : StorageDatabase, name : str) -> SQLiteCollection:
+        """
+            Gets a collection of the engine.
+
+            :param database:    The database holding the collection.
+            :param name:        The name of the collection.
+            :return SQLiteCollection:   The collection.
+        """
+
+        # Only one thread may use the connection at a time.
+        with self.lock:
+            # Returns the collection (creating the reference if it does not exist).
+            return self.collections.setdefault((database.name, name), SQLiteCollection(database, name))
+
+    def list_collection_names(self, database : str) -> list:
+        """
+            Gets the names of every collection in a database.
+
+            :param database:    The name of the database.
+            :return list:       The names of the collections.
+        """
+
+        # Only one thread may use the connection at a time.
+        with self.lock:
+            rows = self.connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+
+        # Returns the names of the tables of the database, without the name of the database.
+        return [row[0][len(database) + 1:] for row in rows if row[0].startswith(f"{database}.")]
+
+    def drop_database(self, name : str):
+        """
+            Deletes every collection of a database.
+
+            :param name:        The name of the database.
+        """
+
+        # For every collection of the database,
+        for collection in self.list_collection_names(name):
+            self[name][collection].drop()  # Deletes the collection.
+
+    def server_info(self) -> dict:
+        """
+            Gets information about the engine.
+
+            :return dict:       The SQLite version.
+        """
+
+        return {"version": sqlite3.sqlite_version, "storageEngine": {"name": "sqlite"}}  # Returns the information.
+
+    def close(self):
+        """
+            Closes the connection to the SQLite file.
+        """
+
+        # Only one thread may use the connection at a time.
+        with self.lock:
+            self.connection.close()  # Closes the connection.
+
+
+def create_client(engine : str, path : str, username : str, password : str, users : dict):
+    """
+        Creates the client of a local storage engine.
+
+        :param engine:      The storage engine ("memory" or "sqlite").
+        :param path:        The path of the SQLite file, or the name of the in-memory engine.
+        :param username:    The username logging in.
+        :param password:    The password logging in.
+        :param users:       The password of every user. If empty, any credentials are accepted (like a MongoDB server
+                            without authentication).
+        :return object:     The client (an OperationFailure is raised if the credentials are invalid).
+    """
+
+    # If users are defined and the credentials do not match one,
+    if users and users.get(username) != password:
+        raise pymongo.errors.OperationFailure("Authentication failed.", 18)  # Refuses the login (like MongoDB).
+
+    # If the engine keeps the data in memory,
+    if engine == "memory":
+        # Only one thread may create an in-memory engine at a time.
+        with memory_clients_lock:
+            # If the engine does not exist,
+            if path not in memory_clients:
+                memory_clients[path] = MemoryClient(path)  # Creates it.
+
+            return memory_clients[path]  # Returns the shared engine.
+
+    # Otherwise if the engine keeps the data in SQLite,
+    elif engine == "sqlite":
+        return SQLiteClient(path)  # Opens the SQLite file.
+
+    raise ValueError(f"Unknown storage engine: {engine}")  # Refuses the engine.
@@ -0,0 +1,103 @@
+"""
+    :author:        Jacob Whetham
+    :version:       1.0.0, 04 JAN 2024
+    :desc:          This file serves the Inventory Management System with several worker processes (a production WSGI
+                    server) instead of the single process development server. The login state of every browser tab
+                    is kept in a session store shared by the workers, so any worker can serve any tab.
+
+                    Example:    python driver.py --workers 4 --threads 8
+                                gunicorn --preload --workers 4 --threads 8 -b 0.0.0.0:8050 \\
+                                    "inventory_management_wsgi:create_server()"
+"""
+
+# Imports
+import os                                       # Allows for counting the cores and reading the session secret.
+import inventory_management_backend as imb      # Allows for preparing the backend for several workers.
+import inventory_management_frontend as imf     # Allows for serving the dashboard.
+import inventory_management_sessions as imse    # Allows for sharing the sessions between the workers.
+
+# Declare global variables.
+session_path = "inventory_management_sessions.sqlite3"  # The SQLite file holding the sessions shared by the workers.
+default_threads = 4                                     # The threads serving requests in every worker.
+
+
+def get_default_workers() -> int:
+    """
+        Gets the number of workers used when none is chosen (two per core plus one, as recommended by gunicorn).
+
+        :return int:        The number of workers.
+    """
+
+    return (os.cpu_count() or 1) * 2 + 1  # Returns the number of workers.
+
+
+def create_server(workers : int =None, path : str =None):
+    """
+        Prepares the backend for several workers and gets the WSGI application of the dashboard.
+
+        :param workers:     The number of workers that will serve the application (the default if None).
+        :param path:        The SQLite file holding the sessions (session_path if None).
+        :return Flask:      The WSGI application (the Flask server underlying the Dash app).
+    """
+
+    workers = get_default_workers() if workers is None else workers  # Chooses the number of workers.
+    secret = os.environ.get("IMS_SESSION_SECRET")  # Gets the secret shared by the workers (if it is set).
+
+    # If the secret is set (e.g. the workers are not forked from one process, or sessions should survive a restart),
+    if secret:
+        imb.session_secret = secret.encode("utf-8")  # Seals the passwords with it.
+
+    # If more than one worker will serve the application,
+    if workers > 1:
+        imb.session_store = imse.SQLiteSessionStore(path or session_path)  # Shares the sessions between the workers.
+        imb.change_feed.set_version_store(imb.session_store)  # Counts the writes of every worker in the same file.
+        imb.shared_storage = True  # Notices the writes of the other workers before reusing pages.
+
+    imb.close_client_pool()  # Closes the bootstrap connections (a connection must not be shared with a forked worker).
+    imf.create_layout()  # Creates the formatting of the app.
+    return imf.app.server  # Returns the WSGI application.
+
+
+def serve(workers : int =None, threads : int =default_threads, host : str ="0.0.0.0", port : int =8050,
+          path : str =None):
+    """
+        Serves the dashboard with gunicorn. The application is loaded before the workers are forked, so they share
+            the settings of this process (e.g. the storage engine and the session secret).
+
+        :param workers:     The number of worker processes (two per core plus one if None).
+        :param threads:     The number of threads serving requests in every worker.
+        :param host:        The address to listen on.
+        :param port:        The port to listen on.
+        :param path:        The SQLite file holding the sessions (session_path if None).
+    """
+
+    import gunicorn.app.base  # Allows for running gunicorn from Python (only needed in production).
+
+    workers = get_default_workers() if workers is None else workers  # Chooses the number of workers.
+    server = create_server(workers, path)  # Prepares the application.
+
+    class Application(gunicorn.app.base.BaseApplication):
+        """
+            Runs the dashboard with gunicorn using the settings given to serve().
+        """
+
+        def load_config(self):
+            """
+                Applies the settings.
+            """
+
+            self.cfg.set("bind", f"{host}:{port}")  # Listens on the address and port.
+            self.cfg.set("workers", workers)  # Forks the worker processes.
+            self.cfg.set("threads", threads)  # Serves requests with several threads in every worker.
+            self.cfg.set("preload_app", True)  # Loads the application before forking the workers.
+
+        def load(self):
+            """
+                Gets the application.
+
+                :return Flask:  The WSGI application.
+            """
+
+            return server  # Returns the WSGI application.
+
+    Application().run()  # Starts gunicorn (blocks until it is stopped).
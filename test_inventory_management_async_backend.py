@@ -0,0 +1,270 @@
+"""
+    :author:        Jacob Whetham
+    :version:       1.0.0, 04 JAN 2024
+    :desc:          This file tests the asynchronous backend of the Inventory Management System. The in-memory storage
+                    engine stands in for MongoDB (its collections are wrapped in coroutines the way AsyncMongoClient
+                    presents them), so the tests run without a server.
+"""
+
+# Imports
+import tempfile     # Allows for keeping the change journal of a test in a temporary directory.
+import threading    # Allows for telling which thread recorded a change.
+import unittest     # Allows for running the tests (IsolatedAsyncioTestCase runs every test in its own event loop).
+import pymongo      # Allows for sending pymongo operations to bulk writes.
+import inventory_management_async_backend as imab   # Allows for testing the asynchronous backend.
+import inventory_management_backend as imb          # Allows for reading the shared settings, cache and change feed.
+import inventory_management_journal as imj          # Allows for rebuilding the inventory from the change journal.
+import inventory_management_storage as ims          # Allows for the use of the in-memory storage engine.
+
+
+class AsyncCursor:
+    """
+        Presents a cursor of a local storage engine the way an AsyncCursor does (to_list() and "async for").
+    """
+
+    def __init__(self, cursor):
+        """
+            Wraps a cursor.
+
+            :param cursor:      The cursor of the storage engine.
+        """
+
+        self.cursor = cursor  # The cursor of the storage engine.
+
+    def sort(self, *args, **kwargs):
+        self.cursor.sort(*args, **kwargs)  # Sorts the results.
+        return self  # Returns the cursor (so calls can be chained).
+
+    def skip(self, count : int):
+        self.cursor.skip(count)  # Skips the first results.
+        return self  # Returns the cursor (so calls can be chained).
+
+    def limit(self, count : int):
+        self.cursor.limit(count)  # Limits the results.
+        return self  # Returns the cursor (so calls can be chained).
+
+    async def to_list(self, length : int =None) -> list:
+        results = list(self.cursor)  # Reads every result.
+        return results if length is None else results[:length]  # Returns the results.
+
+    async def __aiter__(self):
+        # For every result,
+        for document in self.cursor:
+            yield document  # Yields the result.
+
+
+class AsyncCollection:
+    """
+        Presents a collection of a local storage engine the way an AsyncCollection does (every call is awaited, except
+        find(), which returns a cursor).
+    """
+
+    def __init__(self, collection):
+        """
+            Wraps a collection.
+
+            :param collection:  The collection of the storage engine.
+        """
+
+        self.collection = collection  # The collection of the storage engine.
+
+    def find(self, *args, **kwargs) -> AsyncCursor:
+        return AsyncCursor(self.collection.find(*args, **kwargs))  # Returns the cursor of the search.
+
+    async def aggregate(self, pipeline : list) -> AsyncCursor:
+        return AsyncCursor(self.collection.aggregate(pipeline))  # Returns the cursor of the aggregation.
+
+    def __getattr__(self, name : str):
+        method = getattr(self.collection, name)  # Gets the method of the collection.
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)  # Calls the method.
+
+        return call  # Returns the coroutine version of the method.
+
+
+class AsyncDatabase:
+    """
+        Presents a database of a local storage engine the way an AsyncDatabase does.
+    """
+
+    def __init__(self, database):
+        """
+            Wraps a database.
+
+            :param database:    The database of the storage engine.
+        """
+
+        self.database = database  # The database of the storage engine.
+
+    def __getitem__(self, name : str) -> AsyncCollection:
+        return AsyncCollection(self.database[name])  # Returns the collection.
+
+
+class AsyncBackendTest(unittest.IsolatedAsyncioTestCase):
+    """
+        Tests the asynchronous backend against an empty in-memory inventory.
+    """
+
+    def setUp(self):
+        """
+            Logs a new session in to an empty in-memory engine.
+        """
+
+        self.journal_enabled = imb.journal.enabled  # Remembers whether the journal was recording.
+        imb.journal.enabled = False  # Stops the journal from writing segments during the tests.
+        imb.query_cache.clear()  # Removes the pages cached by other tests.
+        imab.reserved_product_ids = iter(())  # Forgets the product IDs reserved by other tests.
+
+        engine = ims.MemoryClient("test")[imb.target_db]  # Creates the empty engine.
+        engine[imb.target_collection].create_index([("product_id", 1)], unique=True, name="product_id_unique")
+        database = AsyncDatabase(engine)  # Wraps the engine the way AsyncMongoClient presents a database.
+        self.session = imab.use_session(f"test-{id(self)}")  # Chooses a new session.
+        self.session.database = database  # Logs the session in to the engine.
+        self.session.collection = database[imb.target_collection]
+        self.session.logged_in = True
+
+    def tearDown(self):
+        """
+            Restores the journal.
+        """
+
+        imb.journal.enabled = self.journal_enabled  # Restores whether the journal was recording.
+
+    async def test_create_allocates_product_ids(self):
+        first = await imab.create({"product_name": "Widget", "product_price": 2.0, "product_quantity": 3})
+        second = await imab.create({"product_name": "Gadget", "product_price": 1.0, "product_quantity": 1})
+
+        self.assertEqual(first["product_id"] + 1, second["product_id"])
+        self.assertIsNone(await imab.create({"product_id": first["product_id"], "product_name": "Copy"}))
+
+    async def test_summary_follows_writes(self):
+        document = await imab.create({"product_name": "Widget", "product_price": 2.0, "product_quantity": 3})
+        await imab.create({"product_name": "Gadget", "product_price": 1.0, "product_quantity": 1})
+        await imab.update({"product_id": document["product_id"]}, {"$set": {"product_quantity": 5}})
+        await imab.delete({"product_name": "Gadget"})
+
+        summary = await imab.get_summary()
+        result = await imab.rebuild_summary()
+
+        self.assertEqual(summary["total_value"], 10.0)
+        self.assertTrue(result["consistent"])
+
+    async def test_update_returns_new_document(self):
+        document = await imab.create({"product_name": "Widget", "product_price": 2.0, "product_quantity": 3})
+        updated = await imab.update({"product_id": document["product_id"]}, {"$set": {"product_price": 4.0}})
+
+        self.assertEqual(updated["product_price"], 4.0)
+        self.assertIsNone(await imab.update({"product_id": -1}, {"$set": {"product_price": 4.0}}))
+
+    async def test_adjust_quantity_refuses_missing_stock(self):
+        document = await imab.create({"product_name": "Widget", "product_price": 2.0, "product_quantity": 3})
+
+        self.assertIsNone(await imab.adjust_quantity(document["product_id"], -4))
+        self.assertEqual((await imab.adjust_quantity(document["product_id"], -3))["product_quantity"], 0)
+
+    async def test_delete_needs_a_query(self):
+        document = await imab.create({"product_name": "Widget", "product_price": 2.0, "product_quantity": 3})
+
+        self.assertIsNone(await imab.delete({}))
+        self.assertEqual((await imab.delete({"product_id": document["product_id"]}))["product_name"], "Widget")
+        self.assertIsNone(await imab.delete({"product_id": document["product_id"]}))
+
+    async def test_read_page_counts_matches(self):
+        # For every product,
+        for number in range(30):
+            await imab.create({"product_name": f"Widget {number}", "product_price": 1.0, "product_quantity": number})
+
+        records, total = await imab.read_page(0, 5, [{"column_id": "product_quantity", "direction": "desc"}],
+                                              "{product_quantity} >= 10")
+
+        self.assertEqual(total, 20)
+        self.assertEqual([record["product_quantity"] for record in records], [29, 28, 27, 26, 25])
+
+    async def test_bulk_write_adjusts_summary(self):
+        operations = [{"op": "insert", "document": {"product_id": number, "product_name": f"Widget {number}",
+                                                    "product_price": 1.0, "product_quantity": 2}}
+                      for number in range(10)]
+        operations.append({"op": "delete", "query": {"product_id": 0}})
+        await imab.get_summary()  # Stores the (empty) summary the batches adjust.
+
+        results = await imab.bulk_write(operations, batch_size=4)
+        result = await imab.rebuild_summary()
+
+        self.assertEqual((results["inserted"], results["deleted"]), (10, 1))
+        self.assertEqual(result["stored"]["total_value"], 18.0)
+        self.assertTrue(result["consistent"])
+
+    async def test_bulk_write_refuses_many_operations(self):
+        await imab.get_summary()  # Stores the (empty) summary the batches adjust.
+
+        results = await imab.bulk_write([pymongo.UpdateMany({}, {"$set": {"product_price": 1.0}}),
+                                         pymongo.DeleteMany({}),
+                                         {"op": "insert", "document": {"product_id": 1, "product_name": "Widget"}}],
+                                        ordered=False)
+
+        self.assertEqual([error["message"] for error in results["errors"]],
+                         ["Unsupported bulk operation: UpdateMany", "Unsupported bulk operation: DeleteMany"])
+        self.assertEqual(results["inserted"], 1)
+
+    async def test_journal_replays_bulk_writes_by_query_once(self):
+        directory = imb.journal.directory  # Remembers where the journal was kept.
+        operations = [{"op": "insert", "document": {"product_id": number, "product_name": f"Widget {number % 2}",
+                                                    "product_price": 1.0, "product_quantity": 2}}
+                      for number in range(4)]
+        await imab.get_summary()  # Stores the (empty) summary the batches adjust.
+        await imab.bulk_write(operations)
+        temporary = tempfile.TemporaryDirectory()  # Holds the journal of the test.
+        imb.journal.set_directory(temporary.name)  # Keeps the journal of the test apart.
+        imb.journal.enabled = True  # Records the writes.
+
+        # Makes an attempt,
+        try:
+            await imab.bulk_write([{"op": "update", "query": {"product_name": "Widget 0"},
+                                    "data": {"$inc": {"product_quantity": 5}}},
+                                   {"op": "delete", "query": {"product_name": "Widget 1"}}])
+            imb.journal.flush()  # Writes the records.
+
+            # Takes a snapshot dated before the records, so they are replayed over products that already hold them.
+            imb.journal.write_snapshot(await self.session.collection.find({}, imb.table_projection).to_list(), 0.0)
+            documents, info = imj.reconstruct(temporary.name)
+
+        # Whether or not it succeeded,
+        finally:
+            imb.journal.enabled = False
+            imb.journal.set_directory(directory)  # Restores where the journal is kept.
+            temporary.cleanup()  # Removes the journal of the test.
+
+        expected = await self.session.collection.find({}, imb.table_projection).sort("product_id", 1).to_list()
+
+        self.assertGreater(info["records"], 0)
+        self.assertEqual(documents, expected)
+
+    async def test_changes_are_recorded_off_the_event_loop(self):
+        threads = []  # Holds the thread that recorded every change.
+        record_local = imb.change_feed.record_local  # Remembers the real function.
+        imb.change_feed.record_local = lambda *args, **kwargs: threads.append(threading.get_ident())
+
+        # Makes an attempt,
+        try:
+            document = await imab.create({"product_name": "Widget", "product_price": 2.0, "product_quantity": 3})
+            await imab.update({"product_id": document["product_id"]}, {"$set": {"product_quantity": 5}})
+            await imab.delete({"product_id": document["product_id"]})
+
+        # Whether or not it succeeded,
+        finally:
+            imb.change_feed.record_local = record_local  # Restores the real function.
+
+        self.assertEqual(len(threads), 3)
+        self.assertNotIn(threading.get_ident(), threads)
+
+    async def test_logged_out_session_is_refused(self):
+        await imab.logout()
+
+        self.assertIsNone(await imab.create({"product_name": "Widget"}))
+        self.assertIsNone(await imab.update({"product_id": 0}, {"$set": {"product_price": 1.0}}))
+        self.assertIsNone(await imab.delete({"product_id": 0}))
+
+
+if __name__ == "__main__":
+    unittest.main()  # Runs the tests.